@@ -31,14 +31,14 @@ async def admin_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_ID:
         return
     
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     # دریافت آمار
-    stats = db.get_statistics()
+    stats = await db.get_statistics()
     
     # Health Check
     health_checker = context.bot_data.get('health_checker')
-    health_status = health_checker.get_health_status() if health_checker else None
+    health_status = await db.run_read(health_checker.get_health_status) if health_checker else None
     
     # Cache Stats
     cache_manager = context.bot_data.get('cache_manager')
@@ -93,6 +93,7 @@ async def admin_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
             InlineKeyboardButton("📈 تحلیل", callback_data="dash:analysis")
         ],
         [
+            InlineKeyboardButton("🐢 کوئری‌ها", callback_data="dash:queries"),
             InlineKeyboardButton("🔄 بروزرسانی", callback_data="dash:refresh")
         ]
     ]
@@ -125,8 +126,8 @@ async def show_full_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    db = context.bot_data['db']
-    stats = db.get_statistics()
+    db = context.bot_data['adb']
+    stats = await db.get_statistics()
     
     text = "📊 **آمار کامل سیستم**\n"
     text += "═" * 30 + "\n\n"
@@ -177,37 +178,19 @@ async def show_users_management(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
     
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    # آمار کاربران
-    conn = db._get_conn()
-    cursor = conn.cursor()
-    
-    # کل کاربران
-    cursor.execute("SELECT COUNT(*) FROM users")
-    total = cursor.fetchone()[0]
+    # کل کاربران و کاربران امروز (از جدول آمار روزانه)
+    users = await db.get_user_summary()
+    total = users['total']
+    today = users['today']
+    reachable = users['reachable']
     
     # کاربران فعال (دارای سفارش)
-    cursor.execute("""
-        SELECT COUNT(DISTINCT user_id) FROM orders
-    """)
-    active = cursor.fetchone()[0]
-    
-    # کاربران امروز
-    cursor.execute("""
-        SELECT COUNT(*) FROM users 
-        WHERE DATE(created_at) = DATE('now')
-    """)
-    today = cursor.fetchone()[0]
+    active = await db.count_customers()
     
     # آخرین کاربران
-    cursor.execute("""
-        SELECT user_id, username, first_name, created_at 
-        FROM users 
-        ORDER BY created_at DESC 
-        LIMIT 5
-    """)
-    recent_users = cursor.fetchall()
+    recent_users = await db.get_recent_users(5)
     
     text = "👥 مدیریت کاربران\n"
     text += "━━━━━━━━━━━━━━━━\n\n"
@@ -216,6 +199,8 @@ async def show_users_management(update: Update, context: ContextTypes.DEFAULT_TY
     text += f"├ کل: {total}\n"
     text += f"├ فعال: {active}\n"
     text += f"├ غیرفعال: {total - active}\n"
+    text += f"├ 📶 قابل دسترس: {reachable}\n"
+    text += f"├ 🚫 بلاک کرده: {total - reachable}\n"
     text += f"└ امروز: {today}\n\n"
     
     text += "🆕 آخرین کاربران:\n"
@@ -263,8 +248,9 @@ async def show_health_status(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await query.answer("Health Checker فعال نیست!", show_alert=True)
         return
     
-    # دریافت گزارش
-    report = health_checker.get_health_report()
+    # دریافت گزارش (کوئری‌ها و psutil خارج از event loop)
+    db = context.bot_data['adb']
+    report = await db.run_read(health_checker.get_health_report)
     
     keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data="dash:main")]]
     
@@ -303,11 +289,26 @@ async def show_cache_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text += f"├ Misses: {stats['misses']}\n"
     text += f"└ Total Requests: {stats['total_requests']}\n\n"
     
+    max_items = stats['max_entries'] or '∞'
+    max_mb = f"{stats['max_bytes'] / 1024 / 1024:.1f} MB" if stats['max_bytes'] else '∞'
+    
     text += f"**💾 ذخیره‌سازی:**\n"
-    text += f"├ Items: {stats['cache_size']}\n"
+    text += f"├ Items: {stats['cache_size']} / {max_items}\n"
+    text += f"├ Memory: {stats['memory_bytes'] / 1024 / 1024:.1f} MB / {max_mb}\n"
     text += f"├ Sets: {stats['sets']}\n"
     text += f"├ Invalidations: {stats['invalidations']}\n"
-    text += f"└ Expirations: {stats['expirations']}\n"
+    text += f"├ Expirations: {stats['expirations']}\n"
+    text += f"├ Evictions: {stats['evictions']}\n"
+    text += f"├ Coalesced: {stats['coalesced']}\n"
+    text += f"└ Stale served: {stats['stale_served']}\n"
+    
+    # hit rate به تفکیک نوع داده (product، packs، user، ...)
+    namespaces = sorted(stats['namespaces'].items(), key=lambda item: -(item[1]['hits'] + item[1]['misses']))
+    if namespaces:
+        text += f"\n**🎯 به تفکیک نوع:**\n"
+        for idx, (namespace, ns_stats) in enumerate(namespaces):
+            prefix = "└" if idx == len(namespaces) - 1 else "├"
+            text += f"{prefix} {namespace}: {ns_stats['hit_rate']}% ({ns_stats['hits']}/{ns_stats['hits'] + ns_stats['misses']})\n"
     
     keyboard = [
         [
@@ -330,6 +331,70 @@ async def show_cache_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
             raise
 
 
+def _sql_preview(sql: str, width: int = 70) -> str:
+    """کوتاه کردن SQL برای نمایش داخل `code` (بدون backtick)"""
+    sql = sql.replace('`', "'")
+    return sql if len(sql) <= width else sql[:width - 1] + '…'
+
+
+async def show_query_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """نمایش پرهزینه‌ترین کوئری‌ها و کوئری‌های کند اخیر"""
+    if update.effective_user.id != ADMIN_ID:
+        return
+    
+    query = update.callback_query
+    await query.answer()
+    
+    db = context.bot_data['adb']
+    stats = await db.get_statement_stats(limit=8)
+    
+    text = "🐢 **کوئری‌های دیتابیس**\n"
+    text += "═" * 30 + "\n\n"
+    
+    if stats['enabled']:
+        text += f"**⏱ پرهزینه‌ترین (زمان کل):**\n"
+        for idx, row in enumerate(stats['statements'], 1):
+            text += f"{idx}. `{_sql_preview(row['name'])}`\n"
+            text += f"   ├ {row['count']} بار | کل: {row['total_ms']:,.0f}ms | ردیف: {row['rows']}\n"
+            text += f"   └ p50: {row['p50_ms']}ms | p95: {row['p95_ms']}ms | p99: {row['p99_ms']}ms\n"
+        if not stats['statements']:
+            text += "هنوز کوئری‌ای ثبت نشده\n"
+        
+        text += f"\n**🐌 کندتر از {stats['slow_ms']:.0f}ms:** {stats['slow_count']}\n"
+        for row in stats['recent_slow'][:3]:
+            text += f"├ {row['at']} | {row['ms']}ms\n"
+            text += f"│ `{_sql_preview(row['sql'])}`\n"
+            if row['plan']:
+                # نام جدول/ایندکس (مثل idx_orders_created_at) بیرون از `code` موجودیت Markdown میسازه
+                text += f"│ 📋 `{_sql_preview(' / '.join(row['plan']), 90)}`\n"
+    else:
+        # بدون DB_QUERY_STATS فقط کوئری‌های رجیستری زمان‌گیری میشن
+        top = await db.get_query_stats(limit=8)
+        text += f"**⏱ کوئری‌های رجیستری (زمان کل):**\n"
+        for idx, row in enumerate(top, 1):
+            text += f"{idx}. `{row['name']}` - {row['count']} بار | کل: {row['total_ms']:,.0f}ms | max: {row['max_ms']}ms\n"
+        if not top:
+            text += "هنوز کوئری‌ای ثبت نشده\n"
+        text += "\nℹ️ برای آمار همه‌ی SQL ها و لاگ کوئری‌های کند DB\\_QUERY\\_STATS=true کنید"
+    
+    keyboard = [
+        [InlineKeyboardButton("🔄 بروزرسانی", callback_data="dash:queries")],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="dash:main")]
+    ]
+    
+    try:
+        await query.edit_message_text(
+            text,
+            parse_mode='Markdown',
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+    except Exception as e:
+        if "Message is not modified" in str(e):
+            await query.answer("✅ اطلاعات به‌روز است", show_alert=False)
+        else:
+            raise
+
+
 async def show_errors(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """نمایش خطاهای اخیر"""
     query = update.callback_query
@@ -388,33 +453,16 @@ async def show_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    db = context.bot_data['db']
-    cursor = db.cursor
-    
-    # تحلیل فروش
-    cursor.execute("""
-        SELECT 
-            DATE(created_at) as date,
-            COUNT(*) as orders,
-            SUM(final_price) as revenue
-        FROM orders
-        WHERE created_at >= DATE('now', '-7 days')
-        AND status IN ('confirmed', 'payment_confirmed')
-        GROUP BY DATE(created_at)
-        ORDER BY date DESC
-    """)
-    sales_data = cursor.fetchall()
+    db = context.bot_data['adb']
+    
+    # تحلیل فروش (از جدول آمار روزانه)
+    sales_data = [
+        (day, orders, revenue)
+        for day, orders, _, _, revenue in await db.get_daily_sales(days=7)
+    ]
     
     # محبوب‌ترین ساعت سفارش
-    cursor.execute("""
-        SELECT strftime('%H', created_at) as hour, COUNT(*) as count
-        FROM orders
-        WHERE created_at >= DATE('now', '-30 days')
-        GROUP BY hour
-        ORDER BY count DESC
-        LIMIT 3
-    """)
-    peak_hours = cursor.fetchall()
+    peak_hours = await db.get_peak_order_hours(days=30, limit=3)
     
     text = "📈 **تحلیل و بررسی**\n"
     text += "═" * 30 + "\n\n"
@@ -503,6 +551,8 @@ async def handle_dashboard_callback(update: Update, context: ContextTypes.DEFAUL
         await show_errors(update, context)
     elif data == "dash:analysis":
         await show_analysis(update, context)
+    elif data == "dash:queries":
+        await show_query_stats(update, context)
     elif data == "dash:refresh":
         await admin_dashboard(update, context)
     elif data == "dash:cache_clear":
@@ -0,0 +1,340 @@
+"""
+موتور تحلیل برداری روی snapshot ستونی سفارشات
+
+به جای کوئری جدا و ساختن لیست پایتونی برای هر نمودار، حقایق سفارش یک بار
+در آرایه‌های NumPy بارگذاری میشن و همه‌ی گزارش‌ها با عملیات برداری حساب میشن:
+- سفارش: id، user_id، زمان (epoch ثانیه، UTC)، کد وضعیت، مبلغ کل/تخفیف/نهایی
+- آیتم: order_id، کد محصول (نام محصول - آمار محصولات حذف شده هم میمونه)، تعداد، مبلغ
+
+بروزرسانی افزایشی است: فقط سفارش‌های بعد از آخرین id دیده شده خونده میشن و
+وضعیت/مبلغ/آیتم‌های سفارش‌های باز (هنوز تایید یا رد نشده) دوباره خونده میشه. اگه
+سفارشی حذف شده باشه یا REBUILD_INTERVAL گذشته باشه کل snapshot از نو ساخته میشه.
+
+استفاده:
+    engine = AnalyticsEngine()
+    engine.refresh(db)                 # روی thread دیتابیس
+    engine.series(30)                  # فروش روزانه‌ی ۳۰ روز اخیر
+    engine.hourly_histogram(30)
+    engine.top_products(10)
+"""
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from database import PAID_STATUSES
+
+SECONDS_PER_DAY = 86400
+
+# وضعیت‌هایی که دیگه عوض نمیشن؛ بقیه در هر refresh دوباره خونده میشن
+FINAL_STATUSES = PAID_STATUSES + ('rejected',)
+
+# حداکثر تعداد پارامتر در یک IN (...)
+_CHUNK = 500
+
+
+def moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    میانگین متحرک (trailing) با cumsum - خروجی هم‌طول ورودی؛
+    چند نقطه‌ی اول میانگین همون تعداد نقطه‌ی موجوده
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if window <= 1 or values.size == 0:
+        return values.copy()
+
+    csum = np.cumsum(values)
+    result = np.empty_like(values)
+    head = min(window, values.size)
+    result[:head] = csum[:head] / np.arange(1, head + 1)
+    result[head:] = (csum[head:] - csum[:-head]) / window
+    return result
+
+
+class AnalyticsEngine:
+    """
+    snapshot ستونی سفارشات + محاسبات برداری گزارش‌ها (thread-safe)
+    """
+
+    # بعد از این مدت (ثانیه) snapshot کامل از نو ساخته میشه
+    REBUILD_INTERVAL = 3600
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status_codes: Dict[str, int] = {}
+        self._product_codes: Dict[str, int] = {}
+        self._product_names: List[str] = []
+        self._reset()
+        self.stats = {'full_loads': 0, 'incremental_loads': 0, 'orders_loaded': 0}
+
+    def _reset(self):
+        self.order_ids = np.empty(0, dtype=np.int64)
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.created = np.empty(0, dtype=np.int64)
+        self.status = np.empty(0, dtype=np.int16)
+        self.gross = np.empty(0, dtype=np.float64)
+        self.discount = np.empty(0, dtype=np.float64)
+        self.net = np.empty(0, dtype=np.float64)
+
+        self.item_order_ids = np.empty(0, dtype=np.int64)
+        self.item_products = np.empty(0, dtype=np.int32)
+        self.item_quantities = np.empty(0, dtype=np.int64)
+        self.item_totals = np.empty(0, dtype=np.float64)
+
+        self.last_order_id = 0
+        self._loaded_at = 0.0
+
+    # ==================== کدگذاری ====================
+
+    def _status_code(self, status: Optional[str]) -> int:
+        status = status or ''
+        code = self._status_codes.get(status)
+        if code is None:
+            code = self._status_codes[status] = len(self._status_codes)
+        return code
+
+    def _product_code(self, name: Optional[str]) -> int:
+        name = name or ''
+        code = self._product_codes.get(name)
+        if code is None:
+            code = self._product_codes[name] = len(self._product_names)
+            self._product_names.append(name)
+        return code
+
+    def _codes(self, statuses) -> np.ndarray:
+        return np.array([self._status_codes[s] for s in statuses if s in self._status_codes], dtype=np.int16)
+
+    # ==================== بارگذاری ====================
+
+    def refresh(self, db) -> int:
+        """
+        بروزرسانی snapshot از دیتابیس (روی thread دیتابیس صدا زده بشه)
+
+        Returns:
+            تعداد سفارش‌های جدید بارگذاری شده
+        """
+        # همه‌ی کوئری‌های یک بروزرسانی از یک snapshot فقط‌خواندنی خونده میشن
+        with self._lock, db.read_snapshot() as conn:
+            full = (
+                time.monotonic() - self._loaded_at > self.REBUILD_INTERVAL
+                or conn.execute(
+                    "SELECT COUNT(*) FROM orders WHERE id <= ?", (self.last_order_id,)
+                ).fetchone()[0] != self.order_ids.size
+            )
+            if full:
+                self._reset()
+                self._loaded_at = time.monotonic()
+                self.stats['full_loads'] += 1
+            else:
+                self._refresh_open_orders(conn)
+                self.stats['incremental_loads'] += 1
+
+            loaded = self._load_new_orders(conn)
+            self.stats['orders_loaded'] += loaded
+            return loaded
+
+    def _load_new_orders(self, conn) -> int:
+        rows = conn.execute("""
+            SELECT id, COALESCE(user_id, 0),
+                   COALESCE(CAST(strftime('%s', created_at) AS INTEGER), -1),
+                   status, COALESCE(total_price, 0), COALESCE(discount_amount, 0), COALESCE(final_price, 0)
+            FROM orders
+            WHERE id > ?
+            ORDER BY id
+        """, (self.last_order_id,)).fetchall()
+
+        if not rows:
+            return 0
+
+        ids, users, created, statuses, gross, discount, net = zip(*rows)
+        first_id, last_id = ids[0], ids[-1]
+
+        self.order_ids = np.concatenate([self.order_ids, np.array(ids, dtype=np.int64)])
+        self.user_ids = np.concatenate([self.user_ids, np.array(users, dtype=np.int64)])
+        self.created = np.concatenate([self.created, np.array(created, dtype=np.int64)])
+        self.status = np.concatenate([
+            self.status, np.array([self._status_code(s) for s in statuses], dtype=np.int16)
+        ])
+        self.gross = np.concatenate([self.gross, np.array(gross, dtype=np.float64)])
+        self.discount = np.concatenate([self.discount, np.array(discount, dtype=np.float64)])
+        self.net = np.concatenate([self.net, np.array(net, dtype=np.float64)])
+
+        # محدود به همین بازه‌ی id تا سفارشی که بین دو کوئری ثبت شده دوبار حساب نشه
+        items = conn.execute("""
+            SELECT order_id, product_name, quantity, line_total
+            FROM order_items
+            WHERE order_id BETWEEN ? AND ?
+        """, (first_id, last_id)).fetchall()
+
+        self._append_items(items)
+
+        self.last_order_id = last_id
+        return len(ids)
+
+    def _append_items(self, items):
+        if not items:
+            return
+
+        order_ids, names, quantities, totals = zip(*items)
+        self.item_order_ids = np.concatenate([self.item_order_ids, np.array(order_ids, dtype=np.int64)])
+        self.item_products = np.concatenate([
+            self.item_products, np.array([self._product_code(n) for n in names], dtype=np.int32)
+        ])
+        self.item_quantities = np.concatenate([self.item_quantities, np.array(quantities, dtype=np.int64)])
+        self.item_totals = np.concatenate([self.item_totals, np.array(totals, dtype=np.float64)])
+
+    def _refresh_open_orders(self, conn):
+        """
+        خواندن دوباره‌ی وضعیت، مبلغ و آیتم‌های سفارش‌هایی که هنوز نهایی نشدن
+
+        ادمین آیتم‌های سفارش باز رو ویرایش میکنه (update_order_items)، پس
+        ردیف‌های آیتم این سفارش‌ها حذف و دوباره اضافه میشن.
+        """
+        open_positions = np.flatnonzero(~np.isin(self.status, self._codes(FINAL_STATUSES)))
+        if not open_positions.size:
+            return
+
+        keep = ~np.isin(self.item_order_ids, self.order_ids[open_positions])
+        self.item_order_ids = self.item_order_ids[keep]
+        self.item_products = self.item_products[keep]
+        self.item_quantities = self.item_quantities[keep]
+        self.item_totals = self.item_totals[keep]
+
+        for start in range(0, open_positions.size, _CHUNK):
+            positions = open_positions[start:start + _CHUNK]
+            ids = self.order_ids[positions].tolist()
+            placeholders = ', '.join('?' * len(ids))
+            self._append_items(conn.execute(f"""
+                SELECT order_id, product_name, quantity, line_total
+                FROM order_items
+                WHERE order_id IN ({placeholders})
+            """, ids).fetchall())
+
+            rows = conn.execute(f"""
+                SELECT id, status, COALESCE(total_price, 0), COALESCE(discount_amount, 0), COALESCE(final_price, 0)
+                FROM orders
+                WHERE id IN ({placeholders})
+            """, ids).fetchall()
+
+            if not rows:
+                continue
+
+            row_ids, statuses, gross, discount, net = zip(*rows)
+            # order_ids مرتبه، پس جای هر id با searchsorted پیدا میشه
+            where = np.searchsorted(self.order_ids, np.array(row_ids, dtype=np.int64))
+            self.status[where] = [self._status_code(s) for s in statuses]
+            self.gross[where] = gross
+            self.discount[where] = discount
+            self.net[where] = net
+
+    # ==================== محاسبات ====================
+
+    @staticmethod
+    def _today() -> int:
+        """شماره‌ی روز فعلی (UTC) - همون date('now') در SQLite"""
+        return int(time.time()) // SECONDS_PER_DAY
+
+    def _window_mask(self, days: Optional[int], statuses) -> np.ndarray:
+        mask = self.created >= 0
+        if statuses is not None:
+            mask &= np.isin(self.status, self._codes(statuses))
+        if days is not None:
+            mask &= self.created // SECONDS_PER_DAY >= self._today() - days
+        return mask
+
+    def series(self, days: int, bucket: str = 'day', statuses=PAID_STATUSES,
+               dense: bool = False) -> Dict[str, np.ndarray]:
+        """
+        جمع سفارش‌ها در بازه‌های روزانه/هفتگی/ماهانه‌ی days روز اخیر
+
+        Args:
+            bucket: 'day'، 'week' (شروع از دوشنبه) یا 'month'
+            dense: بازه‌های بدون سفارش هم با صفر برگردن
+
+        Returns:
+            {'start': datetime64[D], 'orders', 'gross', 'discount', 'net'}
+        """
+        with self._lock:
+            mask = self._window_mask(days, statuses)
+            day = self.created[mask] // SECONDS_PER_DAY
+            values = {
+                'orders': np.ones(day.size),
+                'gross': self.gross[mask],
+                'discount': self.discount[mask],
+                'net': self.net[mask],
+            }
+
+        if bucket == 'day':
+            keys = day
+        elif bucket == 'week':
+            # روز 0 (1970-01-01) پنجشنبه‌ست؛ +3 شروع هفته رو دوشنبه میکنه
+            keys = (day + 3) // 7 * 7 - 3
+        elif bucket == 'month':
+            keys = day.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+        else:
+            raise ValueError(f"Unknown bucket: {bucket}")
+
+        if dense:
+            if bucket == 'day':
+                first = self._today() - days
+                unique = np.arange(first, self._today() + 1)
+            elif keys.size:
+                step = 7 if bucket == 'week' else 1
+                unique = np.arange(keys.min(), keys.max() + 1, step)
+            else:
+                unique = np.empty(0, dtype=np.int64)
+            # سفارش با ساعت جلوتر از ساعت سرور در آخرین بازه حساب میشه
+            inverse = np.minimum(np.searchsorted(unique, keys), max(unique.size - 1, 0))
+        else:
+            unique, inverse = np.unique(keys, return_inverse=True)
+
+        result = {
+            name: np.bincount(inverse, weights=weights, minlength=unique.size)
+            for name, weights in values.items()
+        }
+        result['orders'] = result['orders'].astype(np.int64)
+
+        if bucket == 'month':
+            result['start'] = unique.astype('datetime64[M]').astype('datetime64[D]')
+        else:
+            result['start'] = unique.astype('datetime64[D]')
+        return result
+
+    def hourly_histogram(self, days: int = 30, statuses=None) -> np.ndarray:
+        """تعداد سفارش هر ساعت شبانه‌روز (UTC) در days روز اخیر - آرایه‌ی ۲۴تایی"""
+        with self._lock:
+            created = self.created[self._window_mask(days, statuses)]
+        return np.bincount(created % SECONDS_PER_DAY // 3600, minlength=24)
+
+    def top_products(self, limit: int = 10, statuses=PAID_STATUSES) -> List[Tuple[str, int]]:
+        """پرفروش‌ترین محصولات بر اساس تعداد فروخته شده"""
+        with self._lock:
+            if not self.item_order_ids.size or not self.order_ids.size:
+                return []
+
+            paid = np.isin(self.status, self._codes(statuses))
+            where = np.minimum(np.searchsorted(self.order_ids, self.item_order_ids), self.order_ids.size - 1)
+            item_mask = (self.order_ids[where] == self.item_order_ids) & paid[where]
+
+            sold = np.bincount(self.item_products[item_mask], weights=self.item_quantities[item_mask],
+                               minlength=len(self._product_names))
+            names = list(self._product_names)
+
+        top = np.argsort(-sold, kind='stable')[:limit]
+        return [(names[code], int(sold[code])) for code in top if sold[code] > 0]
+
+    def conversion(self, total_users: int, statuses=PAID_STATUSES) -> dict:
+        """نرخ تبدیل و نرخ تکرار خرید - همون خروجی Analytics.get_conversion_rate"""
+        with self._lock:
+            paid = np.isin(self.status, self._codes(statuses))
+            buyers = int(np.unique(self.user_ids[paid]).size)
+            orders = int(paid.sum())
+
+        return {
+            'total_users': total_users,
+            'buyers': buyers,
+            'non_buyers': total_users - buyers,
+            'conversion_rate': (buyers / total_users * 100) if total_users > 0 else 0,
+            'total_orders': orders,
+            'repeat_rate': (orders / buyers) if buyers > 0 else 0,
+        }
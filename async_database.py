@@ -0,0 +1,374 @@
+"""
+لایه‌ی async روی Database
+
+هندلرها async هستن ولی Database همگام (sync) کار میکنه؛ هر کوئری کند
+(مثلاً انتظار ۳۰ ثانیه‌ای برای قفل نوشتن) کل event loop رو متوقف میکرد.
+این ماژول همه‌ی متدهای عمومی Database رو به صورت awaitable در اختیار میذاره:
+- نوشتن‌ها روی یک thread اختصاصی و سریالی اجرا میشن (فقط یک نویسنده روی SQLite)
+- خواندن‌ها روی N thread جدا اجرا میشن (WAL اجازه‌ی خواندن همزمان میده)
+
+هر thread اجرایی برای یک فراخوان connection از DatabaseConnectionPool میگیره
+و بعد از تموم شدنش به pool برمیگردونه.
+
+اگه DatabaseCache داده بشه، خواندن‌های کاتالوگ، پک، کاربر، سبد و تخفیف
+اول روی خود event loop از کش جواب داده میشن و فقط در miss به thread خواننده میرن.
+miss های همزمان یک کلید (مثلاً ۵۰ کاربر روی یک محصول) منتظر همون یک
+بارگذاری میمونن؛ رکورد stale (اگه فعال باشه) فوراً برگردونده میشه و
+بروزرسانی یک بار در پس‌زمینه انجام میشه.
+
+حالت group commit (اختیاری): نوشتن‌های سبد، سفارش و کیف پول به یک صف
+میرن و یک task نویسنده هر چیزی که در چند میلی‌ثانیه برسه رو در یک تراکنش
+(Database.run_batch) commit میکنه؛ هر فراخوان نتیجه یا خطای خودش رو میگیره.
+"""
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+# متدهایی که فقط می‌خوانند و می‌تونن همزمان روی thread های خواننده اجرا بشن
+# هر متد عمومی دیگه‌ای روی thread نویسنده اجرا میشه
+READ_METHODS = frozenset({
+    'get_product',
+    'get_all_products',
+    'get_packs',
+    'get_pack',
+    'get_user',
+    'get_all_users',
+    'count_users',
+    'get_user_ids',
+    'page_users',
+    'get_recent_users',
+    'get_users_to_probe',
+    'get_cart',
+    'get_order',
+    'get_pending_orders',
+    'get_receipt_orders',
+    'get_waiting_payment_orders',
+    'get_not_shipped_orders',
+    'get_shipped_orders',
+    'get_user_orders',
+    'count_customers',
+    'get_peak_order_hours',
+    'count_cleanable_orders',
+    'get_campaign_totals',
+    'is_order_expired',
+    'get_discount',
+    'get_discount_by_id',
+    'get_all_discounts',
+    'get_user_discount_usage_count',
+    'get_temp_discount',
+    'get_statistics',
+    'get_order_summary',
+    'get_user_summary',
+    'get_daily_sales',
+    'get_broadcast_job',
+    'get_broadcast_jobs',
+    'get_pending_deliveries',
+    'get_broadcast_stats',
+    'get_permanent_wallet',
+    'get_active_temp_wallets',
+    'get_wallet_transactions',
+    'get_wallet_statistics_v2',
+    'get_wallet_balance',
+    'get_query_stats',
+    'get_statement_stats',
+})
+
+# نوشتن‌هایی که در حالت group commit دسته‌ای commit میشن (سبد، سفارش، کیف پول)
+# این متدها باید فقط از Database.transaction() استفاده کنن، نه conn.commit()
+BATCHED_WRITE_METHODS = frozenset({
+    'add_user',
+    'update_user_info',
+    'add_to_cart',
+    'remove_from_cart',
+    'clear_cart',
+    'change_cart_item_quantity',
+    'create_order',
+    'checkout_cart',
+    'update_order_status',
+    'add_receipt',
+    'update_shipping_method',
+    'update_order_items',
+    'mark_order_shipped',
+    'update_order_wallet_payment',
+    'use_discount',
+    'save_temp_discount',
+    'clear_temp_discount',
+    'add_permanent_wallet',
+    'add_temp_wallet',
+    'deduct_permanent_wallet',
+    'deduct_temp_wallet',
+    'deduct_wallet',
+    'add_wallet_credit',
+})
+
+
+class AsyncDatabase:
+    """
+    Facade async روی Database
+
+    استفاده:
+        adb = AsyncDatabase(db)
+        product = await adb.get_product(product_id)
+        await adb.add_to_cart(user_id, product_id, pack_id)
+    """
+
+    def __init__(self, db, readers: int = 4, max_pending: int = 256,
+                 group_commit: bool = False, batch_window_ms: float = 5, max_batch: int = 64,
+                 cache=None):
+        """
+        Args:
+            db: نمونه‌ی Database
+            cache: نمونه‌ی DatabaseCache برای read-through (اختیاری)
+            readers: تعداد thread های خواننده
+            max_pending: حداکثر تعداد کوئری در صف (برای محدود نگه داشتن حافظه)
+            group_commit: فعال‌سازی commit دسته‌ای برای BATCHED_WRITE_METHODS
+            batch_window_ms: مدت انتظار برای جمع کردن نوشتن‌های یک دسته
+            max_batch: حداکثر تعداد عملیات در یک تراکنش
+        """
+        self.db = db
+        self.cache = cache
+        self.readers = max(1, readers)
+        self.group_commit = group_commit
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._queue = None
+        self._writer_task = None
+        self._batch = []
+        self.batch_stats = {'batches': 0, 'operations': 0, 'largest_batch': 0}
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._reader = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="db-reader")
+        self._max_pending = max_pending
+        self._semaphore = None
+        self._wrappers = {}
+        self._inflight = {}
+        self._closed = False
+
+        mode = f", group commit {batch_window_ms}ms" if group_commit else ""
+        logger.info(f"✅ AsyncDatabase initialized (1 writer, {self.readers} readers{mode})")
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Semaphore باید داخل event loop ساخته بشه"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_pending)
+        return self._semaphore
+
+    async def _run(self, executor, func, *args, **kwargs):
+        """اجرای یک تابع sync روی executor داده شده"""
+        if self._closed:
+            raise RuntimeError("AsyncDatabase is closed")
+
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self._call_and_release, func, *args, **kwargs)
+
+        async with self._get_semaphore():
+            return await loop.run_in_executor(executor, call)
+
+    def _call_and_release(self, func, *args, **kwargs):
+        """اجرا روی thread executor و برگردوندن connection به pool"""
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.db.release_conn()
+
+    async def run_read(self, func, *args, **kwargs):
+        """
+        اجرای یک تابع خواندنی دلخواه روی thread های خواننده
+
+        برای کوئری‌های ad-hoc یا توابعی مثل DatabaseCache.get_* که
+        ممکنه به دیتابیس برسن.
+        """
+        return await self._run(self._reader, func, *args, **kwargs)
+
+    async def run_write(self, func, *args, **kwargs):
+        """اجرای یک تابع نوشتنی دلخواه روی thread نویسنده"""
+        return await self._run(self._writer, func, *args, **kwargs)
+
+    async def iter_user_ids(self, chunk_size: int = 1000):
+        """
+        نسخه‌ی async از Database.iter_user_ids
+
+        هر تکه جداگانه روی thread خواننده خوانده میشه؛ event loop بین تکه‌ها آزاده.
+        """
+        after_id = 0
+        while True:
+            chunk = await self._run(self._reader, self.db.get_user_ids, after_id, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+            after_id = chunk[-1]
+
+    async def _submit_batched(self, method, *args, **kwargs):
+        """قرار دادن یک نوشتن در صف group commit و انتظار برای نتیجه‌ی خودش"""
+        if self._closed:
+            raise RuntimeError("AsyncDatabase is closed")
+
+        loop = asyncio.get_running_loop()
+
+        if self._writer_task is None or self._writer_task.done():
+            self._queue = asyncio.Queue()
+            self._writer_task = loop.create_task(self._writer_loop())
+
+        future = loop.create_future()
+
+        async with self._get_semaphore():
+            self._queue.put_nowait((method, args, kwargs, future))
+            return await future
+
+    async def _writer_loop(self):
+        """task نویسنده: جمع کردن نوشتن‌ها در پنجره‌ی زمانی و commit یکجا"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = self._batch = [await self._queue.get()]
+
+            # صبر کوتاه تا نوشتن‌های همزمان به همین دسته برسن
+            if self.batch_window > 0:
+                await asyncio.sleep(self.batch_window)
+
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            calls = [(method, args, kwargs) for method, args, kwargs, _ in batch]
+
+            try:
+                results = await loop.run_in_executor(
+                    self._writer, self._call_and_release, self.db.run_batch, calls
+                )
+            except Exception as e:
+                results = [(False, e) for _ in batch]
+
+            self.batch_stats['batches'] += 1
+            self.batch_stats['operations'] += len(batch)
+            self.batch_stats['largest_batch'] = max(self.batch_stats['largest_batch'], len(batch))
+
+            for (_, _, _, future), (ok, value) in zip(batch, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+            self._batch = []
+            for _ in batch:
+                self._queue.task_done()
+
+    def _load_once(self, name: str, *args) -> asyncio.Future:
+        """
+        single-flight روی event loop: برای هر کلید فقط یک task بارگذاری
+
+        بقیه‌ی درخواست‌های همون کلید به همین task وصل میشن.
+        """
+        key = self.cache.key_for(name, *args)
+        task = self._inflight.get(key)
+
+        if task is not None:
+            self.cache.cache.record('coalesced')
+            return task
+
+        task = asyncio.ensure_future(self._run(self._reader, self.cache.load, name, *args))
+        self._inflight[key] = task
+
+        def _done(t):
+            if self._inflight.get(key) is t:
+                del self._inflight[key]
+            if not t.cancelled():
+                t.exception()  # جلوگیری از هشدار "exception was never retrieved"
+
+        task.add_done_callback(_done)
+        return task
+
+    def __getattr__(self, name: str):
+        # فقط وقتی صدا زده میشه که attribute عادی پیدا نشه
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        wrapper = self._wrappers.get(name)
+        if wrapper is not None:
+            return wrapper
+
+        method = getattr(self.db, name)
+        if not callable(method):
+            return method
+
+        if self.cache is not None and self.cache.handles(name):
+            cache = self.cache
+
+            @functools.wraps(method)
+            async def wrapper(*args, **kwargs):
+                if kwargs:
+                    return await self._run(self._reader, method, *args, **kwargs)
+
+                # hit مستقیم روی event loop - بدون رفتن به thread pool
+                hit, value, stale = cache.lookup(name, *args)
+                if hit:
+                    if stale:
+                        self._load_once(name, *args)  # بروزرسانی در پس‌زمینه
+                    return value
+
+                # shield: لغو یک فراخوان، بارگذاری مشترک بقیه رو لغو نکنه
+                return await asyncio.shield(self._load_once(name, *args))
+        elif self.group_commit and name in BATCHED_WRITE_METHODS:
+            @functools.wraps(method)
+            async def wrapper(*args, **kwargs):
+                return await self._submit_batched(method, *args, **kwargs)
+        else:
+            executor = self._reader if name in READ_METHODS else self._writer
+
+            @functools.wraps(method)
+            async def wrapper(*args, **kwargs):
+                return await self._run(executor, method, *args, **kwargs)
+
+        self._wrappers[name] = wrapper
+        return wrapper
+
+    async def aclose(self):
+        """بستن بعد از ثبت همه‌ی نوشتن‌های صف group commit (خاموش شدن تمیز)"""
+        if self._closed:
+            return
+
+        self._closed = True
+        if self._writer_task is not None and not self._writer_task.done():
+            await self._queue.join()
+        self._shutdown()
+
+    def close(self):
+        """
+        بستن executor ها (کارهای در حال اجرا تموم میشن)
+
+        نوشتن‌هایی که هنوز در صف group commit هستن اجرا نمیشن و future
+        هاشون با RuntimeError تموم میشه؛ برای تخلیه‌ی صف از aclose استفاده کنید.
+        """
+        if self._closed:
+            return
+
+        self._closed = True
+        self._shutdown()
+
+    def _shutdown(self):
+        pending = list(self._batch)
+        if self._queue is not None:
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+
+        if self._writer_task is not None and not self._writer_task.done():
+            self._writer_task.cancel()
+
+        for _, _, _, future in pending:
+            if future.done():
+                continue
+            try:
+                future.set_exception(RuntimeError("AsyncDatabase closed before the write was confirmed"))
+            except RuntimeError:
+                # event loop قبلاً بسته شده و کسی منتظر نتیجه نیست
+                pass
+        if pending:
+            logger.warning(f"⚠️ AsyncDatabase closed with {len(pending)} unconfirmed writes")
+
+        self._reader.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        logger.info("✅ AsyncDatabase executors shut down")
@@ -1,15 +1,56 @@
 """
 سیستم بکاپ خودکار دیتابیس
+
+✅ بکاپ آنلاین با VACUUM INTO: یک snapshot سازگار از دیتابیس WAL (شامل
+   تغییرات داخل فایل -wal) بدون توقف نوشتن‌ها؛ shutil.copy2 روی دیتابیس
+   در حال کار ممکن بود نسخه‌ی ناقص بگیره.
+   (backup API با گام‌های صفحه‌ای در هر نوشتن از اول شروع میشه و روی ربات
+   شلوغ ممکنه هیچ‌وقت تموم نشه؛ VACUUM INTO فقط یک تراکنش خواندنی میگیره)
+✅ بررسی سلامت نسخه با PRAGMA integrity_check
+✅ فشرده‌سازی جریانی gzip قبل از ارسال
+✅ همه‌ی کارهای سنگین خارج از event loop (asyncio.to_thread)
+✅ بکاپ افزایشی (اختیاری): هر چند دقیقه فقط صفحه‌های تغییر کرده از آخرین
+   بکاپ در پوشه‌ی archive ذخیره میشن (زنجیره‌ی full + incremental با manifest)
+   و با دستور restore میشه دیتابیس رو در هر لحظه‌ی دلخواه بازسازی کرد:
+       python backup_scheduler.py restore --at "2026-01-01 12:00" --output restored.db
 """
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
 import os
 import shutil
+import sqlite3
+import struct
+import threading
+import time
 import logging
 from datetime import datetime
 from telegram.ext import ContextTypes
-from config import DATABASE_NAME, BACKUP_FOLDER, BACKUP_HOUR, BACKUP_MINUTE, ADMIN_ID
+from config import (
+    DATABASE_NAME, BACKUP_FOLDER, BACKUP_HOUR, BACKUP_MINUTE, ADMIN_ID,
+    BACKUP_INCREMENTAL_MINUTES, BACKUP_CHAIN_LENGTH
+)
 
 logger = logging.getLogger(__name__)
 
+# اندازه‌ی هر تکه در فشرده‌سازی جریانی
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# پوشه‌ی زنجیره‌های بکاپ افزایشی
+ARCHIVE_FOLDER = os.path.join(BACKUP_FOLDER, "archive")
+MANIFEST_NAME = "manifest.json"
+
+# فرمت فایل delta: header سپس (شماره صفحه + محتوای صفحه) تا انتهای فایل
+DELTA_MAGIC = b"SQLDELTA"
+DELTA_HEADER = struct.Struct(">8sII")  # magic, page_size, page_count
+PAGE_NUMBER = struct.Struct(">I")
+DIGEST_SIZE = 8
+
+# manifest بین job روزانه و job افزایشی مشترکه
+_archive_lock = threading.Lock()
+
 
 def setup_backup_folder():
     """ایجاد پوشه بکاپ اگر وجود نداشته باشد"""
@@ -18,42 +59,103 @@ def setup_backup_folder():
         logger.info(f"✅ پوشه بکاپ ایجاد شد: {BACKUP_FOLDER}")
 
 
+def verify_backup(path: str):
+    """بررسی سلامت فایل بکاپ؛ در صورت خرابی RuntimeError"""
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+    
+    if result != 'ok':
+        raise RuntimeError(f"integrity_check failed: {result}")
+
+
+def compress_file(source: str, destination: str):
+    """فشرده‌سازی gzip به صورت جریانی (بدون خواندن کل فایل در حافظه)"""
+    with open(source, 'rb') as src, gzip.open(destination, 'wb', compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+
+
+def backup_database(source: str = DATABASE_NAME, folder: str = BACKUP_FOLDER) -> dict:
+    """
+    ساخت بکاپ فشرده و بررسی شده (همگام - روی thread جدا اجرا بشه)
+    
+    Returns:
+        {'path', 'filename', 'db_size', 'size', 'duration'}
+    """
+    started = time.perf_counter()
+    os.makedirs(folder, exist_ok=True)
+    
+    # نام فایل با تاریخ و ساعت
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    raw_path = os.path.join(folder, f"backup_{timestamp}.db")
+    gz_path = raw_path + ".gz"
+    
+    try:
+        conn = sqlite3.connect(source, timeout=30)
+        try:
+            conn.execute("VACUUM INTO ?", (raw_path,))
+        finally:
+            conn.close()
+        
+        verify_backup(raw_path)
+        db_size = os.path.getsize(raw_path)
+        compress_file(raw_path, gz_path)
+    except Exception:
+        if os.path.exists(gz_path):
+            os.remove(gz_path)
+        raise
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+    
+    return {
+        'path': gz_path,
+        'filename': os.path.basename(gz_path),
+        'db_size': db_size,
+        'size': os.path.getsize(gz_path),
+        'duration': time.perf_counter() - started,
+    }
+
+
 async def create_backup(context: ContextTypes.DEFAULT_TYPE):
     """ایجاد بکاپ از دیتابیس"""
     try:
         setup_backup_folder()
         
-        # نام فایل با تاریخ و ساعت
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_filename = f"backup_{timestamp}.db"
-        backup_path = os.path.join(BACKUP_FOLDER, backup_filename)
-        
-        # کپی دیتابیس
-        shutil.copy2(DATABASE_NAME, backup_path)
+        # snapshot، بررسی و فشرده‌سازی خارج از event loop
+        report = await asyncio.to_thread(backup_database)
         
         # حذف بکاپ‌های قدیمی (نگه‌داری فقط 7 بکاپ آخر)
-        cleanup_old_backups(keep_count=7)
+        await asyncio.to_thread(cleanup_old_backups, 7)
         
-        logger.info(f"✅ بکاپ با موفقیت ایجاد شد: {backup_filename}")
+        logger.info(
+            f"✅ بکاپ با موفقیت ایجاد شد: {report['filename']} "
+            f"({report['size'] / 1024:.0f} KB, {report['duration']:.1f}s)"
+        )
         
         # ارسال پیام به ادمین
-        file_size = os.path.getsize(backup_path) / 1024  # KB
+        ratio = report['size'] / report['db_size'] * 100 if report['db_size'] else 0
         await context.bot.send_message(
             ADMIN_ID,
             f"✅ **بکاپ خودکار انجام شد**\n\n"
             f"📅 تاریخ: {datetime.now().strftime('%Y/%m/%d - %H:%M')}\n"
-            f"📦 فایل: `{backup_filename}`\n"
-            f"💾 حجم: {file_size:.2f} KB",
+            f"📦 فایل: `{report['filename']}`\n"
+            f"💾 حجم دیتابیس: {report['db_size'] / 1024:.2f} KB\n"
+            f"🗜 حجم فشرده: {report['size'] / 1024:.2f} KB ({ratio:.0f}%)\n"
+            f"⏱ مدت: {report['duration']:.2f} ثانیه\n"
+            f"🩺 integrity_check: ok",
             parse_mode='Markdown'
         )
         
         # ارسال فایل بکاپ به ادمین
-        with open(backup_path, 'rb') as f:
+        with open(report['path'], 'rb') as f:
             await context.bot.send_document(
                 ADMIN_ID,
                 document=f,
-                filename=backup_filename,
-                caption="📦 فایل بکاپ دیتابیس"
+                filename=report['filename'],
+                caption="📦 فایل بکاپ دیتابیس (gzip)"
             )
         
         return True
@@ -74,8 +176,16 @@ async def create_backup(context: ContextTypes.DEFAULT_TYPE):
         return False
 
 
-def cleanup_old_backups(keep_count=7):
-    """حذف بکاپ‌های قدیمی"""
+def cleanup_old_backups(keep_count=7, archive: str = ARCHIVE_FOLDER):
+    """
+    حذف بکاپ‌های قدیمی
+
+    از بکاپ‌های کامل روزانه keep_count تای آخر و از archive هم keep_count
+    زنجیره‌ی آخر نگه داشته میشن؛ زنجیره همیشه کامل (full + همه‌ی incremental ها)
+    حذف میشه چون incremental بدون full قبلیش قابل بازیابی نیست.
+    """
+    prune_chains(keep_count, archive)
+
     try:
         if not os.path.exists(BACKUP_FOLDER):
             return
@@ -83,7 +193,7 @@ def cleanup_old_backups(keep_count=7):
         # لیست فایل‌های بکاپ
         backups = []
         for filename in os.listdir(BACKUP_FOLDER):
-            if filename.startswith("backup_") and filename.endswith(".db"):
+            if filename.startswith("backup_") and filename.endswith((".db", ".db.gz")):
                 filepath = os.path.join(BACKUP_FOLDER, filename)
                 backups.append((filepath, os.path.getctime(filepath)))
         
@@ -99,6 +209,352 @@ def cleanup_old_backups(keep_count=7):
         logger.error(f"❌ خطا در پاکسازی بکاپ‌های قدیمی: {e}")
 
 
+# ==================== بکاپ افزایشی ====================
+
+def load_manifest(archive: str = ARCHIVE_FOLDER) -> dict:
+    """خواندن manifest زنجیره‌ها (اگه نباشه manifest خالی)"""
+    path = os.path.join(archive, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'version': 1, 'chains': []}
+
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_manifest(archive: str, manifest: dict):
+    """نوشتن اتمیک manifest"""
+    path = os.path.join(archive, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+
+
+def _snapshot(source: str, destination: str):
+    """
+    checkpoint و سپس کپی صفحه به صفحه‌ی دیتابیس (شامل WAL) در یک مرحله
+
+    بر خلاف VACUUM INTO چیدمان صفحه‌ها عیناً حفظ میشه تا بشه صفحه‌ها رو
+    با بکاپ قبلی مقایسه کرد.
+    """
+    src = sqlite3.connect(source, timeout=30)
+    dst = sqlite3.connect(destination)
+    try:
+        # WAL رو کوچک نگه میداره؛ PASSIVE منتظر خواننده/نویسنده‌ها نمیمونه
+        src.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def _page_size(path: str) -> int:
+    """اندازه‌ی صفحه از header فایل SQLite (مقدار 1 یعنی 65536)"""
+    with open(path, 'rb') as f:
+        f.seek(16)
+        value = struct.unpack(">H", f.read(2))[0]
+    return 65536 if value == 1 else value
+
+
+def _iter_pages(path: str, page_size: int):
+    """(شماره صفحه از 1، محتوا) برای همه‌ی صفحه‌های فایل"""
+    with open(path, 'rb') as f:
+        page_number = 1
+        while True:
+            page = f.read(page_size)
+            if not page:
+                return
+            yield page_number, page
+            page_number += 1
+
+
+def _digest(page: bytes) -> bytes:
+    return hashlib.blake2b(page, digest_size=DIGEST_SIZE).digest()
+
+
+def _write_digests(path: str, digests: bytes):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(digests)
+    os.replace(tmp_path, path)
+
+
+def _start_chain(archive: str, snapshot: str, page_size: int, now: datetime) -> dict:
+    """شروع زنجیره‌ی جدید با یک بکاپ کامل از snapshot"""
+    chain_id = now.strftime("%Y%m%d_%H%M%S_%f")
+    filename = f"full_{chain_id}.db.gz"
+    digests = bytearray()
+
+    with gzip.open(os.path.join(archive, filename), 'wb', compresslevel=6) as dst:
+        for _, page in _iter_pages(snapshot, page_size):
+            digests += _digest(page)
+            dst.write(page)
+
+    hashes = f"chain_{chain_id}.hashes"
+    _write_digests(os.path.join(archive, hashes), bytes(digests))
+
+    page_count = len(digests) // DIGEST_SIZE
+    entry = {
+        'kind': 'full',
+        'file': filename,
+        'created_at': now.isoformat(),
+        'page_count': page_count,
+        'pages': page_count,
+        'size': os.path.getsize(os.path.join(archive, filename)),
+    }
+    return {'id': chain_id, 'page_size': page_size, 'hashes': hashes, 'entries': [entry]}
+
+
+def _write_delta(archive: str, chain: dict, snapshot: str, now: datetime):
+    """
+    ذخیره‌ی صفحه‌های تغییر کرده نسبت به آخرین بکاپ زنجیره
+
+    Returns:
+        (entry, digests) یا None اگه هیچ صفحه‌ای تغییر نکرده باشه
+    """
+    page_size = chain['page_size']
+    with open(os.path.join(archive, chain['hashes']), 'rb') as f:
+        previous = f.read()
+
+    filename = f"incr_{now.strftime('%Y%m%d_%H%M%S_%f')}.delta.gz"
+    path = os.path.join(archive, filename)
+    page_count = os.path.getsize(snapshot) // page_size
+    digests = bytearray()
+    changed = 0
+
+    with gzip.open(path, 'wb', compresslevel=6) as dst:
+        dst.write(DELTA_HEADER.pack(DELTA_MAGIC, page_size, page_count))
+
+        for page_number, page in _iter_pages(snapshot, page_size):
+            digest = _digest(page)
+            offset = (page_number - 1) * DIGEST_SIZE
+            digests += digest
+
+            if previous[offset:offset + DIGEST_SIZE] != digest:
+                dst.write(PAGE_NUMBER.pack(page_number))
+                dst.write(page)
+                changed += 1
+
+    # کوچک شدن فایل هم تغییره (با page_count در header اعمال میشه)
+    if changed == 0 and len(digests) == len(previous):
+        os.remove(path)
+        return None
+
+    entry = {
+        'kind': 'incremental',
+        'file': filename,
+        'created_at': now.isoformat(),
+        'page_count': page_count,
+        'pages': changed,
+        'size': os.path.getsize(path),
+    }
+    return entry, bytes(digests)
+
+
+def incremental_backup(source: str = DATABASE_NAME, archive: str = ARCHIVE_FOLDER,
+                       chain_length: int = BACKUP_CHAIN_LENGTH) -> dict:
+    """
+    بکاپ افزایشی (همگام - روی thread جدا اجرا بشه)
+
+    اگه زنجیره‌ای نباشه، زنجیره‌ی فعلی پر شده باشه یا اندازه‌ی صفحه عوض
+    شده باشه یک بکاپ کامل جدید شروع میشه؛ در غیر این صورت فقط صفحه‌های
+    تغییر کرده ذخیره میشن.
+
+    Returns:
+        {'kind', 'chain', 'file', 'pages', 'page_count', 'size', 'duration'}
+        (kind == 'unchanged' اگه از بکاپ قبلی تغییری نبوده)
+    """
+    started = time.perf_counter()
+
+    with _archive_lock:
+        os.makedirs(archive, exist_ok=True)
+        manifest = load_manifest(archive)
+        snapshot = os.path.join(archive, "snapshot.tmp")
+        now = datetime.now()
+
+        try:
+            _snapshot(source, snapshot)
+            verify_backup(snapshot)
+            page_size = _page_size(snapshot)
+
+            chain = manifest['chains'][-1] if manifest['chains'] else None
+            # entries[0] بکاپ کامل پایه‌ست؛ فقط incremental ها با chain_length مقایسه میشن
+            incrementals = len(chain['entries']) - 1 if chain else 0
+            if (chain is None
+                    or chain['page_size'] != page_size
+                    or incrementals >= chain_length
+                    or not os.path.exists(os.path.join(archive, chain['hashes']))):
+                chain = _start_chain(archive, snapshot, page_size, now)
+                manifest['chains'].append(chain)
+                _save_manifest(archive, manifest)
+                entry = chain['entries'][0]
+            else:
+                result = _write_delta(archive, chain, snapshot, now)
+                if result is None:
+                    return {'kind': 'unchanged', 'chain': chain['id'], 'file': None,
+                            'pages': 0, 'page_count': None, 'size': 0,
+                            'duration': time.perf_counter() - started}
+
+                # اول manifest و بعد hash ها: اگه وسط کار قطع بشه delta بعدی
+                # فقط صفحه‌های بیشتری داره و زنجیره همچنان درسته
+                entry, digests = result
+                chain['entries'].append(entry)
+                _save_manifest(archive, manifest)
+                _write_digests(os.path.join(archive, chain['hashes']), digests)
+        finally:
+            if os.path.exists(snapshot):
+                os.remove(snapshot)
+
+    return {
+        'kind': entry['kind'],
+        'chain': chain['id'],
+        'file': entry['file'],
+        'pages': entry['pages'],
+        'page_count': entry['page_count'],
+        'size': entry['size'],
+        'duration': time.perf_counter() - started,
+    }
+
+
+def _apply_delta(path: str, target, page_size: int):
+    """نوشتن صفحه‌های یک فایل delta روی فایل باز target"""
+    with gzip.open(path, 'rb') as src:
+        magic, delta_page_size, page_count = DELTA_HEADER.unpack(src.read(DELTA_HEADER.size))
+        if magic != DELTA_MAGIC or delta_page_size != page_size:
+            raise ValueError(f"Invalid delta file: {os.path.basename(path)}")
+
+        while True:
+            header = src.read(PAGE_NUMBER.size)
+            if not header:
+                break
+
+            page = src.read(page_size)
+            if len(header) != PAGE_NUMBER.size or len(page) != page_size:
+                raise ValueError(f"Truncated delta file: {os.path.basename(path)}")
+
+            page_number = PAGE_NUMBER.unpack(header)[0]
+            target.seek((page_number - 1) * page_size)
+            target.write(page)
+
+    target.truncate(page_count * page_size)
+
+
+def restore_backup(output: str, at: datetime = None, archive: str = ARCHIVE_FOLDER) -> dict:
+    """
+    بازسازی دیتابیس در لحظه‌ی at (پیش‌فرض: آخرین بکاپ)
+
+    آخرین زنجیره‌ای که بکاپ کاملش قبل از at گرفته شده انتخاب میشه و
+    incremental های تا at به ترتیب روی اون اعمال میشن.
+
+    Returns:
+        {'chain', 'restored_at', 'entries', 'size'}
+    """
+    if os.path.exists(output):
+        raise FileExistsError(f"Output already exists: {output}")
+
+    with _archive_lock:
+        manifest = load_manifest(archive)
+        at = at or datetime.now()
+
+        chains = [
+            chain for chain in manifest['chains']
+            if datetime.fromisoformat(chain['entries'][0]['created_at']) <= at
+        ]
+        if not chains:
+            raise LookupError(f"No backup found before {at:%Y-%m-%d %H:%M:%S}")
+
+        chain = chains[-1]
+        entries = [
+            entry for entry in chain['entries']
+            if datetime.fromisoformat(entry['created_at']) <= at
+        ]
+
+        tmp_path = output + ".tmp"
+        try:
+            with gzip.open(os.path.join(archive, entries[0]['file']), 'rb') as src, \
+                    open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+
+            with open(tmp_path, 'r+b') as target:
+                for entry in entries[1:]:
+                    _apply_delta(os.path.join(archive, entry['file']), target, chain['page_size'])
+
+            verify_backup(tmp_path)
+            os.replace(tmp_path, output)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    return {
+        'chain': chain['id'],
+        'restored_at': entries[-1]['created_at'],
+        'entries': len(entries),
+        'size': os.path.getsize(output),
+    }
+
+
+def prune_chains(keep_chains: int = 7, archive: str = ARCHIVE_FOLDER):
+    """حذف زنجیره‌های قدیمی به صورت کامل (full + incremental ها + hash ها)"""
+    try:
+        with _archive_lock:
+            manifest = load_manifest(archive)
+            if len(manifest['chains']) <= keep_chains:
+                return
+
+            split = len(manifest['chains']) - max(0, keep_chains)
+            removed = manifest['chains'][:split]
+            manifest['chains'] = manifest['chains'][split:]
+
+            # اول manifest تا هیچ‌وقت به فایل حذف شده اشاره نکنه
+            _save_manifest(archive, manifest)
+
+            for chain in removed:
+                files = [entry['file'] for entry in chain['entries']] + [chain['hashes']]
+                for filename in files:
+                    path = os.path.join(archive, filename)
+                    if os.path.exists(path):
+                        os.remove(path)
+                logger.info(f"🗑 زنجیره‌ی بکاپ قدیمی حذف شد: {chain['id']} ({len(chain['entries'])} فایل)")
+
+    except Exception as e:
+        logger.error(f"❌ خطا در پاکسازی زنجیره‌های بکاپ: {e}")
+
+
+async def create_incremental_backup(context: ContextTypes.DEFAULT_TYPE):
+    """job بکاپ افزایشی"""
+    try:
+        report = await asyncio.to_thread(incremental_backup)
+
+        if report['kind'] == 'full':
+            await asyncio.to_thread(cleanup_old_backups, 7)
+
+        if report['kind'] != 'unchanged':
+            logger.info(
+                f"💾 بکاپ {report['kind']}: {report['file']} "
+                f"({report['pages']} صفحه، {report['size'] / 1024:.0f} KB، {report['duration']:.2f}s)"
+            )
+        return True
+
+    except Exception as e:
+        logger.error(f"❌ خطا در بکاپ افزایشی: {e}")
+
+        try:
+            await context.bot.send_message(
+                ADMIN_ID,
+                f"❌ **خطا در بکاپ افزایشی**\n\n"
+                f"⚠️ خطا: `{str(e)}`",
+                parse_mode='Markdown'
+            )
+        except:
+            pass
+
+        return False
+
+
 async def manual_backup(update, context):
     """بکاپ دستی توسط ادمین"""
     if update.effective_user.id != ADMIN_ID:
@@ -125,4 +581,48 @@ def setup_backup_job(application):
         name="daily_backup"
     )
     
-    logger.info(f"✅ بکاپ خودکار روزانه فعال شد (ساعت {BACKUP_HOUR}:{BACKUP_MINUTE:02d})")
\ No newline at end of file
+    logger.info(f"✅ بکاپ خودکار روزانه فعال شد (ساعت {BACKUP_HOUR}:{BACKUP_MINUTE:02d})")
+
+    if BACKUP_INCREMENTAL_MINUTES > 0:
+        application.job_queue.run_repeating(
+            create_incremental_backup,
+            interval=BACKUP_INCREMENTAL_MINUTES * 60,
+            first=60,
+            name="incremental_backup"
+        )
+        logger.info(f"✅ بکاپ افزایشی فعال شد (هر {BACKUP_INCREMENTAL_MINUTES} دقیقه)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بکاپ افزایشی و بازیابی دیتابیس")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('list', help="نمایش زنجیره‌های بکاپ")
+    commands.add_parser('backup', help="گرفتن یک بکاپ افزایشی")
+
+    restore = commands.add_parser('restore', help="بازسازی دیتابیس در یک لحظه")
+    restore.add_argument('--at', type=datetime.fromisoformat, default=None,
+                         help='زمان بازیابی، مثلاً "2026-01-01 12:00" (پیش‌فرض: آخرین بکاپ)')
+    restore.add_argument('--output', required=True, help="مسیر فایل دیتابیس خروجی")
+
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for chain in load_manifest()['chains']:
+            print(f"🔗 {chain['id']} (page size {chain['page_size']})")
+            for entry in chain['entries']:
+                print(f"   ├ {entry['created_at']}  {entry['kind']:<11} "
+                      f"{entry['pages']:>7} pages  {entry['size'] / 1024:,.0f} KB")
+
+    elif args.command == 'backup':
+        report = incremental_backup()
+        print(f"✅ {report['kind']}: {report['file']} ({report['pages']} pages)")
+
+    else:
+        report = restore_backup(args.output, args.at)
+        print(f"✅ دیتابیس تا {report['restored_at']} بازسازی شد "
+              f"({report['entries']} فایل از زنجیره‌ی {report['chain']}) → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+بنچمارک group commit
+
+مقایسه‌ی تعداد commit در ثانیه و عملیات در ثانیه برای نوشتن‌های همزمان
+(سبد، سفارش، کیف پول) با و بدون AsyncDatabase(group_commit=True).
+
+اجرا (مثل خود ربات به .env نیاز داره):
+    python bench_group_commit.py --users 200 --rounds 5
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+
+def traced_connect(counter):
+    """
+    _connect ای که COMMIT های واقعی همه‌ی connection ها رو میشمره
+
+    trace callback برای commit ضمنی و BEGIN IMMEDIATE/COMMIT هر دو صدا زده
+    میشه، پس هر دو حالت دقیقاً به یک شکل شمرده میشن.
+    """
+    from database import DatabaseConnectionPool
+
+    connect = DatabaseConnectionPool._connect
+
+    def _connect(pool):
+        conn = connect(pool)
+        conn.set_trace_callback(
+            lambda sql: next(counter) if sql.lstrip().upper().startswith('COMMIT') else None
+        )
+        return conn
+
+    return _connect
+
+
+def build_database(path):
+    """ساخت دیتابیس روی فایل موقت با یک محصول و پک"""
+    from database import Database
+
+    with patch('database.DATABASE_NAME', path):
+        db = Database()
+
+    product_id = db.add_product("محصول بنچمارک", "توضیحات", "photo")
+    pack_id = db.add_pack(product_id, "پک 6 تایی", 6, 300000)
+    return db, product_id, pack_id
+
+
+async def user_session(adb, user_id, product_id, pack_id, rounds):
+    """یک کاربر: افزودن به سبد، ثبت سفارش، تغییر وضعیت و شارژ کیف پول"""
+    await adb.add_user(user_id, f"user{user_id}", "Bench")
+
+    for _ in range(rounds):
+        await adb.add_to_cart(user_id, product_id, pack_id, 1)
+        order_id = await adb.create_order(user_id, [{'product': 'x', 'quantity': 6, 'price': 300000}], 300000)
+        await adb.update_order_status(order_id, 'confirmed')
+        await adb.add_permanent_wallet(user_id, 1000, "بنچمارک")
+        await adb.clear_cart(user_id)
+
+
+async def run_once(group_commit, users, rounds, window_ms):
+    from async_database import AsyncDatabase
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    counter = itertools.count()
+
+    try:
+        with patch('database.DatabaseConnectionPool._connect', traced_connect(counter)):
+            db, product_id, pack_id = build_database(path)
+            adb = AsyncDatabase(db, readers=2, group_commit=group_commit, batch_window_ms=window_ms)
+
+            commits_before = next(counter)
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                user_session(adb, 100000 + i, product_id, pack_id, rounds)
+                for i in range(users)
+            ))
+            duration = time.perf_counter() - start
+
+            operations = users * (1 + rounds * 5)
+            # next خودش یکی اضافه میکنه
+            commits = next(counter) - commits_before - 1
+
+            adb.close()
+            db.close()
+
+            return {
+                'duration': duration,
+                'operations': operations,
+                'commits': commits,
+                'largest_batch': adb.batch_stats['largest_batch'],
+            }
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بنچمارک group commit")
+    parser.add_argument('--users', type=int, default=200, help="تعداد کاربر همزمان")
+    parser.add_argument('--rounds', type=int, default=5, help="تعداد دور خرید برای هر کاربر")
+    parser.add_argument('--window-ms', type=float, default=5, help="پنجره‌ی group commit")
+    args = parser.parse_args()
+
+    print(f"👥 users={args.users} rounds={args.rounds} window={args.window_ms}ms\n")
+
+    for group_commit in (False, True):
+        result = asyncio.run(run_once(group_commit, args.users, args.rounds, args.window_ms))
+        label = "group commit" if group_commit else "per-call commit"
+
+        print(f"📊 {label}")
+        print(f"├ operations:   {result['operations']}")
+        print(f"├ commits:      {result['commits']}")
+        print(f"├ duration:     {result['duration']:.2f}s")
+        print(f"├ ops/sec:      {result['operations'] / result['duration']:,.0f}")
+        print(f"├ commits/sec:  {result['commits'] / result['duration']:,.0f}")
+        if group_commit:
+            print(f"└ largest batch: {result['largest_batch']}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+بنچمارک rate limiter
+
+مقایسه‌ی پیاده‌سازی GCRA فعلی با پیاده‌سازی قبلی (deque برای هر کاربر):
+- تعداد check در ثانیه
+- حافظه به ازای هر کاربر در حال پیگیری (با tracemalloc)
+- تعداد کلیدهای باقیمانده بعد از بیکار شدن کاربرها
+
+اجرا (مثل خود ربات به .env نیاز داره):
+    python bench_rate_limiter.py --users 50000 --checks 200000
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from unittest.mock import patch
+
+
+class DequeRateLimiter:
+    """پیاده‌سازی قبلی: پنجره‌ی لغزان با deque برای هر کاربر (بدون حذف کاربر بیکار)"""
+
+    def __init__(self):
+        self._user_requests = defaultdict(lambda: deque(maxlen=100))
+        self._action_requests = defaultdict(lambda: deque(maxlen=50))
+
+    def check_rate_limit(self, user_id, max_requests=10, window_seconds=10):
+        requests = self._user_requests[user_id]
+        cutoff_time = time.time() - window_seconds
+
+        while requests and requests[0] < cutoff_time:
+            requests.popleft()
+
+        if len(requests) >= max_requests:
+            remaining_time = int(window_seconds - (time.time() - requests[0])) + 1
+            return False, remaining_time, False
+
+        requests.append(time.time())
+        return True, 0, False
+
+    def tracked_keys(self):
+        return len(self._user_requests) + len(self._action_requests)
+
+
+def build_limiters():
+    from rate_limiter import RateLimiter
+
+    return {
+        'deque (old)': DequeRateLimiter,
+        'GCRA': RateLimiter,
+    }
+
+
+def bench_throughput(factory, users, checks):
+    limiter = factory()
+    user_ids = [random.randrange(users) for _ in range(checks)]
+
+    start = time.perf_counter()
+    for user_id in user_ids:
+        limiter.check_rate_limit(user_id, 20, 60)
+    duration = time.perf_counter() - start
+
+    return checks / duration
+
+
+def bench_memory(factory, users):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    limiter = factory()
+    for user_id in range(users):
+        limiter.check_rate_limit(user_id, 20, 60)
+
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return allocated / users, limiter
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بنچمارک rate limiter")
+    parser.add_argument('--users', type=int, default=50000, help="تعداد کاربر یکتا")
+    parser.add_argument('--checks', type=int, default=200000, help="تعداد check برای throughput")
+    args = parser.parse_args()
+
+    print(f"👥 users={args.users} checks={args.checks}\n")
+
+    # لاگ‌های rate limit در بنچمارک لازم نیست
+    with patch('rate_limiter.log_rate_limit'):
+        for label, factory in build_limiters().items():
+            checks_per_sec = bench_throughput(factory, args.users, args.checks)
+            bytes_per_user, limiter = bench_memory(factory, args.users)
+
+            # بعد از گذشت پنجره کاربرها بیکار حساب میشن
+            if hasattr(limiter, 'sweep'):
+                with patch('rate_limiter.time.monotonic', return_value=time.monotonic() + 3600):
+                    limiter.sweep()
+
+            print(f"📊 {label}")
+            print(f"├ checks/sec:      {checks_per_sec:,.0f}")
+            print(f"├ bytes/user:      {bytes_per_user:,.0f}")
+            print(f"└ keys after idle: {limiter.tracked_keys():,}")
+            print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+بنچمارک webhook
+
+آپدیت‌های ساختگی (پیام متنی از چند کاربر) رو با چند connection همزمان به
+webhook ربات در حال اجرا POST میکنه و آپدیت در ثانیه و تأخیر پاسخ رو
+گزارش میده. webhook بعد از قرار گرفتن آپدیت در صف جواب 200 میده، پس عدد
+به‌دست‌اومده سرعت دریافت آپدیت‌هاست؛ پاسخ‌های ربات به کاربرهای ساختگی
+به Telegram میرن، پس ربات رو با توکن یک ربات تستی اجرا کنید.
+
+قبل از بار اصلی بررسی میشه که درخواست بدون secret token درست رد بشه.
+
+اجرا (ربات با WEBHOOK_URL و WEBHOOK_SECRET_TOKEN ثابت در حال اجرا):
+    python bench_webhook.py --url http://127.0.0.1:8443/webhook --secret <token> \\
+        --updates 5000 --concurrency 40
+"""
+import argparse
+import asyncio
+import math
+import os
+import time
+from collections import Counter
+
+import httpx
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# شناسه‌ی کاربرهای ساختگی (دور از شناسه‌های واقعی)
+BASE_USER_ID = 900000000
+
+
+def make_update(update_id, user_id, text):
+    """آپدیت پیام متنی خصوصی با فرمت Bot API"""
+    user = {'id': user_id, 'is_bot': False, 'first_name': 'Bench', 'username': f'bench{user_id}'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private', 'first_name': 'Bench'},
+            'from': user,
+            'text': text,
+        },
+    }
+
+
+def percentile(values, fraction):
+    """صدک با روش nearest-rank (values مرتب شده)"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+async def check_secret(client, url, secret):
+    """درخواست با secret اشتباه باید با 403 رد بشه"""
+    response = await client.post(url, json=make_update(0, BASE_USER_ID, '/start'),
+                                 headers={SECRET_HEADER: secret + 'x'})
+    return response.status_code
+
+
+async def run_load(url, secret, updates, concurrency, users, text, check=True):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {SECRET_HEADER: secret} if secret else {}
+    statuses = Counter()
+    latencies = []
+    next_id = iter(range(1, updates + 1))
+
+    async with httpx.AsyncClient(limits=limits, headers=headers, timeout=30) as client:
+        rejected_status = await check_secret(client, url, secret) if check else None
+
+        async def worker():
+            for update_id in next_id:
+                payload = make_update(update_id, BASE_USER_ID + update_id % users, text)
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, json=payload)
+                    statuses[response.status_code] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        duration = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'duration': duration,
+        'statuses': statuses,
+        'rejected_status': rejected_status,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بنچمارک webhook")
+    parser.add_argument('--url', default='http://127.0.0.1:8443/webhook', help="آدرس محلی webhook")
+    parser.add_argument('--secret', default=os.environ.get('WEBHOOK_SECRET_TOKEN', ''),
+                        help="WEBHOOK_SECRET_TOKEN ربات")
+    parser.add_argument('--updates', type=int, default=2000, help="تعداد آپدیت")
+    parser.add_argument('--concurrency', type=int, default=40, help="تعداد connection همزمان")
+    parser.add_argument('--users', type=int, default=100, help="تعداد کاربر ساختگی")
+    parser.add_argument('--text', default='/start', help="متن پیام آپدیت‌ها")
+    parser.add_argument('--skip-secret-check', action='store_true', help="بدون بررسی رد secret اشتباه")
+    args = parser.parse_args()
+
+    print(f"🌐 {args.url} updates={args.updates} concurrency={args.concurrency} users={args.users}\n")
+
+    result = asyncio.run(run_load(
+        args.url, args.secret, args.updates, max(1, args.concurrency), max(1, args.users),
+        args.text, check=not args.skip_secret_check
+    ))
+    ok = result['statuses'].get(200, 0)
+
+    if result['rejected_status'] is not None:
+        mark = "✅" if result['rejected_status'] == 403 else "❌"
+        print(f"{mark} wrong secret → HTTP {result['rejected_status']}\n")
+
+    print("📊 webhook")
+    print(f"├ accepted:     {ok}/{args.updates}")
+    print(f"├ statuses:     {dict(result['statuses'])}")
+    print(f"├ duration:     {result['duration']:.2f}s")
+    print(f"├ updates/sec:  {ok / result['duration']:,.0f}")
+    print(f"└ latency:      p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms p99={result['p99_ms']:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
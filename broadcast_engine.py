@@ -0,0 +1,268 @@
+"""
+موتور ارسال پیام همگانی
+
+به جای batch های ثابت (۳۰ پیام، ۱ ثانیه صبر) ارسال با یک token bucket
+سراسری روی محدودیت واقعی Telegram (حدود ۳۰ پیام در ثانیه) تنظیم میشه:
+- تعداد محدودی worker همزمان پیام میفرستن و هر کدوم قبل از ارسال یک توکن میگیرن
+- RetryAfter کل ارسال رو به اندازه‌ی خواسته شده متوقف میکنه (back-off سراسری)
+  و همون گیرنده دوباره در صف قرار میگیره
+- خطای شبکه فقط همون گیرنده رو با تاخیر دوباره در صف میذاره؛ worker منتظر نمیمونه
+- گزارش پیشرفت حداکثر هر چند ثانیه یک بار فرستاده میشه
+
+استفاده:
+    engine = BroadcastEngine(send, rate=28, on_progress=report)
+    stats = await engine.run(user_ids)
+"""
+import asyncio
+import logging
+import time
+from typing import AsyncIterable, Awaitable, Callable, Dict, Iterable, Optional, Union
+
+from telegram.error import RetryAfter, TimedOut, NetworkError, Forbidden
+
+logger = logging.getLogger(__name__)
+
+# وضعیت‌های نهایی هر گیرنده
+STATUSES = ('success', 'blocked', 'rate_limited', 'network_error', 'error')
+
+
+def block_reason(error: str) -> str:
+    """نوع Forbidden: حساب حذف شده (deactivated) یا بلاک کردن ربات (blocked)"""
+    return 'deactivated' if 'deactivated' in (error or '').lower() else 'blocked'
+
+
+class TokenBucket:
+    """
+    Token bucket سراسری با امکان توقف موقت (برای RetryAfter)
+
+    Args:
+        rate: تعداد توکن در ثانیه
+        capacity: حداکثر توکن ذخیره (اندازه‌ی burst)
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds: float):
+        """توقف همه‌ی ارسال‌ها تا seconds ثانیه‌ی دیگه"""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        # بعد از توقف بدون burst ادامه میدیم
+        self._tokens = 0
+        self._updated = self._paused_until
+
+    async def acquire(self):
+        """انتظار تا یک توکن آزاد بشه"""
+        while True:
+            now = time.monotonic()
+
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class BroadcastEngine:
+    """
+    ارسال یک پیام به تعداد زیادی گیرنده با سرعت نزدیک به سقف Telegram
+
+    Args:
+        send: coroutine که به یک user_id پیام میفرسته و پیام ارسال شده رو برمیگردونه
+              (خطاهای telegram.error رو بالا میده)
+        rate: حداکثر پیام در ثانیه
+        workers: تعداد ارسال همزمان
+        max_attempts: حداکثر تلاش برای هر گیرنده
+        progress_interval: حداقل فاصله‌ی دو گزارش پیشرفت (ثانیه)
+        on_progress: coroutine(stats) برای گزارش پیشرفت
+        on_result: coroutine(user_id, status, value) بعد از وضعیت نهایی هر گیرنده
+                   (value پیام ارسال شده یا متن خطاست)
+    """
+
+    def __init__(self, send: Callable[[int], Awaitable], rate: float = 28, workers: int = 32,
+                 max_attempts: int = 3, progress_interval: float = 3,
+                 on_progress: Optional[Callable[[Dict], Awaitable]] = None,
+                 on_result: Optional[Callable[[int, str, object], Awaitable]] = None):
+        self.send = send
+        self.bucket = TokenBucket(rate)
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.progress_interval = progress_interval
+        self.on_progress = on_progress
+        self.on_result = on_result
+
+        self.stats = {status: 0 for status in STATUSES}
+        self.stats.update({'total': 0, 'processed': 0, 'retries': 0, 'backoffs': 0})
+        self._queue: Optional[asyncio.Queue] = None
+        self._outstanding = 0
+        self._feeding = True
+        self._done: Optional[asyncio.Event] = None
+        self._retry_tasks = set()
+        self._last_progress = 0.0
+        self._cancelled = False
+        self._in_flight = 0
+
+    def cancel(self):
+        """
+        توقف ارسال؛ گیرنده‌های باقیمانده فرستاده نمیشن
+
+        ارسال‌های در حال انجام تموم میشن تا نتیجه‌شون (on_result) از دست نره.
+        """
+        self._cancelled = True
+        if self._done is not None and self._in_flight == 0:
+            self._done.set()
+
+    async def run(self, recipients: Union[Iterable[int], AsyncIterable[int]]) -> Dict:
+        """
+        ارسال به همه‌ی گیرنده‌ها
+
+        recipients میتونه async iterable هم باشه (مثلاً صفحه‌بندی از دیتابیس).
+
+        Returns:
+            آمار نهایی {'success', 'blocked', 'rate_limited', 'network_error', 'error', 'total', ...}
+        """
+        self._queue = asyncio.Queue(maxsize=self.workers * 4)
+        self._done = asyncio.Event()
+        started = time.monotonic()
+
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        feeder = asyncio.create_task(self._feed(recipients))
+
+        try:
+            await self._done.wait()
+        finally:
+            feeder.cancel()
+            for task in workers + list(self._retry_tasks):
+                task.cancel()
+            await asyncio.gather(feeder, *workers, *self._retry_tasks, return_exceptions=True)
+
+        self.stats['duration'] = time.monotonic() - started
+        self.stats['cancelled'] = self._cancelled
+        await self._report(force=True)
+
+        logger.info(
+            f"📢 Broadcast finished: {self.stats['success']}/{self.stats['total']} "
+            f"in {self.stats['duration']:.1f}s ({self.stats['backoffs']} back-offs)"
+        )
+        return self.stats
+
+    async def _feed(self, recipients):
+        if hasattr(recipients, '__aiter__'):
+            async for user_id in recipients:
+                if self._cancelled:
+                    break
+                await self._enqueue(user_id)
+        else:
+            for user_id in recipients:
+                if self._cancelled:
+                    break
+                await self._enqueue(user_id)
+
+        self._feeding = False
+        self._check_done()
+
+    async def _enqueue(self, user_id: int):
+        self._outstanding += 1
+        self.stats['total'] += 1
+        await self._queue.put((user_id, 1))
+
+    def _check_done(self):
+        if not self._feeding and self._outstanding == 0:
+            self._done.set()
+
+    async def _worker(self):
+        while True:
+            user_id, attempt = await self._queue.get()
+            await self.bucket.acquire()
+
+            if self._cancelled:
+                return
+
+            self._in_flight += 1
+            try:
+                await self._deliver(user_id, attempt)
+            finally:
+                self._in_flight -= 1
+
+            if self._cancelled and self._in_flight == 0:
+                self._done.set()
+
+    async def _deliver(self, user_id: int, attempt: int):
+        """یک ارسال و دسته‌بندی نتیجه‌ی اون"""
+        try:
+            message = await self.send(user_id)
+        except Forbidden as e:
+            # کاربر ربات را بلاک کرده
+            await self._finish(user_id, 'blocked', str(e))
+        except RetryAfter as e:
+            # محدودیت Telegram - همه صبر میکنن، نه فقط این worker
+            self.stats['backoffs'] += 1
+            self.bucket.pause(e.retry_after)
+            logger.warning(f"⚠️ RetryAfter {e.retry_after}s, pausing broadcast")
+            await self._retry(user_id, attempt, 'rate_limited', str(e), delay=0)
+        except (TimedOut, NetworkError) as e:
+            # مشکل شبکه - فقط همین گیرنده با تاخیر دوباره امتحان میشه
+            await self._retry(user_id, attempt, 'network_error', str(e), delay=2 ** (attempt - 1))
+        except Exception as e:
+            logger.error(f"❌ Error sending to {user_id}: {e}")
+            await self._finish(user_id, 'error', str(e))
+        else:
+            await self._finish(user_id, 'success', message)
+
+    async def _retry(self, user_id: int, attempt: int, status: str, error: str, delay: float):
+        if attempt >= self.max_attempts:
+            await self._finish(user_id, status, error)
+            return
+
+        self.stats['retries'] += 1
+        task = asyncio.create_task(self._requeue_later(user_id, attempt + 1, delay))
+        self._retry_tasks.add(task)
+        task.add_done_callback(self._retry_tasks.discard)
+
+    async def _requeue_later(self, user_id: int, attempt: int, delay: float):
+        if delay:
+            await asyncio.sleep(delay)
+        await self._queue.put((user_id, attempt))
+
+    async def _finish(self, user_id: int, status: str, value):
+        self.stats[status] += 1
+        self.stats['processed'] += 1
+
+        if self.on_result is not None:
+            try:
+                await self.on_result(user_id, status, value)
+            except Exception as e:
+                logger.error(f"❌ Broadcast result callback failed for {user_id}: {e}")
+
+        await self._report()
+
+        # فقط بعد از تموم شدن callback ها؛ وگرنه run ممکنه worker رو وسط ثبت نتیجه لغو کنه
+        self._outstanding -= 1
+        self._check_done()
+
+    async def _report(self, force: bool = False):
+        if self.on_progress is None:
+            return
+
+        now = time.monotonic()
+        if not force and now - self._last_progress < self.progress_interval:
+            return
+
+        self._last_progress = now
+        try:
+            await self.on_progress(dict(self.stats))
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to update progress: {e}")
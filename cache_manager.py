@@ -5,111 +5,363 @@
 ✅ TTL (Time To Live)
 ✅ Invalidation خودکار
 ✅ FIX: Memory Leak در Cleanup Thread
+✅ ظرفیت محدود (تعداد و حجم تقریبی) با حذف LRU
+✅ Invalidation با index روی namespace و tag (بدون اسکن کلیدها)
+✅ Single-flight: miss های همزمان یک کلید منتظر یک بارگذاری میمونن
+✅ Stale-while-revalidate (اختیاری)
+
+کلیدها ساختار "namespace:id" دارن (مثل cart:12 یا stats:main)؛
+invalidate_namespace("cart") فقط کلیدهای همون namespace رو حذف میکنه و
+invalidate("cart:1") دیگه cart:10 تا cart:19 رو پاک نمیکنه.
 """
+import sys
 import time
 import logging
+import threading
 import atexit
+from collections import OrderedDict
+from concurrent.futures import Future
 from typing import Any, Optional, Dict, Callable
 from functools import wraps
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
+# ظرفیت پیش‌فرض - حافظه‌ی ربات روی VPS کوچک قابل پیش‌بینی میمونه
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+def make_key(namespace: str, *parts) -> str:
+    """ساخت کلید ساختاریافته - مثال: make_key("cart", 12) برمیگردونه cart:12"""
+    return ":".join([namespace, *(str(part) for part in parts)])
+
+
+def key_namespace(key: str) -> str:
+    """namespace یک کلید (بخش قبل از اولین :)"""
+    return key.split(":", 1)[0]
+
+
+def estimate_size(value: Any, _depth: int = 0) -> int:
+    """
+    تخمین حجم یک مقدار به بایت (sys.getsizeof به صورت بازگشتی روی tuple/list/dict/Row)
+    دقیق نیست ولی برای محدود کردن حافظه‌ی کش کافیه
+    """
+    size = sys.getsizeof(value)
+    
+    if _depth >= 4 or isinstance(value, (str, bytes, int, float, bool, type(None))):
+        return size
+    
+    if isinstance(value, dict):
+        return size + sum(
+            estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1)
+            for k, v in value.items()
+        )
+    
+    try:
+        return size + sum(estimate_size(item, _depth + 1) for item in value)
+    except TypeError:
+        return size
+
 
 class CacheEntry:
     """یک رکورد کش"""
-    def __init__(self, value: Any, ttl: int):
+    def __init__(self, value: Any, ttl: int, size: int = 0, tags: tuple = (), stale_ttl: int = 0):
         self.value = value
         self.created_at = time.time()
         self.ttl = ttl
         self.hits = 0
+        self.size = size
+        self.tags = tags
+        self.stale_ttl = stale_ttl
     
-    def is_expired(self) -> bool:
-        """بررسی انقضای کش"""
+    def is_stale(self) -> bool:
+        """TTL گذشته ولی هنوز در پنجره‌ی stale-while-revalidate قابل استفاده است"""
         if self.ttl == 0:  # بی‌نهایت
             return False
         return (time.time() - self.created_at) > self.ttl
     
+    def is_expired(self) -> bool:
+        """بررسی انقضای کش (بعد از پنجره‌ی stale)"""
+        if self.ttl == 0:  # بی‌نهایت
+            return False
+        return (time.time() - self.created_at) > self.ttl + self.stale_ttl
+    
     def get_age(self) -> float:
         """سن کش به ثانیه"""
         return time.time() - self.created_at
 
 
 class CacheManager:
-    """مدیریت کش"""
+    """
+    مدیریت کش با ظرفیت محدود
+    
+    ترتیب OrderedDict همون ترتیب استفاده است (LRU): هر get/set کلید رو به انتها
+    میبره و وقتی تعداد یا حجم از سقف بیشتر بشه، قدیمی‌ترین‌ها از ابتدا حذف میشن.
+    انقضا lazy است: موقع get و موقع حذف از ابتدای صف چک میشه (O(1)).
+    """
     
-    def __init__(self):
-        self._cache: Dict[str, CacheEntry] = {}
+    def __init__(self, max_entries: Optional[int] = DEFAULT_MAX_ENTRIES,
+                 max_bytes: Optional[int] = DEFAULT_MAX_BYTES):
+        """
+        Args:
+            max_entries: حداکثر تعداد رکورد (None = نامحدود)
+            max_bytes: حداکثر حجم تقریبی به بایت (None = نامحدود)
+        """
+        self._cache: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        # index ها: namespace -> کلیدها و tag -> کلیدها
+        self._namespaces: Dict[str, set] = {}
+        self._tags: Dict[str, set] = {}
+        # نسخه‌ی هر namespace با هر invalidate زیاد میشه؛ بارگذاری که قبل از
+        # invalidate شروع شده نباید داده‌ی قدیمی رو دوباره کش کنه
+        self._epochs: Dict[str, int] = {}
+        self._tag_epoch = 0
+        # آمار hit/miss به تفکیک namespace (product، packs، user، ...)
+        self._namespace_stats: Dict[str, Dict[str, int]] = {}
+        # کش از thread های دیتابیس (AsyncDatabase) و cleanup thread هم استفاده میشه
+        self._lock = threading.RLock()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._bytes = 0
         self._stats = {
             'hits': 0,
             'misses': 0,
             'sets': 0,
             'invalidations': 0,
-            'expirations': 0
+            'expirations': 0,
+            'evictions': 0,
+            'coalesced': 0,
+            'stale_served': 0
         }
     
+    def configure(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        """تغییر ظرفیت کش (مثلاً از روی config در main.py)"""
+        with self._lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self._evict()
+        
+        logger.info(f"💾 Cache capacity: {max_entries or '∞'} items, "
+                    f"{round(max_bytes / 1024 / 1024, 1) if max_bytes else '∞'} MB")
+    
+    def _index(self, key: str, entry: CacheEntry):
+        """اضافه کردن کلید به index های namespace و tag (داخل lock)"""
+        self._namespaces.setdefault(key_namespace(key), set()).add(key)
+        for tag in entry.tags:
+            self._tags.setdefault(tag, set()).add(key)
+    
+    def _unindex(self, index: Dict[str, set], name: str, key: str):
+        keys = index.get(name)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del index[name]
+    
+    def _remove(self, key: str) -> CacheEntry:
+        """حذف یک رکورد و بروزرسانی حجم و index ها (باید داخل lock صدا زده بشه)"""
+        entry = self._cache.pop(key)
+        self._bytes -= entry.size
+        self._unindex(self._namespaces, key_namespace(key), key)
+        for tag in entry.tags:
+            self._unindex(self._tags, tag, key)
+        return entry
+    
+    def _evict(self):
+        """حذف قدیمی‌ترین رکوردها تا وقتی کش به سقف برسه (داخل lock)"""
+        while self._cache and (
+            (self.max_entries is not None and len(self._cache) > self.max_entries)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            key = next(iter(self._cache))
+            entry = self._remove(key)
+            
+            if entry.is_expired():
+                self._stats['expirations'] += 1
+            else:
+                self._stats['evictions'] += 1
+                logger.debug(f"♻️ Cache EVICT: {key}")
+    
+    def _count(self, key: str, result: str):
+        """شمارش hit/miss برای namespace کلید (داخل lock)"""
+        namespace = key_namespace(key)
+        counters = self._namespace_stats.get(namespace)
+        if counters is None:
+            counters = self._namespace_stats[namespace] = {'hits': 0, 'misses': 0}
+        counters[result] += 1
+    
     def get(self, key: str) -> Optional[Any]:
         """دریافت از کش"""
-        if key not in self._cache:
-            self._stats['misses'] += 1
-            return None
-        
-        entry = self._cache[key]
-        
-        # بررسی انقضا
-        if entry.is_expired():
-            self._stats['expirations'] += 1
-            del self._cache[key]
-            return None
-        
-        # Cache hit
-        entry.hits += 1
-        self._stats['hits'] += 1
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                self._count(key, 'misses')
+                return None
+            
+            # بررسی انقضا
+            if entry.is_expired():
+                self._stats['expirations'] += 1
+                self._count(key, 'misses')
+                self._remove(key)
+                return None
+            
+            # رکورد stale برای get معمولی حکم miss داره (get_stale اون رو برمیگردونه)
+            if entry.is_stale():
+                self._stats['misses'] += 1
+                self._count(key, 'misses')
+                return None
+            
+            # Cache hit
+            self._cache.move_to_end(key)
+            entry.hits += 1
+            self._stats['hits'] += 1
+            self._count(key, 'hits')
         
         logger.debug(f"📦 Cache HIT: {key} (age: {entry.get_age():.1f}s, hits: {entry.hits})")
         return entry.value
     
-    def set(self, key: str, value: Any, ttl: int = 300):
+    def get_stale(self, key: str) -> tuple:
+        """
+        دریافت با پشتیبانی از stale-while-revalidate
+        
+        Returns:
+            (value, stale) - اگه stale=True باشه مقدار قدیمیه و باید دوباره بارگذاری بشه
+        """
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None or entry.is_expired():
+                value = self.get(key)
+                return value, False
+            
+            stale = entry.is_stale()
+            self._cache.move_to_end(key)
+            entry.hits += 1
+            self._stats['hits'] += 1
+            self._count(key, 'hits')
+            if stale:
+                self._stats['stale_served'] += 1
+            
+            return entry.value, stale
+    
+    def record(self, stat: str, count: int = 1):
+        """افزایش یک شمارنده‌ی آماری (مثل coalesced)"""
+        with self._lock:
+            self._stats[stat] = self._stats.get(stat, 0) + count
+    
+    def epoch(self, key: str) -> tuple:
+        """نسخه‌ی فعلی namespace کلید؛ قبل از خواندن از دیتابیس گرفته میشه و به set داده میشه"""
+        with self._lock:
+            return self._epochs.get(key_namespace(key), 0), self._tag_epoch
+    
+    def _bump(self, namespace: str):
+        self._epochs[namespace] = self._epochs.get(namespace, 0) + 1
+    
+    def set(self, key: str, value: Any, ttl: int = 300, tags: tuple = (), epoch: tuple = None,
+            stale_ttl: int = 0):
         """ذخیره در کش
         
         Args:
-            key: کلید
+            key: کلید با ساختار namespace:id
             value: مقدار
             ttl: مدت اعتبار به ثانیه (0 = بی‌نهایت)
+            tags: tag های اضافه برای invalidate گروهی (مثلاً "product:5" برای پک‌های محصول)
+            epoch: خروجی epoch() قبل از خواندن؛ اگه در این فاصله invalidate شده باشه ذخیره نمیشه
+            stale_ttl: چند ثانیه بعد از ttl هنوز با get_stale قابل استفاده است
         """
-        self._cache[key] = CacheEntry(value, ttl)
-        self._stats['sets'] += 1
+        size = estimate_size(value) if self.max_bytes is not None else 0
+        
+        with self._lock:
+            if epoch is not None and epoch != (self._epochs.get(key_namespace(key), 0), self._tag_epoch):
+                logger.debug(f"⏭ Cache SKIP (invalidated during load): {key}")
+                return
+            
+            if key in self._cache:
+                self._remove(key)
+            
+            # رکوردی که به تنهایی از کل ظرفیت بزرگ‌تره کش نمیشه
+            if self.max_bytes is not None and size > self.max_bytes:
+                self._stats['evictions'] += 1
+                logger.debug(f"♻️ Cache SKIP (too large): {key} ({size} bytes)")
+                return
+            
+            entry = CacheEntry(value, ttl, size, tuple(tags), stale_ttl)
+            self._cache[key] = entry
+            self._index(key, entry)
+            self._bytes += size
+            self._stats['sets'] += 1
+            self._evict()
         
         logger.debug(f"💾 Cache SET: {key} (ttl: {ttl}s)")
     
     def invalidate(self, key: str):
         """حذف از کش"""
-        if key in self._cache:
-            del self._cache[key]
-            self._stats['invalidations'] += 1
-            logger.debug(f"🗑 Cache INVALIDATE: {key}")
+        with self._lock:
+            self._bump(key_namespace(key))
+            if key in self._cache:
+                self._remove(key)
+                self._stats['invalidations'] += 1
+                logger.debug(f"🗑 Cache INVALIDATE: {key}")
+    
+    def _invalidate_keys(self, keys) -> int:
+        """حذف مجموعه‌ای از کلیدها (داخل lock)"""
+        for key in keys:
+            self._remove(key)
+        self._stats['invalidations'] += len(keys)
+        return len(keys)
+    
+    def invalidate_namespace(self, namespace: str) -> int:
+        """حذف تمام کلیدهای یک namespace - O(تعداد کلیدهای حذف شده)"""
+        with self._lock:
+            self._bump(namespace)
+            count = self._invalidate_keys(list(self._namespaces.get(namespace, ())))
+        
+        logger.debug(f"🗑 Cache INVALIDATE NAMESPACE: {namespace} ({count} items)")
+        return count
+    
+    def invalidate_tag(self, tag: str) -> int:
+        """حذف تمام کلیدهایی که این tag رو دارن (و خود کلید هم‌نام)"""
+        with self._lock:
+            self._tag_epoch += 1
+            keys = set(self._tags.get(tag, ()))
+            if tag in self._cache:
+                keys.add(tag)
+            count = self._invalidate_keys(list(keys))
+        
+        logger.debug(f"🗑 Cache INVALIDATE TAG: {tag} ({count} items)")
+        return count
     
     def invalidate_pattern(self, pattern: str):
-        """حذف تمام کش‌های با الگوی مشخص"""
-        keys_to_delete = [k for k in self._cache.keys() if pattern in k]
-        for key in keys_to_delete:
-            self.invalidate(key)
-        
-        logger.debug(f"🗑 Cache INVALIDATE PATTERN: {pattern} ({len(keys_to_delete)} items)")
+        """
+        سازگاری با API قدیمی: "namespace:" کل namespace رو حذف میکنه
+        و هر چیز دیگه‌ای به عنوان کلید دقیق حذف میشه (دیگه substring نیست)
+        """
+        if pattern.endswith(":"):
+            self.invalidate_namespace(pattern[:-1])
+        else:
+            self.invalidate(pattern)
     
     def clear(self):
         """پاک کردن تمام کش"""
-        count = len(self._cache)
-        self._cache.clear()
+        with self._lock:
+            count = len(self._cache)
+            self._cache.clear()
+            self._namespaces.clear()
+            self._tags.clear()
+            self._bytes = 0
+            # همه‌ی بارگذاری‌های در جریان باطل میشن
+            for namespace in list(self._epochs):
+                self._bump(namespace)
+            self._tag_epoch += 1
         logger.info(f"🗑 Cache CLEARED: {count} items removed")
     
     def cleanup(self):
         """حذف کش‌های منقضی شده"""
-        expired_keys = [k for k, v in self._cache.items() if v.is_expired()]
-        
-        for key in expired_keys:
-            del self._cache[key]
-            self._stats['expirations'] += 1
+        with self._lock:
+            expired_keys = [k for k, v in self._cache.items() if v.is_expired()]
+            
+            for key in expired_keys:
+                self._remove(key)
+                self._stats['expirations'] += 1
         
         if expired_keys:
             logger.info(f"🧹 Cache CLEANUP: {len(expired_keys)} expired items removed")
@@ -124,9 +376,25 @@ class CacheManager:
             'total_requests': total_requests,
             'hit_rate': round(hit_rate, 2),
             'cache_size': len(self._cache),
-            'memory_items': sum(1 for _ in self._cache.values())
+            'memory_items': len(self._cache),
+            'memory_bytes': self._bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'namespaces': self.get_namespace_stats()
         }
     
+    def get_namespace_stats(self) -> Dict[str, Dict]:
+        """hit rate به تفکیک namespace"""
+        with self._lock:
+            result = {}
+            for namespace, counters in self._namespace_stats.items():
+                total = counters['hits'] + counters['misses']
+                result[namespace] = {
+                    **counters,
+                    'hit_rate': round(counters['hits'] / total * 100, 2) if total else 0
+                }
+            return result
+    
     def get_info(self, key: str) -> Optional[Dict]:
         """اطلاعات یک کش"""
         if key not in self._cache:
@@ -187,7 +455,7 @@ def invalidate_cache(key_pattern: str):
     Decorator برای حذف کش پس از اجرای تابع
     
     مثال:
-        @invalidate_cache("product:*")
+        @invalidate_cache("products:")
         def update_product(product_id, data):
             db.update_product(product_id, data)
     """
@@ -204,129 +472,188 @@ def invalidate_cache(key_pattern: str):
 
 # ==================== Cache Helpers برای دیتابیس ====================
 
+# متدهای دیتابیس که read-through کش میشن:
+# متد -> (بخش‌های ثابت کلید، ttl، تابع ساخت tag از روی (args, value))
+READ_THROUGH = {
+    'get_product': (("product",), 600, None),
+    'get_all_products': (("products", "all"), 300, None),
+    'get_packs': (("packs",), 600, lambda args, value: (make_key("product", args[0]),)),
+    'get_pack': (("pack",), 600, lambda args, value: (make_key("product", value[1]),)),
+    'get_user': (("user",), 1800, None),
+    'get_cart': (("cart",), 120, None),
+    'get_discount': (("discount", "code"), 300, None),
+    'get_discount_by_id': (("discount", "id"), 300, None),
+    'get_all_discounts': (("discount", "all"), 300, None),
+    'get_statistics': (("stats", "main"), 60, None),
+}
+
+
 class DatabaseCache:
-    """کش اختصاصی برای عملیات دیتابیس"""
+    """
+    کش read-through برای عملیات دیتابیس
+    
+    lookup() فقط کش رو نگاه میکنه (سریع، روی event loop قابل اجراست) و
+    load() از دیتابیس میخونه و نتیجه رو کش میکنه (روی thread خواننده).
+    AsyncDatabase برای متدهای READ_THROUGH همین دو مرحله رو انجام میده.
+    None (مثلاً محصول حذف شده) کش نمیشه.
+    
+    load() single-flight است: اگه یک کلید در حال بارگذاری باشه، بقیه‌ی
+    thread ها منتظر همون نتیجه میمونن و کوئری تکراری اجرا نمیشه.
+    """
     
-    def __init__(self, db, cache_manager: CacheManager):
+    def __init__(self, db, cache_manager: CacheManager, stale_ttl: int = 0):
+        """
+        Args:
+            stale_ttl: پنجره‌ی stale-while-revalidate به ثانیه (0 = غیرفعال)
+        """
         self.db = db
         self.cache = cache_manager
+        self.stale_ttl = stale_ttl
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
     
-    # محصولات
+    def handles(self, method: str) -> bool:
+        """آیا این متد دیتابیس read-through کش میشه؟"""
+        return method in READ_THROUGH
     
-    def get_product(self, product_id: int):
-        """دریافت محصول با کش"""
-        cache_key = f"product:{product_id}"
-        
-        cached = self.cache.get(cache_key)
-        if cached is not None:
-            return cached
+    def key_for(self, method: str, *args) -> str:
+        parts, _, _ = READ_THROUGH[method]
+        return make_key(*parts, *args)
+    
+    def lookup(self, method: str, *args):
+        """
+        Returns:
+            (hit, value, stale) - stale فقط وقتی stale_ttl فعال باشه True میشه
+        """
+        key = self.key_for(method, *args)
         
-        product = self.db.get_product(product_id)
-        if product:
-            self.cache.set(cache_key, product, ttl=600)  # 10 دقیقه
+        if self.stale_ttl:
+            value, stale = self.cache.get_stale(key)
+        else:
+            value, stale = self.cache.get(key), False
         
-        return product
+        return value is not None, value, stale
     
-    def get_all_products(self):
-        """دریافت تمام محصولات با کش"""
-        cache_key = "products:all"
+    def is_loading(self, method: str, *args) -> bool:
+        """آیا این کلید الان در حال بارگذاری است؟"""
+        return self.key_for(method, *args) in self._inflight
+    
+    def load(self, method: str, *args):
+        """خواندن از دیتابیس و ذخیره در کش (single-flight)"""
+        key = self.key_for(method, *args)
+        
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
         
-        cached = self.cache.get(cache_key)
-        if cached is not None:
-            return cached
+        if not leader:
+            self.cache.record('coalesced')
+            return future.result()
         
-        products = self.db.get_all_products()
-        self.cache.set(cache_key, products, ttl=300)  # 5 دقیقه
+        try:
+            value = self._load(method, key, args)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+    
+    def _load(self, method: str, key: str, args: tuple):
+        _, ttl, make_tags = READ_THROUGH[method]
+        epoch = self.cache.epoch(key)
         
-        return products
+        value = getattr(self.db, method)(*args)
+        
+        if value is not None:
+            tags = make_tags(args, value) if make_tags else ()
+            self.cache.set(key, value, ttl=ttl, tags=tags, epoch=epoch, stale_ttl=self.stale_ttl)
+        
+        return value
+    
+    def _read_through(self, method: str, *args):
+        hit, value, stale = self.lookup(method, *args)
+        if hit and not stale:
+            return value
+        
+        # stale: اگه کس دیگه‌ای در حال بروزرسانیه، مقدار قدیمی کافیه
+        if stale and self.is_loading(method, *args):
+            return value
+        
+        return self.load(method, *args)
+    
+    # محصولات
+    
+    def get_product(self, product_id: int):
+        """دریافت محصول با کش"""
+        return self._read_through('get_product', product_id)
+    
+    def get_all_products(self):
+        """دریافت تمام محصولات با کش"""
+        return self._read_through('get_all_products')
     
     def invalidate_product(self, product_id: int):
-        """حذف کش محصول"""
-        self.cache.invalidate(f"product:{product_id}")
-        self.cache.invalidate("products:all")
+        """حذف کش محصول و پک‌هاش (tag محصول) و لیست محصولات"""
+        self.cache.invalidate_tag(make_key("product", product_id))
+        self.cache.invalidate_namespace("products")
     
     # پک‌ها
     
     def get_packs(self, product_id: int):
         """دریافت پک‌های محصول با کش"""
-        cache_key = f"packs:{product_id}"
-        
-        cached = self.cache.get(cache_key)
-        if cached is not None:
-            return cached
-        
-        packs = self.db.get_packs(product_id)
-        self.cache.set(cache_key, packs, ttl=600)  # 10 دقیقه
-        
-        return packs
+        return self._read_through('get_packs', product_id)
+    
+    def get_pack(self, pack_id: int):
+        """دریافت یک پک با کش"""
+        return self._read_through('get_pack', pack_id)
     
     def invalidate_packs(self, product_id: int):
         """حذف کش پک‌ها"""
-        self.cache.invalidate(f"packs:{product_id}")
+        self.cache.invalidate(make_key("packs", product_id))
     
     # آمار
     
     def get_statistics(self):
         """دریافت آمار با کش"""
-        cache_key = "stats:main"
-        
-        cached = self.cache.get(cache_key)
-        if cached is not None:
-            return cached
-        
-        stats = self.db.get_statistics()
-        self.cache.set(cache_key, stats, ttl=60)  # 1 دقیقه
-        
-        return stats
+        return self._read_through('get_statistics')
     
     def invalidate_statistics(self):
         """حذف کش آمار"""
-        self.cache.invalidate("stats:main")
+        self.cache.invalidate_namespace("stats")
     
     # کاربران
     
     def get_user(self, user_id: int):
         """دریافت کاربر با کش"""
-        cache_key = f"user:{user_id}"
-        
-        cached = self.cache.get(cache_key)
-        if cached is not None:
-            return cached
-        
-        user = self.db.get_user(user_id)
-        if user:
-            self.cache.set(cache_key, user, ttl=1800)  # 30 دقیقه
-        
-        return user
+        return self._read_through('get_user', user_id)
     
     def invalidate_user(self, user_id: int):
         """حذف کش کاربر"""
-        self.cache.invalidate(f"user:{user_id}")
+        self.cache.invalidate(make_key("user", user_id))
     
     # سبد خرید
     
     def get_cart(self, user_id: int):
         """دریافت سبد خرید با کش"""
-        cache_key = f"cart:{user_id}"
-        
-        cached = self.cache.get(cache_key)
-        if cached is not None:
-            return cached
-        
-        cart = self.db.get_cart(user_id)
-        self.cache.set(cache_key, cart, ttl=120)  # 2 دقیقه
-        
-        return cart
+        return self._read_through('get_cart', user_id)
     
     def invalidate_cart(self, user_id: int):
         """حذف کش سبد خرید"""
-        self.cache.invalidate(f"cart:{user_id}")
+        self.cache.invalidate(make_key("cart", user_id))
+    
+    # تخفیف‌ها
+    
+    def get_discount(self, code: str):
+        """دریافت کد تخفیف فعال با کش"""
+        return self._read_through('get_discount', code)
 
 
 # ==================== Auto Cleanup - ✅ FIX Memory Leak ====================
 
-import threading
-
 class CacheCleanupThread(threading.Thread):
     """Thread برای پاکسازی خودکار کش"""
     
@@ -0,0 +1,385 @@
+"""
+رندر نمودارهای گزارش تحلیلی خارج از event loop
+
+رسم با matplotlib (۱۵۰ dpi) برای هر نمودار چند صد میلی‌ثانیه CPU میگیره و
+pyplot هم state سراسری داره که thread-safe نیست. اینجا:
+- هر نمودار با API شیءگرای Figure (بدون pyplot) رسم میشه
+- رسم در یک process pool انجام میشه تا event loop و GIL درگیر نشن
+- PNG نهایی با کلید (گزارش، دوره، اثرانگشت داده) کش میشه؛ کلیک دوباره‌ی
+  ادمین تا وقتی داده عوض نشده (سفارش جدید نیومده) هزینه‌ای نداره
+
+استفاده:
+    renderer = ChartRenderer(workers=2, cache_size=32)
+    png = await renderer.render('sales', 'weekly', data)
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CHART_DPI = 150
+
+# روز های هر دوره برای نمودارهای زمانی
+PERIOD_DAYS = {'daily': 7, 'weekly': 30, 'monthly': 90}
+
+_configured = False
+
+
+def _figure(**kwargs):
+    """ساخت Figure مستقل (بدون pyplot) با تنظیم فونت یک بار در هر process"""
+    global _configured
+    import matplotlib
+    from matplotlib.figure import Figure
+
+    if not _configured:
+        matplotlib.rcParams['font.family'] = 'DejaVu Sans'
+        matplotlib.rcParams['axes.unicode_minus'] = False
+        _configured = True
+
+    return Figure(**kwargs)
+
+
+def _png(fig) -> bytes:
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=CHART_DPI, bbox_inches='tight')
+    return buf.getvalue()
+
+
+def _rotate_labels(ax):
+    from matplotlib.artist import setp
+    setp(ax.xaxis.get_majorticklabels(), rotation=45, ha='right')
+
+
+# ==================== نمودارها ====================
+# ورودی همه‌ی توابع داده‌ی ساده (tuple/dict/آرایه‌ی NumPy) است تا به process دیگه pickle بشه
+
+def render_sales(data, period='weekly') -> bytes:
+    """
+    نمودار فروش - data: {'dates', 'orders', 'sales'} روزهای دارای فروش و
+    {'ma_dates', 'ma'} میانگین متحرک روی همه‌ی روزها (مبالغ به میلیون تومان)
+    """
+    import matplotlib.dates as mdates
+
+    dates = data['dates']
+    order_counts = data['orders']
+    sales = data['sales']
+
+    fig = _figure(figsize=(12, 6))
+    ax1 = fig.subplots()
+
+    color1 = '#3498db'
+    ax1.set_xlabel('Date', fontsize=12)
+    ax1.set_ylabel('Order Count', color=color1, fontsize=12)
+    ax1.plot(dates, order_counts, color=color1, marker='o', linewidth=2, label='Orders')
+    ax1.tick_params(axis='y', labelcolor=color1)
+    ax1.grid(True, alpha=0.3)
+
+    ax2 = ax1.twinx()
+    color2 = '#2ecc71'
+    ax2.set_ylabel('Sales (Million Toman)', color=color2, fontsize=12)
+    ax2.plot(dates, sales, color=color2, marker='s', linewidth=2, label='Sales')
+    if len(data.get('ma', ())):
+        ax2.plot(data['ma_dates'], data['ma'], color=color2, linestyle='--', linewidth=1.5,
+                 alpha=0.7, label=f"Sales ({data['ma_window']}-day avg)")
+    ax2.tick_params(axis='y', labelcolor=color2)
+
+    if period == 'daily':
+        ax1.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
+    else:
+        ax1.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
+
+    _rotate_labels(ax1)
+
+    period_title = {'daily': 'Daily', 'weekly': 'Weekly', 'monthly': 'Monthly'}
+    ax2.set_title(f'{period_title[period]} Sales Report', fontsize=16, fontweight='bold', pad=20)
+
+    fig.tight_layout()
+    return _png(fig)
+
+
+def render_popular(data, period=None) -> bytes:
+    """نمودار محبوب‌ترین محصولات - data: [(product_name, quantity), ...]"""
+    from matplotlib import colormaps
+
+    names = [p[0][:20] + '...' if len(p[0]) > 20 else p[0] for p in data]
+    counts = [p[1] for p in data]
+
+    fig = _figure(figsize=(12, 8))
+    ax = fig.subplots()
+
+    colors = colormaps['viridis']([i/len(names) for i in range(len(names))])
+    bars = ax.barh(names, counts, color=colors, edgecolor='black', linewidth=1.5)
+
+    ax.set_xlabel('Quantity Sold', fontsize=12, fontweight='bold')
+    ax.set_title('Top 10 Popular Products', fontsize=16, fontweight='bold', pad=20)
+    ax.grid(axis='x', alpha=0.3, linestyle='--')
+
+    for bar, count in zip(bars, counts):
+        ax.text(count + max(counts)*0.01, bar.get_y() + bar.get_height()/2,
+                f'{count}', va='center', fontsize=10, fontweight='bold')
+
+    fig.tight_layout()
+    return _png(fig)
+
+
+def render_hourly(data, period=None) -> bytes:
+    """نمودار ساعات شلوغی - data: تعداد سفارش هر ساعت (۲۴ عدد)"""
+    hours = list(range(24))
+    counts = [int(count) for count in data]
+
+    fig = _figure(figsize=(14, 6))
+    ax = fig.subplots()
+
+    colors = ['#e74c3c' if c == max(counts) else '#3498db' for c in counts]
+    bars = ax.bar(hours, counts, color=colors, edgecolor='black', linewidth=1.5, alpha=0.8)
+
+    ax.set_xlabel('Hour of Day', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Number of Orders', fontsize=12, fontweight='bold')
+    ax.set_title('Peak Hours for Orders (Last 30 Days)', fontsize=16, fontweight='bold', pad=20)
+    ax.set_xticks(hours)
+    ax.set_xticklabels([f'{h:02d}:00' for h in hours], rotation=45, ha='right')
+    ax.grid(axis='y', alpha=0.3, linestyle='--')
+
+    avg = sum(counts) / len(counts)
+    ax.axhline(y=avg, color='orange', linestyle='--', linewidth=2, label=f'Average: {avg:.1f}')
+    ax.legend()
+
+    for bar, count in zip(bars, counts):
+        if count > 0:
+            ax.text(bar.get_x() + bar.get_width()/2, bar.get_height() + max(counts)*0.01,
+                    f'{int(count)}', ha='center', va='bottom', fontsize=9, fontweight='bold')
+
+    fig.tight_layout()
+    return _png(fig)
+
+
+def render_revenue(data, period='monthly') -> bytes:
+    """نمودار درآمد - data: {'dates', 'gross', 'net'} (میلیون تومان)"""
+    import matplotlib.dates as mdates
+
+    dates = data['dates']
+    gross = data['gross']
+    net = data['net']
+
+    fig = _figure(figsize=(14, 7))
+    ax = fig.subplots()
+
+    ax.plot(dates, gross, marker='o', linewidth=2, label='Gross Revenue', color='#3498db')
+    ax.plot(dates, net, marker='s', linewidth=2, label='Net Revenue', color='#2ecc71')
+    ax.fill_between(dates, gross, net, alpha=0.2, color='#e74c3c', label='Discounts')
+
+    ax.set_xlabel('Date', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Revenue (Million Toman)', fontsize=12, fontweight='bold')
+    ax.set_title('Revenue Analysis', fontsize=16, fontweight='bold', pad=20)
+    ax.legend(loc='upper left', fontsize=11)
+    ax.grid(True, alpha=0.3, linestyle='--')
+
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
+    _rotate_labels(ax)
+
+    fig.tight_layout()
+    return _png(fig)
+
+
+def render_conversion(data, period=None) -> bytes:
+    """نمودار نرخ تبدیل - data: خروجی Analytics.get_conversion_rate"""
+    fig = _figure(figsize=(14, 6))
+    ax1, ax2 = fig.subplots(1, 2)
+
+    labels1 = ['Buyers', 'Non-Buyers']
+    sizes1 = [data['buyers'], data['non_buyers']]
+    colors1 = ['#2ecc71', '#e74c3c']
+    explode1 = (0.1, 0)
+
+    ax1.pie(sizes1, explode=explode1, labels=labels1, colors=colors1,
+            autopct='%1.1f%%', shadow=True, startangle=90, textprops={'fontsize': 12, 'fontweight': 'bold'})
+    ax1.set_title(f'User Conversion Rate\n{data["conversion_rate"]:.1f}% converted',
+                  fontsize=14, fontweight='bold', pad=20)
+
+    categories = ['Total\nUsers', 'Buyers', 'Total\nOrders']
+    values = [data['total_users'], data['buyers'], data['total_orders']]
+    colors2 = ['#3498db', '#2ecc71', '#f39c12']
+
+    bars = ax2.bar(categories, values, color=colors2, edgecolor='black', linewidth=2, alpha=0.8)
+    ax2.set_ylabel('Count', fontsize=12, fontweight='bold')
+    ax2.set_title(f'Statistics Overview\nRepeat Rate: {data["repeat_rate"]:.2f} orders/buyer',
+                  fontsize=14, fontweight='bold', pad=20)
+    ax2.grid(axis='y', alpha=0.3, linestyle='--')
+
+    for bar, value in zip(bars, values):
+        ax2.text(bar.get_x() + bar.get_width()/2, bar.get_height() + max(values)*0.02,
+                 f'{int(value)}', ha='center', va='bottom', fontsize=12, fontweight='bold')
+
+    fig.tight_layout()
+    return _png(fig)
+
+
+RENDERERS = {
+    'sales': render_sales,
+    'popular': render_popular,
+    'hourly': render_hourly,
+    'revenue': render_revenue,
+    'conversion': render_conversion,
+}
+
+
+def render_chart(report: str, period: Optional[str], data) -> bytes:
+    """رسم نمودار report (در process pool اجرا میشه)"""
+    return RENDERERS[report](data, period)
+
+
+# ==================== سرویس رندر ====================
+
+class ChartRenderer:
+    """
+    رندر نمودارها در process pool با کش PNG
+
+    - کلید کش: (report, period, اثرانگشت داده) - با رسیدن داده‌ی جدید
+      نسخه‌ی قبلی همون گزارش کنار گذاشته میشه
+    - درخواست‌های همزمان برای یک کلید فقط یک بار رسم میشن
+    - workers=0 یعنی رسم در thread (بدون process جدا)
+
+    همه‌ی متدها روی event loop صدا زده میشن، پس قفل لازم نیست.
+    """
+
+    def __init__(self, workers: int = 2, cache_size: int = 32):
+        self.workers = workers
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # key -> png bytes
+        self._inflight = {}          # key -> Task
+        self._executor = None
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'renders': 0,
+            'errors': 0,
+            'render_time': 0.0,
+        }
+
+    @staticmethod
+    def fingerprint(data) -> str:
+        """اثرانگشت داده‌ی نمودار (آرایه‌های NumPy با محتوای کامل، بقیه با repr)"""
+        digest = hashlib.blake2b(digest_size=16)
+
+        def feed(value):
+            if isinstance(value, np.ndarray):
+                digest.update(f"{value.dtype}{value.shape}".encode())
+                digest.update(np.ascontiguousarray(value).tobytes())
+            elif isinstance(value, dict):
+                for key in value:
+                    digest.update(repr(key).encode('utf-8'))
+                    feed(value[key])
+            elif isinstance(value, (list, tuple)):
+                digest.update(b'[')
+                for item in value:
+                    feed(item)
+                digest.update(b']')
+            else:
+                digest.update(repr(value).encode('utf-8'))
+
+        feed(data)
+        return digest.hexdigest()
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self._executor is None and self.workers > 0:
+            # spawn: fork کردن process ای که thread های دیتابیس داره امن نیست
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    async def render(self, report: str, period: Optional[str], data) -> Optional[bytes]:
+        """
+        PNG نمودار report برای data (از کش اگه داده عوض نشده باشه)
+
+        Returns:
+            bytes تصویر، یا None اگه داده‌ای نباشه
+        """
+        if data is None or not len(data):
+            return None
+
+        key = (report, period, self.fingerprint(data))
+
+        png = self._cache.get(key)
+        if png is not None:
+            self._cache.move_to_end(key)
+            self.stats['hits'] += 1
+            return png
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats['coalesced'] += 1
+        else:
+            self.stats['misses'] += 1
+            task = self._inflight[key] = asyncio.ensure_future(self._render(key, report, period, data))
+
+        # shield: لغو یک درخواست، رسم مشترک بقیه رو لغو نکنه
+        return await asyncio.shield(task)
+
+    async def _render(self, key, report: str, period: Optional[str], data) -> bytes:
+        started = time.perf_counter()
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                png = await asyncio.to_thread(render_chart, report, period, data)
+            else:
+                png = await asyncio.get_running_loop().run_in_executor(
+                    executor, render_chart, report, period, data
+                )
+        except BrokenProcessPool:
+            # یک worker مرده - pool بعدی از نو ساخته میشه
+            self.stats['errors'] += 1
+            self._executor = None
+            raise
+        except Exception:
+            self.stats['errors'] += 1
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        elapsed = time.perf_counter() - started
+        self.stats['renders'] += 1
+        self.stats['render_time'] += elapsed
+        logger.debug(f"📊 Chart {report}/{period} rendered in {elapsed * 1000:.0f}ms ({len(png)} bytes)")
+
+        self._store(key, png)
+        return png
+
+    def _store(self, key, png: bytes):
+        # نسخه‌های قبلی همین گزارش دیگه به درد نمیخورن
+        for old_key in [k for k in self._cache if k[:2] == key[:2]]:
+            del self._cache[old_key]
+
+        self._cache[key] = png
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        renders = self.stats['renders']
+        return dict(
+            self.stats,
+            cached=len(self._cache),
+            cache_bytes=sum(len(png) for png in self._cache.values()),
+            avg_render_ms=round(self.stats['render_time'] / renders * 1000, 1) if renders else 0.0,
+        )
+
+    def clear(self):
+        self._cache.clear()
+
+    def close(self):
+        """بستن process pool (رسم‌های در حال انجام لغو میشن)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -23,13 +23,13 @@ async def scheduled_cleanup(context: ContextTypes.DEFAULT_TYPE):
     try:
         logger.info("🧹 شروع پاکسازی خودکار روزانه...")
         
-        db = context.bot_data.get('db')
+        db = context.bot_data.get('adb')
         if not db:
             logger.error("❌ دیتابیس در دسترس نیست!")
             return
         
         # پاکسازی سفارشات قدیمی (بیشتر از 7 روز)
-        report = db.cleanup_old_orders(days_old=7)
+        report = await db.cleanup_old_orders(days_old=7)
         
         if report.get('success'):
             deleted_count = report.get('deleted_count', 0)
@@ -108,13 +108,13 @@ async def manual_cleanup(update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     try:
-        db = context.bot_data.get('db')
+        db = context.bot_data.get('adb')
         if not db:
             await processing_msg.edit_text("❌ خطا: دیتابیس در دسترس نیست!")
             return
         
         # پاکسازی سفارشات قدیمی (بیشتر از 7 روز)
-        report = db.cleanup_old_orders(days_old=7)
+        report = await db.cleanup_old_orders(days_old=7)
         
         if report.get('success'):
             deleted_count = report.get('deleted_count', 0)
@@ -203,42 +203,14 @@ def get_cleanup_stats(db):
     """
     try:
         from datetime import timedelta
+        from database import to_db_timestamp
         
-        conn = db._get_conn()
-        cursor = conn.cursor()
+        cutoff_date = to_db_timestamp(datetime.now() - timedelta(days=7))
         
-        cutoff_date = datetime.now() - timedelta(days=7)
-        
-        # شمارش سفارشات رد شده قدیمی
-        cursor.execute("""
-            SELECT COUNT(*) FROM orders 
-            WHERE status = 'rejected' 
-            AND datetime(created_at) < datetime(?)
-        """, (cutoff_date,))
-        rejected_count = cursor.fetchone()[0]
-        
-        # شمارش سفارشات منقضی شده قدیمی
-        cursor.execute("""
-            SELECT COUNT(*) FROM orders 
-            WHERE datetime(expires_at) < datetime('now')
-            AND status NOT IN ('payment_confirmed', 'confirmed', 'rejected')
-            AND datetime(created_at) < datetime(?)
-        """, (cutoff_date,))
-        expired_count = cursor.fetchone()[0]
-        
-        # شمارش سفارشات تکمیل شده
-        cursor.execute("""
-            SELECT COUNT(*) FROM orders 
-            WHERE status IN ('payment_confirmed', 'confirmed')
-        """)
-        completed_count = cursor.fetchone()[0]
-        
-        return {
-            'rejected_old': rejected_count,
-            'expired_old': expired_count,
-            'completed': completed_count,
-            'total_cleanable': rejected_count + expired_count
-        }
+        # رد شده‌ها و منقضی شده‌های قدیمی + تکمیل شده‌ها
+        counts = db.count_cleanable_orders(cutoff_date)
+        counts['total_cleanable'] = counts['rejected_old'] + counts['expired_old']
+        return counts
         
     except Exception as e:
         logger.error(f"❌ خطا در دریافت آمار پاکسازی: {e}")
@@ -250,11 +222,11 @@ async def send_cleanup_report(context: ContextTypes.DEFAULT_TYPE):
     ارسال گزارش وضعیت پاکسازی به ادمین
     """
     try:
-        db = context.bot_data.get('db')
+        db = context.bot_data.get('adb')
         if not db:
             return
         
-        stats = get_cleanup_stats(db)
+        stats = await db.run_read(get_cleanup_stats, db.db)
         if not stats:
             return
         
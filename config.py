@@ -38,6 +38,20 @@ ADMIN_ID = int(get_env('ADMIN_ID', required=True))
 # username کانال بدون @ - مثال: mychannel
 CHANNEL_USERNAME = get_env('CHANNEL_USERNAME', required=True)
 
+# آدرس عمومی https برای webhook (خالی = long polling)، مثال: https://bot.example.com
+WEBHOOK_URL = get_env('WEBHOOK_URL', default='', required=False)
+
+# آدرس و پورت سرور محلی webhook و مسیر آن
+WEBHOOK_LISTEN = get_env('WEBHOOK_LISTEN', default='0.0.0.0', required=False)
+WEBHOOK_PORT = int(get_env('WEBHOOK_PORT', default='8443', required=False))
+WEBHOOK_PATH = get_env('WEBHOOK_PATH', default='webhook', required=False)
+
+# هدر X-Telegram-Bot-Api-Secret-Token (خالی = مقدار تصادفی در هر اجرا)
+WEBHOOK_SECRET_TOKEN = get_env('WEBHOOK_SECRET_TOKEN', default='', required=False)
+
+# حداکثر connection همزمان Telegram به webhook (1 تا 100)
+WEBHOOK_MAX_CONNECTIONS = int(get_env('WEBHOOK_MAX_CONNECTIONS', default='40', required=False))
+
 
 # ==================== Database Configuration ====================
 
@@ -51,6 +65,52 @@ BACKUP_FOLDER = get_env('BACKUP_FOLDER', default='backups', required=False)
 BACKUP_HOUR = int(get_env('BACKUP_HOUR', default='3', required=False))
 BACKUP_MINUTE = int(get_env('BACKUP_MINUTE', default='0', required=False))
 
+# بکاپ افزایشی: هر چند دقیقه فقط صفحه‌های تغییر کرده (0 = غیرفعال)
+BACKUP_INCREMENTAL_MINUTES = int(get_env('BACKUP_INCREMENTAL_MINUTES', default='0', required=False))
+
+# تعداد بکاپ افزایشی در هر زنجیره قبل از شروع یک بکاپ کامل جدید
+BACKUP_CHAIN_LENGTH = int(get_env('BACKUP_CHAIN_LENGTH', default='96', required=False))
+
+# تعداد thread های خواننده‌ی دیتابیس (نوشتن همیشه روی یک thread انجام میشه)
+DB_READER_THREADS = int(get_env('DB_READER_THREADS', default='4', required=False))
+
+# حداکثر تعداد connection های دیتابیس (بین thread ها به اشتراک گذاشته میشن)
+DB_POOL_SIZE = int(get_env('DB_POOL_SIZE', default='6', required=False))
+
+# حداکثر انتظار برای connection آزاد یا قفل دیتابیس (ثانیه)
+DB_POOL_TIMEOUT = float(get_env('DB_POOL_TIMEOUT', default='30', required=False))
+
+# تعداد connection های فقط‌خواندنی گزارش‌ها و تحلیل (جدا از DB_POOL_SIZE)
+DB_ANALYTICS_CONNECTIONS = int(get_env('DB_ANALYTICS_CONNECTIONS', default='2', required=False))
+
+# تغییر پروفایل PRAGMA، مثلاً "synchronous=FULL,cache_size=-32000"
+DB_PRAGMAS = get_env('DB_PRAGMAS', default='', required=False)
+
+# آمار همه‌ی SQL ها (p50/p95/p99، تعداد ردیف) و لاگ کوئری‌های کند - پیش‌فرض خاموش
+DB_QUERY_STATS = get_env('DB_QUERY_STATS', default='false', required=False).lower() in ('1', 'true', 'yes')
+DB_SLOW_QUERY_MS = float(get_env('DB_SLOW_QUERY_MS', default='200', required=False))
+
+# Group commit: نوشتن‌های سبد/سفارش/کیف پول که در این پنجره (میلی‌ثانیه) برسن یکجا commit میشن
+DB_GROUP_COMMIT = get_env('DB_GROUP_COMMIT', default='false', required=False).lower() in ('1', 'true', 'yes')
+DB_GROUP_COMMIT_WINDOW_MS = float(get_env('DB_GROUP_COMMIT_WINDOW_MS', default='5', required=False))
+
+# ظرفیت کش: حداکثر تعداد رکورد و حجم تقریبی (مگابایت) - 0 یعنی نامحدود
+CACHE_MAX_ENTRIES = int(get_env('CACHE_MAX_ENTRIES', default='5000', required=False))
+CACHE_MAX_MB = float(get_env('CACHE_MAX_MB', default='32', required=False))
+
+# Stale-while-revalidate: چند ثانیه بعد از انقضا مقدار قدیمی برگردونده بشه و در پس‌زمینه بروز بشه (0 = غیرفعال)
+CACHE_STALE_SECONDS = int(get_env('CACHE_STALE_SECONDS', default='0', required=False))
+
+# تعداد process های رسم نمودار گزارش‌ها (0 = رسم در thread) و تعداد PNG های کش شده
+CHART_WORKERS = int(get_env('CHART_WORKERS', default='2', required=False))
+CHART_CACHE_SIZE = int(get_env('CHART_CACHE_SIZE', default='32', required=False))
+
+# محدودیت درخواست هر عملیات به شکل action=max/window_seconds (خالی = مقادیر پیش‌فرض کد)
+RATE_LIMITS = get_env('RATE_LIMITS', default='', required=False)
+
+# سقف سرعت پیام همگانی (پیام در ثانیه) - محدودیت سراسری Telegram حدود ۳۰ است
+BROADCAST_RATE = float(get_env('BROADCAST_RATE', default='28', required=False))
+
 
 # ==================== Payment Configuration ====================
 
@@ -4,13 +4,24 @@
 """
 import sqlite3
 import json
+import os
+import re
 import threading
+import time
 import atexit
 from logger import log_database_operation, log_error
 from datetime import datetime, timedelta, timezone
 from typing import Optional, List
 from contextlib import contextmanager
-from config import DATABASE_NAME
+from urllib.request import pathname2url
+from config import (
+    DATABASE_NAME, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_PRAGMAS,
+    DB_QUERY_STATS, DB_SLOW_QUERY_MS, DB_ANALYTICS_CONNECTIONS
+)
+from queries import (
+    QUERIES, QueryStats,
+    QueryInstrumentation, InstrumentedConnection
+)
 import logging
 import pytz
 
@@ -24,62 +35,502 @@ def get_tehran_now():
     return datetime.now(TEHRAN_TZ)
 
 
-class DatabaseConnectionPool:
-    """مدیریت Connection Pool برای دیتابیس"""
+# فرمت استاندارد ذخیره‌ی زمان: UTC بدون timezone - همون خروجی CURRENT_TIMESTAMP و datetime('now')
+# این فرمت به ترتیب زمانی قابل مقایسه‌ی متنی است، پس شرط‌هایی مثل
+# expires_at > datetime('now') مستقیم از index استفاده می‌کنن
+DB_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# ستون‌های زمانی که در کوئری‌های پرتکرار فیلتر میشن
+TIMESTAMP_COLUMNS = [
+    ('orders', 'created_at'),
+    ('orders', 'expires_at'),
+    ('users', 'created_at'),
+    ('wallet_temp', 'expires_at'),
+    ('wallet_transactions', 'created_at'),
+    ('temp_discount_codes', 'expires_at'),
+]
+
+
+def _order_rollup_sql(row: str, sign: str) -> str:
+    """SQL بروزرسانی daily_order_stats برای ردیف NEW یا OLD یک سفارش (sign: '+' یا '-')"""
+    return f"""
+        INSERT INTO daily_order_stats (day, status, order_count, gross_amount, discount_amount, revenue)
+        VALUES (
+            COALESCE(date({row}.created_at), ''), COALESCE({row}.status, ''), {sign}1,
+            {sign}COALESCE({row}.total_price, 0), {sign}COALESCE({row}.discount_amount, 0),
+            {sign}COALESCE({row}.final_price, 0)
+        )
+        ON CONFLICT(day, status) DO UPDATE SET
+            order_count = order_count + excluded.order_count,
+            gross_amount = gross_amount + excluded.gross_amount,
+            discount_amount = discount_amount + excluded.discount_amount,
+            revenue = revenue + excluded.revenue;
+    """
+
+
+def _user_rollup_sql(row: str, sign: str) -> str:
+    """SQL بروزرسانی daily_user_stats برای ردیف NEW یا OLD یک کاربر"""
+    return f"""
+        INSERT INTO daily_user_stats (day, new_users)
+        VALUES (COALESCE(date({row}.created_at), ''), {sign}1)
+        ON CONFLICT(day) DO UPDATE SET new_users = new_users + excluded.new_users;
+    """
+
+
+# trigger ها آمار روزانه رو در همون تراکنش نوشتن سفارش/کاربر بروز نگه میدارن
+ROLLUP_TRIGGERS = {
+    'trg_orders_rollup_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS trg_orders_rollup_insert AFTER INSERT ON orders
+        BEGIN {_order_rollup_sql('NEW', '+')} END
+    """,
+    'trg_orders_rollup_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS trg_orders_rollup_delete AFTER DELETE ON orders
+        BEGIN {_order_rollup_sql('OLD', '-')} END
+    """,
+    'trg_orders_rollup_update': f"""
+        CREATE TRIGGER IF NOT EXISTS trg_orders_rollup_update
+        AFTER UPDATE OF status, total_price, discount_amount, final_price, created_at ON orders
+        BEGIN {_order_rollup_sql('OLD', '-')} {_order_rollup_sql('NEW', '+')} END
+    """,
+    'trg_users_rollup_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS trg_users_rollup_insert AFTER INSERT ON users
+        BEGIN {_user_rollup_sql('NEW', '+')} END
+    """,
+    'trg_users_rollup_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS trg_users_rollup_delete AFTER DELETE ON users
+        BEGIN {_user_rollup_sql('OLD', '-')} END
+    """,
+}
+
+# وضعیت‌هایی که درآمد حساب میشن
+PAID_STATUSES = ('confirmed', 'payment_confirmed')
+
+_PAID_SQL = "('confirmed', 'payment_confirmed')"
+
+
+def _product_delta_sql(order_id: str, sign: str, where: str = "") -> str:
+    """SQL ثبت delta آمار محصولات برای همه‌ی آیتم‌های یک سفارش (sign: '+' یا '-')"""
+    return f"""
+        INSERT INTO product_stats_deltas (product_name, quantity, revenue, order_date)
+        SELECT oi.product_name, {sign}oi.quantity, {sign}oi.line_total, o.created_at
+        FROM order_items oi
+        JOIN orders o ON o.id = oi.order_id
+        WHERE oi.order_id = {order_id} {where};
+    """
+
+
+# trigger های آمار محصولات: هر بار سفارشی وارد/خارج وضعیت پرداخت شده بشه
+# (یا آیتم‌های سفارش پرداخت شده عوض بشن) delta در product_stats_deltas ثبت میشه
+# و apply_product_stats_deltas بعداً از high-water mark به بعد رو اعمال میکنه
+PRODUCT_STATS_TRIGGERS = {
+    'trg_product_stats_status': f"""
+        CREATE TRIGGER IF NOT EXISTS trg_product_stats_status
+        AFTER UPDATE OF status ON orders
+        WHEN (COALESCE(OLD.status, '') IN {_PAID_SQL}) != (COALESCE(NEW.status, '') IN {_PAID_SQL})
+        BEGIN
+            {_product_delta_sql('NEW.id', '+', f"AND NEW.status IN {_PAID_SQL}")}
+            {_product_delta_sql('NEW.id', '-', f"AND OLD.status IN {_PAID_SQL}")}
+        END
+    """,
+    'trg_product_stats_order_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS trg_product_stats_order_delete
+        BEFORE DELETE ON orders
+        WHEN OLD.status IN {_PAID_SQL}
+        BEGIN {_product_delta_sql('OLD.id', '-')} END
+    """,
+    'trg_product_stats_item_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS trg_product_stats_item_insert
+        AFTER INSERT ON order_items
+        WHEN (SELECT status FROM orders WHERE id = NEW.order_id) IN {_PAID_SQL}
+        BEGIN
+            INSERT INTO product_stats_deltas (product_name, quantity, revenue, order_date)
+            SELECT NEW.product_name, NEW.quantity, NEW.line_total, created_at
+            FROM orders WHERE id = NEW.order_id;
+        END
+    """,
+    'trg_product_stats_item_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS trg_product_stats_item_delete
+        AFTER DELETE ON order_items
+        WHEN (SELECT status FROM orders WHERE id = OLD.order_id) IN {_PAID_SQL}
+        BEGIN
+            INSERT INTO product_stats_deltas (product_name, quantity, revenue, order_date)
+            SELECT OLD.product_name, -OLD.quantity, -OLD.line_total, created_at
+            FROM orders WHERE id = OLD.order_id;
+        END
+    """,
+}
+
+# ساختار product_stats (برای ساخت جدول سایه در بازسازی کامل هم استفاده میشه)
+PRODUCT_STATS_COLUMNS = """
+    product_name TEXT PRIMARY KEY,
+    total_sold INTEGER DEFAULT 0,
+    total_revenue REAL DEFAULT 0,
+    last_order_date TIMESTAMP,
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+"""
+
+# گروه‌های مخاطب پیام همگانی: هر کدوم یک SELECT از user_id روی جداول index دار
+# (پارامتر ? در صورت نیاز، مثل کد تخفیف). کاربران بلاک‌شده همیشه حذف میشن.
+AUDIENCE_SEGMENTS = {
+    'all': "SELECT user_id FROM users",
+    'recent_buyers': """
+        SELECT DISTINCT user_id FROM orders WHERE created_at >= datetime('now', '-30 days')
+    """,
+    'temp_wallet': """
+        SELECT DISTINCT user_id FROM wallet_temp WHERE expires_at > datetime('now') AND balance > 0
+    """,
+    'cart_not_empty': "SELECT DISTINCT user_id FROM cart",
+    'never_ordered': """
+        SELECT user_id FROM users u WHERE NOT EXISTS (SELECT 1 FROM orders o WHERE o.user_id = u.user_id)
+    """,
+    'used_discount': "SELECT DISTINCT user_id FROM discount_usage WHERE discount_code = ?",
+}
+
+# تغییر وضعیت مجاز پیام همگانی: وضعیت جدید -> وضعیت‌هایی که ازشون میشه رسید
+BROADCAST_TRANSITIONS = {
+    'running': ('pending', 'running', 'paused'),
+    'paused': ('pending', 'running'),
+    'cancelled': ('pending', 'running', 'paused'),
+    'completed': ('running',),
+}
+
+
+def to_db_timestamp(dt: datetime) -> str:
+    """
+    تبدیل datetime به فرمت استاندارد دیتابیس (UTC)
+    datetime بدون timezone به عنوان ساعت محلی سرور در نظر گرفته میشه (مثل datetime.now())
+    """
+    return dt.astimezone(timezone.utc).strftime(DB_TIMESTAMP_FORMAT)
+
+
+def from_db_timestamp(value) -> Optional[datetime]:
+    """تبدیل مقدار ذخیره شده (UTC) به datetime با timezone تهران"""
+    if not value:
+        return None
+    
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        dt = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
     
-    def __init__(self, database_name: str):
+    return dt.astimezone(TEHRAN_TZ)
+
+
+# پروفایل پیش‌فرض PRAGMA هر connection (با DB_PRAGMAS قابل تغییر)
+DEFAULT_PRAGMAS = {
+    'synchronous': 'NORMAL',     # در حالت WAL امنه؛ fsync فقط موقع checkpoint
+    'cache_size': '-16000',      # حدود 16MB کش صفحه برای هر connection
+    'mmap_size': '134217728',    # خواندن تا 128MB از فایل با mmap
+    'temp_store': 'MEMORY',
+    'busy_timeout': '5000',      # انتظار برای قفل نوشتن (میلی‌ثانیه)
+}
+
+_PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+_PRAGMA_VALUE = re.compile(r'^-?[A-Za-z0-9_]+$')
+
+
+def parse_pragmas(spec: str) -> dict:
+    """
+    خواندن پروفایل PRAGMA از رشته‌ی تنظیمات
+
+    فرمت: "synchronous=FULL,cache_size=-32000"؛ مقادیر روی DEFAULT_PRAGMAS
+    اعمال میشن. مقدار نامعتبر نادیده گرفته میشه.
+    """
+    pragmas = dict(DEFAULT_PRAGMAS)
+
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+
+        name, _, value = item.partition('=')
+        name, value = name.strip().lower(), value.strip()
+
+        if not _PRAGMA_NAME.match(name) or not _PRAGMA_VALUE.match(value):
+            logger.warning(f"⚠️ Invalid DB_PRAGMAS entry ignored: {item}")
+            continue
+
+        pragmas[name] = value
+
+    return pragmas
+
+
+class DatabaseConnectionPool:
+    """
+    Connection Pool محدود برای دیتابیس
+
+    هر thread در طول یک عملیات connection خودش رو نگه میداره (یک تراکنش
+    چند بار _get_conn صدا میزنه) و با release_connection اون رو به pool
+    برمیگردونه تا thread های دیگه (مثلاً executor های AsyncDatabase) ازش
+    استفاده کنن. thread ای که release نکنه connection رو نگه میداره؛
+    connection thread های تموم شده خودکار پس گرفته میشه.
+
+    - حداکثر max_size connection؛ بیشتر از اون منتظر آزاد شدن میمونه
+    - connection ای که مدتی بیکار بوده قبل از تحویل با SELECT 1 بررسی میشه
+    - PRAGMA ها از پروفایل (DEFAULT_PRAGMAS / DB_PRAGMAS) اعمال میشن
+    - با instrumentation، همه‌ی SQL های connection ها زمان‌گیری میشن (DB_QUERY_STATS)
+    - read_only: connection ها با mode=ro و query_only باز میشن (گزارش‌ها)
+    """
+
+    # connection بیکارتر از این (ثانیه) قبل از تحویل بررسی میشه
+    HEALTH_CHECK_INTERVAL = 60
+
+    # تعداد تلاش دوباره‌ی BEGIN وقتی دیتابیس قفله
+    BUSY_RETRIES = 3
+
+    def __init__(self, database_name: str, max_size: int = 6, timeout: float = 30.0,
+                 pragmas: Optional[dict] = None, statement_cache: int = 256,
+                 instrumentation: Optional[QueryInstrumentation] = None, read_only: bool = False):
         self.database_name = database_name
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.statement_cache = statement_cache
+        self.instrumentation = instrumentation
+        self.read_only = read_only
         self._local = threading.local()
         self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
         self._active_connections = []
-        
+        self._idle = []      # (conn, released_at) - آخرین آزاد شده اول استفاده میشه
+        self._leases = {}    # thread ident -> (thread, conn)
+        self._size = 0       # connection های باز + در حال ساخت
+        self.stats = {
+            'created': 0,
+            'acquired': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'max_wait': 0.0,
+            'timeouts': 0,
+            'health_checks': 0,
+            'replaced': 0,
+            'busy_retries': 0,
+        }
+
         atexit.register(self.cleanup_all)
-        
-    def get_connection(self) -> sqlite3.Connection:
-        """دریافت connection برای thread فعلی"""
-        if not hasattr(self._local, 'connection') or self._local.connection is None:
-            try:
-                conn = sqlite3.connect(
-                    self.database_name,
-                    timeout=30.0,
-                    check_same_thread=False
-                )
-                conn.row_factory = sqlite3.Row
+
+    def _connect(self) -> sqlite3.Connection:
+        """ساخت connection جدید با پروفایل PRAGMA"""
+        if self.read_only:
+            # mode=ro: فایل با دسترسی فقط خواندنی باز میشه (ساخته هم نمیشه)
+            target = f"file:{pathname2url(os.path.abspath(self.database_name))}?mode=ro"
+        else:
+            target = self.database_name
+
+        conn = sqlite3.connect(
+            target,
+            uri=self.read_only,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.statement_cache,
+            factory=InstrumentedConnection if self.instrumentation else sqlite3.Connection
+        )
+        if self.instrumentation:
+            conn.instrumentation = self.instrumentation
+        try:
+            conn.row_factory = sqlite3.Row
+            if self.read_only:
+                conn.execute("PRAGMA query_only = ON")
+            else:
                 conn.execute("PRAGMA foreign_keys = ON")
                 conn.execute("PRAGMA journal_mode = WAL")
-                
-                self._local.connection = conn
-                
-                with self._lock:
-                    self._active_connections.append(conn)
-                
-                logger.debug(f"✅ Connection created for thread {threading.current_thread().name}")
+            for name, value in self.pragmas.items():
+                conn.execute(f"PRAGMA {name} = {value}")
+        except sqlite3.Error:
+            conn.close()
+            raise
+
+        with self._lock:
+            self._active_connections.append(conn)
+            self.stats['created'] += 1
+
+        logger.debug(f"✅ Connection created for thread {threading.current_thread().name}")
+        return conn
+
+    def _is_alive(self, conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn: sqlite3.Connection):
+        """بستن و حذف یک connection از pool (قفل باید گرفته شده باشه)"""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        if conn in self._active_connections:
+            self._active_connections.remove(conn)
+        self._size -= 1
+        self._available.notify()
+
+    def _reclaim_dead_threads(self) -> bool:
+        """پس گرفتن connection thread های تموم شده (قفل باید گرفته شده باشه)"""
+        reclaimed = False
+
+        for ident, (thread, conn) in list(self._leases.items()):
+            if thread.is_alive():
+                continue
+
+            del self._leases[ident]
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.append((conn, time.monotonic()))
+            reclaimed = True
+
+        return reclaimed
+
+    def _acquire(self) -> sqlite3.Connection:
+        """گرفتن یک connection آزاد، ساخت connection جدید یا انتظار"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        conn = None
+
+        with self._available:
+            while True:
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                    break
+
+                if self._size < self.max_size:
+                    self._size += 1
+                    released_at = None
+                    break
+
+                if self._reclaim_dead_threads():
+                    continue
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise sqlite3.OperationalError(
+                        f"connection pool exhausted ({self.max_size} in use)"
+                    )
+
+                waited = True
+                # بیدار شدن دوره‌ای برای پس گرفتن connection thread های تموم شده
+                self._available.wait(min(remaining, 1.0))
+
+            self.stats['acquired'] += 1
+            if waited:
+                wait_time = time.monotonic() - started
+                self.stats['waits'] += 1
+                self.stats['wait_time'] += wait_time
+                self.stats['max_wait'] = max(self.stats['max_wait'], wait_time)
+
+            # connection بیکار مونده قبل از تحویل بررسی میشه
+            check = released_at is not None and started - released_at > self.HEALTH_CHECK_INTERVAL
+            if check:
+                self.stats['health_checks'] += 1
+
+        if conn is not None and check and not self._is_alive(conn):
+            logger.warning("⚠️ Dead database connection replaced")
+            with self._available:
+                self.stats['replaced'] += 1
+                self._discard(conn)
+                self._size += 1
+            conn = None
+
+        if conn is None:
+            try:
+                conn = self._connect()
             except sqlite3.Error as e:
                 logger.error(f"❌ Failed to create connection: {e}")
+                with self._available:
+                    self._size -= 1
+                    self._available.notify()
                 raise
-        
-        return self._local.connection
-    
-    def close_connection(self):
-        """بستن connection thread فعلی"""
-        if hasattr(self._local, 'connection') and self._local.connection is not None:
+
+        with self._lock:
+            self._leases[threading.get_ident()] = (threading.current_thread(), conn)
+
+        return conn
+
+    def get_connection(self) -> sqlite3.Connection:
+        """دریافت connection برای thread فعلی"""
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            conn = self._acquire()
+            self._local.connection = conn
+        return conn
+
+    def release_connection(self):
+        """برگردوندن connection thread فعلی به pool (بعد از پایان یک عملیات)"""
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            return
+
+        self._local.connection = None
+
+        if conn.in_transaction:
+            # تراکنش نیمه‌کاره (مثلاً بعد از خطا) نباید ثبت بشه؛ نوشتن باید
+            # خودش commit کنه یا از transaction() استفاده کنه
+            logger.error("❌ Connection released with an open transaction, rolling back")
+            conn.rollback()
+
+        with self._available:
+            self._leases.pop(threading.get_ident(), None)
+            if conn in self._active_connections:
+                self._idle.append((conn, time.monotonic()))
+                self._available.notify()
+
+    def execute_retrying(self, cursor: sqlite3.Cursor, sql: str):
+        """
+        اجرای BEGIN با تلاش دوباره وقتی دیتابیس قفله
+
+        فقط برای دستورهایی که هنوز چیزی ننوشتن امنه (شروع تراکنش).
+        """
+        for attempt in range(self.BUSY_RETRIES + 1):
             try:
-                self._local.connection.close()
-                
+                return cursor.execute(sql)
+            except sqlite3.OperationalError as e:
+                message = str(e).lower()
+                if attempt == self.BUSY_RETRIES or ('locked' not in message and 'busy' not in message):
+                    raise
+
                 with self._lock:
-                    if self._local.connection in self._active_connections:
-                        self._active_connections.remove(self._local.connection)
-                
-                logger.debug(f"✅ Connection closed for thread {threading.current_thread().name}")
-            except sqlite3.Error as e:
-                logger.error(f"❌ Failed to close connection: {e}")
-            finally:
-                self._local.connection = None
-    
+                    self.stats['busy_retries'] += 1
+                logger.warning(f"⚠️ Database busy, retrying {sql} ({attempt + 1}/{self.BUSY_RETRIES})")
+                time.sleep(0.05 * 2 ** attempt)
+
+    def get_stats(self) -> dict:
+        """آمار pool"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update({
+                'size': self._size,
+                'max_size': self.max_size,
+                'in_use': len(self._leases),
+                'idle': len(self._idle),
+                'avg_wait_ms': round(stats['wait_time'] / stats['waits'] * 1000, 2) if stats['waits'] else 0,
+                'max_wait_ms': round(stats['max_wait'] * 1000, 2),
+            })
+            return stats
+
+    def close_connection(self):
+        """بستن connection thread فعلی"""
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            return
+
+        self._local.connection = None
+
+        with self._available:
+            self._leases.pop(threading.get_ident(), None)
+            if conn in self._active_connections:
+                self._discard(conn)
+
+        logger.debug(f"✅ Connection closed for thread {threading.current_thread().name}")
+
     def cleanup_all(self):
         """بستن تمام connection‌های فعال"""
         logger.info("🧹 Cleaning up all database connections...")
-        
+
         with self._lock:
             for conn in self._active_connections[:]:
                 try:
@@ -87,9 +538,12 @@ class DatabaseConnectionPool:
                     logger.debug(f"✅ Connection closed during cleanup")
                 except Exception as e:
                     logger.error(f"❌ Error closing connection: {e}")
-            
+
             self._active_connections.clear()
-        
+            self._idle.clear()
+            self._leases.clear()
+            self._size = 0
+
         logger.info("✅ All connections cleaned up")
 
 
@@ -103,8 +557,28 @@ class Database:
 
     def __init__(self, cache_manager=None):
         """✅ FIX: حذف self.conn و self.cursor سراسری"""
-        self.pool = DatabaseConnectionPool(DATABASE_NAME)
+        self.pool = DatabaseConnectionPool(
+            DATABASE_NAME,
+            max_size=DB_POOL_SIZE,
+            timeout=DB_POOL_TIMEOUT,
+            pragmas=parse_pragmas(DB_PRAGMAS),
+            # همه‌ی کوئری‌های رجیستری + جا برای کوئری‌های پویا
+            statement_cache=max(256, len(QUERIES) + 128),
+            instrumentation=QueryInstrumentation(DB_SLOW_QUERY_MS) if DB_QUERY_STATS else None
+        )
+        # connection های فقط‌خواندنی جدا برای گزارش‌ها (read_snapshot)
+        self.read_pool = DatabaseConnectionPool(
+            DATABASE_NAME,
+            max_size=DB_ANALYTICS_CONNECTIONS,
+            timeout=DB_POOL_TIMEOUT,
+            pragmas=self.pool.pragmas,
+            instrumentation=self.pool.instrumentation,
+            read_only=True
+        )
+        self.query_stats = QueryStats()
         self.cache_manager = cache_manager
+        # وضعیت group commit برای thread فعلی (فقط thread نویسنده استفاده میکنه)
+        self._batch = threading.local()
         self.create_tables()
         
         logger.info("✅ Database initialized successfully")
@@ -112,6 +586,72 @@ class Database:
     def _get_conn(self) -> sqlite3.Connection:
         """دریافت connection برای thread فعلی"""
         return self.pool.get_connection()
+
+    def release_conn(self):
+        """برگردوندن connection thread فعلی به pool (بعد از هر عملیات executor)"""
+        self.pool.release_connection()
+
+    # ==================== کوئری‌های رجیستری ====================
+
+    def _execute(self, name: str, params=(), cursor: Optional[sqlite3.Cursor] = None) -> sqlite3.Cursor:
+        """
+        اجرای کوئری name از queries.QUERIES با ثبت زمان اجرا
+
+        Args:
+            cursor: cursor تراکنش فعلی؛ اگه نباشه cursor جدید روی connection این thread
+        """
+        if cursor is None:
+            cursor = self._get_conn().cursor()
+
+        started = time.perf_counter()
+        try:
+            cursor.execute(QUERIES[name], params)
+        finally:
+            self.query_stats.record(name, time.perf_counter() - started)
+        return cursor
+
+    def _executemany(self, name: str, seq_of_params, cursor: sqlite3.Cursor) -> sqlite3.Cursor:
+        """نسخه‌ی executemany از _execute"""
+        started = time.perf_counter()
+        try:
+            cursor.executemany(QUERIES[name], seq_of_params)
+        finally:
+            self.query_stats.record(name, time.perf_counter() - started)
+        return cursor
+
+    def _fetchone(self, name: str, params=()):
+        """اجرای کوئری خواندنی و برگردوندن یک ردیف (زمان fetch هم حساب میشه)"""
+        cursor = self._get_conn().cursor()
+        started = time.perf_counter()
+        try:
+            return cursor.execute(QUERIES[name], params).fetchone()
+        finally:
+            self.query_stats.record(name, time.perf_counter() - started)
+
+    def _fetchall(self, name: str, params=()) -> list:
+        """اجرای کوئری خواندنی و برگردوندن همه‌ی ردیف‌ها (زمان fetch هم حساب میشه)"""
+        cursor = self._get_conn().cursor()
+        started = time.perf_counter()
+        try:
+            return cursor.execute(QUERIES[name], params).fetchall()
+        finally:
+            self.query_stats.record(name, time.perf_counter() - started)
+
+    def get_query_stats(self, limit: Optional[int] = None) -> List[dict]:
+        """آمار زمان اجرای کوئری‌ها (پرهزینه‌ترین اول) - QueryStats.snapshot"""
+        return self.query_stats.snapshot(limit)
+
+    def get_statement_stats(self, limit: Optional[int] = None) -> dict:
+        """
+        آمار تک‌تک SQL ها (نرمال‌شده) و کوئری‌های کند اخیر - فقط با DB_QUERY_STATS
+
+        Returns:
+            {'enabled', 'slow_ms', 'slow_count', 'statements', 'recent_slow'}
+        """
+        instrumentation = self.pool.instrumentation
+        if instrumentation is None:
+            return {'enabled': False, 'slow_ms': 0, 'slow_count': 0, 'statements': [], 'recent_slow': []}
+        return dict(instrumentation.snapshot(limit), enabled=True)
     
     def _sanitize_text_input(self, text: str, max_length: int = None) -> str:
         """
@@ -127,14 +667,68 @@ class Database:
         
         return text
     
+    def _in_batch(self) -> bool:
+        """آیا داخل یک group commit (run_batch) هستیم؟"""
+        return getattr(self._batch, 'active', False)
+    
+    @contextmanager
+    def read_snapshot(self):
+        """
+        connection فقط‌خواندنی با یک snapshot ثابت برای گزارش‌ها
+        
+        همه‌ی کوئری‌های داخل بلوک یک نسخه از دیتابیس رو میبینن (تراکنش
+        خواندنی در WAL)، پس نوشتن سفارش‌ها رو block نمیکنن و وضعیت نیمه‌کاره
+        هم نمیبینن. connection جدا از pool اصلیه و هر thread مال خودش رو داره.
+        استفاده‌ی تو در تو همون snapshot بیرونی رو برمیگردونه.
+        
+        استفاده:
+            with db.read_snapshot() as conn:
+                conn.execute("SELECT ...").fetchall()
+        """
+        conn = self.read_pool.get_connection()
+        
+        if conn.in_transaction:
+            yield conn
+            return
+        
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+            self.read_pool.release_connection()
+    
     @contextmanager
     def transaction(self):
-        """Context Manager برای تراکنش‌های دیتابیس"""
+        """
+        Context Manager برای تراکنش‌های دیتابیس
+        
+        داخل run_batch به جای BEGIN/COMMIT از SAVEPOINT استفاده میشه تا
+        خطای یک عملیات فقط همون عملیات رو برگردونه و commit یکجا انجام بشه.
+        """
         conn = self._get_conn()
         cursor = conn.cursor()
         
+        if self._in_batch():
+            self._batch.savepoints += 1
+            savepoint = f"sp_{self._batch.savepoints}"
+            cursor.execute(f"SAVEPOINT {savepoint}")
+            try:
+                yield cursor
+                cursor.execute(f"RELEASE {savepoint}")
+            except Exception as e:
+                cursor.execute(f"ROLLBACK TO {savepoint}")
+                cursor.execute(f"RELEASE {savepoint}")
+                logger.error(f"❌ Batched operation failed: {e}")
+                if isinstance(e, DatabaseError):
+                    raise
+                raise DatabaseError(f"خطای تراکنش: {e}")
+            return
+        
         try:
-            cursor.execute("BEGIN")
+            # IMMEDIATE: قفل نوشتن همین اول گرفته میشه (با تلاش دوباره) و
+            # تراکنش وسط کار به SQLITE_BUSY نمیخوره
+            self.pool.execute_retrying(cursor, "BEGIN IMMEDIATE")
             yield cursor
             conn.commit()
             logger.debug("✅ Transaction committed")
@@ -151,10 +745,77 @@ class Database:
             logger.error(f"❌ Transaction failed: {e}")
             raise DatabaseError(f"خطای تراکنش: {e}")
     
-    def _invalidate_cache(self, pattern: str):
-        """حذف کش مرتبط"""
-        if self.cache_manager:
-            self.cache_manager.invalidate_pattern(pattern)
+    def _invalidate_cache(self, key: str = None, namespace: str = None, tag: str = None):
+        """
+        حذف کش مرتبط: یک کلید دقیق، یک namespace کامل یا همه‌ی کلیدهای یک tag
+        داخل run_batch تا بعد از commit عقب می‌افته؛ وگرنه یک خواننده
+        ممکنه داده‌ی قبل از commit رو دوباره کش کنه.
+        """
+        if self._in_batch():
+            self._batch.invalidations.append((key, namespace, tag))
+            return
+        
+        if not self.cache_manager:
+            return
+        
+        if key:
+            self.cache_manager.invalidate(key)
+        if namespace:
+            self.cache_manager.invalidate_namespace(namespace)
+        if tag:
+            self.cache_manager.invalidate_tag(tag)
+    
+    def run_batch(self, calls: list) -> list:
+        """
+        اجرای چند عملیات نوشتنی در یک تراکنش (group commit)
+        
+        هر عملیات داخل SAVEPOINT خودش اجرا میشه؛ خطای یکی بقیه رو خراب نمیکنه.
+        فقط یک commit (و یک fsync) برای کل دسته انجام میشه.
+        
+        Args:
+            calls: لیست (func, args, kwargs) - func باید متدی از همین Database باشه
+        
+        Returns:
+            لیست (ok, value) به ترتیب calls؛ اگه ok=False باشه value همون exception است
+        """
+        conn = self._get_conn()
+        cursor = conn.cursor()
+        results = []
+        
+        self._batch.active = True
+        self._batch.savepoints = 0
+        self._batch.invalidations = []
+        
+        try:
+            self.pool.execute_retrying(cursor, "BEGIN IMMEDIATE")
+            
+            for func, args, kwargs in calls:
+                cursor.execute("SAVEPOINT batch_item")
+                try:
+                    value = func(*args, **kwargs)
+                    cursor.execute("RELEASE batch_item")
+                    results.append((True, value))
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO batch_item")
+                    cursor.execute("RELEASE batch_item")
+                    results.append((False, e))
+            
+            conn.commit()
+            logger.debug(f"✅ Batch committed ({len(calls)} operations)")
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"❌ Batch failed: {e}")
+            error = DatabaseError(f"خطای تراکنش گروهی: {e}")
+            results = [(False, error) for _ in calls]
+        finally:
+            self._batch.active = False
+            invalidations = self._batch.invalidations
+            self._batch.invalidations = []
+        
+        for key, namespace, tag in dict.fromkeys(invalidations):
+            self._invalidate_cache(key, namespace, tag)
+        
+        return results
     
     def clean_invalid_cart_items(self, user_id: int):
         """
@@ -163,14 +824,7 @@ class Database:
         """
         try:
             with self.transaction() as cursor:
-                cursor.execute("""
-                    DELETE FROM cart 
-                    WHERE user_id = ? 
-                    AND (
-                        product_id NOT IN (SELECT id FROM products)
-                        OR pack_id NOT IN (SELECT id FROM packs)
-                    )
-                """, (user_id,))
+                self._execute('cart.delete_invalid', (user_id,), cursor)
                 
                 deleted_count = cursor.rowcount
                 if deleted_count > 0:
@@ -220,7 +874,10 @@ class Database:
                 landline_phone TEXT,
                 address TEXT,
                 shop_name TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                blocked_at TIMESTAMP,
+                block_reason TEXT,
+                block_checked_at TIMESTAMP
             )
         """)
         
@@ -256,6 +913,44 @@ class Database:
             )
         """)
         
+        # آیتم‌های سفارش به صورت جدول نرمال (نسخه‌ی قابل query از orders.items)
+        # product_name جدا ذخیره میشه تا آمار محصولات حذف شده هم بمونه
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS order_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_id INTEGER NOT NULL,
+                product_id INTEGER,
+                pack_id INTEGER,
+                product_name TEXT,
+                pack_name TEXT,
+                quantity INTEGER NOT NULL DEFAULT 0,
+                unit_price REAL NOT NULL DEFAULT 0,
+                line_total REAL NOT NULL DEFAULT 0,
+                FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE
+            )
+        """)
+        
+        # آمار روزانه‌ی سفارشات به تفکیک وضعیت (با trigger بروز میشه)
+        # day همون date(created_at) به UTC است
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS daily_order_stats (
+                day TEXT NOT NULL,
+                status TEXT NOT NULL,
+                order_count INTEGER NOT NULL DEFAULT 0,
+                gross_amount REAL NOT NULL DEFAULT 0,
+                discount_amount REAL NOT NULL DEFAULT 0,
+                revenue REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, status)
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS daily_user_stats (
+                day TEXT PRIMARY KEY,
+                new_users INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS discount_codes (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -341,6 +1036,85 @@ class Database:
             )
         """)
         
+        # پیام همگانی: هر ارسال یک job با وضعیت جدا برای هر گیرنده
+        # تا بعد از restart از همون جا ادامه پیدا کنه و به کسی دو بار نرسه
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_type TEXT NOT NULL,
+                content TEXT NOT NULL,
+                caption TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                created_by INTEGER,
+                progress_chat_id INTEGER,
+                progress_message_id INTEGER,
+                total INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        """)
+        
+        # گروه‌های مخاطب محاسبه شده (materialized) - انتخاب گروه در زمان ارسال فوریه
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS audiences (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                segment TEXT NOT NULL,
+                param TEXT NOT NULL DEFAULT '',
+                size INTEGER DEFAULT 0,
+                built_at TIMESTAMP,
+                UNIQUE(segment, param)
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS audience_members (
+                audience_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                PRIMARY KEY (audience_id, user_id),
+                FOREIGN KEY (audience_id) REFERENCES audiences(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+                job_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                message_id INTEGER,
+                error TEXT,
+                updated_at TIMESTAMP,
+                PRIMARY KEY (job_id, user_id),
+                FOREIGN KEY (job_id) REFERENCES broadcast_jobs(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        """)
+        
+        # آمار تجمعی محصولات (بروزرسانی افزایشی از product_stats_deltas)
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS product_stats ({PRODUCT_STATS_COLUMNS})")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS product_stats_deltas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                product_name TEXT,
+                quantity INTEGER NOT NULL DEFAULT 0,
+                revenue REAL NOT NULL DEFAULT 0,
+                order_date TIMESTAMP
+            )
+        """)
+        
+        # high-water mark مصرف کننده‌های جداول delta (آخرین id اعمال شده)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stats_watermarks (
+                name TEXT PRIMARY KEY,
+                last_id INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        
+        for trigger_sql in ROLLUP_TRIGGERS.values():
+            cursor.execute(trigger_sql)
+        
+        for trigger_sql in PRODUCT_STATS_TRIGGERS.values():
+            cursor.execute(trigger_sql)
+        
         conn.commit()
         self._create_indexes()
         self._migrate_existing_data()
@@ -390,10 +1164,206 @@ class Database:
                 conn.commit()
                 logger.info("✅ ستون wallet_used اضافه شد")
             
+            # وضعیت بلاک کاربر (از نتیجه‌ی پیام همگانی)
+            cursor.execute("PRAGMA table_info(users)")
+            columns = [col[1] for col in cursor.fetchall()]
+            
+            for column in ('blocked_at', 'block_reason', 'block_checked_at'):
+                if column not in columns:
+                    logger.info(f"🔄 اضافه کردن ستون {column} به users...")
+                    column_type = 'TEXT' if column == 'block_reason' else 'TIMESTAMP'
+                    cursor.execute(f"ALTER TABLE users ADD COLUMN {column} {column_type}")
+            
+            # index های جزئی: گیرنده‌های قابل دسترس و صف بررسی دوباره‌ی بلاک‌شده‌ها
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_users_reachable ON users(user_id) WHERE blocked_at IS NULL
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_users_blocked_checked ON users(block_checked_at)
+                WHERE blocked_at IS NOT NULL
+            """)
+            conn.commit()
+            
+            # نسخه‌ی schema برای migration های یک‌باره
+            cursor.execute("PRAGMA user_version")
+            schema_version = cursor.fetchone()[0]
+            
+            if schema_version < 1:
+                self._normalize_timestamps(cursor)
+                cursor.execute("PRAGMA user_version = 1")
+                conn.commit()
+            
+            if schema_version < 2:
+                self._backfill_order_items(cursor)
+                cursor.execute("PRAGMA user_version = 2")
+                conn.commit()
+            
+            if schema_version < 3:
+                self._rebuild_rollups(cursor)
+                cursor.execute("PRAGMA user_version = 3")
+                conn.commit()
+            
+            if schema_version < 4:
+                # product_stats قبلاً ساعتی از نو ساخته میشد؛ از اینجا به بعد با delta
+                self._rebuild_product_stats(cursor)
+                cursor.execute("PRAGMA user_version = 4")
+                conn.commit()
+            
             logger.info("✅ بررسی migration‌ها تمام شد")
         except Exception as e:
             logger.error(f"❌ خطا در مهاجرت: {e}")
     
+    def _normalize_timestamps(self, cursor):
+        """
+        Migration: تبدیل تمام مقادیر زمانی به UTC با فرمت DB_TIMESTAMP_FORMAT
+        
+        مقادیر قدیمی ترکیبی از ISO با timezone (+03:30) و بدون timezone بودن.
+        datetime() در SQLite همون تفسیری رو انجام میده که کوئری‌های قبلی
+        (expires_at > datetime('now')) انجام میدادن، پس معنی داده‌ها عوض نمیشه.
+        """
+        logger.info("🔄 یکسان‌سازی ستون‌های زمانی به UTC...")
+        
+        for table, column in TIMESTAMP_COLUMNS:
+            cursor.execute(f"""
+                UPDATE {table}
+                SET {column} = datetime({column})
+                WHERE {column} IS NOT NULL
+                AND datetime({column}) IS NOT NULL
+                AND {column} != datetime({column})
+            """)
+            
+            if cursor.rowcount > 0:
+                logger.info(f"✅ {table}.{column}: {cursor.rowcount} ردیف یکسان‌سازی شد")
+    
+    def _backfill_order_items(self, cursor):
+        """Migration: پر کردن order_items از JSON سفارشات قدیمی"""
+        cursor.execute("SELECT id, items FROM orders")
+        orders = cursor.fetchall()
+        
+        if not orders:
+            return
+        
+        logger.info(f"🔄 انتقال آیتم‌های {len(orders)} سفارش به order_items...")
+        
+        for order_id, items_json in orders:
+            try:
+                items = json.loads(items_json) if items_json else []
+            except (TypeError, ValueError):
+                logger.warning(f"⚠️ آیتم‌های سفارش {order_id} قابل خواندن نیست")
+                continue
+            
+            self._write_order_items(cursor, order_id, items)
+        
+        logger.info("✅ order_items پر شد")
+    
+    def _rebuild_rollups(self, cursor):
+        """محاسبه‌ی دوباره‌ی جداول آمار روزانه از روی orders و users"""
+        cursor.execute("DELETE FROM daily_order_stats")
+        cursor.execute("""
+            INSERT INTO daily_order_stats (day, status, order_count, gross_amount, discount_amount, revenue)
+            SELECT
+                COALESCE(date(created_at), ''), COALESCE(status, ''), COUNT(*),
+                COALESCE(SUM(total_price), 0), COALESCE(SUM(discount_amount), 0),
+                COALESCE(SUM(final_price), 0)
+            FROM orders
+            GROUP BY 1, 2
+        """)
+        order_days = cursor.rowcount
+        
+        cursor.execute("DELETE FROM daily_user_stats")
+        cursor.execute("""
+            INSERT INTO daily_user_stats (day, new_users)
+            SELECT COALESCE(date(created_at), ''), COUNT(*)
+            FROM users
+            GROUP BY 1
+        """)
+        user_days = cursor.rowcount
+        
+        logger.info(f"✅ آمار روزانه بازسازی شد: {order_days} ردیف سفارش، {user_days} ردیف کاربر")
+        return {'order_rows': order_days, 'user_rows': user_days}
+    
+    def _rebuild_product_stats(self, cursor) -> int:
+        """
+        ساخت کامل product_stats در جدول سایه و جایگزینی با یک rename
+
+        داخل تراکنش صدا زده میشه: خواننده‌ها تا commit جدول قبلی رو میبینن
+        (هیچ وقت جدول خالی نمیبینن). delta های موجود در نتیجه حساب شدن، پس
+        high-water mark تا آخرین delta جلو میره.
+        """
+        cursor.execute("DROP TABLE IF EXISTS product_stats_rebuild")
+        cursor.execute(f"CREATE TABLE product_stats_rebuild ({PRODUCT_STATS_COLUMNS})")
+        cursor.execute(f"""
+            INSERT INTO product_stats_rebuild
+            (product_name, total_sold, total_revenue, last_order_date, last_updated)
+            SELECT
+                COALESCE(oi.product_name, ''),
+                COALESCE(SUM(oi.quantity), 0),
+                COALESCE(SUM(oi.line_total), 0),
+                MAX(o.created_at),
+                CURRENT_TIMESTAMP
+            FROM orders o
+            JOIN order_items oi ON oi.order_id = o.id
+            WHERE o.status IN {_PAID_SQL}
+            GROUP BY 1
+        """)
+        products = cursor.rowcount
+        
+        cursor.execute("DROP TABLE IF EXISTS product_stats")
+        cursor.execute("ALTER TABLE product_stats_rebuild RENAME TO product_stats")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_product_stats_sold ON product_stats(total_sold DESC)")
+        
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM product_stats_deltas")
+        self._set_watermark(cursor, 'product_stats', cursor.fetchone()[0])
+        cursor.execute("DELETE FROM product_stats_deltas")
+        
+        logger.info(f"✅ آمار محصولات بازسازی شد: {products} محصول")
+        return products
+    
+    def _get_watermark(self, cursor, name: str) -> int:
+        self._execute('watermarks.get', (name,), cursor)
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    
+    def _set_watermark(self, cursor, name: str, last_id: int):
+        self._execute('watermarks.set', (name, last_id), cursor)
+    
+    def _write_order_items(self, cursor, order_id: int, items: List[dict]):
+        """
+        بازنویسی ردیف‌های order_items یک سفارش از روی لیست آیتم‌ها
+        
+        باید داخل همون تراکنشی صدا زده بشه که orders.items رو مینویسه.
+        آیتم‌های سبد خرید شناسه‌ی محصول ندارن، پس از روی نام محصول و پک پیدا میشن.
+        """
+        self._execute('order_items.delete', (order_id,), cursor)
+        
+        rows = []
+        for item in items:
+            product_name = item.get('product') or item.get('product_name')
+            pack_name = item.get('pack') or item.get('pack_name')
+            quantity = int(item.get('quantity', 0) or 0)
+            
+            # آیتم‌های سبد: price = جمع ردیف و unit_price جدا
+            # آیتم‌های فاکتور ادمین: price = قیمت واحد
+            if 'unit_price' in item:
+                unit_price = float(item['unit_price'] or 0)
+            else:
+                unit_price = float(item.get('price', 0) or 0)
+            
+            product_id = item.get('product_id')
+            pack_id = item.get('pack_id')
+            
+            if product_id is None and product_name:
+                self._execute('order_items.resolve_product', (pack_name, product_name), cursor)
+                found = cursor.fetchone()
+                if found:
+                    product_id, pack_id = found[0], pack_id or found[1]
+            
+            rows.append((order_id, product_id, pack_id, product_name, pack_name,
+                         quantity, unit_price, unit_price * quantity))
+        
+        if rows:
+            self._executemany('order_items.insert', rows, cursor)
+    
     def _create_indexes(self):
         """ایجاد Index ها برای بهبود سرعت"""
         conn = self._get_conn()
@@ -417,6 +1387,17 @@ class Database:
             "CREATE INDEX IF NOT EXISTS idx_wallet_temp_expires ON wallet_temp(expires_at)",
             "CREATE INDEX IF NOT EXISTS idx_wallet_temp_active ON wallet_temp(user_id, expires_at, balance)",
             "CREATE INDEX IF NOT EXISTS idx_wallet_trans_user_type ON wallet_transactions(user_id, wallet_type)",
+            "CREATE INDEX IF NOT EXISTS idx_wallet_trans_created ON wallet_transactions(created_at)",
+            # covering index برای join با orders و جمع زدن بر اساس محصول
+            "CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id, product_name, quantity, line_total)",
+            "CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items(product_id)",
+            "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at)",
+            # صفحه‌بندی گیرنده‌های باقیمانده و شمارش وضعیت‌های یک job
+            "CREATE INDEX IF NOT EXISTS idx_broadcast_deliveries_status ON broadcast_deliveries(job_id, status, user_id)",
+            "CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs(status)",
+            # گروه‌های مخاطب پیام همگانی
+            "CREATE INDEX IF NOT EXISTS idx_orders_created_user ON orders(created_at, user_id)",
+            "CREATE INDEX IF NOT EXISTS idx_discount_usage_code ON discount_usage(discount_code, user_id)",
         ]
         
         for index_sql in indexes:
@@ -432,14 +1413,11 @@ class Database:
     def add_product(self, name: str, description: str, photo_id: str):
         try:
             with self.transaction() as cursor:
-                cursor.execute(
-                    "INSERT INTO products (name, description, photo_id) VALUES (?, ?, ?)",
-                    (name, description, photo_id)
-                )
+                self._execute('products.insert', (name, description, photo_id), cursor)
                 product_id = cursor.lastrowid
                 
                 log_database_operation("INSERT", "products", product_id)
-                self._invalidate_cache("products:")
+                self._invalidate_cache(namespace="products")
                 return product_id
 
         except Exception as e:
@@ -447,42 +1425,35 @@ class Database:
             raise
     
     def get_product(self, product_id):
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
-        return cursor.fetchone()
-    
+        return self._fetchone('products.by_id', (product_id,))
+
     def get_all_products(self):
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM products ORDER BY created_at DESC")
-        return cursor.fetchall()
+        return self._fetchall('products.all')
     
     def update_product_name(self, product_id: int, name: str):
         with self.transaction() as cursor:
-            cursor.execute("UPDATE products SET name = ? WHERE id = ?", (name, product_id))
-        self._invalidate_cache(f"product:{product_id}")
-        self._invalidate_cache("products:")
+            self._execute('products.set_name', (name, product_id), cursor)
+        self._invalidate_cache(f"product:{product_id}", namespace="products")
+        # نام محصول داخل سبدها نمایش داده میشه
+        self._invalidate_cache(namespace="cart")
     
     def update_product_description(self, product_id: int, description: str):
         with self.transaction() as cursor:
-            cursor.execute("UPDATE products SET description = ? WHERE id = ?", (description, product_id))
-        self._invalidate_cache(f"product:{product_id}")
+            self._execute('products.set_description', (description, product_id), cursor)
+        self._invalidate_cache(f"product:{product_id}", namespace="products")
     
     def update_product_photo(self, product_id: int, photo_id: str):
         with self.transaction() as cursor:
-            cursor.execute("UPDATE products SET photo_id = ? WHERE id = ?", (photo_id, product_id))
-        self._invalidate_cache(f"product:{product_id}")
+            self._execute('products.set_photo', (photo_id, product_id), cursor)
+        self._invalidate_cache(f"product:{product_id}", namespace="products")
     
     def save_channel_message_id(self, product_id: int, message_id: int) -> bool:
         try:
             with self.transaction() as cursor:
-                cursor.execute("UPDATE products SET channel_message_id = ? WHERE id = ?", (message_id, product_id))
-            
-            conn = self._get_conn()
-            cursor = conn.cursor()
-            cursor.execute("SELECT channel_message_id FROM products WHERE id = ?", (product_id,))
-            saved_id = cursor.fetchone()
+                self._execute('products.set_channel_message', (message_id, product_id), cursor)
+            self._invalidate_cache(f"product:{product_id}", namespace="products")
+
+            saved_id = self._fetchone('products.channel_message', (product_id,))
             
             if saved_id and saved_id[0] == message_id:
                 logger.info(f"✅ channel_message_id={message_id} ذخیره شد برای product={product_id}")
@@ -496,62 +1467,60 @@ class Database:
     
     def delete_product(self, product_id: int):
         with self.transaction() as cursor:
-            cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
-            cursor.execute("DELETE FROM packs WHERE product_id = ?", (product_id,))
-            cursor.execute("DELETE FROM cart WHERE product_id = ?", (product_id,))
+            self._execute('products.delete', (product_id,), cursor)
+            self._execute('packs.delete_by_product', (product_id,), cursor)
+            self._execute('cart.delete_by_product', (product_id,), cursor)
         
-        self._invalidate_cache(f"product:{product_id}")
-        self._invalidate_cache(f"packs:{product_id}")
-        self._invalidate_cache("products:")
+        self._invalidate_cache(tag=f"product:{product_id}", namespace="products")
+        self._invalidate_cache(namespace="cart")
     
     # ==================== پک‌ها ====================
     
     def add_pack(self, product_id: int, name: str, quantity: int, price: float):
         with self.transaction() as cursor:
-            cursor.execute("INSERT INTO packs (product_id, name, quantity, price) VALUES (?, ?, ?, ?)", 
-                         (product_id, name, quantity, price))
+            self._execute('packs.insert', (product_id, name, quantity, price), cursor)
             pack_id = cursor.lastrowid
         
         self._invalidate_cache(f"packs:{product_id}")
         return pack_id
     
     def get_packs(self, product_id: int):
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM packs WHERE product_id = ?", (product_id,))
-        return cursor.fetchall()
-    
+        return self._fetchall('packs.by_product', (product_id,))
+
     def get_pack(self, pack_id: int):
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM packs WHERE id = ?", (pack_id,))
-        return cursor.fetchone()
+        return self._fetchone('packs.by_id', (pack_id,))
     
     def update_pack(self, pack_id: int, name: str, quantity: int, price: float):
         pack = self.get_pack(pack_id)
         if pack:
             product_id = pack[1]
             with self.transaction() as cursor:
-                cursor.execute("UPDATE packs SET name = ?, quantity = ?, price = ? WHERE id = ?", 
-                             (name, quantity, price, pack_id))
+                self._execute('packs.update', (name, quantity, price, pack_id), cursor)
             self._invalidate_cache(f"packs:{product_id}")
+            self._invalidate_cache(f"pack:{pack_id}", namespace="cart")
     
     def delete_pack(self, pack_id: int):
         pack = self.get_pack(pack_id)
         if pack:
             product_id = pack[1]
             with self.transaction() as cursor:
-                cursor.execute("DELETE FROM packs WHERE id = ?", (pack_id,))
-                cursor.execute("DELETE FROM cart WHERE pack_id = ?", (pack_id,))
+                self._execute('packs.delete', (pack_id,), cursor)
+                self._execute('cart.delete_by_pack', (pack_id,), cursor)
             
             self._invalidate_cache(f"packs:{product_id}")
+            self._invalidate_cache(f"pack:{pack_id}", namespace="cart")
     
     # ==================== کاربران ====================
     
     def add_user(self, user_id: int, username: Optional[str], first_name: str):
         with self.transaction() as cursor:
-            cursor.execute("INSERT OR IGNORE INTO users (user_id, username, first_name) VALUES (?, ?, ?)", 
-                         (user_id, username, first_name))
+            self._execute('users.insert', (user_id, username, first_name), cursor)
+            # کاربری که دوباره /start زده دیگه بلاک نیست
+            unblocked = self._execute('users.unblock_on_start', (user_id,), cursor).rowcount
+        
+        # کاربر جدید کش نشده (None کش نمیشه)، فقط رفع بلاک ردیف کش شده رو عوض میکنه
+        if unblocked:
+            self._invalidate_cache(f"user:{user_id}")
     
     def update_user_info(self, user_id: int, phone=None, landline_phone=None, address=None, full_name=None, shop_name=None):
         """
@@ -588,16 +1557,89 @@ class Database:
         self._invalidate_cache(f"user:{user_id}")
     
     def get_user(self, user_id: int):
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-        return cursor.fetchone()
-    
+        return self._fetchone('users.by_id', (user_id,))
+
     def get_all_users(self):
+        return self._fetchall('users.all')
+    
+    def count_users(self, reachable_only: bool = False) -> int:
+        """
+        تعداد کاربران (بدون خواندن ردیف‌ها)
+        
+        Args:
+            reachable_only: فقط کاربرانی که ربات رو بلاک نکردن
+        """
+        return self._fetchone('users.count_reachable' if reachable_only else 'users.count')[0]
+    
+    def mark_users_blocked(self, users: list):
+        """
+        ثبت کاربرانی که ربات رو بلاک کردن یا حسابشون حذف شده
+        
+        Args:
+            users: لیست (user_id, reason) - reason مثل 'blocked' یا 'deactivated'
+        """
+        if not users:
+            return
+        
+        with self.transaction() as cursor:
+            self._executemany('users.mark_blocked', [(reason, user_id) for user_id, reason in users], cursor)
+        
+        for user_id, _ in users:
+            self._invalidate_cache(f"user:{user_id}")
+    
+    def mark_users_reachable(self, user_ids: list):
+        """برداشتن وضعیت بلاک (مثلاً بعد از بررسی دوباره‌ی موفق)"""
+        if not user_ids:
+            return
+        
+        with self.transaction() as cursor:
+            self._executemany('users.mark_reachable', [(user_id,) for user_id in user_ids], cursor)
+        
+        for user_id in user_ids:
+            self._invalidate_cache(f"user:{user_id}")
+    
+    def get_users_to_probe(self, older_than_days: int = 30, limit: int = 200) -> List[int]:
+        """کاربران بلاک‌شده‌ای که آخرین بررسی‌شون قدیمی‌تر از older_than_days روزه"""
         conn = self._get_conn()
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users")
-        return cursor.fetchall()
+        self._execute('users.to_probe', (f'-{int(older_than_days)} days', limit), cursor)
+        return [row[0] for row in cursor.fetchall()]
+    
+    def get_user_ids(self, after_id: int = 0, limit: int = 1000) -> List[int]:
+        """یک تکه از شناسه‌ی کاربران بعد از after_id (keyset، به ترتیب user_id)"""
+        return [row[0] for row in self._fetchall('users.ids_after', (after_id, limit))]
+    
+    def iter_user_ids(self, chunk_size: int = 1000):
+        """
+        پیمایش شناسه‌ی همه‌ی کاربران به صورت تکه‌تکه (لیست‌هایی به طول chunk_size)
+        
+        حافظه به تعداد کاربران بستگی نداره؛ فقط یک تکه در هر لحظه خوانده میشه.
+        """
+        after_id = 0
+        while True:
+            chunk = self.get_user_ids(after_id, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+            after_id = chunk[-1]
+    
+    def page_users(self, after_id: int = 0, limit: int = 20, before_id: Optional[int] = None) -> list:
+        """
+        صفحه‌بندی keyset کاربران (به ترتیب user_id)
+        
+        Args:
+            after_id: صفحه‌ی بعد از این شناسه
+            limit: تعداد در صفحه
+            before_id: اگه داده بشه، صفحه‌ی قبل از این شناسه (برای دکمه‌ی قبلی)
+        """
+        if before_id is not None:
+            return self._fetchall('users.page_before', (before_id, limit))[::-1]
+
+        return self._fetchall('users.page_after', (after_id, limit))
+
+    def get_recent_users(self, limit: int = 5) -> list:
+        """آخرین کاربران ثبت‌نام شده: (user_id, username, first_name, created_at)"""
+        return self._fetchall('users.recent', (limit,))
     
     # ==================== سبد خرید ====================
     
@@ -615,12 +1657,7 @@ class Database:
             actual_quantity = quantity * pack_quantity
             
             with self.transaction() as cursor:
-                cursor.execute("""
-                    INSERT INTO cart (user_id, product_id, pack_id, quantity) 
-                    VALUES (?, ?, ?, ?)
-                    ON CONFLICT(user_id, pack_id) DO UPDATE 
-                    SET quantity = quantity + excluded.quantity
-                """, (user_id, product_id, pack_id, actual_quantity))
+                self._execute('cart.upsert', (user_id, product_id, pack_id, actual_quantity), cursor)
             
             self._invalidate_cache(f"cart:{user_id}")
             logger.info(f"✅ Cart updated: user={user_id}, pack={pack_id}, qty={actual_quantity}")
@@ -631,35 +1668,52 @@ class Database:
     
     def get_cart(self, user_id: int):
         """✅ FIXED: حذف clean_invalid_cart_items"""
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT c.id, p.name, pk.name, pk.quantity, pk.price, c.quantity
-            FROM cart c
-            JOIN products p ON c.product_id = p.id
-            JOIN packs pk ON c.pack_id = pk.id
-            WHERE c.user_id = ?
-        """, (user_id,))
-        return cursor.fetchall()
+        return self._fetchall('cart.by_user', (user_id,))
     
     def clear_cart(self, user_id: int):
         with self.transaction() as cursor:
-            cursor.execute("DELETE FROM cart WHERE user_id = ?", (user_id,))
+            self._execute('cart.clear', (user_id,), cursor)
         self._invalidate_cache(f"cart:{user_id}")
     
     def remove_from_cart(self, cart_id: int):
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT user_id FROM cart WHERE id = ?", (cart_id,))
-        result = cursor.fetchone()
-        
-        cursor.execute("DELETE FROM cart WHERE id = ?", (cart_id,))
-        conn.commit()
+        with self.transaction() as cursor:
+            result = self._execute('cart.item_owner', (cart_id,), cursor).fetchone()
+
+            self._execute('cart.delete_item', (cart_id,), cursor)
         
         if result:
             self._invalidate_cache(f"cart:{result[0]}")
-    
+
+    def change_cart_item_quantity(self, cart_id: int, user_id: int, delta: int) -> Optional[dict]:
+        """
+        تغییر تعداد یک آیتم سبد به اندازه‌ی delta پک (اگه به صفر برسه حذف میشه)
+
+        Returns:
+            dict با new_quantity، pack_quantity، pack_name و product_name
+            یا None اگه آیتم پیدا نشد
+        """
+        with self.transaction() as cursor:
+            result = self._execute('cart.item_detail', (cart_id, user_id), cursor).fetchone()
+            if not result:
+                return None
+
+            current_qty, pack_qty, pack_name, product_name = result
+            new_qty = current_qty + (delta * pack_qty)
+
+            if new_qty <= 0:
+                self._execute('cart.delete_item', (cart_id,), cursor)
+            else:
+                self._execute('cart.set_quantity', (new_qty, cart_id), cursor)
+
+        self._invalidate_cache(f"cart:{user_id}")
+
+        return {
+            'new_quantity': new_qty,
+            'pack_quantity': pack_qty,
+            'pack_name': pack_name,
+            'product_name': product_name
+        }
+
     # ==================== سفارشات ====================
     
     def create_order(self, user_id: int, items: List[dict], total_price: float, 
@@ -672,95 +1726,164 @@ class Database:
         
         # ✅ FIX: استفاده از زمان تهران
         now_tehran = get_tehran_now()
-        expires_at = now_tehran + timedelta(hours=1)  # ۱ ساعت
+        expires_at = to_db_timestamp(now_tehran + timedelta(hours=1))  # ۱ ساعت
         
         with self.transaction() as cursor:
-            cursor.execute("""
-                INSERT INTO orders 
-                (user_id, items, total_price, discount_amount, final_price, discount_code, expires_at) 
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (user_id, items_json, total_price, discount_amount, final_price, discount_code, expires_at))
+            self._execute('orders.insert', (
+                user_id, items_json, total_price, discount_amount, final_price, discount_code, expires_at
+            ), cursor)
             order_id = cursor.lastrowid
+            self._write_order_items(cursor, order_id, items)
             
-        self._invalidate_cache("stats:")
+        self._invalidate_cache(namespace="stats")
         return order_id
-    
+
+    def checkout_cart(self, user_id: int, items: List[dict], total_price: float,
+                      discount_amount: float, final_price: float,
+                      discount_code: Optional[str] = None, credit_amount: float = 0) -> int:
+        """
+        ثبت سفارش از سبد خرید کاربر در یک تراکنش:
+        ثبت سفارش، ثبت استفاده از تخفیف، خالی کردن سبد و کسر اعتبار
+
+        Returns:
+            شناسه سفارش جدید
+        """
+        with self.transaction() as cursor:
+            self._execute('orders.insert_checkout', (
+                user_id, json.dumps(items, ensure_ascii=False), total_price,
+                discount_amount, final_price, discount_code
+            ), cursor)
+            order_id = cursor.lastrowid
+            self._write_order_items(cursor, order_id, items)
+
+            if discount_code:
+                self._execute('discounts.insert_usage', (user_id, discount_code, order_id), cursor)
+                self._execute('discounts.increment_used', (discount_code,), cursor)
+
+            self._execute('cart.clear', (user_id,), cursor)
+
+            if credit_amount > 0:
+                self.deduct_wallet(user_id, credit_amount, cursor=cursor)
+
+        self._invalidate_cache(f"cart:{user_id}")
+        self._invalidate_cache(namespace="stats")
+        if discount_code:
+            self._invalidate_cache(namespace="discount")
+        return order_id
+
     def get_order(self, order_id: int):
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, user_id, items, total_price, discount_amount, final_price,
-                   discount_code, status, receipt_photo, shipping_method, created_at, expires_at
-            FROM orders 
-            WHERE id = ?
-        """, (order_id,))
-        return cursor.fetchone()
+        return self._fetchone('orders.by_id', (order_id,))
     
     def update_order_status(self, order_id: int, status: str):
         with self.transaction() as cursor:
-            cursor.execute("UPDATE orders SET status = ? WHERE id = ?", (status, order_id))
-        self._invalidate_cache("stats:")
+            self._execute('orders.set_status', (status, order_id), cursor)
+        self._invalidate_cache(namespace="stats")
     
     def add_receipt(self, order_id: int, photo_id: str):
         with self.transaction() as cursor:
-            cursor.execute("UPDATE orders SET receipt_photo = ?, status = 'receipt_sent' WHERE id = ?", 
-                         (photo_id, order_id))
+            self._execute('orders.set_receipt', (photo_id, order_id), cursor)
     
     def update_shipping_method(self, order_id: int, method: str):
         with self.transaction() as cursor:
-            cursor.execute("UPDATE orders SET shipping_method = ? WHERE id = ?", (method, order_id))
-    
-    def get_pending_orders(self):
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, user_id, items, total_price, discount_amount, final_price, 
-                   discount_code, status, receipt_photo, shipping_method, created_at, expires_at
-            FROM orders 
-            WHERE status = 'pending' 
-            ORDER BY created_at DESC
-        """)
-        return cursor.fetchall()
-    
+            self._execute('orders.set_shipping', (method, order_id), cursor)
+
+    def update_order_items(self, order_id: int, items: List[dict], total_price: float,
+                           discount_amount: float, final_price: float,
+                           discount_code: Optional[str] = None, update_discount_code: bool = False):
+        """
+        بروزرسانی آیتم‌ها و مبالغ سفارش بعد از ویرایش ادمین
+
+        Args:
+            update_discount_code: اگه True باشه discount_code هم ذخیره میشه
+        """
+        items_json = json.dumps(items, ensure_ascii=False)
+
+        with self.transaction() as cursor:
+            if update_discount_code:
+                self._execute('orders.update_items_with_code', (
+                    items_json, total_price, discount_amount, final_price, discount_code, order_id
+                ), cursor)
+            else:
+                self._execute('orders.update_items', (items_json, total_price, discount_amount, final_price, order_id), cursor)
+
+            self._write_order_items(cursor, order_id, items)
+
+        self._invalidate_cache(namespace="stats")
+
+    def mark_order_shipped(self, order_id: int, current_shipping: str):
+        """
+        ثبت ارسال سفارش
+        نحوه ارسال اصلی توی receipt_photo با فرمت "shipped|نحوه_ارسال" نگه داشته میشه
+        """
+        with self.transaction() as cursor:
+            self._execute('orders.mark_shipped', (f"shipped|{current_shipping}", order_id), cursor)
+
+    def get_pending_orders(self, active_only: bool = False):
+        """
+        سفارشات در انتظار تایید
+
+        Args:
+            active_only: فقط سفارش‌هایی که هنوز منقضی نشدن
+        """
+        return self._fetchall('orders.pending_active' if active_only else 'orders.pending')
+
     def get_waiting_payment_orders(self):
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, user_id, items, total_price, discount_amount, final_price,
-                   discount_code, status, receipt_photo, shipping_method, created_at, expires_at
-            FROM orders 
-            WHERE status = 'waiting_payment' 
-            ORDER BY created_at DESC
-        """)
-        return cursor.fetchall()
-    
+        return self._fetchall('orders.waiting_payment')
+
+    def get_receipt_orders(self):
+        """سفارش‌هایی که رسید پرداختشون منتظر بررسی ادمینه"""
+        return self._fetchall('orders.receipt_sent')
+
+    def get_not_shipped_orders(self):
+        """سفارشات تایید شده‌ای که هنوز ارسال نشده‌اند"""
+        return self._fetchall('orders.not_shipped')
+
+    def get_shipped_orders(self):
+        """سفارشات ارسال شده"""
+        return self._fetchall('orders.shipped')
+
     def get_user_orders(self, user_id: int):
         """دریافت سفارشات کاربر"""
-        conn = self._get_conn()
-        cursor = conn.cursor()
-    
-        cursor.execute("""
-            SELECT id, user_id, items, total_price, discount_amount, final_price,
-                   discount_code, status, receipt_photo, shipping_method, created_at, expires_at
-            FROM orders 
-            WHERE user_id = ? 
-            AND status != 'rejected'
-            AND (
-                status IN ('payment_confirmed', 'confirmed')
-                OR datetime(expires_at) > datetime('now')
-            )
-            ORDER BY created_at DESC
-        """, (user_id,))
-    
-        return cursor.fetchall()
+        return self._fetchall('orders.by_user', (user_id,))
+
+    def count_customers(self) -> int:
+        """تعداد کاربرانی که حداقل یک سفارش دارن"""
+        return self._fetchone('orders.count_customers')[0]
+
+    def get_peak_order_hours(self, days: int = 30, limit: int = 3) -> list:
+        """شلوغ‌ترین ساعت‌های ثبت سفارش: [(hour, count), ...]"""
+        return self._fetchall('orders.peak_hours', (f'-{int(days)} days', limit))
+
+    def count_cleanable_orders(self, cutoff: str) -> dict:
+        """
+        شمارش سفارش‌های قابل پاکسازی قدیمی‌تر از cutoff (رشته‌ی timestamp دیتابیس)
+
+        Returns:
+            {'rejected_old', 'expired_old', 'completed'}
+        """
+        return {
+            'rejected_old': self._fetchone('orders.count_rejected_before', (cutoff,))[0],
+            'expired_old': self._fetchone('orders.count_expired_before', (cutoff,))[0],
+            'completed': self._fetchone('orders.count_completed')[0],
+        }
+
+    def get_campaign_totals(self, start: str, end: str, min_amount: float,
+                            max_amount: Optional[float] = None) -> list:
+        """
+        جمع سفارش‌های تایید شده‌ی هر کاربر در بازه‌ی کمپین
+
+        Returns:
+            [(user_id, total_amount), ...]
+        """
+        return self._fetchall('orders.campaign_totals', (start, end, min_amount, max_amount, max_amount))
     
     def delete_order(self, order_id: int):
         """حذف سفارش"""
         try:
             with self.transaction() as cursor:
-                cursor.execute("DELETE FROM orders WHERE id = ?", (order_id,))
+                self._execute('orders.delete', (order_id,), cursor)
                 log_database_operation("DELETE", "orders", order_id)
-                self._invalidate_cache("stats:")
+                self._invalidate_cache(namespace="stats")
                 return True
         except Exception as e:
             logger.error(f"❌ خطا در حذف سفارش {order_id}: {e}")
@@ -772,18 +1895,11 @@ class Database:
         if not order:
             return True
         
-        expires_at = order[11]
+        expires_at = from_db_timestamp(order[11])
         if not expires_at:
             return False
         
-        if isinstance(expires_at, str):
-            expires_at = datetime.fromisoformat(expires_at)
-        
-        # ✅ FIX: مقایسه با زمان تهران
-        # اگر expires_at بدون timezone هست، timezone تهران بهش اضافه می‌کنیم
-        if expires_at.tzinfo is None:
-            expires_at = TEHRAN_TZ.localize(expires_at)
-        
+        # ✅ FIX: مقادیر ذخیره شده UTC هستن، from_db_timestamp به تهران تبدیلشون میکنه
         return get_tehran_now() > expires_at
     
     def cleanup_old_orders(self, days_old: int = 7) -> dict:
@@ -794,26 +1910,13 @@ class Database:
             
             # ✅ FIX: استفاده از زمان تهران
             cutoff_date = get_tehran_now() - timedelta(days=days_old)
+            cutoff = to_db_timestamp(cutoff_date)
             
-            cursor.execute("""
-                SELECT COUNT(*) FROM orders 
-                WHERE (
-                    status = 'rejected' 
-                    OR (datetime(expires_at) < datetime('now') AND status NOT IN ('payment_confirmed', 'confirmed'))
-                )
-                AND datetime(created_at) < datetime(?)
-            """, (cutoff_date,))
+            self._execute('orders.count_stale', (cutoff,), cursor)
             
             count_before = cursor.fetchone()[0]
             
-            cursor.execute("""
-                DELETE FROM orders 
-                WHERE (
-                    status = 'rejected' 
-                    OR (datetime(expires_at) < datetime('now') AND status NOT IN ('payment_confirmed', 'confirmed'))
-                )
-                AND datetime(created_at) < datetime(?)
-            """, (cutoff_date,))
+            self._execute('orders.delete_stale', (cutoff,), cursor)
             
             conn.commit()
             deleted_count = cursor.rowcount
@@ -827,7 +1930,7 @@ class Database:
                 'success': True
             }
             
-            self._invalidate_cache("stats:")
+            self._invalidate_cache(namespace="stats")
             
             return report
             
@@ -860,26 +1963,23 @@ class Database:
             end_date: تاریخ پایان
         """
         with self.transaction() as cursor:
-            cursor.execute("""
-                INSERT INTO discount_codes 
-                (code, type, value, min_purchase, max_discount, usage_limit, per_user_limit, start_date, end_date) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (code, type, value, min_purchase, max_discount, usage_limit, per_user_limit, start_date, end_date))
+            self._execute('discounts.insert', (
+                code, type, value, min_purchase, max_discount, usage_limit, per_user_limit, start_date, end_date
+            ), cursor)
             discount_id = cursor.lastrowid
+        self._invalidate_cache(namespace="discount")
         return discount_id
     
     def get_discount(self, code: str):
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM discount_codes WHERE code = ? AND is_active = 1", (code,))
-        return cursor.fetchone()
-    
+        return self._fetchone('discounts.active_by_code', (code,))
+
+    def get_discount_by_id(self, discount_id: int):
+        """دریافت کد تخفیف با شناسه (فعال یا غیرفعال)"""
+        return self._fetchone('discounts.by_id', (discount_id,))
+
     def get_all_discounts(self):
         """دریافت تمام کدهای تخفیف"""
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM discount_codes ORDER BY created_at DESC")
-        return cursor.fetchall()
+        return self._fetchall('discounts.all')
     
     def get_user_discount_usage_count(self, user_id: int, discount_code: str) -> int:
         """
@@ -893,15 +1993,7 @@ class Database:
             تعداد دفعات استفاده
         """
         try:
-            conn = self._get_conn()
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) 
-                FROM discount_usage 
-                WHERE user_id = ? AND discount_code = ?
-            """, (user_id, discount_code))
-            
-            result = cursor.fetchone()
+            result = self._fetchone('discounts.user_usage', (user_id, discount_code))
             return result[0] if result else 0
         
         except Exception as e:
@@ -910,17 +2002,19 @@ class Database:
     
     def use_discount(self, user_id: int, discount_code: str, order_id: int):
         with self.transaction() as cursor:
-            cursor.execute("INSERT INTO discount_usage (user_id, discount_code, order_id) VALUES (?, ?, ?)", 
-                         (user_id, discount_code, order_id))
-            cursor.execute("UPDATE discount_codes SET used_count = used_count + 1 WHERE code = ?", (discount_code,))
+            self._execute('discounts.insert_usage', (user_id, discount_code, order_id), cursor)
+            self._execute('discounts.increment_used', (discount_code,), cursor)
+        self._invalidate_cache(namespace="discount")
     
     def toggle_discount(self, discount_id: int):
         with self.transaction() as cursor:
-            cursor.execute("UPDATE discount_codes SET is_active = 1 - is_active WHERE id = ?", (discount_id,))
+            self._execute('discounts.toggle', (discount_id,), cursor)
+        self._invalidate_cache(namespace="discount")
     
     def delete_discount(self, discount_id: int):
         with self.transaction() as cursor:
-            cursor.execute("DELETE FROM discount_codes WHERE id = ?", (discount_id,))
+            self._execute('discounts.delete', (discount_id,), cursor)
+        self._invalidate_cache(namespace="discount")
     
     # ==================== ✅ NEW: تخفیف‌های موقت ====================
     
@@ -929,19 +2023,11 @@ class Database:
         ذخیره کد تخفیف موقت برای کاربر (با timezone تهران)
         """
         # ✅ FIX: استفاده از زمان تهران
-        expires_at = get_tehran_now() + timedelta(hours=1)
+        expires_at = to_db_timestamp(get_tehran_now() + timedelta(hours=1))
         
         try:
             with self.transaction() as cursor:
-                cursor.execute("""
-                    INSERT INTO temp_discount_codes (user_id, discount_code, discount_amount, expires_at)
-                    VALUES (?, ?, ?, ?)
-                    ON CONFLICT(user_id) DO UPDATE SET
-                        discount_code = excluded.discount_code,
-                        discount_amount = excluded.discount_amount,
-                        applied_at = CURRENT_TIMESTAMP,
-                        expires_at = excluded.expires_at
-                """, (user_id, discount_code, discount_amount, expires_at))
+                self._execute('temp_discounts.upsert', (user_id, discount_code, discount_amount, expires_at), cursor)
             
             logger.info(f"✅ Temp discount saved for user {user_id}: {discount_code}")
         
@@ -953,16 +2039,7 @@ class Database:
         دریافت کد تخفیف موقت کاربر
         """
         try:
-            conn = self._get_conn()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT discount_code, discount_amount, expires_at
-                FROM temp_discount_codes
-                WHERE user_id = ? AND datetime(expires_at) > datetime('now')
-            """, (user_id,))
-            
-            result = cursor.fetchone()
+            result = self._fetchone('temp_discounts.active_by_user', (user_id,))
             
             if result:
                 return {
@@ -981,7 +2058,7 @@ class Database:
         """پاک کردن تخفیف موقت بعد از استفاده"""
         try:
             with self.transaction() as cursor:
-                cursor.execute("DELETE FROM temp_discount_codes WHERE user_id = ?", (user_id,))
+                self._execute('temp_discounts.clear', (user_id,), cursor)
             
             logger.info(f"✅ Temp discount cleared for user {user_id}")
         
@@ -992,10 +2069,7 @@ class Database:
         """پاکسازی تخفیف‌های موقت منقضی شده"""
         try:
             with self.transaction() as cursor:
-                cursor.execute("""
-                    DELETE FROM temp_discount_codes
-                    WHERE datetime(expires_at) < datetime('now')
-                """)
+                self._execute('temp_discounts.delete_expired', (), cursor)
                 
                 deleted_count = cursor.rowcount
                 
@@ -1011,56 +2085,290 @@ class Database:
     # ==================== آمار ====================
     
     def get_statistics(self):
+        """آمار کلی از جداول آمار روزانه (بدون اسکن orders و users)"""
         conn = self._get_conn()
         cursor = conn.cursor()
         stats = {}
         
-        cursor.execute("SELECT COUNT(*) FROM orders")
-        stats['total_orders'] = cursor.fetchone()[0]
+        orders = self.get_order_summary()
+        stats['total_orders'] = orders['total']
+        stats['today_orders'] = orders['today']
+        stats['week_orders'] = orders['week']
+        stats['total_income'] = orders['total_income']
+        stats['today_income'] = orders['today_income']
+        stats['week_income'] = orders['week_income']
         
-        cursor.execute("SELECT COUNT(*) FROM orders WHERE DATE(created_at) = DATE('now')")
-        stats['today_orders'] = cursor.fetchone()[0]
+        users = self.get_user_summary()
+        stats['total_users'] = users['total']
+        stats['week_new_users'] = users['week']
         
-        cursor.execute("SELECT COUNT(*) FROM orders WHERE DATE(created_at) >= DATE('now', '-7 days')")
-        stats['week_orders'] = cursor.fetchone()[0]
+        self._execute('stats.product_count', (), cursor)
+        stats['total_products'] = cursor.fetchone()[0]
         
-        cursor.execute("SELECT SUM(final_price) FROM orders WHERE status IN ('confirmed', 'payment_confirmed')")
-        total_income = cursor.fetchone()[0]
-        stats['total_income'] = total_income if total_income else 0
+        stats['pending_orders'] = orders['pending']
         
-        cursor.execute("SELECT SUM(final_price) FROM orders WHERE status IN ('confirmed', 'payment_confirmed') AND DATE(created_at) = DATE('now')")
-        today_income = cursor.fetchone()[0]
-        stats['today_income'] = today_income if today_income else 0
+        self._execute('stats.top_product', (), cursor)
+        most_popular = cursor.fetchone()
         
-        cursor.execute("SELECT SUM(final_price) FROM orders WHERE status IN ('confirmed', 'payment_confirmed') AND DATE(created_at) >= DATE('now', '-7 days')")
-        week_income = cursor.fetchone()[0]
-        stats['week_income'] = week_income if week_income else 0
+        if most_popular:
+            stats['most_popular'] = most_popular[0]
+        else:
+            stats['most_popular'] = "هنوز داده‌ای نیست"
         
-        cursor.execute("SELECT COUNT(*) FROM users")
-        stats['total_users'] = cursor.fetchone()[0]
+        return stats
+    
+    # ==================== آمار روزانه (Rollup) ====================
+    
+    def get_order_summary(self) -> dict:
+        """خلاصه‌ی سفارشات و درآمد از daily_order_stats - O(تعداد روزها)"""
+        conn = self._get_conn()
+        cursor = conn.cursor()
+        self._execute('stats.order_summary', PAID_STATUSES * 4, cursor)
+        row = cursor.fetchone()
+        
+        return {
+            'total': row[0],
+            'today': row[1],
+            'week': row[2],
+            'pending': row[3],
+            'total_income': row[4],
+            'today_income': row[5],
+            'week_income': row[6],
+            'successful_today': row[7],
+        }
+    
+    def get_user_summary(self) -> dict:
+        """تعداد کاربران از daily_user_stats"""
+        conn = self._get_conn()
+        cursor = conn.cursor()
+        self._execute('stats.user_summary', (), cursor)
+        row = cursor.fetchone()
         
-        cursor.execute("SELECT COUNT(*) FROM users WHERE DATE(created_at) >= DATE('now', '-7 days')")
-        stats['week_new_users'] = cursor.fetchone()[0]
+        self._execute('stats.blocked_users', (), cursor)
+        blocked = cursor.fetchone()[0]
         
-        cursor.execute("SELECT COUNT(*) FROM products")
-        stats['total_products'] = cursor.fetchone()[0]
+        return {
+            'total': row[0], 'today': row[1], 'week': row[2],
+            'blocked': blocked, 'reachable': row[0] - blocked
+        }
+    
+    def get_daily_sales(self, days: int = 7):
+        """
+        فروش روزانه‌ی سفارشات پرداخت شده
         
-        cursor.execute("SELECT COUNT(*) FROM orders WHERE status = 'pending'")
-        stats['pending_orders'] = cursor.fetchone()[0]
+        Returns:
+            List[(day, order_count, gross_amount, discount_amount, revenue)] - جدیدترین روز اول
+        """
+        conn = self._get_conn()
+        cursor = conn.cursor()
+        self._execute('stats.daily_sales', (f'-{int(days)} days', *PAID_STATUSES), cursor)
+        return cursor.fetchall()
+    
+    def rebuild_rollups(self) -> dict:
+        """
+        همگام‌سازی جداول آمار روزانه با orders و users
+        برای وقتی که داده‌ها خارج از trigger ها تغییر کرده باشن (مثلاً restore بکاپ)
+        """
+        with self.transaction() as cursor:
+            report = self._rebuild_rollups(cursor)
         
-        cursor.execute("""SELECT items FROM orders WHERE status IN ('confirmed', 'payment_confirmed')""")
-        product_counts = {}
-        for row in cursor.fetchall():
-            items = json.loads(row[0])
-            for item in items:
-                product_name = item.get('product', '')
-                product_counts[product_name] = product_counts.get(product_name, 0) + item.get('quantity', 0)
+        self._invalidate_cache(namespace="stats")
+        return report
+    
+    def apply_product_stats_deltas(self) -> dict:
+        """
+        اعمال delta های آمار محصولات بعد از high-water mark (یک تراکنش)
         
-        if product_counts:
-            stats['most_popular'] = max(product_counts.items(), key=lambda x: x[1])[0]
-        else:
-            stats['most_popular'] = "هنوز داده‌ای نیست"
+        Returns:
+            {'deltas': تعداد delta اعمال شده، 'products': تعداد محصول بروز شده، 'watermark'}
+        """
+        with self.transaction() as cursor:
+            watermark = self._get_watermark(cursor, 'product_stats')
+            self._execute('product_stats.max_delta_id', (), cursor)
+            last_id = cursor.fetchone()[0]
+            
+            if last_id <= watermark:
+                return {'deltas': 0, 'products': 0, 'watermark': watermark}
+            
+            self._execute('product_stats.apply_deltas', (watermark, last_id), cursor)
+            products = cursor.rowcount
+            
+            self._execute('product_stats.count_deltas', (watermark, last_id), cursor)
+            deltas = cursor.fetchone()[0]
+            
+            self._set_watermark(cursor, 'product_stats', last_id)
+            self._execute('product_stats.delete_deltas', (last_id,), cursor)
+        
+        return {'deltas': deltas, 'products': products, 'watermark': last_id}
+    
+    def rebuild_product_stats(self) -> dict:
+        """
+        بازسازی کامل و atomic آمار محصولات (عملیات دستی ادمین - /rebuild_stats)
+        """
+        with self.transaction() as cursor:
+            products = self._rebuild_product_stats(cursor)
+        
+        return {'products': products}
+    
+    # ==================== پیام همگانی ====================
+    
+    def build_audience(self, segment: str, param: str = '') -> dict:
+        """
+        محاسبه و ذخیره‌ی اعضای یک گروه مخاطب (فقط کاربران قابل دسترس)
+        
+        Args:
+            segment: یکی از کلیدهای AUDIENCE_SEGMENTS
+            param: پارامتر گروه (مثلاً کد تخفیف برای used_discount)
+        
+        Returns:
+            {'id', 'segment', 'param', 'size'}
+        """
+        segment_sql = AUDIENCE_SEGMENTS[segment]
+        params = (param,) if '?' in segment_sql else ()
+        
+        with self.transaction() as cursor:
+            self._execute('audiences.insert', (segment, param), cursor)
+            self._execute('audiences.id', (segment, param), cursor)
+            audience_id = cursor.fetchone()[0]
+            
+            self._execute('audiences.clear_members', (audience_id,), cursor)
+            cursor.execute(f"""
+                INSERT INTO audience_members (audience_id, user_id)
+                SELECT ?, s.user_id
+                FROM ({segment_sql}) s
+                JOIN users u ON u.user_id = s.user_id
+                WHERE u.blocked_at IS NULL
+            """, (audience_id, *params))
+            size = cursor.rowcount
+            
+            self._execute('audiences.set_size', (size, audience_id), cursor)
+        
+        logger.info(f"🎯 Audience '{segment}' {param} built: {size} users")
+        return {'id': audience_id, 'segment': segment, 'param': param, 'size': size}
+    
+    def get_audience(self, segment: str, param: str = '', max_age_seconds: int = 600) -> dict:
+        """
+        گروه مخاطب ذخیره شده؛ اگه قدیمی‌تر از max_age_seconds باشه دوباره ساخته میشه
+        """
+        conn = self._get_conn()
+        cursor = conn.cursor()
+        self._execute('audiences.fresh', (segment, param, f'-{int(max_age_seconds)} seconds'), cursor)
+        row = cursor.fetchone()
+        
+        if row:
+            return {'id': row[0], 'segment': segment, 'param': param, 'size': row[1]}
+        
+        return self.build_audience(segment, param)
+    
+    def create_broadcast_job(self, message_type: str, content: str, caption: str = None,
+                             created_by: int = None, include_blocked: bool = False,
+                             audience_id: Optional[int] = None) -> int:
+        """
+        ایجاد job پیام همگانی با لیست گیرنده‌ها (همه‌ی کاربرهای فعلی یا یک گروه مخاطب)
+        
+        Args:
+            include_blocked: کاربرانی که ربات رو بلاک کردن هم گیرنده باشن
+            audience_id: فقط اعضای این گروه (خروجی build_audience/get_audience)
+        
+        Returns:
+            شناسه job
+        """
+        with self.transaction() as cursor:
+            self._execute('broadcast.insert_job', (message_type, content, caption, created_by), cursor)
+            job_id = cursor.lastrowid
+            
+            if audience_id is not None:
+                self._execute('broadcast.enqueue_audience', (job_id, audience_id), cursor)
+            elif include_blocked:
+                self._execute('broadcast.enqueue_all', (job_id,), cursor)
+            else:
+                self._execute('broadcast.enqueue_reachable', (job_id,), cursor)
+            
+            self._execute('broadcast.set_total', (cursor.rowcount, job_id), cursor)
+        
+        return job_id
+    
+    def get_broadcast_job(self, job_id: int):
+        """دریافت یک job پیام همگانی"""
+        conn = self._get_conn()
+        cursor = conn.cursor()
+        self._execute('broadcast.job_by_id', (job_id,), cursor)
+        return cursor.fetchone()
+    
+    def get_broadcast_jobs(self, statuses: tuple = ('running',)) -> list:
+        """دریافت job ها با وضعیت داده شده (مثلاً برای ادامه بعد از restart)"""
+        conn = self._get_conn()
+        cursor = conn.cursor()
+        placeholders = ','.join('?' * len(statuses))
+        cursor.execute(f"SELECT * FROM broadcast_jobs WHERE status IN ({placeholders}) ORDER BY id",
+                       tuple(statuses))
+        return cursor.fetchall()
+    
+    def set_broadcast_job_status(self, job_id: int, status: str) -> bool:
+        """
+        تغییر وضعیت job (فقط طبق BROADCAST_TRANSITIONS)
+        
+        Returns:
+            True اگه وضعیت تغییر کرد
+        """
+        allowed = BROADCAST_TRANSITIONS[status]
+        placeholders = ','.join('?' * len(allowed))
+        
+        with self.transaction() as cursor:
+            cursor.execute(f"""
+                UPDATE broadcast_jobs
+                SET status = ?,
+                    started_at = CASE WHEN ? = 'running' THEN COALESCE(started_at, datetime('now')) ELSE started_at END,
+                    finished_at = CASE WHEN ? IN ('completed', 'cancelled') THEN datetime('now') ELSE finished_at END
+                WHERE id = ? AND status IN ({placeholders})
+            """, (status, status, status, job_id, *allowed))
+            return cursor.rowcount > 0
+    
+    def set_broadcast_progress_message(self, job_id: int, chat_id: int, message_id: int):
+        """ذخیره‌ی پیام پیشرفت ادمین (برای ادامه‌ی گزارش بعد از restart)"""
+        with self.transaction() as cursor:
+            self._execute('broadcast.set_progress_message', (chat_id, message_id, job_id), cursor)
+    
+    def get_pending_deliveries(self, job_id: int, after_user_id: int = 0, limit: int = 1000) -> list:
+        """صفحه‌ی بعدی گیرنده‌هایی که هنوز پیام نگرفتن (به ترتیب user_id)"""
+        conn = self._get_conn()
+        cursor = conn.cursor()
+        self._execute('broadcast.pending', (job_id, after_user_id, limit), cursor)
+        return [row[0] for row in cursor.fetchall()]
+    
+    def record_broadcast_deliveries(self, job_id: int, results: list):
+        """
+        ثبت نتیجه‌ی ارسال (checkpoint)
+        
+        Args:
+            results: لیست (user_id, status, message_id, error)
+        """
+        if not results:
+            return
+        
+        with self.transaction() as cursor:
+            self._executemany('broadcast.record_delivery', [
+                (status, message_id, error, job_id, user_id)
+                for user_id, status, message_id, error in results
+            ], cursor)
+    
+    def get_broadcast_stats(self, job_id: int) -> dict:
+        """
+        آمار یک job از جدول broadcast_deliveries
+        
+        Returns:
+            {'total', 'processed', 'pending', 'success', 'blocked', ...}
+        """
+        conn = self._get_conn()
+        cursor = conn.cursor()
+        self._execute('broadcast.stats', (job_id,), cursor)
         
+        stats = {status: 0 for status in ('pending', 'success', 'blocked', 'rate_limited', 'network_error', 'error')}
+        for status, count in cursor.fetchall():
+            stats[status] = count
+        
+        stats['total'] = sum(stats.values())
+        stats['processed'] = stats['total'] - stats['pending']
         return stats
     
     # ==================== سیستم اعتبار V2 (Wallet) - جداسازی دائمی و موقت ====================
@@ -1071,11 +2379,7 @@ class Database:
             conn = self._get_conn()
             cursor = conn.cursor()
             
-            cursor.execute("""
-                SELECT balance 
-                FROM wallet_permanent 
-                WHERE user_id = ?
-            """, (user_id,))
+            self._execute('wallet.permanent_balance', (user_id,), cursor)
             
             result = cursor.fetchone()
             return result[0] if result else 0.0
@@ -1093,14 +2397,7 @@ class Database:
             conn = self._get_conn()
             cursor = conn.cursor()
             
-            cursor.execute("""
-                SELECT id, balance, expires_at, description
-                FROM wallet_temp
-                WHERE user_id = ?
-                AND balance > 0
-                AND datetime(expires_at) > datetime('now')
-                ORDER BY expires_at ASC
-            """, (user_id,))
+            self._execute('wallet.active_temp', (user_id,), cursor)
             
             return cursor.fetchall()
             
@@ -1113,30 +2410,19 @@ class Database:
         try:
             with self.transaction() as cursor:
                 # چک وجود رکورد
-                cursor.execute("SELECT id, balance FROM wallet_permanent WHERE user_id = ?", (user_id,))
+                self._execute('wallet.permanent_row', (user_id,), cursor)
                 wallet = cursor.fetchone()
                 
                 if wallet:
                     # آپدیت موجودی
                     new_balance = wallet[1] + amount
-                    cursor.execute("""
-                        UPDATE wallet_permanent 
-                        SET balance = ?, updated_at = CURRENT_TIMESTAMP
-                        WHERE user_id = ?
-                    """, (new_balance, user_id))
+                    self._execute('wallet.set_permanent_balance', (new_balance, user_id), cursor)
                 else:
                     # ایجاد رکورد جدید
-                    cursor.execute("""
-                        INSERT INTO wallet_permanent (user_id, balance)
-                        VALUES (?, ?)
-                    """, (user_id, amount))
+                    self._execute('wallet.insert_permanent', (user_id, amount), cursor)
                 
                 # ثبت تراکنش
-                cursor.execute("""
-                    INSERT INTO wallet_transactions 
-                    (user_id, amount, transaction_type, wallet_type, description, admin_id)
-                    VALUES (?, ?, 'credit', 'permanent', ?, ?)
-                """, (user_id, amount, description, admin_id))
+                self._execute('wallet.log_permanent_credit', (user_id, amount, description, admin_id), cursor)
                 
                 log_database_operation("WALLET", "add_permanent", user_id)
                 self._invalidate_cache(f"wallet:{user_id}")
@@ -1152,17 +2438,10 @@ class Database:
         try:
             with self.transaction() as cursor:
                 # ایجاد اعتبار موقت جدید
-                cursor.execute("""
-                    INSERT INTO wallet_temp (user_id, balance, expires_at, description)
-                    VALUES (?, ?, ?, ?)
-                """, (user_id, amount, expires_at.isoformat(), description))
+                self._execute('wallet.insert_temp', (user_id, amount, to_db_timestamp(expires_at), description), cursor)
                 
                 # ثبت تراکنش
-                cursor.execute("""
-                    INSERT INTO wallet_transactions 
-                    (user_id, amount, transaction_type, wallet_type, description, admin_id)
-                    VALUES (?, ?, 'credit', 'temp', ?, ?)
-                """, (user_id, amount, description, admin_id))
+                self._execute('wallet.log_temp_credit', (user_id, amount, description, admin_id), cursor)
                 
                 log_database_operation("WALLET", "add_temp", user_id)
                 self._invalidate_cache(f"wallet:{user_id}")
@@ -1177,7 +2456,7 @@ class Database:
         """کسر اعتبار دائمی از کاربر"""
         try:
             with self.transaction() as cursor:
-                cursor.execute("SELECT balance FROM wallet_permanent WHERE user_id = ?", (user_id,))
+                self._execute('wallet.permanent_balance', (user_id,), cursor)
                 wallet = cursor.fetchone()
                 
                 if not wallet or wallet[0] < amount:
@@ -1185,18 +2464,10 @@ class Database:
                 
                 new_balance = wallet[0] - amount
                 
-                cursor.execute("""
-                    UPDATE wallet_permanent 
-                    SET balance = ?, updated_at = CURRENT_TIMESTAMP
-                    WHERE user_id = ?
-                """, (new_balance, user_id))
+                self._execute('wallet.set_permanent_balance', (new_balance, user_id), cursor)
                 
                 # ثبت تراکنش
-                cursor.execute("""
-                    INSERT INTO wallet_transactions 
-                    (user_id, amount, transaction_type, wallet_type, description, order_id)
-                    VALUES (?, ?, 'debit', 'permanent', ?, ?)
-                """, (user_id, -amount, description, order_id))
+                self._execute('wallet.log_permanent_debit', (user_id, -amount, description, order_id), cursor)
                 
                 log_database_operation("WALLET", "deduct_permanent", user_id)
                 self._invalidate_cache(f"wallet:{user_id}")
@@ -1211,11 +2482,7 @@ class Database:
         """کسر اعتبار موقت از یک wallet خاص"""
         try:
             with self.transaction() as cursor:
-                cursor.execute("""
-                    SELECT balance 
-                    FROM wallet_temp 
-                    WHERE id = ? AND user_id = ?
-                """, (wallet_id, user_id))
+                self._execute('wallet.temp_balance', (wallet_id, user_id), cursor)
                 
                 wallet = cursor.fetchone()
                 
@@ -1224,18 +2491,10 @@ class Database:
                 
                 new_balance = wallet[0] - amount
                 
-                cursor.execute("""
-                    UPDATE wallet_temp 
-                    SET balance = ?, updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                """, (new_balance, wallet_id))
+                self._execute('wallet.set_temp_balance', (new_balance, wallet_id), cursor)
                 
                 # ثبت تراکنش
-                cursor.execute("""
-                    INSERT INTO wallet_transactions 
-                    (user_id, amount, transaction_type, wallet_type, description, order_id)
-                    VALUES (?, ?, 'debit', 'temp', ?, ?)
-                """, (user_id, -amount, description, order_id))
+                self._execute('wallet.log_temp_debit', (user_id, -amount, description, order_id), cursor)
                 
                 log_database_operation("WALLET", "deduct_temp", user_id)
                 self._invalidate_cache(f"wallet:{user_id}")
@@ -1269,12 +2528,7 @@ class Database:
         remaining = amount
         
         # 1. ابتدا از اعتبارهای موقت فعال کم کن
-        cursor.execute("""
-            SELECT id, balance, expires_at 
-            FROM wallet_temp 
-            WHERE user_id = ? AND balance > 0 AND datetime(expires_at) > datetime('now')
-            ORDER BY expires_at ASC
-        """, (user_id,))
+        self._execute('wallet.active_temp_for_deduct', (user_id,), cursor)
         temp_wallets = cursor.fetchall()
         
         for wallet_id, balance, expires_at in temp_wallets:
@@ -1284,24 +2538,17 @@ class Database:
             deduct_from_this = min(remaining, balance)
             new_balance = balance - deduct_from_this
             
-            cursor.execute("""
-                UPDATE wallet_temp 
-                SET balance = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            """, (new_balance, wallet_id))
+            self._execute('wallet.set_temp_balance', (new_balance, wallet_id), cursor)
             
             # ثبت تراکنش
-            cursor.execute("""
-                INSERT INTO wallet_transactions 
-                (user_id, amount, transaction_type, wallet_type, description, order_id)
-                VALUES (?, ?, 'debit', 'temp', ?, ?)
-            """, (user_id, -deduct_from_this, f"{description} (موقت)", order_id))
-            
+            self._execute('wallet.log_temp_debit', (
+                user_id, -deduct_from_this, f"{description} (موقت)", order_id
+            ), cursor)
             remaining -= deduct_from_this
         
         # 2. اگر باقی مونده، از اعتبار دائمی کم کن
         if remaining > 0:
-            cursor.execute("SELECT balance FROM wallet_permanent WHERE user_id = ?", (user_id,))
+            self._execute('wallet.permanent_balance', (user_id,), cursor)
             perm_wallet = cursor.fetchone()
             
             if not perm_wallet or perm_wallet[0] < remaining:
@@ -1310,19 +2557,12 @@ class Database:
             
             new_perm_balance = perm_wallet[0] - remaining
             
-            cursor.execute("""
-                UPDATE wallet_permanent 
-                SET balance = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE user_id = ?
-            """, (new_perm_balance, user_id))
+            self._execute('wallet.set_permanent_balance', (new_perm_balance, user_id), cursor)
             
             # ثبت تراکنش
-            cursor.execute("""
-                INSERT INTO wallet_transactions 
-                (user_id, amount, transaction_type, wallet_type, description, order_id)
-                VALUES (?, ?, 'debit', 'permanent', ?, ?)
-            """, (user_id, -remaining, f"{description} (دائمی)", order_id))
-        
+            self._execute('wallet.log_permanent_debit', (
+                user_id, -remaining, f"{description} (دائمی)", order_id
+            ), cursor)    
         self._invalidate_cache(f"wallet:{user_id}")
         logger.info(f"✅ {amount:,.0f} تومان از اعتبار کاربر {user_id} کسر شد")
         return True
@@ -1333,13 +2573,7 @@ class Database:
             conn = self._get_conn()
             cursor = conn.cursor()
             
-            cursor.execute("""
-                SELECT id, amount, transaction_type, wallet_type, description, created_at
-                FROM wallet_transactions
-                WHERE user_id = ?
-                ORDER BY created_at DESC
-                LIMIT ?
-            """, (user_id, limit))
+            self._execute('wallet.transactions', (user_id, limit), cursor)
             
             return cursor.fetchall()
         
@@ -1351,12 +2585,7 @@ class Database:
         """به‌روزرسانی سفارش بعد از استفاده از اعتبار"""
         try:
             with self.transaction() as cursor:
-                cursor.execute("""
-                    UPDATE orders
-                    SET wallet_used = ?,
-                        final_price = ?
-                    WHERE id = ?
-                """, (wallet_amount, new_final_price, order_id))
+                self._execute('orders.set_wallet_payment', (wallet_amount, new_final_price, order_id), cursor)
                 
                 log_database_operation("UPDATE", "orders", order_id)
                 self._invalidate_cache(f"order:{order_id}")
@@ -1372,11 +2601,7 @@ class Database:
         try:
             with self.transaction() as cursor:
                 # حذف اعتبارهای منقضی شده یا با موجودی صفر
-                cursor.execute("""
-                    DELETE FROM wallet_temp
-                    WHERE balance <= 0 
-                    OR datetime(expires_at) <= datetime('now')
-                """)
+                self._execute('wallet.delete_expired_temp', (), cursor)
                 
                 deleted_count = cursor.rowcount
                 
@@ -1398,65 +2623,34 @@ class Database:
             stats = {}
             
             # آمار اعتبار دائمی
-            cursor.execute("""
-                SELECT COUNT(*), COALESCE(SUM(balance), 0), COALESCE(AVG(balance), 0)
-                FROM wallet_permanent 
-                WHERE balance > 0
-            """)
+            self._execute('wallet.permanent_totals', (), cursor)
             perm = cursor.fetchone()
             stats['permanent_users'] = perm[0]
             stats['permanent_total'] = perm[1]
             stats['permanent_avg'] = perm[2]
             
             # آمار اعتبار موقت فعال
-            cursor.execute("""
-                SELECT 
-                    COUNT(DISTINCT user_id),
-                    COUNT(*),
-                    COALESCE(SUM(balance), 0)
-                FROM wallet_temp 
-                WHERE balance > 0 
-                AND datetime(expires_at) > datetime('now')
-            """)
+            self._execute('wallet.temp_totals', (), cursor)
             temp = cursor.fetchone()
             stats['temp_users'] = temp[0]
             stats['temp_count'] = temp[1]
             stats['temp_total'] = temp[2]
             
             # اعتبارهای منقضی شده
-            cursor.execute("""
-                SELECT COUNT(*)
-                FROM wallet_temp 
-                WHERE datetime(expires_at) <= datetime('now')
-                OR balance <= 0
-            """)
+            self._execute('wallet.expired_temp_count', (), cursor)
             stats['expired_count'] = cursor.fetchone()[0]
             
             # مجموع کل
             stats['grand_total'] = stats['permanent_total'] + stats['temp_total']
             
             # تراکنش‌های امروز
-            cursor.execute("""
-                SELECT COUNT(*)
-                FROM wallet_transactions 
-                WHERE DATE(created_at) = DATE('now')
-            """)
+            self._execute('wallet.today_transactions', (), cursor)
             stats['today_transactions'] = cursor.fetchone()[0]
             
-            cursor.execute("""
-                SELECT COALESCE(SUM(amount), 0)
-                FROM wallet_transactions 
-                WHERE DATE(created_at) = DATE('now') 
-                AND transaction_type = 'credit'
-            """)
+            self._execute('wallet.today_credit', (), cursor)
             stats['today_charges'] = cursor.fetchone()[0]
             
-            cursor.execute("""
-                SELECT COALESCE(SUM(ABS(amount)), 0)
-                FROM wallet_transactions 
-                WHERE DATE(created_at) = DATE('now') 
-                AND transaction_type = 'debit'
-            """)
+            self._execute('wallet.today_debit', (), cursor)
             stats['today_withdrawals'] = cursor.fetchone()[0]
             
             return stats
@@ -1534,6 +2728,8 @@ class Database:
         try:
             if hasattr(self, 'pool') and self.pool:
                 self.pool.cleanup_all()
+            if hasattr(self, 'read_pool') and self.read_pool:
+                self.read_pool.cleanup_all()
             logger.info("✅ Database connections closed successfully")
         except Exception as e:
             logger.error(f"❌ Error closing database: {e}")
@@ -108,9 +108,9 @@ async def product_photo_received(update: Update, context: ContextTypes.DEFAULT_T
     photo = update.message.photo[-1]
     context.user_data['product_photo'] = photo.file_id
     
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    product_id = db.add_product(
+    product_id = await db.add_product(
         context.user_data['product_name'],
         context.user_data['product_desc'],
         context.user_data['product_photo']
@@ -125,7 +125,7 @@ async def product_photo_received(update: Update, context: ContextTypes.DEFAULT_T
     # 🆕 Invalidate cache
     cache_manager = context.bot_data.get('cache_manager')
     if cache_manager:
-        cache_manager.invalidate_pattern("products:")
+        cache_manager.invalidate_namespace("products")
     
     await update.message.reply_text(
         MESSAGES["product_added"],
@@ -150,10 +150,10 @@ async def list_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await is_admin(update.effective_user.id):
         return
     
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     db_cache = context.bot_data.get('db_cache')
     
-    products = db_cache.get_all_products() if db_cache else db.get_all_products()
+    products = await db.run_read(db_cache.get_all_products) if db_cache else await db.get_all_products()
     
     if not products:
         await update.message.reply_text("هیچ محصولی ثبت نشده است.")
@@ -175,10 +175,10 @@ async def product_list_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error("❌ query.message is None in product_list_all")
         return
     
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     db_cache = context.bot_data.get('db_cache')
     
-    products = db_cache.get_all_products() if db_cache else db.get_all_products()
+    products = await db.run_read(db_cache.get_all_products) if db_cache else await db.get_all_products()
     
     if not products:
         await query.message.reply_text("هیچ محصولی ثبت نشده است.")
@@ -197,7 +197,7 @@ async def product_list_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     for product in products:
         product_id, name, desc, photo_id, *_ = product
         
-        packs = db_cache.get_packs(product_id) if db_cache else db.get_packs(product_id)
+        packs = await db.run_read(db_cache.get_packs, product_id) if db_cache else await db.get_packs(product_id)
         
         text = f"🏷 {name}\n\n{desc}\n\n"
         if packs:
@@ -252,10 +252,10 @@ async def product_search_received(update: Update, context: ContextTypes.DEFAULT_
     
     search_text = update.message.text.strip().lower()
     
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     db_cache = context.bot_data.get('db_cache')
     
-    products = db_cache.get_all_products() if db_cache else db.get_all_products()
+    products = await db.run_read(db_cache.get_all_products) if db_cache else await db.get_all_products()
     
     # فیلتر کنیم — جستجوی fuzzy (شامل شدن متن جستجو در اسم محصول)
     matched = []
@@ -288,7 +288,7 @@ async def product_search_received(update: Update, context: ContextTypes.DEFAULT_
     for product in matched:
         product_id, name, desc, photo_id, *_ = product
         
-        packs = db_cache.get_packs(product_id) if db_cache else db.get_packs(product_id)
+        packs = await db.run_read(db_cache.get_packs, product_id) if db_cache else await db.get_packs(product_id)
         
         text = f"🏷 {name}\n\n{desc}\n\n"
         if packs:
@@ -410,10 +410,10 @@ async def pack_price_received(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
         return PACK_PRICE
     
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     product_id = context.user_data['adding_pack_to']
     
-    db.add_pack(
+    await db.add_pack(
         product_id,
         context.user_data['pack_name'],
         context.user_data['pack_quantity'],
@@ -443,12 +443,12 @@ async def view_packs(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # 🆕 استفاده از Cache
     db_cache = context.bot_data.get('db_cache')
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     if db_cache:
-        packs = db_cache.get_packs(product_id)
+        packs = await db.run_read(db_cache.get_packs, product_id)
     else:
-        packs = db.get_packs(product_id)
+        packs = await db.get_packs(product_id)
     
     if not packs:
         await query.message.reply_text("هیچ پکی برای این محصول تعریف نشده است.")
@@ -484,14 +484,14 @@ async def get_channel_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # 🆕 استفاده از Cache
     db_cache = context.bot_data.get('db_cache')
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     if db_cache:
-        product = db_cache.get_product(product_id)
-        packs = db_cache.get_packs(product_id)
+        product = await db.run_read(db_cache.get_product, product_id)
+        packs = await db.run_read(db_cache.get_packs, product_id)
     else:
-        product = db.get_product(product_id)
-        packs = db.get_packs(product_id)
+        product = await db.get_product(product_id)
+        packs = await db.get_packs(product_id)
     
     if not product:
         await query.message.reply_text("❌ محصول یافت نشد.")
@@ -566,7 +566,7 @@ async def get_channel_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         if sent_message:
             message_id = sent_message.message_id
-            success = db.save_channel_message_id(product_id, message_id)
+            success = await db.save_channel_message_id(product_id, message_id)
             
             if success:
                 await query.message.reply_text(
@@ -615,15 +615,14 @@ async def delete_product(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     product_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
-    db.delete_product(product_id)
+    db = context.bot_data['adb']
+    await db.delete_product(product_id)
     
     # 🆕 Invalidate cache
     cache_manager = context.bot_data.get('cache_manager')
     if cache_manager:
-        cache_manager.invalidate(f"product:{product_id}")
-        cache_manager.invalidate(f"packs:{product_id}")
-        cache_manager.invalidate_pattern("products:")
+        cache_manager.invalidate_tag(f"product:{product_id}")
+        cache_manager.invalidate_namespace("products")
     
     await query.message.reply_text("✅ محصول حذف شد.")
     await query.message.delete()
@@ -641,12 +640,12 @@ async def show_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # 🆕 استفاده از Cache
     db_cache = context.bot_data.get('db_cache')
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     if db_cache:
-        stats = db_cache.get_statistics()
+        stats = await db.run_read(db_cache.get_statistics)
     else:
-        stats = db.get_statistics()
+        stats = await db.get_statistics()
     
     text = "📊 **آمار فروشگاه**\n"
     text += "═" * 25 + "\n\n"
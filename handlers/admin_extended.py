@@ -24,8 +24,8 @@ async def edit_product_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     product_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
-    product = db.get_product(product_id)
+    db = context.bot_data['adb']
+    product = await db.get_product(product_id)
     
     if not product:
         await query.answer("❌ محصول یافت نشد!", show_alert=True)
@@ -80,8 +80,8 @@ async def edit_product_name_received(update: Update, context: ContextTypes.DEFAU
     
     new_name = update.message.text
     
-    db = context.bot_data['db']
-    db.update_product_name(product_id, new_name)
+    db = context.bot_data['adb']
+    await db.update_product_name(product_id, new_name)
     
     await update.message.reply_text(
         f"✅ نام محصول به '{new_name}' تغییر کرد!",
@@ -127,8 +127,8 @@ async def edit_product_desc_received(update: Update, context: ContextTypes.DEFAU
     
     new_desc = update.message.text
     
-    db = context.bot_data['db']
-    db.update_product_description(product_id, new_desc)
+    db = context.bot_data['adb']
+    await db.update_product_description(product_id, new_desc)
     
     await update.message.reply_text(
         "✅ توضیحات محصول به‌روزرسانی شد!",
@@ -173,8 +173,8 @@ async def edit_product_photo_received(update: Update, context: ContextTypes.DEFA
     
     photo_id = update.message.photo[-1].file_id
     
-    db = context.bot_data['db']
-    db.update_product_photo(product_id, photo_id)
+    db = context.bot_data['adb']
+    await db.update_product_photo(product_id, photo_id)
     
     await update.message.reply_text(
         "✅ عکس محصول به‌روزرسانی شد!",
@@ -193,8 +193,8 @@ async def view_packs_with_edit(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     
     product_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
-    packs = db.get_packs(product_id)
+    db = context.bot_data['adb']
+    packs = await db.get_packs(product_id)
     
     if not packs:
         await query.message.reply_text("هیچ پکی برای این محصول تعریف نشده است.")
@@ -219,8 +219,8 @@ async def edit_pack_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     pack_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
-    pack = db.get_pack(pack_id)
+    db = context.bot_data['adb']
+    pack = await db.get_pack(pack_id)
     
     if not pack:
         await query.answer("❌ پک یافت نشد!", show_alert=True)
@@ -260,8 +260,8 @@ async def edit_pack_name_received(update: Update, context: ContextTypes.DEFAULT_
     
     context.user_data['new_pack_name'] = update.message.text
     
-    db = context.bot_data['db']
-    pack = db.get_pack(pack_id)
+    db = context.bot_data['adb']
+    pack = await db.get_pack(pack_id)
     
     await update.message.reply_text(
         f"🔢 تعداد جدید پک را وارد کنید:\n"
@@ -292,8 +292,8 @@ async def edit_pack_quantity_received(update: Update, context: ContextTypes.DEFA
         quantity = int(update.message.text)
         context.user_data['new_pack_quantity'] = quantity
         
-        db = context.bot_data['db']
-        pack = db.get_pack(pack_id)
+        db = context.bot_data['adb']
+        pack = await db.get_pack(pack_id)
         
         await update.message.reply_text(
             f"💰 قیمت جدید پک را وارد کنید (به تومان):\n"
@@ -327,9 +327,9 @@ async def edit_pack_price_received(update: Update, context: ContextTypes.DEFAULT
     try:
         price = float(update.message.text.replace(',', ''))
         
-        db = context.bot_data['db']
+        db = context.bot_data['adb']
         
-        db.update_pack(
+        await db.update_pack(
             pack_id,
             context.user_data['new_pack_name'],
             context.user_data['new_pack_quantity'],
@@ -355,8 +355,8 @@ async def delete_pack_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer("پک حذف شد!")
     
     pack_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
-    db.delete_pack(pack_id)
+    db = context.bot_data['adb']
+    await db.delete_pack(pack_id)
     
     await query.message.edit_text("✅ پک حذف شد.")
 
@@ -378,8 +378,8 @@ async def edit_in_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     product_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
-    product = db.get_product(product_id)
+    db = context.bot_data['adb']
+    product = await db.get_product(product_id)
     
     if not product:
         await query.answer("❌ محصول یافت نشد!", show_alert=True)
@@ -394,7 +394,7 @@ async def edit_in_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    packs = db.get_packs(product_id)
+    packs = await db.get_packs(product_id)
     
     # ساخت متن جدید
     caption = f"🏷 **{name}**\n\n"
@@ -487,8 +487,8 @@ async def back_to_product(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.message.delete()
     
     # نمایش دوباره دکمه‌های مدیریت
-    db = context.bot_data['db']
-    product = db.get_product(product_id)
+    db = context.bot_data['adb']
+    product = await db.get_product(product_id)
     
     if product:
         prod_id, name, desc, photo_id, channel_msg_id, created_at = product
@@ -133,8 +133,8 @@ async def invoice_user_id_received(update: Update, context: ContextTypes.DEFAULT
         user_id = int(update.message.text)
         
         # چک کردن وجود کاربر
-        db = context.bot_data['db']
-        user = db.get_user(user_id)
+        db = context.bot_data['adb']
+        user = await db.get_user(user_id)
         
         if not user:
             await update.message.reply_text(
@@ -187,8 +187,8 @@ async def invoice_add_product(update: Update, context: ContextTypes.DEFAULT_TYPE
     context.user_data['invoice_target_user_id'] = user_id
     
     # نمایش لیست محصولات
-    db = context.bot_data['db']
-    products = db.get_all_products()
+    db = context.bot_data['adb']
+    products = await db.get_all_products()
     
     if not products:
         await query.answer("❌ هیچ محصولی وجود ندارد!", show_alert=True)
@@ -225,9 +225,9 @@ async def invoice_product_selected(update: Update, context: ContextTypes.DEFAULT
     context.user_data['invoice_product_id'] = product_id
     
     # دریافت پک‌های محصول
-    db = context.bot_data['db']
-    packs = db.get_packs(product_id)
-    product = db.get_product(product_id)
+    db = context.bot_data['adb']
+    packs = await db.get_packs(product_id)
+    product = await db.get_product(product_id)
     
     if not packs:
         await query.answer("❌ این محصول پکی ندارد!", show_alert=True)
@@ -308,10 +308,10 @@ async def invoice_quantity_received(update: Update, context: ContextTypes.DEFAUL
         pack_id = context.user_data.get('invoice_pack_id')
         
         # افزودن به سبد کاربر
-        db = context.bot_data['db']
+        db = context.bot_data['adb']
         
         # دریافت اطلاعات پک
-        pack = db.get_pack(pack_id)
+        pack = await db.get_pack(pack_id)
         if not pack:
             await update.message.reply_text("❌ پک یافت نشد!")
             return ConversationHandler.END
@@ -319,7 +319,7 @@ async def invoice_quantity_received(update: Update, context: ContextTypes.DEFAUL
         _, product_id, pack_name, pack_qty, price = pack
         
         # افزودن به سبد
-        db.add_to_cart(user_id, product_id, pack_id, quantity)
+        await db.add_to_cart(user_id, product_id, pack_id, quantity)
         
         total_price = price * quantity
         
@@ -351,8 +351,8 @@ async def invoice_view_draft(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     user_id = int(query.data.split(":")[1])
     
-    db = context.bot_data['db']
-    cart_items = db.get_cart(user_id)
+    db = context.bot_data['adb']
+    cart_items = await db.get_cart(user_id)
     
     if not cart_items:
         text = "🛒 **سبد خرید خالی است**\n\n"
@@ -389,8 +389,8 @@ async def invoice_finalize(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user_id = int(query.data.split(":")[1])
     
-    db = context.bot_data['db']
-    cart_items = db.get_cart(user_id)
+    db = context.bot_data['adb']
+    cart_items = await db.get_cart(user_id)
     
     if not cart_items:
         await query.answer("❌ سبد خرید خالی است!", show_alert=True)
@@ -415,7 +415,7 @@ async def invoice_finalize(update: Update, context: ContextTypes.DEFAULT_TYPE):
         })
     
     # ثبت سفارش
-    order_id = db.create_order(
+    order_id = await db.create_order(
         user_id=user_id,
         items=items_data,
         total_price=total_price,
@@ -426,7 +426,7 @@ async def invoice_finalize(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if order_id:
         # خالی کردن سبد
-        db.clear_cart(user_id)
+        await db.clear_cart(user_id)
         
         await query.message.reply_text(
             f"✅ **فاکتور ثبت شد**\n\n"
@@ -484,8 +484,8 @@ async def invoice_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user_id = int(query.data.split(":")[1])
     
-    db = context.bot_data['db']
-    db.clear_cart(user_id)
+    db = context.bot_data['adb']
+    await db.clear_cart(user_id)
     
     await query.message.reply_text(
         "❌ **فاکتور لغو شد**\n\n"
@@ -507,8 +507,8 @@ async def invoice_remove_item(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
     
     user_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
-    cart_items = db.get_cart(user_id)
+    db = context.bot_data['adb']
+    cart_items = await db.get_cart(user_id)
     
     if not cart_items:
         await query.answer("سبد خالی است!", show_alert=True)
@@ -544,8 +544,8 @@ async def invoice_remove_item_confirm(update: Update, context: ContextTypes.DEFA
     user_id = int(data_parts[1])
     cart_id = int(data_parts[2])
     
-    db = context.bot_data['db']
-    db.remove_from_cart(cart_id)
+    db = context.bot_data['adb']
+    await db.remove_from_cart(cart_id)
     
     await query.answer("✅ آیتم حذف شد", show_alert=True)
     
@@ -558,8 +558,8 @@ async def invoice_edit_quantity_menu(update: Update, context: ContextTypes.DEFAU
     await query.answer()
     
     user_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
-    cart_items = db.get_cart(user_id)
+    db = context.bot_data['adb']
+    cart_items = await db.get_cart(user_id)
     
     if not cart_items:
         await query.answer("سبد خالی است!", show_alert=True)
@@ -616,8 +616,8 @@ async def invoice_increment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     cart_id = int(query.data.split(":")[1])
     
-    db = context.bot_data['db']
-    db.update_cart_quantity(cart_id, increment=1)
+    db = context.bot_data['adb']
+    await db.update_cart_quantity(cart_id, increment=1)
     
     await query.answer("✅ تعداد افزایش یافت")
     user_id = context.user_data.get('invoice_target_user_id')
@@ -630,12 +630,12 @@ async def invoice_decrement(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     cart_id = int(query.data.split(":")[1])
     
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     # چک کردن که تعداد از 1 کمتر نشود
-    cart_item = db.get_cart_item(cart_id)
+    cart_item = await db.get_cart_item(cart_id)
     if cart_item and cart_item[6] > 1:  # item_qty
-        db.update_cart_quantity(cart_id, increment=-1)
+        await db.update_cart_quantity(cart_id, increment=-1)
         await query.answer("✅ تعداد کاهش یافت")
     else:
         await query.answer("❌ حداقل تعداد 1 است", show_alert=True)
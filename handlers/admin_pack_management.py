@@ -22,9 +22,9 @@ async def manage_packs_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     product_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
-    product = db.get_product(product_id)
-    packs = db.get_packs(product_id)
+    db = context.bot_data['adb']
+    product = await db.get_product(product_id)
+    packs = await db.get_packs(product_id)
     
     if not product:
         await query.answer("❌ محصول یافت نشد!", show_alert=True)
@@ -92,8 +92,8 @@ async def confirm_delete_pack(update: Update, context: ContextTypes.DEFAULT_TYPE
     pack_id = int(data[1])
     product_id = int(data[2])
     
-    db = context.bot_data['db']
-    pack = db.get_pack(pack_id)
+    db = context.bot_data['adb']
+    pack = await db.get_pack(pack_id)
     
     if not pack:
         await query.answer("❌ پک یافت نشد!", show_alert=True)
@@ -133,10 +133,10 @@ async def delete_pack_final(update: Update, context: ContextTypes.DEFAULT_TYPE):
     pack_id = int(data[1])
     product_id = int(data[2])
     
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     # حذف پک
-    db.delete_pack(pack_id)
+    await db.delete_pack(pack_id)
     
     await query.edit_message_text(
         "✅ **پک با موفقیت حذف شد!**",
@@ -159,7 +159,7 @@ async def delete_pack_final(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await asyncio.sleep(1)
     
     # بازگشت به منوی مدیریت پک‌ها
-    packs = db.get_packs(product_id)
+    packs = await db.get_packs(product_id)
     
     if not packs:
         await query.message.reply_text(
@@ -183,8 +183,8 @@ async def bulk_delete_packs(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     product_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
-    packs = db.get_packs(product_id)
+    db = context.bot_data['adb']
+    packs = await db.get_packs(product_id)
     
     if not packs:
         await query.answer("❌ پکی وجود ندارد!", show_alert=True)
@@ -2,72 +2,54 @@
 سیستم گزارش‌های گرافیکی و تحلیلی
 ✅ FIX باگ 11: استفاده از aggregation SQL و جدول آماری
 ✅ بهینه‌سازی کوئری‌ها برای داده‌های زیاد
+✅ رسم نمودارها خارج از event loop با کش (chart_renderer)
+✅ داده‌ی نمودارها از snapshot ستونی NumPy (analytics_engine)
 """
-import io
-import json
-from datetime import datetime, timedelta
+from datetime import timedelta
 from telegram import Update
 from telegram.ext import ContextTypes
-from config import ADMIN_ID
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from matplotlib import font_manager
-import matplotlib.dates as mdates
-from collections import defaultdict, Counter
-
-# تنظیم فونت فارسی
-plt.rcParams['font.family'] = 'DejaVu Sans'
-plt.rcParams['axes.unicode_minus'] = False
+from config import ADMIN_ID, CHART_WORKERS, CHART_CACHE_SIZE
+from chart_renderer import ChartRenderer, PERIOD_DAYS
+from analytics_engine import AnalyticsEngine, moving_average
+from collections import defaultdict
 
 
 class Analytics:
     """کلاس تحلیل و گزارش‌گیری - بهینه شده"""
     
     def __init__(self, db):
+        # جدول product_stats و trigger های delta در Database.create_tables ساخته میشن
         self.db = db
-        self._ensure_stats_table()
     
-    def _ensure_stats_table(self):
-        """ایجاد جدول آماری اگر وجود نداشته باشد"""
-        try:
-            self.db.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS product_stats (
-                    product_name TEXT PRIMARY KEY,
-                    total_sold INTEGER DEFAULT 0,
-                    total_revenue REAL DEFAULT 0,
-                    last_order_date TIMESTAMP,
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Index برای سرعت بیشتر
-            self.db.cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_product_stats_sold 
-                ON product_stats(total_sold DESC)
-            """)
-            
-            self.db.conn.commit()
-        except Exception as e:
-            print(f"⚠️ خطا در ایجاد جدول آمار: {e}")
+    def _fetchall(self, query, params=()):
+        """اجرا روی connection فقط‌خواندنی (read_snapshot) تا نوشتن سفارش‌ها block نشه"""
+        with self.db.read_snapshot() as conn:
+            return conn.execute(query, params).fetchall()
+    
+    def _fetchone(self, query, params=()):
+        with self.db.read_snapshot() as conn:
+            return conn.execute(query, params).fetchone()
     
     def cleanup_old_stats(self, days=90):
         """
         🔴 FIX باگ 2: پاکسازی آمار قدیمی
         این تابع باید دوره‌ای (مثلاً هر شب) اجرا بشه
         
+        آمار افزایشی است، پس فقط ردیف محصولاتی حذف میشه که فروششون کامل
+        برگشت خورده (total_sold <= 0) و X روزه تغییری نکردن؛ حذف بقیه جمع کل رو خراب میکنه
+        
         Args:
             days: نگهداری آمار چند روز اخیر (پیشفرض: 90 روز)
         """
         try:
-            # حذف آمار قدیمی‌تر از X روز
-            self.db.cursor.execute("""
-                DELETE FROM product_stats 
-                WHERE last_updated < DATE('now', '-{} days')
-            """.format(days))
-            
-            deleted = self.db.cursor.rowcount
-            self.db.conn.commit()
+            with self.db.transaction() as cursor:
+                cursor.execute("""
+                    DELETE FROM product_stats 
+                    WHERE total_sold <= 0
+                    AND last_updated < DATE('now', ?)
+                """, (f'-{int(days)} days',))
+                
+                deleted = cursor.rowcount
             
             if deleted > 0:
                 print(f"🧹 {deleted} آمار قدیمی پاک شد")
@@ -83,8 +65,7 @@ class Analytics:
         🔴 FIX: چک کردن سایز جدول آمار
         """
         try:
-            self.db.cursor.execute("SELECT COUNT(*) FROM product_stats")
-            count = self.db.cursor.fetchone()[0]
+            count = self._fetchone("SELECT COUNT(*) FROM product_stats")[0]
             
             # تخمین سایز (هر رکورد ~1KB)
             size_kb = count * 1
@@ -102,59 +83,42 @@ class Analytics:
         """
         🔴 FIX باگ 11: به‌روزرسانی جدول آماری
         این تابع باید دوره‌ای (مثلاً هر ساعت) اجرا بشه
+        
+        فقط delta های ثبت شده توسط trigger ها (بعد از high-water mark) اعمال
+        میشن؛ جدول هیچ وقت خالی نمیشه. بازسازی کامل: rebuild_product_stats
         """
         try:
-            # پاک کردن آمار قبلی
-            self.db.cursor.execute("DELETE FROM product_stats")
-            
-            # محاسبه آمار از سفارشات موفق
-            query = """
-                SELECT 
-                    json_extract(value, '$.product') as product_name,
-                    SUM(CAST(json_extract(value, '$.quantity') AS INTEGER)) as total_sold,
-                    SUM(CAST(json_extract(value, '$.price') AS REAL)) as total_revenue,
-                    MAX(o.created_at) as last_order_date
-                FROM orders o,
-                     json_each(o.items)
-                WHERE o.status IN ('confirmed', 'payment_confirmed')
-                GROUP BY product_name
-            """
-            
-            self.db.cursor.execute(query)
-            results = self.db.cursor.fetchall()
-            
-            # Insert در جدول آمار
-            for row in results:
-                product_name, total_sold, total_revenue, last_order = row
-                self.db.cursor.execute("""
-                    INSERT INTO product_stats 
-                    (product_name, total_sold, total_revenue, last_order_date, last_updated)
-                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-                """, (product_name, total_sold or 0, total_revenue or 0, last_order))
-            
-            self.db.conn.commit()
-            print(f"✅ آمار محصولات به‌روزرسانی شد: {len(results)} محصول")
+            report = self.db.apply_product_stats_deltas()
+            if report['deltas']:
+                print(f"✅ آمار محصولات به‌روزرسانی شد: {report['products']} محصول ({report['deltas']} تغییر)")
             return True
             
         except Exception as e:
             print(f"❌ خطا در به‌روزرسانی آمار: {e}")
             return False
     
+    def rebuild_product_stats(self):
+        """بازسازی کامل آمار محصولات در جدول سایه و جایگزینی atomic (عملیات دستی ادمین)"""
+        return self.db.rebuild_product_stats()
+    
+    # get_sales_data / get_popular_products* / get_hourly_orders / get_conversion_rate /
+    # get_revenue_data دیگه در گزارش‌ها استفاده نمیشن (داده از AnalyticsEngine میاد)؛
+    # فقط به عنوان مرجع SQL در تست test_vectorized_reports_match_sql نگه داشته شدن
     def get_sales_data(self, days=30):
-        """دریافت داده‌های فروش - بهینه شده"""
+        """دریافت داده‌های فروش - از جدول آمار روزانه"""
         query = """
-            SELECT DATE(created_at) as date, 
-                   COUNT(*) as order_count,
-                   SUM(final_price) as total_sales
-            FROM orders 
+            SELECT day as date, 
+                   SUM(order_count) as order_count,
+                   SUM(revenue) as total_sales
+            FROM daily_order_stats 
             WHERE status IN ('confirmed', 'payment_confirmed')
-              AND created_at >= DATE('now', '-{} days')
-            GROUP BY DATE(created_at)
+              AND day >= DATE('now', '-{} days')
+            GROUP BY day
+            HAVING SUM(order_count) > 0
             ORDER BY date
         """.format(days)
         
-        self.db.cursor.execute(query)
-        return self.db.cursor.fetchall()
+        return self._fetchall(query)
     
     def get_popular_products(self, limit=10, use_cache=True):
         """
@@ -169,68 +133,46 @@ class Analytics:
             query = """
                 SELECT product_name, total_sold
                 FROM product_stats
+                WHERE total_sold > 0
                 ORDER BY total_sold DESC
                 LIMIT ?
             """
             
-            self.db.cursor.execute(query, (limit,))
-            results = self.db.cursor.fetchall()
+            results = self._fetchall(query, (limit,))
             
             # اگر جدول آمار خالی بود، اول به‌روزرسانی کن
             if not results:
                 self.update_product_stats()
-                self.db.cursor.execute(query, (limit,))
-                results = self.db.cursor.fetchall()
+                results = self._fetchall(query, (limit,))
             
             return results
         
         else:
-            # روش قدیمی - برای مقایسه
-            # ⚠️ این روش با داده زیاد خیلی کنده!
-            query = """
-                SELECT items FROM orders 
-                WHERE status IN ('confirmed', 'payment_confirmed')
-            """
-            
-            self.db.cursor.execute(query)
-            orders = self.db.cursor.fetchall()
-            
-            product_counter = Counter()
-            
-            for order in orders:
-                items = json.loads(order[0])
-                for item in items:
-                    product_name = item.get('product', 'Unknown')
-                    quantity = item.get('quantity', 0)
-                    product_counter[product_name] += quantity
-            
-            return product_counter.most_common(limit)
+            return self.get_popular_products_fast(limit)
     
     def get_popular_products_fast(self, limit=10):
         """
-        🔴 FIX باگ 11: روش سریع‌تر با JSON aggregation در SQLite
-        این روش از جدول آمار استفاده نمیکنه ولی خیلی سریع‌تره
+        🔴 FIX باگ 11: محاسبه‌ی مستقیم با aggregation روی order_items
+        این روش از جدول آمار استفاده نمیکنه و همیشه به‌روزه
         """
         try:
             query = """
                 SELECT 
-                    json_extract(value, '$.product') as product_name,
-                    SUM(CAST(json_extract(value, '$.quantity') AS INTEGER)) as total_quantity
-                FROM orders,
-                     json_each(orders.items)
-                WHERE status IN ('confirmed', 'payment_confirmed')
-                GROUP BY product_name
+                    oi.product_name,
+                    SUM(oi.quantity) as total_quantity
+                FROM orders o
+                JOIN order_items oi ON oi.order_id = o.id
+                WHERE o.status IN ('confirmed', 'payment_confirmed')
+                GROUP BY oi.product_name
                 ORDER BY total_quantity DESC
                 LIMIT ?
             """
             
-            self.db.cursor.execute(query, (limit,))
-            return self.db.cursor.fetchall()
+            return self._fetchall(query, (limit,))
             
         except Exception as e:
             print(f"❌ خطا در get_popular_products_fast: {e}")
-            # Fallback به روش معمولی
-            return self.get_popular_products(limit, use_cache=False)
+            return []
     
     def get_hourly_orders(self):
         """ساعات شلوغی سفارش - بهینه شده"""
@@ -243,28 +185,25 @@ class Analytics:
             ORDER BY hour
         """
         
-        self.db.cursor.execute(query)
-        return self.db.cursor.fetchall()
+        return self._fetchall(query)
     
     def get_conversion_rate(self):
-        """نرخ تبدیل - بهینه شده"""
-        # تعداد کل کاربران
-        self.db.cursor.execute("SELECT COUNT(*) FROM users")
-        total_users = self.db.cursor.fetchone()[0]
-        
-        # تعداد کاربران خریدار
-        self.db.cursor.execute("""
-            SELECT COUNT(DISTINCT user_id) FROM orders
-            WHERE status IN ('confirmed', 'payment_confirmed')
-        """)
-        buyers = self.db.cursor.fetchone()[0]
-        
-        # تعداد سفارشات
-        self.db.cursor.execute("""
-            SELECT COUNT(*) FROM orders
-            WHERE status IN ('confirmed', 'payment_confirmed')
-        """)
-        orders = self.db.cursor.fetchone()[0]
+        """نرخ تبدیل - بهینه شده (هر سه شمارش از یک snapshot)"""
+        with self.db.read_snapshot():
+            # تعداد کل کاربران
+            total_users = self._fetchone("SELECT COUNT(*) FROM users")[0]
+            
+            # تعداد کاربران خریدار
+            buyers = self._fetchone("""
+                SELECT COUNT(DISTINCT user_id) FROM orders
+                WHERE status IN ('confirmed', 'payment_confirmed')
+            """)[0]
+            
+            # تعداد سفارشات
+            orders = self._fetchone("""
+                SELECT COUNT(*) FROM orders
+                WHERE status IN ('confirmed', 'payment_confirmed')
+            """)[0]
         
         conversion_rate = (buyers / total_users * 100) if total_users > 0 else 0
         repeat_rate = (orders / buyers) if buyers > 0 else 0
@@ -279,21 +218,21 @@ class Analytics:
         }
     
     def get_revenue_data(self, days=30):
-        """داده‌های درآمد - بهینه شده"""
+        """داده‌های درآمد - از جدول آمار روزانه"""
         query = """
-            SELECT DATE(created_at) as date,
-                   SUM(total_price) as gross_revenue,
+            SELECT day as date,
+                   SUM(gross_amount) as gross_revenue,
                    SUM(discount_amount) as total_discount,
-                   SUM(final_price) as net_revenue
-            FROM orders
+                   SUM(revenue) as net_revenue
+            FROM daily_order_stats
             WHERE status IN ('confirmed', 'payment_confirmed')
-              AND created_at >= DATE('now', '-{} days')
-            GROUP BY DATE(created_at)
+              AND day >= DATE('now', '-{} days')
+            GROUP BY day
+            HAVING SUM(order_count) > 0
             ORDER BY date
         """.format(days)
         
-        self.db.cursor.execute(query)
-        return self.db.cursor.fetchall()
+        return self._fetchall(query)
 
 
 # ==================== تابع برای پاکسازی خودکار ====================
@@ -304,15 +243,15 @@ async def scheduled_cleanup(context):
     این تابع رو در main.py به job_queue اضافه کن
     """
     try:
-        db = context.bot_data.get('db')
-        if db:
-            analytics = Analytics(db)
+        adb = context.bot_data.get('adb')
+        if adb:
+            analytics = Analytics(adb.db)
             
             # پاکسازی آمار قدیمی‌تر از 90 روز
-            deleted = analytics.cleanup_old_stats(days=90)
+            deleted = await adb.run_write(analytics.cleanup_old_stats, days=90)
             
             # چک سایز جدول
-            size_info = analytics.get_table_size()
+            size_info = await adb.run_read(analytics.get_table_size)
             
             print(f"✅ Cleanup done: {deleted} deleted, table size: {size_info['size_mb']} MB")
             
@@ -331,214 +270,84 @@ async def scheduled_cleanup(context):
         print(f"❌ خطا در scheduled_cleanup: {e}")
 
 
-# ==================== توابع نمودارسازی ====================
+# ==================== داده‌ی نمودارها ====================
 
-def create_sales_chart(analytics, period='weekly'):
-    """نمودار فروش"""
-    days_map = {'daily': 7, 'weekly': 30, 'monthly': 90}
-    days = days_map.get(period, 30)
-    
-    data = analytics.get_sales_data(days)
-    
-    if not data:
-        return None
-    
-    dates = [datetime.strptime(row[0], '%Y-%m-%d') for row in data]
-    order_counts = [row[1] for row in data]
-    sales = [row[2]/1000000 for row in data]
-    
-    fig, ax1 = plt.subplots(figsize=(12, 6))
-    
-    color1 = '#3498db'
-    ax1.set_xlabel('Date', fontsize=12)
-    ax1.set_ylabel('Order Count', color=color1, fontsize=12)
-    ax1.plot(dates, order_counts, color=color1, marker='o', linewidth=2, label='Orders')
-    ax1.tick_params(axis='y', labelcolor=color1)
-    ax1.grid(True, alpha=0.3)
-    
-    ax2 = ax1.twinx()
-    color2 = '#2ecc71'
-    ax2.set_ylabel('Sales (Million Toman)', color=color2, fontsize=12)
-    ax2.plot(dates, sales, color=color2, marker='s', linewidth=2, label='Sales')
-    ax2.tick_params(axis='y', labelcolor=color2)
-    
-    if period == 'daily':
-        ax1.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
-    else:
-        ax1.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-    
-    plt.setp(ax1.xaxis.get_majorticklabels(), rotation=45, ha='right')
-    
-    period_title = {'daily': 'Daily', 'weekly': 'Weekly', 'monthly': 'Monthly'}
-    plt.title(f'{period_title[period]} Sales Report', fontsize=16, fontweight='bold', pad=20)
-    
-    fig.tight_layout()
-    
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-    buf.seek(0)
-    plt.close()
-    
-    return buf
+# report_type -> (نمودار، دوره، caption)
+REPORTS = {
+    'sales_daily': ('sales', 'daily', "📊 **گزارش فروش روزانه** (7 روز اخیر)"),
+    'sales_weekly': ('sales', 'weekly', "📊 **گزارش فروش هفتگی** (30 روز اخیر)"),
+    'sales_monthly': ('sales', 'monthly', "📊 **گزارش فروش ماهانه** (90 روز اخیر)"),
+    'popular': ('popular', None, "🏆 **محبوب‌ترین محصولات** (بر اساس تعداد فروش)"),
+    'hourly': ('hourly', None, "⏰ **ساعات شلوغی سفارش‌گذاری** (30 روز اخیر)"),
+    'revenue': ('revenue', 'monthly', "💰 **تحلیل درآمد** (90 روز اخیر)\n\n"
+                                      "🔵 درآمد ناخالص | 🟢 درآمد خالص | 🔴 تخفیفات"),
+    'conversion': ('conversion', None, "📈 **نرخ تبدیل و آمار کاربران**"),
+}
 
 
-def create_popular_products_chart(analytics):
-    """🔴 FIX باگ 11: نمودار محبوب‌ترین محصولات - بهینه شده"""
-    # استفاده از روش سریع
-    products = analytics.get_popular_products_fast(10)
-    
-    if not products:
-        return None
-    
-    names = [p[0][:20] + '...' if len(p[0]) > 20 else p[0] for p in products]
-    counts = [p[1] for p in products]
-    
-    fig, ax = plt.subplots(figsize=(12, 8))
-    
-    colors = plt.cm.viridis([i/len(names) for i in range(len(names))])
-    bars = ax.barh(names, counts, color=colors, edgecolor='black', linewidth=1.5)
-    
-    ax.set_xlabel('Quantity Sold', fontsize=12, fontweight='bold')
-    ax.set_title('Top 10 Popular Products', fontsize=16, fontweight='bold', pad=20)
-    ax.grid(axis='x', alpha=0.3, linestyle='--')
-    
-    for i, (bar, count) in enumerate(zip(bars, counts)):
-        ax.text(count + max(counts)*0.01, bar.get_y() + bar.get_height()/2, 
-                f'{count}', va='center', fontsize=10, fontweight='bold')
-    
-    plt.tight_layout()
-    
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-    buf.seek(0)
-    plt.close()
-    
-    return buf
+# پنجره‌ی میانگین متحرک فروش (روز)
+SALES_MA_WINDOW = 7
 
 
-def create_hourly_orders_chart(analytics):
-    """نمودار ساعات شلوغی"""
-    data = analytics.get_hourly_orders()
-    
-    if not data:
-        return None
-    
-    hours_dict = {str(i).zfill(2): 0 for i in range(24)}
-    for hour, count in data:
-        hours_dict[hour] = count
-    
-    hours = list(range(24))
-    counts = [hours_dict[str(h).zfill(2)] for h in hours]
-    
-    fig, ax = plt.subplots(figsize=(14, 6))
-    
-    colors = ['#e74c3c' if c == max(counts) else '#3498db' for c in counts]
-    bars = ax.bar(hours, counts, color=colors, edgecolor='black', linewidth=1.5, alpha=0.8)
-    
-    ax.set_xlabel('Hour of Day', fontsize=12, fontweight='bold')
-    ax.set_ylabel('Number of Orders', fontsize=12, fontweight='bold')
-    ax.set_title('Peak Hours for Orders (Last 30 Days)', fontsize=16, fontweight='bold', pad=20)
-    ax.set_xticks(hours)
-    ax.set_xticklabels([f'{h:02d}:00' for h in hours], rotation=45, ha='right')
-    ax.grid(axis='y', alpha=0.3, linestyle='--')
-    
-    avg = sum(counts) / len(counts)
-    ax.axhline(y=avg, color='orange', linestyle='--', linewidth=2, label=f'Average: {avg:.1f}')
-    ax.legend()
-    
-    for bar, count in zip(bars, counts):
-        if count > 0:
-            ax.text(bar.get_x() + bar.get_width()/2, bar.get_height() + max(counts)*0.01,
-                   f'{int(count)}', ha='center', va='bottom', fontsize=9, fontweight='bold')
-    
-    plt.tight_layout()
-    
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-    buf.seek(0)
-    plt.close()
+def load_chart_data(engine, db, chart, period=None):
+    """
+    داده‌ی نمودار از AnalyticsEngine (روی thread دیتابیس اجرا میشه)
+    مبالغ به میلیون تومان و تاریخ‌ها datetime64 هستن - بدون حلقه‌ی پایتونی روی ردیف‌ها
+
+    Returns:
+        ورودی chart_renderer، یا None اگه داده‌ای نباشه
+    """
+    engine.refresh(db)
     
-    return buf
+    if chart == 'sales':
+        days = PERIOD_DAYS[period]
+        daily = engine.series(days, dense=True)
+        if not daily['orders'].any():
+            return None
+        
+        has_orders = daily['orders'] > 0
+        return {
+            'dates': daily['start'][has_orders],
+            'orders': daily['orders'][has_orders],
+            'sales': daily['net'][has_orders] / 1e6,
+            'ma_dates': daily['start'],
+            'ma': moving_average(daily['net'], SALES_MA_WINDOW) / 1e6 if days > SALES_MA_WINDOW else daily['net'][:0],
+            'ma_window': SALES_MA_WINDOW,
+        }
+    elif chart == 'popular':
+        return engine.top_products(10)
+    elif chart == 'hourly':
+        counts = engine.hourly_histogram(30)
+        return counts if counts.any() else None
+    elif chart == 'revenue':
+        daily = engine.series(PERIOD_DAYS[period])
+        if not daily['orders'].size:
+            return None
+        return {
+            'dates': daily['start'],
+            'gross': daily['gross'] / 1e6,
+            'net': daily['net'] / 1e6,
+        }
+    elif chart == 'conversion':
+        return engine.conversion(db.count_users())
+    else:
+        raise ValueError(f"Unknown chart: {chart}")
 
 
-def create_revenue_chart(analytics, period='monthly'):
-    """نمودار درآمد"""
-    days_map = {'weekly': 30, 'monthly': 90}
-    days = days_map.get(period, 30)
-    
-    data = analytics.get_revenue_data(days)
-    
-    if not data:
-        return None
-    
-    dates = [datetime.strptime(row[0], '%Y-%m-%d') for row in data]
-    gross = [row[1]/1000000 for row in data]
-    discounts = [row[2]/1000000 for row in data]
-    net = [row[3]/1000000 for row in data]
-    
-    fig, ax = plt.subplots(figsize=(14, 7))
-    
-    ax.plot(dates, gross, marker='o', linewidth=2, label='Gross Revenue', color='#3498db')
-    ax.plot(dates, net, marker='s', linewidth=2, label='Net Revenue', color='#2ecc71')
-    ax.fill_between(dates, gross, net, alpha=0.2, color='#e74c3c', label='Discounts')
-    
-    ax.set_xlabel('Date', fontsize=12, fontweight='bold')
-    ax.set_ylabel('Revenue (Million Toman)', fontsize=12, fontweight='bold')
-    ax.set_title('Revenue Analysis', fontsize=16, fontweight='bold', pad=20)
-    ax.legend(loc='upper left', fontsize=11)
-    ax.grid(True, alpha=0.3, linestyle='--')
-    
-    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-    plt.setp(ax.xaxis.get_majorticklabels(), rotation=45, ha='right')
-    
-    plt.tight_layout()
-    
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-    buf.seek(0)
-    plt.close()
-    
-    return buf
+def get_analytics_engine(context) -> AnalyticsEngine:
+    """AnalyticsEngine مشترک ربات - snapshot بین گزارش‌ها نگه داشته میشه"""
+    engine = context.bot_data.get('analytics_engine')
+    if engine is None:
+        engine = context.bot_data['analytics_engine'] = AnalyticsEngine()
+    return engine
 
 
-def create_conversion_chart(analytics):
-    """نمودار نرخ تبدیل"""
-    data = analytics.get_conversion_rate()
-    
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 6))
-    
-    labels1 = ['Buyers', 'Non-Buyers']
-    sizes1 = [data['buyers'], data['non_buyers']]
-    colors1 = ['#2ecc71', '#e74c3c']
-    explode1 = (0.1, 0)
-    
-    ax1.pie(sizes1, explode=explode1, labels=labels1, colors=colors1,
-            autopct='%1.1f%%', shadow=True, startangle=90, textprops={'fontsize': 12, 'fontweight': 'bold'})
-    ax1.set_title(f'User Conversion Rate\n{data["conversion_rate"]:.1f}% converted', 
-                  fontsize=14, fontweight='bold', pad=20)
-    
-    categories = ['Total\nUsers', 'Buyers', 'Total\nOrders']
-    values = [data['total_users'], data['buyers'], data['total_orders']]
-    colors2 = ['#3498db', '#2ecc71', '#f39c12']
-    
-    bars = ax2.bar(categories, values, color=colors2, edgecolor='black', linewidth=2, alpha=0.8)
-    ax2.set_ylabel('Count', fontsize=12, fontweight='bold')
-    ax2.set_title(f'Statistics Overview\nRepeat Rate: {data["repeat_rate"]:.2f} orders/buyer', 
-                  fontsize=14, fontweight='bold', pad=20)
-    ax2.grid(axis='y', alpha=0.3, linestyle='--')
-    
-    for bar, value in zip(bars, values):
-        ax2.text(bar.get_x() + bar.get_width()/2, bar.get_height() + max(values)*0.02,
-                f'{int(value)}', ha='center', va='bottom', fontsize=12, fontweight='bold')
-    
-    plt.tight_layout()
-    
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-    buf.seek(0)
-    plt.close()
-    
-    return buf
+def get_chart_renderer(context) -> ChartRenderer:
+    """ChartRenderer مشترک ربات (در main ساخته میشه)"""
+    renderer = context.bot_data.get('chart_renderer')
+    if renderer is None:
+        renderer = context.bot_data['chart_renderer'] = ChartRenderer(CHART_WORKERS, CHART_CACHE_SIZE)
+    return renderer
 
 
 # ==================== Telegram Handlers ====================
@@ -570,46 +379,18 @@ async def handle_analytics_report(update: Update, context: ContextTypes.DEFAULT_
     
     await query.message.reply_text("⏳ در حال تولید گزارش...\nلطفاً صبر کنید...")
     
-    db = context.bot_data['db']
-    analytics = Analytics(db)
+    if report_type not in REPORTS:
+        await query.message.reply_text("❌ نوع گزارش نامعتبر است!")
+        return
     
-    # 🔴 FIX باگ 11: به‌روزرسانی آمار قبل از نمایش گزارش محصولات
-    if report_type == 'popular':
-        analytics.update_product_stats()
+    chart_name, period, caption = REPORTS[report_type]
+    
+    adb = context.bot_data['adb']
     
     try:
-        if report_type == 'sales_daily':
-            chart = create_sales_chart(analytics, 'daily')
-            caption = "📊 **گزارش فروش روزانه** (7 روز اخیر)"
-        
-        elif report_type == 'sales_weekly':
-            chart = create_sales_chart(analytics, 'weekly')
-            caption = "📊 **گزارش فروش هفتگی** (30 روز اخیر)"
-        
-        elif report_type == 'sales_monthly':
-            chart = create_sales_chart(analytics, 'monthly')
-            caption = "📊 **گزارش فروش ماهانه** (90 روز اخیر)"
-        
-        elif report_type == 'popular':
-            chart = create_popular_products_chart(analytics)
-            caption = "🏆 **محبوب‌ترین محصولات** (بر اساس تعداد فروش)"
-        
-        elif report_type == 'hourly':
-            chart = create_hourly_orders_chart(analytics)
-            caption = "⏰ **ساعات شلوغی سفارش‌گذاری** (30 روز اخیر)"
-        
-        elif report_type == 'revenue':
-            chart = create_revenue_chart(analytics, 'monthly')
-            caption = "💰 **تحلیل درآمد** (90 روز اخیر)\n\n" \
-                     "🔵 درآمد ناخالص | 🟢 درآمد خالص | 🔴 تخفیفات"
-        
-        elif report_type == 'conversion':
-            chart = create_conversion_chart(analytics)
-            caption = "📈 **نرخ تبدیل و آمار کاربران**"
-        
-        else:
-            await query.message.reply_text("❌ نوع گزارش نامعتبر است!")
-            return
+        data = await adb.run_read(load_chart_data, get_analytics_engine(context), adb.db, chart_name, period)
+        # رسم در process pool - اگه داده عوض نشده باشه از کش
+        chart = await get_chart_renderer(context).render(chart_name, period, data)
         
         if chart:
             await query.message.reply_photo(
@@ -630,10 +411,10 @@ async def scheduled_stats_update(context: ContextTypes.DEFAULT_TYPE):
     این تابع باید هر ساعت یا هر 30 دقیقه اجرا بشه
     """
     try:
-        db = context.bot_data.get('db')
-        if db:
-            analytics = Analytics(db)
-            success = analytics.update_product_stats()
+        adb = context.bot_data.get('adb')
+        if adb:
+            analytics = Analytics(adb.db)
+            success = await adb.run_write(analytics.update_product_stats)
             if success:
                 print("✅ آمار محصولات به‌روزرسانی شد")
             else:
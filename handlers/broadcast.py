@@ -1,26 +1,51 @@
 """
 سیستم پیام‌رسانی همگانی
-✅ FIX: Batch Processing با Progress Bar
 ✅ FIX: Error handling بهتر
 ✅ FIX: Retry mechanism
-✅ بهینه‌سازی سرعت ارسال
+✅ ارسال با سرعت ثابت نزدیک به سقف Telegram (BroadcastEngine)
+✅ Progress Bar با به‌روزرسانی محدود (هر چند ثانیه)
+✅ job ماندگار: وضعیت هر گیرنده در broadcast_deliveries ثبت میشه و
+   بعد از restart از همون جا ادامه پیدا میکنه؛ توقف/ادامه/لغو از پنل ادمین
+✅ ارسال به گروه‌های مخاطب (خریداران اخیر، سبد پر، ...) از جدول audience_members
+✅ کاربرانی که ربات رو بلاک کردن علامت میخورن و در ارسال‌های بعدی حذف میشن؛
+   هر چند وقت یک بار (probe_blocked_users) دوباره بررسی میشن
+
+نتیجه‌ها هر CHECKPOINT_SIZE ارسال (یا هر PROGRESS_INTERVAL ثانیه) ذخیره میشن؛
+در crash حداکثر همین تعداد پیام ممکنه دوباره فرستاده بشه.
 """
-import asyncio
 from telegram import Update
+from telegram.constants import ChatAction
 from telegram.ext import ContextTypes, ConversationHandler
-from telegram.error import RetryAfter, TimedOut, NetworkError, Forbidden
-from config import ADMIN_ID
+from config import ADMIN_ID, BROADCAST_RATE
 from logger import log_broadcast, log_error
 from states import BROADCAST_MESSAGE
-from keyboards import cancel_keyboard, admin_main_keyboard, broadcast_confirm_keyboard
+from keyboards import (
+    cancel_keyboard, admin_main_keyboard, broadcast_confirm_keyboard, broadcast_job_keyboard,
+    broadcast_segments_keyboard, broadcast_discount_segment_keyboard, BROADCAST_SEGMENTS
+)
+from broadcast_engine import BroadcastEngine, block_reason
 import logging
 
 logger = logging.getLogger(__name__)
 
-# 🔥 تنظیمات Batch Processing
-BATCH_SIZE = 30  # ارسال به 30 نفر همزمان
-BATCH_DELAY = 1  # تاخیر 1 ثانیه بین هر batch
+# 🔥 تنظیمات ارسال
+BROADCAST_WORKERS = 32  # حداکثر ارسال همزمان
 RETRY_ATTEMPTS = 3  # تعداد تلاش مجدد
+PROGRESS_INTERVAL = 3  # حداقل فاصله‌ی به‌روزرسانی پیام پیشرفت (ثانیه)
+CHECKPOINT_SIZE = 50  # ثبت نتیجه‌ها در دیتابیس بعد از این تعداد ارسال
+PAGE_SIZE = 1000  # تعداد گیرنده‌ی خوانده شده از دیتابیس در هر مرحله
+BLOCKED_REPROBE_DAYS = 30  # بررسی دوباره‌ی کاربر بلاک‌شده بعد از این مدت
+PROBE_BATCH = 200  # حداکثر کاربر بررسی شده در هر اجرا
+PROBE_RATE = 5  # سرعت بررسی (درخواست در ثانیه) - سهم کمی از محدودیت Telegram
+AUDIENCE_MAX_AGE = 600  # گروه مخاطب ساخته شده تا این مدت (ثانیه) دوباره محاسبه نمیشه
+
+STATUS_LABELS = {
+    'pending': "⏳ **در صف ارسال...**",
+    'running': "⏳ **در حال ارسال...**",
+    'paused': "⏸ **ارسال متوقف شده**",
+    'cancelled': "🛑 **ارسال لغو شد**",
+    'completed': "✅ **ارسال پیام همگانی تکمیل شد!**",
+}
 
 
 async def broadcast_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -37,6 +62,8 @@ async def broadcast_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data.pop('broadcast_type', None)
     context.user_data.pop('broadcast_content', None)
     context.user_data.pop('broadcast_caption', None)
+    context.user_data.pop('broadcast_preview', None)
+    context.user_data.pop('broadcast_audience', None)
     
     await update.message.reply_text(
         "📢 **پیام‌رسانی همگانی**\n\n"
@@ -82,10 +109,11 @@ async def broadcast_message_received(update: Update, context: ContextTypes.DEFAU
         )
         return BROADCAST_MESSAGE
     
+    context.user_data['broadcast_preview'] = preview
+    
     # تعداد کاربران
-    db = context.bot_data['db']
-    users = db.get_all_users()
-    user_count = len(users)
+    db = context.bot_data['adb']
+    user_count = await db.count_users(reachable_only=True)
     
     await update.message.reply_text(
         f"📊 **پیش‌نمایش پیام:**\n\n"
@@ -99,80 +127,165 @@ async def broadcast_message_received(update: Update, context: ContextTypes.DEFAU
     return ConversationHandler.END
 
 
-async def send_message_to_user(context, user_id, broadcast_type, broadcast_content, broadcast_caption):
+async def send_message_to_user(bot, user_id, broadcast_type, broadcast_content, broadcast_caption):
     """
-    🔥 ارسال پیام به یک کاربر با Retry
+    🔥 ارسال پیام به یک کاربر
+    
+    retry و back-off با BroadcastEngine است؛ خطاهای Telegram بالا داده میشن.
     """
-    for attempt in range(RETRY_ATTEMPTS):
-        try:
-            if broadcast_type == 'text':
-                await context.bot.send_message(
-                    user_id,
-                    broadcast_content,
-                    parse_mode='Markdown'
-                )
-            elif broadcast_type == 'photo':
-                await context.bot.send_photo(
-                    user_id,
-                    broadcast_content,
-                    caption=broadcast_caption if broadcast_caption else None,
-                    parse_mode='Markdown' if broadcast_caption else None
-                )
-            elif broadcast_type == 'video':
-                await context.bot.send_video(
-                    user_id,
-                    broadcast_content,
-                    caption=broadcast_caption if broadcast_caption else None,
-                    parse_mode='Markdown' if broadcast_caption else None
-                )
-            
-            return 'success', None
-        
-        except Forbidden as e:
-            # کاربر ربات را بلاک کرده
-            return 'blocked', str(e)
-        
-        except RetryAfter as e:
-            # محدودیت Telegram - صبر کن
-            logger.warning(f"⚠️ RetryAfter {e.retry_after}s for user {user_id}")
-            if attempt < RETRY_ATTEMPTS - 1:
-                await asyncio.sleep(e.retry_after)
-            else:
-                return 'rate_limited', str(e)
+    if broadcast_type == 'text':
+        return await bot.send_message(
+            user_id,
+            broadcast_content,
+            parse_mode='Markdown'
+        )
+    
+    if broadcast_type == 'photo':
+        return await bot.send_photo(
+            user_id,
+            broadcast_content,
+            caption=broadcast_caption if broadcast_caption else None,
+            parse_mode='Markdown' if broadcast_caption else None
+        )
+    
+    if broadcast_type == 'video':
+        return await bot.send_video(
+            user_id,
+            broadcast_content,
+            caption=broadcast_caption if broadcast_caption else None,
+            parse_mode='Markdown' if broadcast_caption else None
+        )
+    
+    raise ValueError(f"Unknown broadcast type: {broadcast_type}")
+
+
+def format_progress(stats: dict, status: str = 'running') -> str:
+    """متن پیام پیشرفت ارسال (از آمار جدول broadcast_deliveries)"""
+    total = stats['total']
+    processed = stats['processed']
+    progress = int(processed / total * 100) if total else 0
+    failed = stats['network_error'] + stats['error']
+    
+    return (
+        f"{STATUS_LABELS.get(status, status)}\n\n"
+        f"👥 کل: {total} کاربر\n"
+        f"📊 پیشرفت: {progress}% ({processed}/{total})\n\n"
+        f"✅ موفق: {stats['success']}\n"
+        f"🚫 بلاک: {stats['blocked']}\n"
+        f"⚠️ Rate Limited: {stats['rate_limited']}\n"
+        f"❌ خطا: {failed}"
+    )
+
+
+def format_report(stats: dict) -> str:
+    """گزارش نهایی ارسال"""
+    total = stats['total']
+    failed = stats['network_error'] + stats['error']
+    success_rate = (stats['success'] / total * 100) if total > 0 else 0
+    
+    report = f"{STATUS_LABELS['completed']}\n\n"
+    report += f"📊 **نتیجه:**\n"
+    report += f"├ کل: {total}\n"
+    report += f"├ ✅ موفق: {stats['success']}\n"
+    report += f"├ 🚫 بلاک شده: {stats['blocked']}\n"
+    report += f"├ ⚠️ محدودیت: {stats['rate_limited']}\n"
+    report += f"└ ❌ خطا: {failed}\n\n"
+    report += f"📈 **نرخ موفقیت:** {success_rate:.1f}%\n\n"
+    
+    if stats['rate_limited'] > 0:
+        report += f"⚠️ {stats['rate_limited']} کاربر به دلیل محدودیت Telegram پیام دریافت نکردند.\n"
+    
+    return report
+
+
+async def broadcast_choose_segment(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """نمایش گروه‌های مخاطب"""
+    query = update.callback_query
+    await query.answer()
+    
+    if not update.effective_user or update.effective_user.id != ADMIN_ID:
+        return
+    
+    await query.edit_message_text(
+        "🎯 **پیام برای کدام گروه ارسال شود؟**",
+        parse_mode='Markdown',
+        reply_markup=broadcast_segments_keyboard()
+    )
+
+
+async def broadcast_segment_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    انتخاب گروه مخاطب: ساخت (یا استفاده از) audience و نمایش تعداد گیرندگان
+    
+    callback_data: bcast_seg:<segment> یا bcast_seg:used_discount:<discount_id>
+    """
+    query = update.callback_query
+    
+    if not update.effective_user or update.effective_user.id != ADMIN_ID:
+        await query.answer()
+        return
+    
+    parts = query.data.split(':')
+    segment = parts[1] if len(parts) > 1 else ''
+    db = context.bot_data['adb']
+    
+    if segment not in dict(BROADCAST_SEGMENTS):
+        await query.answer("❌ گروه نامعتبر!", show_alert=True)
+        return
+    
+    param = ''
+    label = dict(BROADCAST_SEGMENTS)[segment]
+    
+    if segment == 'used_discount':
+        if len(parts) < 3:
+            discounts = await db.get_all_discounts()
+            if not discounts:
+                await query.answer("❌ هیچ کد تخفیفی وجود ندارد!", show_alert=True)
+                return
+            await query.answer()
+            await query.edit_message_text(
+                "🎁 **کد تخفیف مورد نظر را انتخاب کنید:**",
+                parse_mode='Markdown',
+                reply_markup=broadcast_discount_segment_keyboard(discounts)
+            )
+            return
         
-        except (TimedOut, NetworkError) as e:
-            # مشکل شبکه - retry
-            if attempt < RETRY_ATTEMPTS - 1:
-                await asyncio.sleep(2 ** attempt)  # exponential backoff
-            else:
-                return 'network_error', str(e)
+        if not parts[2].isdigit():
+            await query.answer("❌ کد تخفیف نامعتبر!", show_alert=True)
+            return
         
-        except Exception as e:
-            # خطای دیگر
-            logger.error(f"❌ Error sending to {user_id}: {e}")
-            return 'error', str(e)
+        discount = await db.get_discount_by_id(int(parts[2]))
+        if not discount:
+            await query.answer("❌ کد تخفیف یافت نشد!", show_alert=True)
+            return
+        param = discount[1]
+        label = f"🎁 استفاده از کد {param}"
+    
+    await query.answer("⏳ در حال محاسبه‌ی گروه...")
+    audience = await db.get_audience(segment, param, AUDIENCE_MAX_AGE)
+    context.user_data['broadcast_audience'] = audience['id']
     
-    return 'error', 'Max retries exceeded'
+    preview = context.user_data.get('broadcast_preview', '')
+    
+    await query.edit_message_text(
+        f"📊 **پیش‌نمایش پیام:**\n\n"
+        f"{preview}\n\n"
+        f"🎯 گروه: {label}\n"
+        f"👥 تعداد گیرندگان: {audience['size']} نفر\n\n"
+        f"❓ آیا مطمئن هستید؟",
+        parse_mode='Markdown',
+        reply_markup=broadcast_confirm_keyboard()
+    )
 
 
 async def confirm_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    🔥 تایید و ارسال پیام همگانی با Batch Processing
+    🔥 تایید پیام همگانی: ساخت job و اجرای اون در پس‌زمینه
     """
     query = update.callback_query
     await query.answer()
     
-    db = context.bot_data['db']
-    
-    try:
-        users = db.get_all_users()
-    except Exception as e:
-        log_error("Broadcast", f"خطا در دریافت لیست کاربران: {e}")
-        await query.edit_message_text(
-            "❌ خطا در دریافت لیست کاربران!",
-            reply_markup=admin_main_keyboard()
-        )
-        return
+    db = context.bot_data['adb']
     
     broadcast_type = context.user_data.get('broadcast_type')
     broadcast_content = context.user_data.get('broadcast_content')
@@ -182,113 +295,235 @@ async def confirm_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("❌ خطا! پیامی یافت نشد.")
         return
     
-    total_users = len(users)
+    try:
+        job_id = await db.create_broadcast_job(
+            broadcast_type, broadcast_content, broadcast_caption, update.effective_user.id,
+            audience_id=context.user_data.get('broadcast_audience')
+        )
+    except Exception as e:
+        log_error("Broadcast", f"خطا در ایجاد job پیام همگانی: {e}")
+        await query.edit_message_text(
+            "❌ خطا در دریافت لیست کاربران!",
+            reply_markup=admin_main_keyboard()
+        )
+        return
+    
+    stats = await db.get_broadcast_stats(job_id)
     
-    # پیام اولیه
+    # پیام پیشرفت (بعد از restart هم همین پیام به‌روز میشه)
     progress_msg = await query.edit_message_text(
-        f"⏳ **در حال ارسال...**\n\n"
-        f"👥 کل: {total_users} کاربر\n"
-        f"📊 پیشرفت: 0%\n"
-        f"✅ موفق: 0\n"
-        f"❌ ناموفق: 0",
-        parse_mode='Markdown'
+        format_progress(stats, 'pending'),
+        parse_mode='Markdown',
+        reply_markup=broadcast_job_keyboard(job_id, 'pending')
     )
+    await db.set_broadcast_progress_message(job_id, progress_msg.chat_id, progress_msg.message_id)
     
-    # 🔥 شمارنده‌ها
-    success_count = 0
-    blocked_count = 0
-    failed_count = 0
-    rate_limited_count = 0
+    start_broadcast_job(context.job_queue, job_id)
+    logger.info(f"📢 Broadcast job #{job_id} queued for {stats['total']} users")
     
-    # 🔥 Batch Processing
-    for i in range(0, total_users, BATCH_SIZE):
-        batch = users[i:i + BATCH_SIZE]
-        batch_tasks = []
-        
-        # ایجاد task های همزمان برای این batch
-        for user in batch:
-            user_id = user[0]
-            task = send_message_to_user(
-                context, 
-                user_id, 
-                broadcast_type, 
-                broadcast_content, 
-                broadcast_caption
-            )
-            batch_tasks.append(task)
-        
-        # اجرای همزمان
-        results = await asyncio.gather(*batch_tasks, return_exceptions=True)
-        
-        # پردازش نتایج
-        for result in results:
-            if isinstance(result, tuple):
-                status, error = result
-                if status == 'success':
-                    success_count += 1
-                elif status == 'blocked':
-                    blocked_count += 1
-                elif status == 'rate_limited':
-                    rate_limited_count += 1
-                else:
-                    failed_count += 1
-            else:
-                # Exception رخ داده
-                failed_count += 1
+    # پاک کردن داده‌های موقت
+    context.user_data.clear()
+
+
+def start_broadcast_job(job_queue, job_id: int, delay: float = 0):
+    """اجرای job پیام همگانی به عنوان task پس‌زمینه‌ی JobQueue"""
+    job_queue.run_once(run_broadcast_job, when=delay, data=job_id, name=f"broadcast:{job_id}")
+
+
+async def pending_recipients(db, job_id: int):
+    """گیرنده‌هایی که هنوز پیام نگرفتن، صفحه به صفحه از دیتابیس"""
+    after_user_id = 0
+    
+    while True:
+        page = await db.get_pending_deliveries(job_id, after_user_id, PAGE_SIZE)
+        if not page:
+            return
         
-        # 🔥 به‌روزرسانی Progress
-        processed = min(i + BATCH_SIZE, total_users)
-        progress = int((processed / total_users) * 100)
+        for user_id in page:
+            yield user_id
         
-        try:
-            await progress_msg.edit_text(
-                f"⏳ **در حال ارسال...**\n\n"
-                f"👥 کل: {total_users} کاربر\n"
-                f"📊 پیشرفت: {progress}% ({processed}/{total_users})\n\n"
-                f"✅ موفق: {success_count}\n"
-                f"🚫 بلاک: {blocked_count}\n"
-                f"⚠️ Rate Limited: {rate_limited_count}\n"
-                f"❌ خطا: {failed_count}",
-                parse_mode='Markdown'
-            )
-        except Exception as e:
-            logger.warning(f"⚠️ Failed to update progress: {e}")
+        after_user_id = page[-1]
+
+
+async def edit_job_message(bot, job, text: str, reply_markup=None):
+    """به‌روزرسانی پیام پیشرفت ادمین"""
+    if not job['progress_chat_id']:
+        return
+    
+    try:
+        await bot.edit_message_text(
+            text,
+            chat_id=job['progress_chat_id'],
+            message_id=job['progress_message_id'],
+            parse_mode='Markdown',
+            reply_markup=reply_markup
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to update progress: {e}")
+
+
+async def run_broadcast_job(context: ContextTypes.DEFAULT_TYPE):
+    """
+    اجرای یک job پیام همگانی (JobQueue)
+    
+    فقط گیرنده‌های pending فرستاده میشن، پس اجرای دوباره (بعد از restart یا
+    ادامه بعد از توقف) به کسی دو بار پیام نمیده.
+    """
+    job_id = context.job.data
+    db = context.bot_data['adb']
+    engines = context.bot_data.setdefault('broadcast_engines', {})
+    
+    if job_id in engines:
+        # اجرای قبلی هنوز ارسال‌های در جریان رو تموم میکنه
+        start_broadcast_job(context.job_queue, job_id, delay=1)
+        return
+    
+    job = await db.get_broadcast_job(job_id)
+    if not job or not await db.set_broadcast_job_status(job_id, 'running'):
+        return
+    
+    results = []
+    
+    async def checkpoint():
+        if results:
+            batch = results[:]
+            results.clear()
+            await db.record_broadcast_deliveries(job_id, batch)
+            
+            # در ارسال‌های بعدی به این کاربرها پیامی فرستاده نمیشه
+            blocked = [(user_id, block_reason(error))
+                       for user_id, status, _, error in batch if status == 'blocked']
+            await db.mark_users_blocked(blocked)
+    
+    async def send(user_id):
+        return await send_message_to_user(
+            context.bot, user_id, job['message_type'], job['content'], job['caption']
+        )
+    
+    async def on_result(user_id, status, value):
+        if status == 'success':
+            results.append((user_id, status, getattr(value, 'message_id', None), None))
+        else:
+            results.append((user_id, status, None, str(value)))
         
-        # تاخیر بین batch ها
-        if i + BATCH_SIZE < total_users:
-            await asyncio.sleep(BATCH_DELAY)
-    
-    # لاگ broadcast
-    log_broadcast(
-        update.effective_user.id,
-        success_count,
-        blocked_count + failed_count + rate_limited_count,
-        total_users
+        if len(results) >= CHECKPOINT_SIZE:
+            await checkpoint()
+    
+    async def on_progress(_):
+        await checkpoint()
+        stats = await db.get_broadcast_stats(job_id)
+        await edit_job_message(context.bot, job, format_progress(stats), broadcast_job_keyboard(job_id, 'running'))
+    
+    engine = BroadcastEngine(
+        send,
+        rate=BROADCAST_RATE,
+        workers=BROADCAST_WORKERS,
+        max_attempts=RETRY_ATTEMPTS,
+        progress_interval=PROGRESS_INTERVAL,
+        on_progress=on_progress,
+        on_result=on_result
     )
+    engines[job_id] = engine
     
-    # 🔥 گزارش نهایی
-    success_rate = (success_count / total_users * 100) if total_users > 0 else 0
+    try:
+        await engine.run(pending_recipients(db, job_id))
+    finally:
+        engines.pop(job_id, None)
+        await checkpoint()
     
-    report = "✅ **ارسال پیام همگانی تکمیل شد!**\n\n"
-    report += f"📊 **نتیجه:**\n"
-    report += f"├ کل: {total_users}\n"
-    report += f"├ ✅ موفق: {success_count}\n"
-    report += f"├ 🚫 بلاک شده: {blocked_count}\n"
-    report += f"├ ⚠️ محدودیت: {rate_limited_count}\n"
-    report += f"└ ❌ خطا: {failed_count}\n\n"
-    report += f"📈 **نرخ موفقیت:** {success_rate:.1f}%\n\n"
+    if not engine.stats['cancelled']:
+        await db.set_broadcast_job_status(job_id, 'completed')
     
-    if rate_limited_count > 0:
-        report += f"⚠️ {rate_limited_count} کاربر به دلیل محدودیت Telegram پیام دریافت نکردند.\n"
+    # گزارش نهایی از جدول، نه شمارنده‌های همین اجرا
+    job = await db.get_broadcast_job(job_id)
+    stats = await db.get_broadcast_stats(job_id)
     
-    await progress_msg.edit_text(
-        report,
-        parse_mode='Markdown',
-        reply_markup=admin_main_keyboard()
-    )
+    if job['status'] == 'completed':
+        log_broadcast(job['created_by'], stats['success'], stats['total'] - stats['success'], stats['total'])
+        await edit_job_message(context.bot, job, format_report(stats))
+    else:
+        await edit_job_message(context.bot, job, format_progress(stats, job['status']),
+                               broadcast_job_keyboard(job_id, job['status']))
+
+
+async def probe_blocked_users(context: ContextTypes.DEFAULT_TYPE):
+    """
+    بررسی دوباره‌ی کاربران بلاک‌شده (زمان‌بندی شده، آهسته)
     
-    # پاک کردن داده‌های موقت
-    context.user_data.clear()
+    با send_chat_action (بدون پیام قابل مشاهده) چک میشه که هنوز بلاک هستن یا نه.
+    """
+    db = context.bot_data['adb']
+    user_ids = await db.get_users_to_probe(BLOCKED_REPROBE_DAYS, PROBE_BATCH)
+    if not user_ids:
+        return
+    
+    reachable = []
+    still_blocked = []
+    
+    async def probe(user_id):
+        return await context.bot.send_chat_action(user_id, ChatAction.TYPING)
+    
+    async def on_result(user_id, status, value):
+        if status == 'success':
+            reachable.append(user_id)
+        elif status == 'blocked':
+            still_blocked.append((user_id, block_reason(str(value))))
+    
+    engine = BroadcastEngine(probe, rate=PROBE_RATE, workers=4, on_result=on_result)
+    await engine.run(user_ids)
+    
+    await db.mark_users_reachable(reachable)
+    await db.mark_users_blocked(still_blocked)
+    
+    logger.info(f"🔍 Blocked users probed: {len(reachable)} reachable again, {len(still_blocked)} still blocked")
+
+
+async def resume_broadcast_jobs(context: ContextTypes.DEFAULT_TYPE):
+    """ادامه‌ی job های نیمه‌کاره بعد از restart"""
+    db = context.bot_data['adb']
+    
+    for job in await db.get_broadcast_jobs(('pending', 'running')):
+        logger.info(f"🔄 Resuming broadcast job #{job['id']}")
+        start_broadcast_job(context.job_queue, job['id'])
+
+
+async def broadcast_job_control(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """توقف، ادامه یا لغو یک job پیام همگانی"""
+    query = update.callback_query
+    
+    if not update.effective_user or update.effective_user.id != ADMIN_ID:
+        await query.answer()
+        return
+    
+    _, action, job_id = query.data.split(':')
+    job_id = int(job_id)
+    status = {'pause': 'paused', 'resume': 'running', 'cancel': 'cancelled'}[action]
+    
+    db = context.bot_data['adb']
+    
+    if not await db.set_broadcast_job_status(job_id, status):
+        await query.answer("⚠️ وضعیت این ارسال قابل تغییر نیست", show_alert=True)
+        return
+    
+    await query.answer({'paused': "متوقف شد", 'running': "ادامه ارسال", 'cancelled': "لغو شد"}[status])
+    
+    engine = context.bot_data.get('broadcast_engines', {}).get(job_id)
+    if engine is not None and status in ('paused', 'cancelled'):
+        engine.cancel()
+    
+    if status == 'running':
+        start_broadcast_job(context.job_queue, job_id)
+    
+    stats = await db.get_broadcast_stats(job_id)
+    
+    try:
+        await query.edit_message_text(
+            format_progress(stats, status),
+            parse_mode='Markdown',
+            reply_markup=broadcast_job_keyboard(job_id, status)
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to update progress: {e}")
 
 
 async def cancel_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
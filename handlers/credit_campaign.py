@@ -13,6 +13,7 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from datetime import datetime, timedelta
 import logging
+from database import to_db_timestamp
 
 logger = logging.getLogger(__name__)
 
@@ -337,10 +338,10 @@ async def campaign_credit_expiry_received(update: Update, context: ContextTypes.
         context.user_data['campaign_data']['expiry_days'] = expiry_days
         
         # محاسبه کاربران واجد شرایط
-        db = context.bot_data['db']
+        db = context.bot_data['adb']
         campaign = context.user_data['campaign_data']
         
-        eligible_users = get_eligible_users(db, campaign)
+        eligible_users = await db.run_read(get_eligible_users, db.db, campaign)
         
         if not eligible_users:
             await update.message.reply_text(
@@ -416,27 +417,10 @@ def get_eligible_users(db, campaign):
     max_amount = campaign.get('max_amount')
     credit_percent = campaign['credit_percent'] / 100
     
-    query = """
-        SELECT 
-            user_id,
-            SUM(final_price) as total_amount
-        FROM orders
-        WHERE created_at >= ? AND created_at <= ?
-        AND status = 'confirmed'
-        AND final_price >= ?
-    """
-    
-    params = [start_date, end_date, min_amount]
-    
-    if max_amount:
-        query += " AND final_price <= ?"
-        params.append(max_amount)
-    
-    query += " GROUP BY user_id"
-    
-    cursor = db.conn.cursor()
-    cursor.execute(query, params)
-    results = cursor.fetchall()
+    # created_at به صورت UTC ذخیره شده
+    results = db.get_campaign_totals(
+        to_db_timestamp(start_date), to_db_timestamp(end_date), min_amount, max_amount or None
+    )
     
     eligible_users = []
     for user_id, total_amount in results:
@@ -452,10 +436,10 @@ async def campaign_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await query.message.reply_text("⏳ در حال اجرای کمپین...")
     
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     campaign = context.user_data['campaign_data']
     
-    eligible_users = get_eligible_users(db, campaign)
+    eligible_users = await db.run_read(get_eligible_users, db.db, campaign)
     expiry_days = campaign['expiry_days']
     
     success_count = 0
@@ -467,10 +451,10 @@ async def campaign_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if expiry_days > 0:
                 # اعتبار موقت
                 expiry_date = datetime.now() + timedelta(days=expiry_days)
-                db.add_wallet_credit(user_id, credit_amount, expiry_date=expiry_date, credit_type='campaign')
+                await db.add_wallet_credit(user_id, credit_amount, expiry_date=expiry_date, credit_type='campaign')
             else:
                 # اعتبار دائمی
-                db.add_wallet_credit(user_id, credit_amount, credit_type='campaign')
+                await db.add_wallet_credit(user_id, credit_amount, credit_type='campaign')
             
             success_count += 1
             total_credit += credit_amount
@@ -483,7 +467,7 @@ async def campaign_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     text=f"🎉 **تبریک!**\n\n"
                          f"شما {format_price(credit_amount)} تومان اعتبار {expiry_text} دریافت کردید!\n\n"
                          f"این اعتبار بابت خریدهای شما در کمپین ویژه اعطا شده است.\n\n"
-                         f"💰 موجودی شما: {format_price(db.get_wallet_balance(user_id))} تومان",
+                         f"💰 موجودی شما: {format_price(await db.get_wallet_balance(user_id))} تومان",
                     parse_mode='Markdown'
                 )
             except:
@@ -194,8 +194,8 @@ async def discount_code_received(update: Update, context: ContextTypes.DEFAULT_T
         )
         return DISCOUNT_CODE
     
-    db = context.bot_data['db']
-    existing = db.get_discount(cleaned_code)
+    db = context.bot_data['adb']
+    existing = await db.get_discount(cleaned_code)
     
     if existing:
         logger.warning(f"❌ Duplicate discount code: {cleaned_code}")
@@ -505,10 +505,10 @@ async def discount_end_received(update: Update, context: ContextTypes.DEFAULT_TY
             )
             return DISCOUNT_END
     
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     try:
-        db.create_discount(
+        await db.create_discount(
             code=context.user_data['discount_code'],
             type=context.user_data['discount_type'],
             value=context.user_data['discount_value'],
@@ -571,8 +571,8 @@ async def list_discounts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    db = context.bot_data['db']
-    discounts = db.get_all_discounts()
+    db = context.bot_data['adb']
+    discounts = await db.get_all_discounts()
     
     if not discounts:
         await query.message.reply_text(
@@ -595,12 +595,9 @@ async def view_discount(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     discount_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    discount = db.cursor.execute(
-        "SELECT * FROM discount_codes WHERE id = ?",
-        (discount_id,)
-    ).fetchone()
+    discount = await db.get_discount_by_id(discount_id)
     
     if not discount:
         await query.answer("❌ تخفیف یافت نشد!", show_alert=True)
@@ -660,8 +657,8 @@ async def toggle_discount(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     
     discount_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
-    db.toggle_discount(discount_id)
+    db = context.bot_data['adb']
+    await db.toggle_discount(discount_id)
     
     await query.answer("✅ وضعیت تغییر کرد!")
     
@@ -674,8 +671,8 @@ async def delete_discount(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     
     discount_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
-    db.delete_discount(discount_id)
+    db = context.bot_data['adb']
+    await db.delete_discount(discount_id)
     
     await query.answer("✅ کد تخفیف حذف شد!")
     await query.edit_message_text("🗑 کد تخفیف حذف شد.")
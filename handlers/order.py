@@ -18,6 +18,7 @@ from keyboards import (
     order_items_removal_keyboard
 )
 from states import OrderStatus
+from database import from_db_timestamp
 
 logger = logging.getLogger(__name__)
 
@@ -32,12 +33,9 @@ def get_tehran_now():
 # ==================== HELPER FUNCTIONS ====================
 
 def format_jalali_datetime(dt_str):
-    """تبدیل تاریخ میلادی به شمسی"""
+    """تبدیل تاریخ میلادی (UTC دیتابیس) به شمسی با ساعت تهران"""
     try:
-        if isinstance(dt_str, str):
-            dt = datetime.fromisoformat(dt_str.replace('Z', '+00:00'))
-        else:
-            dt = dt_str
+        dt = from_db_timestamp(dt_str)
         
         jalali = jdatetime.datetime.fromgregorian(datetime=dt)
         return jalali.strftime('%Y-%m-%d %H:%M:%S')
@@ -93,19 +91,14 @@ def is_order_expired(order):
     if not order:
         return True
     
-    expires_at = order[11]  # فیلد expires_at
-    if not expires_at:
+    # ✅ FIX: مقادیر ذخیره شده UTC هستن، from_db_timestamp به تهران تبدیلشون میکنه
+    try:
+        expires_at = from_db_timestamp(order[11])  # فیلد expires_at
+    except ValueError:
         return False
     
-    if isinstance(expires_at, str):
-        try:
-            expires_at = datetime.fromisoformat(expires_at)
-        except:
-            return False
-    
-    # ✅ FIX: اگر expires_at بدون timezone هست، timezone تهران بهش اضافه می‌کنیم
-    if expires_at.tzinfo is None:
-        expires_at = TEHRAN_TZ.localize(expires_at)
+    if not expires_at:
+        return False
     
     return get_tehran_now() > expires_at
 
@@ -161,9 +154,9 @@ def create_order_action_keyboard(order_id, status, is_expired):
 async def view_user_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """نمایش سفارشات کاربر"""
     user_id = update.effective_user.id
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    orders = db.get_user_orders(user_id)
+    orders = await db.get_user_orders(user_id)
     
     if not orders:
         await update.message.reply_text(
@@ -229,8 +222,8 @@ async def handle_continue_payment(update: Update, context: ContextTypes.DEFAULT_
     await query.answer()
     
     order_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
-    order = db.get_order(order_id)
+    db = context.bot_data['adb']
+    order = await db.get_order(order_id)
     
     if not order:
         await query.edit_message_text("❌ سفارش یافت نشد!")
@@ -264,14 +257,14 @@ async def handle_delete_order(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     order_id = int(query.data.split(":")[1])
     user_id = update.effective_user.id
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     if not order or order[1] != user_id:
         await query.edit_message_text("❌ سفارش یافت نشد یا متعلق به شما نیست!")
         return
     
-    success = db.delete_order(order_id)
+    success = await db.delete_order(order_id)
     
     if success:
         await query.edit_message_text("✅ سفارش با موفقیت حذف شد.")
@@ -284,8 +277,8 @@ async def handle_delete_order(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 async def send_order_to_admin(context: ContextTypes.DEFAULT_TYPE, order_id: int):
     """ارسال سفارش به ادمین"""
-    db = context.bot_data['db']
-    order = db.get_order(order_id)
+    db = context.bot_data['adb']
+    order = await db.get_order(order_id)
     
     if not order:
         logger.error(f"❌ سفارش {order_id} یافت نشد برای ارسال به ادمین")
@@ -293,7 +286,7 @@ async def send_order_to_admin(context: ContextTypes.DEFAULT_TYPE, order_id: int)
     
     order_id_val, user_id, items_json, total_price, discount_amount, final_price, discount_code, status, receipt, shipping_method, created_at, expires_at, *_ = order
     items = json.loads(items_json)
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     
     first_name = user[2] if len(user) > 2 else "کاربر"
     username = user[1] if len(user) > 1 and user[1] else "ندارد"
@@ -343,20 +336,10 @@ async def send_order_to_admin(context: ContextTypes.DEFAULT_TYPE, order_id: int)
 
 async def view_pending_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """نمایش سفارشات در انتظار تایید"""
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    # فقط سفارشات pending و غیر منقضی
-    conn = db._get_conn()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT * FROM orders 
-        WHERE status = 'pending'
-        ORDER BY created_at DESC
-    """)
-    all_pending = cursor.fetchall()
-    
-    # فیلتر سفارشات غیر منقضی
-    pending_orders = [order for order in all_pending if not is_order_expired(order)]
+    # فقط سفارشات pending و غیر منقضی (فیلتر انقضا داخل کوئری)
+    pending_orders = await db.get_pending_orders(active_only=True)
     
     if not pending_orders:
         # ✅ FIX: اضافه کردن parse_mode=None
@@ -369,7 +352,7 @@ async def view_pending_orders(update: Update, context: ContextTypes.DEFAULT_TYPE
     for order in pending_orders:
         order_id, user_id, items_json, total_price, discount_amount, final_price, discount_code, status, receipt, shipping_method, created_at, expires_at, *_ = order
         items = json.loads(items_json)
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         
         first_name = user[2] if len(user) > 2 else "کاربر"
         username = user[1] if len(user) > 1 and user[1] else "ندارد"
@@ -413,10 +396,10 @@ async def confirm_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer("✅ سفارش تایید شد")
     
     order_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     # ✅ بررسی منقضی بودن قبل از تایید
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     if is_order_expired(order):
         await query.edit_message_text(
             "⏰ این سفارش منقضی شده و نمی‌توان آن را تایید کرد!\n\n"
@@ -424,7 +407,7 @@ async def confirm_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    db.update_order_status(order_id, OrderStatus.WAITING_PAYMENT)
+    await db.update_order_status(order_id, OrderStatus.WAITING_PAYMENT)
     log_admin_action(ADMIN_ID, f"confirm_order:{order_id}")
     
     user_id = order[1]
@@ -455,12 +438,12 @@ async def reject_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer("❌ سفارش رد شد")
     
     order_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    db.update_order_status(order_id, OrderStatus.REJECTED)
+    await db.update_order_status(order_id, OrderStatus.REJECTED)
     log_admin_action(ADMIN_ID, f"reject_order:{order_id}")
     
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     user_id = order[1]
     
     # ✅ FIX: اضافه کردن parse_mode=None
@@ -492,8 +475,8 @@ async def handle_item_removal(update: Update, context: ContextTypes.DEFAULT_TYPE
         await query.answer("❌ خطا در پردازش!", show_alert=True)
         return
     
-    db = context.bot_data['db']
-    order = db.get_order(order_id)
+    db = context.bot_data['adb']
+    order = await db.get_order(order_id)
     
     if not order:
         await query.answer("❌ سفارش یافت نشد!", show_alert=True)
@@ -518,7 +501,7 @@ async def handle_item_removal(update: Update, context: ContextTypes.DEFAULT_TYPE
     discount_code = order[6]
     
     if discount_code:
-        discount = db.get_discount_by_code(discount_code)
+        discount = await db.get_discount_by_code(discount_code)
         if discount:
             discount_type = discount[2]
             discount_value = discount[3]
@@ -539,12 +522,10 @@ async def handle_item_removal(update: Update, context: ContextTypes.DEFAULT_TYPE
     final_price = total_price - discount_amount
     
     # آپدیت سفارش
-    with db.transaction() as cursor:
-        cursor.execute("""
-            UPDATE orders 
-            SET items = ?, total_price = ?, discount_amount = ?, final_price = ?, discount_code = ?
-            WHERE id = ?
-        """, (json.dumps(items, ensure_ascii=False), total_price, discount_amount, final_price, discount_code, order_id))
+    await db.update_order_items(
+        order_id, items, total_price, discount_amount, final_price,
+        discount_code=discount_code, update_discount_code=True
+    )
     
     await query.answer(f"✅ {removed_item['product']} حذف شد", show_alert=True)
     
@@ -580,8 +561,8 @@ async def handle_item_increase(update: Update, context: ContextTypes.DEFAULT_TYP
         await query.answer("❌ خطا در پردازش!", show_alert=True)
         return
     
-    db = context.bot_data['db']
-    order = db.get_order(order_id)
+    db = context.bot_data['adb']
+    order = await db.get_order(order_id)
     
     if not order:
         await query.answer("❌ سفارش یافت نشد!", show_alert=True)
@@ -603,7 +584,7 @@ async def handle_item_increase(update: Update, context: ContextTypes.DEFAULT_TYP
     discount_code = order[6]
     
     if discount_code:
-        discount = db.get_discount_by_code(discount_code)
+        discount = await db.get_discount_by_code(discount_code)
         if discount:
             discount_type = discount[2]
             discount_value = discount[3]
@@ -624,12 +605,7 @@ async def handle_item_increase(update: Update, context: ContextTypes.DEFAULT_TYP
     final_price = total_price - discount_amount
     
     # آپدیت سفارش
-    with db.transaction() as cursor:
-        cursor.execute("""
-            UPDATE orders 
-            SET items = ?, total_price = ?, discount_amount = ?, final_price = ?
-            WHERE id = ?
-        """, (json.dumps(items, ensure_ascii=False), total_price, discount_amount, final_price, order_id))
+    await db.update_order_items(order_id, items, total_price, discount_amount, final_price)
     
     await query.answer(f"✅ تعداد افزایش یافت", show_alert=False)
     
@@ -665,8 +641,8 @@ async def handle_item_decrease(update: Update, context: ContextTypes.DEFAULT_TYP
         await query.answer("❌ خطا در پردازش!", show_alert=True)
         return
     
-    db = context.bot_data['db']
-    order = db.get_order(order_id)
+    db = context.bot_data['adb']
+    order = await db.get_order(order_id)
     
     if not order:
         await query.answer("❌ سفارش یافت نشد!", show_alert=True)
@@ -693,7 +669,7 @@ async def handle_item_decrease(update: Update, context: ContextTypes.DEFAULT_TYP
     discount_code = order[6]
     
     if discount_code:
-        discount = db.get_discount_by_code(discount_code)
+        discount = await db.get_discount_by_code(discount_code)
         if discount:
             discount_type = discount[2]
             discount_value = discount[3]
@@ -714,12 +690,7 @@ async def handle_item_decrease(update: Update, context: ContextTypes.DEFAULT_TYP
     final_price = total_price - discount_amount
     
     # آپدیت سفارش
-    with db.transaction() as cursor:
-        cursor.execute("""
-            UPDATE orders 
-            SET items = ?, total_price = ?, discount_amount = ?, final_price = ?
-            WHERE id = ?
-        """, (json.dumps(items, ensure_ascii=False), total_price, discount_amount, final_price, order_id))
+    await db.update_order_items(order_id, items, total_price, discount_amount, final_price)
     
     await query.answer(f"✅ تعداد کاهش یافت", show_alert=False)
     
@@ -748,10 +719,10 @@ async def confirm_modified_order(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     
     order_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     # ✅ بررسی منقضی بودن
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     if is_order_expired(order):
         await query.answer("⏰ این سفارش منقضی شده است!", show_alert=True)
         # ✅ FIX: اضافه کردن parse_mode=None
@@ -761,7 +732,7 @@ async def confirm_modified_order(update: Update, context: ContextTypes.DEFAULT_T
         )
         return
     
-    db.update_order_status(order_id, OrderStatus.WAITING_PAYMENT)
+    await db.update_order_status(order_id, OrderStatus.WAITING_PAYMENT)
     
     user_id = order[1]
     final_price = order[5]
@@ -790,11 +761,11 @@ async def reject_full_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     
     order_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    db.update_order_status(order_id, OrderStatus.REJECTED)
+    await db.update_order_status(order_id, OrderStatus.REJECTED)
     
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     user_id = order[1]
     
     # ✅ FIX: اضافه کردن parse_mode=None
@@ -816,16 +787,9 @@ async def reject_full_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def view_payment_receipts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """نمایش رسیدهای پرداخت برای ادمین"""
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    conn = db._get_conn()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT * FROM orders 
-        WHERE status = 'receipt_sent'
-        ORDER BY created_at DESC
-    """)
-    orders = cursor.fetchall()
+    orders = await db.get_receipt_orders()
     
     if not orders:
         # ✅ FIX: اضافه کردن parse_mode=None
@@ -838,7 +802,7 @@ async def view_payment_receipts(update: Update, context: ContextTypes.DEFAULT_TY
     for order in orders:
         order_id, user_id, items_json, total_price, discount_amount, final_price, discount_code, status, receipt, shipping_method, created_at, expires_at, receipt_photo, *_ = order
         items = json.loads(items_json)
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         
         first_name = user[2] if len(user) > 2 else "کاربر"
         username = user[1] if len(user) > 1 and user[1] else "ندارد"
@@ -870,11 +834,11 @@ async def confirm_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer("✅ پرداخت تایید شد")
     
     order_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    db.update_order_status(order_id, OrderStatus.PAYMENT_CONFIRMED)
+    await db.update_order_status(order_id, OrderStatus.PAYMENT_CONFIRMED)
     
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     user_id = order[1]
     log_payment(order_id, user_id, "confirmed")
     
@@ -901,17 +865,9 @@ async def confirm_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def view_not_shipped_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """نمایش سفارشات ارسال نشده (confirmed یا payment_confirmed، بدون shipped)"""
-    db = context.bot_data['db']
-    
-    conn = db._get_conn()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT * FROM orders 
-        WHERE status IN ('payment_confirmed', 'confirmed') 
-        AND (shipping_method IS NULL OR shipping_method != 'shipped')
-        ORDER BY created_at DESC
-    """)
-    orders = cursor.fetchall()
+    db = context.bot_data['adb']
+    
+    orders = await db.get_not_shipped_orders()
     
     if not orders:
         # ✅ FIX: اضافه کردن parse_mode=None
@@ -924,7 +880,7 @@ async def view_not_shipped_orders(update: Update, context: ContextTypes.DEFAULT_
     for order in orders:
         order_id, user_id, items_json, total_price, discount_amount, final_price, discount_code, status, receipt, shipping_method, created_at, expires_at, *_ = order
         items = json.loads(items_json)
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         
         first_name = user[2] if len(user) > 2 else "کاربر"
         username = user[1] if len(user) > 1 and user[1] else "ندارد"
@@ -965,16 +921,9 @@ async def view_not_shipped_orders(update: Update, context: ContextTypes.DEFAULT_
 
 async def view_shipped_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """نمایش سفارشات ارسال شده"""
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    conn = db._get_conn()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT * FROM orders 
-        WHERE shipping_method = 'shipped'
-        ORDER BY created_at DESC
-    """)
-    orders = cursor.fetchall()
+    orders = await db.get_shipped_orders()
     
     if not orders:
         # ✅ FIX: اضافه کردن parse_mode=None
@@ -987,7 +936,7 @@ async def view_shipped_orders(update: Update, context: ContextTypes.DEFAULT_TYPE
     for order in orders:
         order_id, user_id, items_json, total_price, discount_amount, final_price, discount_code, status, receipt, shipping_method_raw, created_at, expires_at, *_ = order
         items = json.loads(items_json)
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         
         first_name = user[2] if len(user) > 2 else "کاربر"
         username = user[1] if len(user) > 1 and user[1] else "ندارد"
@@ -1031,9 +980,9 @@ async def mark_order_shipped(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     
     order_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     if not order:
         await query.answer("❌ سفارش یافت نشد!", show_alert=True)
         return
@@ -1043,11 +992,7 @@ async def mark_order_shipped(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # shipping_method رو به 'shipped' تغییر بده
     # نحوه ارسال اصلی رو توی receipt_photo ذخیره کن با فرمت "shipped|نحوه_ارسال"
-    with db.transaction() as cursor:
-        cursor.execute(
-            "UPDATE orders SET shipping_method = 'shipped', receipt_photo = ? WHERE id = ?",
-            (f"shipped|{current_shipping}", order_id)
-        )
+    await db.mark_order_shipped(order_id, current_shipping)
     
     await query.answer("✅ سفارش به عنوان ارسال شده ثبت شد!", show_alert=True)
     
@@ -1066,14 +1011,14 @@ async def admin_delete_not_shipped_order(update: Update, context: ContextTypes.D
     query = update.callback_query
     
     order_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     if not order:
         await query.answer("❌ سفارش یافت نشد!", show_alert=True)
         return
     
-    success = db.delete_order(order_id)
+    success = await db.delete_order(order_id)
     
     if success:
         await query.answer("✅ سفارش حذف شد", show_alert=True)
@@ -1090,11 +1035,11 @@ async def reject_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer("❌ رسید رد شد")
     
     order_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    db.update_order_status(order_id, OrderStatus.WAITING_PAYMENT)
+    await db.update_order_status(order_id, OrderStatus.WAITING_PAYMENT)
     
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     user_id = order[1]
     final_price = order[5]
     
@@ -1120,9 +1065,9 @@ async def reject_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """دریافت رسید از کاربر"""
     user_id = update.effective_user.id
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    orders = db.get_waiting_payment_orders()
+    orders = await db.get_waiting_payment_orders()
     user_order = None
     
     for order in orders:
@@ -1138,16 +1083,16 @@ async def handle_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
     order_id = user_order[0]
     photo = update.message.photo[-1]
     
-    db.add_receipt(order_id, photo.file_id)
-    db.update_order_status(order_id, OrderStatus.RECEIPT_SENT)
+    await db.add_receipt(order_id, photo.file_id)
+    await db.update_order_status(order_id, OrderStatus.RECEIPT_SENT)
     
     # ✅ FIX: اضافه کردن parse_mode=None
     await update.message.reply_text(MESSAGES["receipt_received"], parse_mode=None)
     
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     items = json.loads(order[2])
     final_price = order[5]
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     
     first_name = user[2] if len(user) > 2 else "کاربر"
     username = user[1] if len(user) > 1 and user[1] else "ندارد"
@@ -1188,8 +1133,8 @@ async def remove_item_from_order(update: Update, context: ContextTypes.DEFAULT_T
     order_id = int(data[1])
     item_index = int(data[2])
     
-    db = context.bot_data['db']
-    order = db.get_order(order_id)
+    db = context.bot_data['adb']
+    order = await db.get_order(order_id)
     
     if not order:
         await query.answer("❌ سفارش یافت نشد!", show_alert=True)
@@ -1226,7 +1171,7 @@ async def remove_item_from_order(update: Update, context: ContextTypes.DEFAULT_T
     new_final = new_total
     
     if discount_code:
-        discount_info = db.get_discount_by_code(discount_code)
+        discount_info = await db.get_discount_by_code(discount_code)
         if discount_info:
             discount_type = discount_info[2]
             discount_value = discount_info[3]
@@ -1245,12 +1190,7 @@ async def remove_item_from_order(update: Update, context: ContextTypes.DEFAULT_T
     
     # بروزرسانی
     try:
-        with db.transaction() as cursor:
-            cursor.execute("""
-                UPDATE orders 
-                SET items = ?, total_price = ?, discount_amount = ?, final_price = ? 
-                WHERE id = ?
-            """, (json.dumps(items, ensure_ascii=False), new_total, new_discount, new_final, order_id))
+        await db.update_order_items(order_id, items, new_total, new_discount, new_final)
         
         logger.info(f"✅ آیتم از سفارش {order_id} حذف شد")
     except Exception as e:
@@ -1293,8 +1233,8 @@ async def back_to_order_review(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     
     order_id = int(query.data.split(":")[1])
-    db = context.bot_data['db']
-    order = db.get_order(order_id)
+    db = context.bot_data['adb']
+    order = await db.get_order(order_id)
     
     if not order:
         await query.answer("❌ سفارش یافت نشد!", show_alert=True)
@@ -1302,7 +1242,7 @@ async def back_to_order_review(update: Update, context: ContextTypes.DEFAULT_TYP
     
     order_id_val, user_id, items_json, total_price, discount_amount, final_price, discount_code, status, receipt, shipping_method, created_at, expires_at, *_ = order
     items = json.loads(items_json)
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     
     first_name = user[2] if len(user) > 2 else "کاربر"
     username = user[1] if len(user) > 1 and user[1] else "ندارد"
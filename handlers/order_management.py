@@ -26,8 +26,8 @@ async def increase_item_quantity(update: Update, context: ContextTypes.DEFAULT_T
         order_id = int(data[1])
         item_index = int(data[2])
         
-        db = context.bot_data['db']
-        order = db.get_order(order_id)
+        db = context.bot_data['adb']
+        order = await db.get_order(order_id)
         
         if not order:
             await query.answer("❌ سفارش یافت نشد!", show_alert=True)
@@ -75,8 +75,8 @@ async def decrease_item_quantity(update: Update, context: ContextTypes.DEFAULT_T
         order_id = int(data[1])
         item_index = int(data[2])
         
-        db = context.bot_data['db']
-        order = db.get_order(order_id)
+        db = context.bot_data['adb']
+        order = await db.get_order(order_id)
         
         if not order:
             await query.answer("❌ سفارش یافت نشد!", show_alert=True)
@@ -134,8 +134,8 @@ async def edit_item_quantity_start(update: Update, context: ContextTypes.DEFAULT
         order_id = int(data[1])
         item_index = int(data[2])
         
-        db = context.bot_data['db']
-        order = db.get_order(order_id)
+        db = context.bot_data['adb']
+        order = await db.get_order(order_id)
         
         if not order:
             await query.answer("❌ سفارش یافت نشد!", show_alert=True)
@@ -200,8 +200,8 @@ async def edit_item_quantity_received(update: Update, context: ContextTypes.DEFA
         item_index = context.user_data.get('editing_item_index')
         discount_code = context.user_data.get('editing_discount_code')
         
-        db = context.bot_data['db']
-        order = db.get_order(order_id)
+        db = context.bot_data['adb']
+        order = await db.get_order(order_id)
         
         if not order:
             await update.message.reply_text(
@@ -257,7 +257,7 @@ async def edit_item_quantity_received(update: Update, context: ContextTypes.DEFA
                 text += f"   🔢 تعداد: {item['quantity']} عدد\n"
                 text += f"   💰 {item['price']:,.0f} تومان\n\n"
             
-            order_updated = db.get_order(order_id)
+            order_updated = await db.get_order(order_id)
             final_price_updated = order_updated[5]
             
             text += f"💳 **مبلغ نهایی جدید: {final_price_updated:,.0f} تومان**"
@@ -324,8 +324,8 @@ async def edit_item_notes_received(update: Update, context: ContextTypes.DEFAULT
     new_quantity = context.user_data.get('new_quantity')
     old_quantity = context.user_data.get('old_quantity')
     
-    db = context.bot_data['db']
-    order = db.get_order(order_id)
+    db = context.bot_data['adb']
+    order = await db.get_order(order_id)
     
     if not order:
         await update.message.reply_text(
@@ -374,8 +374,8 @@ async def skip_item_notes(update: Update, context: ContextTypes.DEFAULT_TYPE):
     old_quantity = context.user_data.get('old_quantity')
     discount_code = context.user_data.get('editing_discount_code')
     
-    db = context.bot_data['db']
-    order = db.get_order(order_id)
+    db = context.bot_data['adb']
+    order = await db.get_order(order_id)
     
     if not order:
         await query.answer("❌ سفارش یافت نشد!", show_alert=True)
@@ -434,7 +434,7 @@ async def show_updated_items_with_notes(update_or_query, order_id, items, db):
             
             text += f"   💰 {item['price']:,.0f} تومان\n\n"
         
-        order = db.get_order(order_id)
+        order = await db.get_order(order_id)
         final_price = order[5]
         
         text += f"💳 **جمع کل: {final_price:,.0f} تومان**\n\n"
@@ -494,7 +494,7 @@ async def update_order_prices(db, order_id, items, discount_code=None):
         new_final = new_total
         
         if discount_code:
-            discount_info = db.get_discount(discount_code)
+            discount_info = await db.get_discount(discount_code)
             if discount_info:
                 discount_type = discount_info[2]
                 discount_value = discount_info[3]
@@ -513,14 +513,7 @@ async def update_order_prices(db, order_id, items, discount_code=None):
         
         # 🔥 بروزرسانی با Try-Except
         try:
-            conn = db._get_conn()
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE orders 
-                SET items = ?, total_price = ?, discount_amount = ?, final_price = ? 
-                WHERE id = ?
-            """, (json.dumps(items, ensure_ascii=False), new_total, new_discount, new_final, order_id))
-            conn.commit()
+            await db.update_order_items(order_id, items, new_total, new_discount, new_final)
             
             logger.info(f"✅ Order {order_id} updated: total={new_total:,.0f}, discount={new_discount:,.0f}, final={new_final:,.0f}")
         
@@ -544,7 +537,7 @@ async def show_updated_order_items(query, order_id, items, db):
             text += f"   🔢 تعداد: {item['quantity']} عدد\n"
             text += f"   💰 {item['price']:,.0f} تومان\n\n"
         
-        order = db.get_order(order_id)
+        order = await db.get_order(order_id)
         final_price = order[5]
         
         text += f"💳 **جمع کل: {final_price:,.0f} تومان**\n\n"
@@ -56,7 +56,7 @@ async def _update_cart_item_quantity(update: Update, context: ContextTypes.DEFAU
     
     query = update.callback_query
     user_id = update.effective_user.id
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     # ✅ اگه این کاربر قفل نداره، بساز
     if user_id not in cart_locks:
@@ -65,44 +65,24 @@ async def _update_cart_item_quantity(update: Update, context: ContextTypes.DEFAU
     # ✅ قفل کن تا کار قبلی تموم شه
     async with cart_locks[user_id]:
         try:
-            # دریافت اطلاعات cart item
-            conn = db._get_conn()
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT c.id, c.product_id, c.pack_id, c.quantity, 
-                       pk.quantity as pack_qty, pk.name, p.name
-                FROM cart c
-                JOIN packs pk ON c.pack_id = pk.id
-                JOIN products p ON c.product_id = p.id
-                WHERE c.id = ? AND c.user_id = ?
-            """, (cart_id, user_id))
-            
-            result = cursor.fetchone()
+            # ✅ خواندن و تغییر تعداد داخل یک transaction روی thread نویسنده
+            result = await db.change_cart_item_quantity(cart_id, user_id, delta)
             
             if not result:
                 return False, 0, "❌ آیتم یافت نشد!"
             
-            cart_id_val, product_id, pack_id, current_qty, pack_qty, pack_name, product_name = result
-            
-            # محاسبه تعداد جدید
-            new_qty = current_qty + (delta * pack_qty)
-            
-            # ✅ FIX: استفاده از Transaction برای جلوگیری از Memory Leak
-            with db.transaction() as cursor:
-                if new_qty <= 0:
-                    # حذف آیتم
-                    cursor.execute("DELETE FROM cart WHERE id = ?", (cart_id,))
-                    action = "حذف از سبد"
-                    message = f"🗑 آیتم حذف شد!"
-                else:
-                    # بروزرسانی تعداد
-                    cursor.execute("UPDATE cart SET quantity = ? WHERE id = ?", (new_qty, cart_id))
-                    action = "افزایش در سبد" if delta > 0 else "کاهش در سبد"
-                    change_text = "➕" if delta > 0 else "➖"
-                    message = f"{change_text} {abs(delta * pack_qty)} عدد {'اضافه' if delta > 0 else 'کم'} شد!\n🔢 تعداد جدید: {new_qty} عدد"
+            new_qty = result['new_quantity']
+            pack_qty = result['pack_quantity']
+            pack_name = result['pack_name']
+            product_name = result['product_name']
             
-            # Invalidate cache
-            db._invalidate_cache(f"cart:{user_id}")
+            if new_qty <= 0:
+                action = "حذف از سبد"
+                message = f"🗑 آیتم حذف شد!"
+            else:
+                action = "افزایش در سبد" if delta > 0 else "کاهش در سبد"
+                change_text = "➕" if delta > 0 else "➖"
+                message = f"{change_text} {abs(delta * pack_qty)} عدد {'اضافه' if delta > 0 else 'کم'} شد!\n🔢 تعداد جدید: {new_qty} عدد"
             
             # ثبت لاگ
             log_user_action(user_id, action, f"{product_name} - {pack_name}")
@@ -129,9 +109,9 @@ async def _refresh_cart_display(update: Update, context: ContextTypes.DEFAULT_TY
     
     query = update.callback_query
     user_id = update.effective_user.id
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    cart = db.get_cart(user_id)
+    cart = await db.get_cart(user_id)
     
     if not cart:
         await query.edit_message_text("✅ سبد خرید شما خالی شد.")
@@ -155,7 +135,7 @@ async def _refresh_cart_display(update: Update, context: ContextTypes.DEFAULT_TY
     discount_amount = 0
     
     if discount_code:
-        discount = db.get_discount(discount_code)
+        discount = await db.get_discount(discount_code)
         if discount:
             disc_type = discount[2]
             value = discount[3]
@@ -213,10 +193,10 @@ async def _refresh_cart_display(update: Update, context: ContextTypes.DEFAULT_TY
 async def user_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """پیام خوش‌آمدگویی به کاربر"""
     user = update.effective_user
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     # ثبت کاربر در دیتابیس
-    db.add_user(user.id, user.username, user.first_name)
+    await db.add_user(user.id, user.username, user.first_name)
     
     # بررسی اگر از لینک خاصی اومده
     if context.args:
@@ -233,8 +213,8 @@ async def user_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             product_id = int(parts[1])
             pack_id = int(parts[3])
             
-            pack = db.get_pack(pack_id)
-            product = db.get_product(product_id)
+            pack = await db.get_pack(pack_id)
+            product = await db.get_product(product_id)
             
             if pack and product:
                 _, _, pack_name, quantity, price = pack
@@ -269,15 +249,15 @@ async def user_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def show_product(update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int):
     """نمایش محصول به کاربر"""
-    db = context.bot_data['db']
-    product = db.get_product(product_id)
+    db = context.bot_data['adb']
+    product = await db.get_product(product_id)
     
     if not product:
         await update.message.reply_text("❌ محصول یافت نشد.")
         return
     
     prod_id, name, desc, photo_id, *_ = product
-    packs = db.get_packs(product_id)
+    packs = await db.get_packs(product_id)
     
     if not packs:
         await update.message.reply_text("❌ این محصول فعلاً موجود نیست.")
@@ -313,7 +293,7 @@ async def handle_pack_selection(update: Update, context: ContextTypes.DEFAULT_TY
     pack_id = int(data[2])
     
     user_id = update.effective_user.id
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     # ✅ اگه این کاربر قفل نداره، بساز
     if user_id not in cart_locks:
@@ -323,10 +303,10 @@ async def handle_pack_selection(update: Update, context: ContextTypes.DEFAULT_TY
     async with cart_locks[user_id]:
         # ثبت کاربر اگه قبلاً ثبت نشده
         user = update.effective_user
-        db.add_user(user.id, user.username, user.first_name)
+        await db.add_user(user.id, user.username, user.first_name)
         
-        pack = db.get_pack(pack_id)
-        product = db.get_product(product_id)
+        pack = await db.get_pack(pack_id)
+        product = await db.get_product(product_id)
         
         if not pack or not product:
             await query.answer("❌ محصول یافت نشد!", show_alert=True)
@@ -337,7 +317,7 @@ async def handle_pack_selection(update: Update, context: ContextTypes.DEFAULT_TY
         
         # افزودن 1 بار کلیک = pack_qty عدد
         try:
-            db.add_to_cart(user_id, product_id, pack_id, quantity=1)
+            await db.add_to_cart(user_id, product_id, pack_id, quantity=1)
             log_user_action(user_id, "افزودن به سبد", f"{prod_name} - {pack_name}")
         except Exception as e:
             logger.error(f"❌ خطا در افزودن به سبد: {e}")
@@ -345,7 +325,7 @@ async def handle_pack_selection(update: Update, context: ContextTypes.DEFAULT_TY
             return
         
         # محاسبه تعداد کل در سبد
-        cart = db.get_cart(user_id)
+        cart = await db.get_cart(user_id)
         total_this_pack_count = 0
         total_price_this_pack = 0
         total_items = 0
@@ -378,9 +358,9 @@ async def handle_pack_selection(update: Update, context: ContextTypes.DEFAULT_TY
 async def view_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """نمایش سبد خرید"""
     user_id = update.effective_user.id
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    cart = db.get_cart(user_id)
+    cart = await db.get_cart(user_id)
     
     if not cart:
         message = "🛒 سبد خرید شما خالی است!"
@@ -476,7 +456,7 @@ async def remove_from_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     cart_id = int(query.data.split(":")[1])
     user_id = update.effective_user.id
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     # ✅ اگه این کاربر قفل نداره، بساز
     if user_id not in cart_locks:
@@ -485,7 +465,7 @@ async def remove_from_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # ✅ قفل کن
     async with cart_locks[user_id]:
         try:
-            db.remove_from_cart(cart_id)
+            await db.remove_from_cart(cart_id)
         except Exception as e:
             logger.error(f"❌ خطا در حذف از سبد: {e}")
             await query.answer("❌ خطا در حذف آیتم!", show_alert=True)
@@ -504,7 +484,7 @@ async def clear_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer("🗑 سبد خرید خالی شد!")
     
     user_id = update.effective_user.id
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     # ✅ اگه این کاربر قفل نداره، بساز
     if user_id not in cart_locks:
@@ -513,7 +493,7 @@ async def clear_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # ✅ قفل کن
     async with cart_locks[user_id]:
         try:
-            db.clear_cart(user_id)
+            await db.clear_cart(user_id)
         except Exception as e:
             logger.error(f"❌ خطا در خالی کردن سبد: {e}")
             await query.answer("❌ خطا در خالی کردن سبد!", show_alert=True)
@@ -531,8 +511,8 @@ async def finalize_order_start(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     
     user_id = update.effective_user.id
-    db = context.bot_data['db']
-    user = db.get_user(user_id)
+    db = context.bot_data['adb']
+    user = await db.get_user(user_id)
     
     # بررسی اطلاعات کاربر
     has_full_info = (
@@ -646,12 +626,12 @@ async def phone_number_received(update: Update, context: ContextTypes.DEFAULT_TY
         return PHONE_NUMBER
     
     user_id = update.effective_user.id
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     full_name = context.user_data.get('temp_full_name', '')
     address = context.user_data.get('temp_address', '')
     
-    db.update_user_info(
+    await db.update_user_info(
         user_id, 
         phone=phone, 
         address=address, 
@@ -769,7 +749,7 @@ async def create_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     query = update.callback_query
     user_id = update.effective_user.id
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     # ✅ اگه این کاربر قفل نداره، بساز
     if user_id not in cart_locks:
@@ -777,7 +757,7 @@ async def create_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # ✅ قفل کن - این خیلی مهمه چون cart رو خالی میکنیم
     async with cart_locks[user_id]:
-        cart = db.get_cart(user_id)
+        cart = await db.get_cart(user_id)
         if not cart:
             await query.message.reply_text("سبد خرید شما خالی است!")
             return
@@ -812,36 +792,11 @@ async def create_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
         final_price = total_price - total_discount
         
         try:
-            # ✅ FIX: استفاده از Transaction برای atomicity
-            with db.transaction() as cursor:
-                # 1. ثبت سفارش
-                cursor.execute("""
-                    INSERT INTO orders 
-                    (user_id, items, total_price, discount_amount, final_price, discount_code, expires_at) 
-                    VALUES (?, ?, ?, ?, ?, ?, datetime('now', '+1 day'))
-                """, (user_id, json.dumps(items, ensure_ascii=False), total_price, 
-                      total_discount, final_price, discount_code))
-                order_id = cursor.lastrowid
-                
-                # 2. ثبت استفاده از تخفیف (اگر وجود داشت)
-                if discount_code:
-                    cursor.execute("""
-                        INSERT INTO discount_usage (user_id, discount_code, order_id) 
-                        VALUES (?, ?, ?)
-                    """, (user_id, discount_code, order_id))
-                    
-                    cursor.execute("""
-                        UPDATE discount_codes 
-                        SET used_count = used_count + 1 
-                        WHERE code = ?
-                    """, (discount_code,))
-                
-                # 3. خالی کردن سبد خرید
-                cursor.execute("DELETE FROM cart WHERE user_id = ?", (user_id,))
-                
-                # 4. کسر اعتبار (اگر استفاده شده)
-                if credit_amount > 0:
-                    db.deduct_wallet(user_id, credit_amount, cursor=cursor)
+            # ✅ ثبت سفارش، تخفیف، خالی کردن سبد و کسر اعتبار در یک transaction
+            order_id = await db.checkout_cart(
+                user_id, items, total_price, total_discount, final_price,
+                discount_code=discount_code, credit_amount=credit_amount
+            )
             
             # ✅ Transaction موفق بود - حالا می‌تونیم log کنیم
             log_order(order_id, user_id, "pending", final_price)
@@ -859,10 +814,6 @@ async def create_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
             context.user_data.pop('credit_discount_amount', None)
             context.user_data.pop('applied_credit', None)
             
-            # Invalidate cache
-            db._invalidate_cache(f"cart:{user_id}")
-            db._invalidate_cache("stats:")
-            
             # نمایش پیام موفقیت
             await query.message.reply_text(
                 MESSAGES["order_received"],
@@ -894,7 +845,7 @@ async def create_order_from_message(update: Update, context: ContextTypes.DEFAUL
     ✅ FIXED باگ 5: استفاده از Lock برای Race Condition
     """
     user_id = update.effective_user.id
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     # ✅ اگه این کاربر قفل نداره، بساز
     if user_id not in cart_locks:
@@ -902,7 +853,7 @@ async def create_order_from_message(update: Update, context: ContextTypes.DEFAUL
     
     # ✅ قفل کن
     async with cart_locks[user_id]:
-        cart = db.get_cart(user_id)
+        cart = await db.get_cart(user_id)
         if not cart:
             await update.message.reply_text("سبد خرید شما خالی است!")
             return
@@ -935,36 +886,11 @@ async def create_order_from_message(update: Update, context: ContextTypes.DEFAUL
         final_price = total_price - total_discount
         
         try:
-            # ✅ FIX: استفاده از Transaction
-            with db.transaction() as cursor:
-                # 1. ثبت سفارش
-                cursor.execute("""
-                    INSERT INTO orders 
-                    (user_id, items, total_price, discount_amount, final_price, discount_code, expires_at) 
-                    VALUES (?, ?, ?, ?, ?, ?, datetime('now', '+1 day'))
-                """, (user_id, json.dumps(items, ensure_ascii=False), total_price, 
-                      total_discount, final_price, discount_code))
-                order_id = cursor.lastrowid
-                
-                # 2. ثبت استفاده از تخفیف
-                if discount_code:
-                    cursor.execute("""
-                        INSERT INTO discount_usage (user_id, discount_code, order_id) 
-                        VALUES (?, ?, ?)
-                    """, (user_id, discount_code, order_id))
-                    
-                    cursor.execute("""
-                        UPDATE discount_codes 
-                        SET used_count = used_count + 1 
-                        WHERE code = ?
-                    """, (discount_code,))
-                
-                # 3. خالی کردن سبد
-                cursor.execute("DELETE FROM cart WHERE user_id = ?", (user_id,))
-                
-                # 4. کسر اعتبار
-                if credit_amount > 0:
-                    db.deduct_wallet(user_id, credit_amount, cursor=cursor)
+            # ✅ ثبت سفارش، تخفیف، خالی کردن سبد و کسر اعتبار در یک transaction
+            order_id = await db.checkout_cart(
+                user_id, items, total_price, total_discount, final_price,
+                discount_code=discount_code, credit_amount=credit_amount
+            )
             
             # Transaction موفق - ثبت log
             log_order(order_id, user_id, "pending", final_price)
@@ -982,9 +908,6 @@ async def create_order_from_message(update: Update, context: ContextTypes.DEFAUL
             context.user_data.pop('credit_discount_amount', None)
             context.user_data.pop('applied_credit', None)
             
-            db._invalidate_cache(f"cart:{user_id}")
-            db._invalidate_cache("stats:")
-            
             await update.message.reply_text(
                 MESSAGES["order_received"],
                 reply_markup=user_main_keyboard()
@@ -1020,7 +943,7 @@ async def handle_shipping_selection(update: Update, context: ContextTypes.DEFAUL
     await query.answer()
     
     user_id = update.effective_user.id
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     order_id = context.bot_data.get(f'pending_shipping_{user_id}')
     
@@ -1036,7 +959,7 @@ async def handle_shipping_selection(update: Update, context: ContextTypes.DEFAUL
     }
     
     shipping_method = shipping_map.get(query.data, "نامشخص")
-    db.update_shipping_method(order_id, shipping_method)
+    await db.update_shipping_method(order_id, shipping_method)
     
     await show_final_invoice(update, context, order_id)
 
@@ -1055,15 +978,15 @@ def _html_escape(text):
 async def show_final_invoice(update, context, order_id):
     """نمایش فاکتور نهایی - با HTML به جای Markdown"""
     query = update.callback_query if hasattr(update, 'callback_query') else None
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     if not order:
         return
     
     order_id_val, user_id, items_json, total_price, discount_amount, final_price, discount_code, status, receipt, shipping_method, created_at, expires_at = order
     items = json.loads(items_json)
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     
     invoice_text = "📋 <b>فاکتور نهایی سفارش</b>\n"
     invoice_text += "═" * 25 + "\n\n"
@@ -1134,8 +1057,8 @@ async def final_confirm_order(update: Update, context: ContextTypes.DEFAULT_TYPE
         await query.message.reply_text("❌ خطا! لطفاً دوباره تلاش کنید.")
         return
 
-    db = context.bot_data['db']
-    db.update_order_status(order_id, 'confirmed')
+    db = context.bot_data['adb']
+    await db.update_order_status(order_id, 'confirmed')
     
     user_id = update.effective_user.id
     context.bot_data.pop(f'pending_shipping_{user_id}', None)
@@ -1176,8 +1099,8 @@ async def final_edit_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def view_my_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """نمایش آدرس ثبت شده"""
     user_id = update.effective_user.id
-    db = context.bot_data['db']
-    user = db.get_user(user_id)
+    db = context.bot_data['adb']
+    user = await db.get_user(user_id)
     
     if not user:
         await update.message.reply_text("❌ خطا! لطفاً /start کنید.")
@@ -42,10 +42,10 @@ async def discount_code_entered(update: Update, context: ContextTypes.DEFAULT_TY
     
     user_id = update.effective_user.id
     discount_code = update.message.text.strip().upper()
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     # بررسی سبد خرید
-    cart = db.get_cart(user_id)
+    cart = await db.get_cart(user_id)
     if not cart:
         await update.message.reply_text(
             "❌ سبد خرید شما خالی است!",
@@ -62,7 +62,7 @@ async def discount_code_entered(update: Update, context: ContextTypes.DEFAULT_TY
         total_price += item_total
     
     # بررسی کد تخفیف
-    discount = db.get_discount(discount_code)
+    discount = await db.get_discount(discount_code)
     
     if not discount:
         await update.message.reply_text(
@@ -119,7 +119,7 @@ async def discount_code_entered(update: Update, context: ContextTypes.DEFAULT_TY
     
     # ✅ NEW: بررسی محدودیت به ازای هر کاربر
     if per_user_limit:
-        user_usage_count = db.get_user_discount_usage_count(user_id, discount_code)
+        user_usage_count = await db.get_user_discount_usage_count(user_id, discount_code)
         if user_usage_count >= per_user_limit:
             await update.message.reply_text(
                 f"❌ شما قبلاً {per_user_limit} بار از این کد استفاده کرده‌اید!",
@@ -7,8 +7,18 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-async def view_users_list(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
-    """نمایش لیست کاربران با pagination"""
+# تعداد کاربر در هر صفحه
+USERS_PER_PAGE = 5
+
+
+async def view_users_list(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0,
+                          after_id: int = 0, before_id: int = None):
+    """
+    نمایش لیست کاربران با pagination
+    
+    صفحه‌بندی keyset است (بعد از / قبل از یک user_id)، پس هر صفحه فقط
+    USERS_PER_PAGE ردیف از دیتابیس میخونه، نه کل جدول.
+    """
     query = update.callback_query if update.callback_query else None
     
     if query:
@@ -17,27 +27,24 @@ async def view_users_list(update: Update, context: ContextTypes.DEFAULT_TYPE, pa
     else:
         message_func = update.message.reply_text
     
-    db = context.bot_data['db']
-    all_users = db.get_all_users()
+    db = context.bot_data['adb']
+    total_users = await db.count_users()
     
-    if not all_users:
+    if not total_users:
         await message_func("👥 هیچ کاربری در ربات ثبت نشده است.")
         return
     
-    # تنظیمات pagination
-    USERS_PER_PAGE = 5
-    total_users = len(all_users)
     total_pages = (total_users + USERS_PER_PAGE - 1) // USERS_PER_PAGE
     
-    if page >= total_pages:
-        page = total_pages - 1
-    if page < 0:
+    users_on_page = await db.page_users(after_id, USERS_PER_PAGE, before_id)
+    
+    # کاربرهای صفحه حذف شدن - برگشت به صفحه‌ی اول
+    if not users_on_page:
         page = 0
+        users_on_page = await db.page_users(0, USERS_PER_PAGE)
     
+    page = max(0, min(page, total_pages - 1))
     start_idx = page * USERS_PER_PAGE
-    end_idx = min(start_idx + USERS_PER_PAGE, total_users)
-    
-    users_on_page = all_users[start_idx:end_idx]
     
     text = f"👥 لیست کاربران (صفحه {page + 1} از {total_pages})\n\n"
     text += f"📊 کل کاربران: {total_users}\n\n"
@@ -73,13 +80,17 @@ async def view_users_list(update: Update, context: ContextTypes.DEFAULT_TYPE, pa
     keyboard = []
     nav_buttons = []
     
+    # cursor صفحه در callback_data: b<id> = قبل از id، a<id> = بعد از id
+    first_id = users_on_page[0][0]
+    last_id = users_on_page[-1][0]
+    
     if page > 0:
-        nav_buttons.append(InlineKeyboardButton("◀️ قبلی", callback_data=f"users_page:{page - 1}"))
+        nav_buttons.append(InlineKeyboardButton("◀️ قبلی", callback_data=f"users_page:{page - 1}:b{first_id}"))
     
     nav_buttons.append(InlineKeyboardButton(f"📄 {page + 1}/{total_pages}", callback_data="users_page:current"))
     
     if page < total_pages - 1:
-        nav_buttons.append(InlineKeyboardButton("بعدی ▶️", callback_data=f"users_page:{page + 1}"))
+        nav_buttons.append(InlineKeyboardButton("بعدی ▶️", callback_data=f"users_page:{page + 1}:a{last_id}"))
     
     keyboard.append(nav_buttons)
     keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="dash:users")])
@@ -105,6 +116,16 @@ async def handle_users_pagination(update: Update, context: ContextTypes.DEFAULT_
     
     try:
         page = int(page_data[1])
-        await view_users_list(update, context, page)
+        
+        # دکمه‌های قدیمی بدون cursor از صفحه‌ی اول شروع میکنن
+        if len(page_data) < 3:
+            await view_users_list(update, context)
+            return
+        
+        cursor = page_data[2]
+        if cursor.startswith('b'):
+            await view_users_list(update, context, page, before_id=int(cursor[1:]))
+        else:
+            await view_users_list(update, context, page, after_id=int(cursor[1:]))
     except ValueError:
         await query.answer("❌ خطا در صفحه‌بندی!")
@@ -12,6 +12,7 @@ from telegram.ext import ContextTypes, ConversationHandler
 from datetime import datetime, timedelta
 from typing import Optional, Tuple, List
 import logging
+from database import from_db_timestamp, get_tehran_now
 
 logger = logging.getLogger(__name__)
 
@@ -70,13 +71,13 @@ async def view_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
         message_func = update.message.reply_text
     
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     # دریافت اعتبار دائمی
-    permanent_balance = db.get_permanent_wallet(user_id)
+    permanent_balance = await db.get_permanent_wallet(user_id)
     
     # دریافت اعتبارهای موقت فعال
-    temp_wallets = db.get_active_temp_wallets(user_id)
+    temp_wallets = await db.get_active_temp_wallets(user_id)
     
     # محاسبه مجموع
     total_temp = sum([w[1] for w in temp_wallets])  # w[1] = balance
@@ -103,8 +104,8 @@ async def view_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text += f"🎁 **اعتبار هدیه ({len(temp_wallets)} عدد):**\n"
             for idx, wallet in enumerate(temp_wallets, 1):
                 wallet_id, balance, expires_at, description = wallet
-                expiry = datetime.fromisoformat(expires_at)
-                days_left = (expiry - datetime.now()).days
+                expiry = from_db_timestamp(expires_at)
+                days_left = (expiry - get_tehran_now()).days
                 
                 text += f"   {idx}. {format_price(balance)} تومان"
                 if days_left > 0:
@@ -129,9 +130,9 @@ async def view_wallet_gifts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = query.from_user.id
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    temp_wallets = db.get_active_temp_wallets(user_id)
+    temp_wallets = await db.get_active_temp_wallets(user_id)
     
     if not temp_wallets:
         text = "🎁 **اعتبار هدیه شما**\n\n"
@@ -149,8 +150,8 @@ async def view_wallet_gifts(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         for idx, wallet in enumerate(temp_wallets, 1):
             wallet_id, balance, expires_at, description = wallet
-            expiry = datetime.fromisoformat(expires_at)
-            days_left = (expiry - datetime.now()).days
+            expiry = from_db_timestamp(expires_at)
+            days_left = (expiry - get_tehran_now()).days
             
             text += f"**{idx}. اعتبار #{wallet_id}**\n"
             text += f"💰 مبلغ: {format_price(balance)} تومان\n"
@@ -184,9 +185,9 @@ async def view_wallet_history(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
     
     user_id = query.from_user.id
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
-    transactions = db.get_wallet_transactions(user_id, limit=15)
+    transactions = await db.get_wallet_transactions(user_id, limit=15)
     
     if not transactions:
         text = "📋 **تاریخچه تراکنش‌ها**\n\n"
@@ -237,10 +238,10 @@ async def use_wallet_in_order(update: Update, context: ContextTypes.DEFAULT_TYPE
     user_id = query.from_user.id
     order_id = int(query.data.split(":")[1])
     
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     # دریافت اطلاعات سفارش
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     if not order:
         await query.answer("❌ سفارش یافت نشد!", show_alert=True)
         return
@@ -254,8 +255,8 @@ async def use_wallet_in_order(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     # دریافت موجودی‌ها
-    permanent_balance = db.get_permanent_wallet(user_id)
-    temp_wallets = db.get_active_temp_wallets(user_id)
+    permanent_balance = await db.get_permanent_wallet(user_id)
+    temp_wallets = await db.get_active_temp_wallets(user_id)
     total_balance = permanent_balance + sum([w[1] for w in temp_wallets])
     
     if total_balance <= 0:
@@ -278,7 +279,7 @@ async def use_wallet_in_order(update: Update, context: ContextTypes.DEFAULT_TYPE
         wallet_id, balance, expires_at, description = wallet
         deduct_from_this = min(balance, amount_to_deduct)
         
-        success = db.deduct_temp_wallet(
+        success = await db.deduct_temp_wallet(
             user_id=user_id,
             wallet_id=wallet_id,
             amount=deduct_from_this,
@@ -294,7 +295,7 @@ async def use_wallet_in_order(update: Update, context: ContextTypes.DEFAULT_TYPE
     if amount_to_deduct > 0 and permanent_balance > 0:
         deduct_from_permanent = min(permanent_balance, amount_to_deduct)
         
-        success = db.deduct_permanent_wallet(
+        success = await db.deduct_permanent_wallet(
             user_id=user_id,
             amount=deduct_from_permanent,
             description=f"پرداخت سفارش #{order_id}",
@@ -306,12 +307,12 @@ async def use_wallet_in_order(update: Update, context: ContextTypes.DEFAULT_TYPE
             amount_to_deduct -= deduct_from_permanent
     
     # به‌روزرسانی سفارش
-    db.update_order_wallet_payment(order_id, usable_amount, remaining_to_pay)
+    await db.update_order_wallet_payment(order_id, usable_amount, remaining_to_pay)
     
     # پیام نتیجه
     if remaining_to_pay <= 0:
         # سفارش کاملاً با اعتبار پرداخت شد
-        db.update_order_status(order_id, 'payment_confirmed')
+        await db.update_order_status(order_id, 'payment_confirmed')
         text = f"✅ **پرداخت موفق!**\n\n"
         text += f"💰 مبلغ کسر شده: {format_price(usable_amount)} تومان\n\n"
         
@@ -452,8 +453,8 @@ async def admin_charge_permanent_amount_received(update: Update, context: Contex
             await update.message.reply_text("❌ مبلغ باید بیشتر از صفر باشد!")
             return WALLET_CHARGE_AMOUNT
         
-        db = context.bot_data['db']
-        success = db.add_permanent_wallet(
+        db = context.bot_data['adb']
+        success = await db.add_permanent_wallet(
             user_id=user_id,
             amount=amount,
             description="شارژ دائمی توسط ادمین",
@@ -546,8 +547,8 @@ async def admin_gift_temp_expiry_received(update: Update, context: ContextTypes.
         
         expires_at = datetime.now() + timedelta(days=days)
         
-        db = context.bot_data['db']
-        success = db.add_temp_wallet(
+        db = context.bot_data['adb']
+        success = await db.add_temp_wallet(
             user_id=user_id,
             amount=amount,
             expires_at=expires_at,
@@ -597,8 +598,8 @@ async def admin_wallet_cleanup(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     
-    db = context.bot_data['db']
-    cleaned_count = db.cleanup_expired_wallets()
+    db = context.bot_data['adb']
+    cleaned_count = await db.cleanup_expired_wallets()
     
     text = "🧹 **پاکسازی انجام شد**\n\n"
     text += f"🗑 تعداد حذف شده: {cleaned_count} اعتبار منقضی\n\n"
@@ -621,8 +622,8 @@ async def admin_wallet_report(update: Update, context: ContextTypes.DEFAULT_TYPE
     query = update.callback_query
     await query.answer()
     
-    db = context.bot_data['db']
-    report = db.get_wallet_statistics_v2()
+    db = context.bot_data['adb']
+    report = await db.get_wallet_statistics_v2()
     
     text = "📊 **گزارش سیستم اعتبار**\n\n"
     
@@ -667,8 +668,8 @@ async def wallet_back_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
     if "سبد خرید" in message_text or context.user_data.get('from_cart'):
         # بازگشت به سبد خرید
         user_id = update.effective_user.id
-        db = context.bot_data['db']
-        cart = db.get_cart(user_id)
+        db = context.bot_data['adb']
+        cart = await db.get_cart(user_id)
         
         if not cart:
             await query.edit_message_text("🛒 سبد خرید شما خالی است!")
@@ -709,10 +710,10 @@ async def use_credit_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
     
     user_id = query.from_user.id
-    db = context.bot_data['db']
+    db = context.bot_data['adb']
     
     # دریافت سبد خرید
-    cart = db.get_cart(user_id)
+    cart = await db.get_cart(user_id)
     if not cart:
         await query.edit_message_text("سبد خرید شما خالی است!")
         return
@@ -726,8 +727,8 @@ async def use_credit_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         total_price += item_total
     
     # دریافت اعتبار
-    permanent_balance = db.get_permanent_wallet(user_id)
-    temp_wallets = db.get_active_temp_wallets(user_id)
+    permanent_balance = await db.get_permanent_wallet(user_id)
+    temp_wallets = await db.get_active_temp_wallets(user_id)
     total_temp = sum([w[1] for w in temp_wallets])
     total_credit = permanent_balance + total_temp
     
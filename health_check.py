@@ -83,6 +83,8 @@ class HealthChecker:
                 'status': 'connected',
                 'size_mb': round(db_size, 2),
                 'tables': table_count,
+                'pool': self.db.pool.get_stats(),
+                'top_queries': self.db.get_query_stats(limit=3),
                 'healthy': True
             }
         except Exception as e:
@@ -168,34 +170,13 @@ class HealthChecker:
     def check_users(self) -> Dict:
         """بررسی آمار کاربران - ✅ FIXED"""
         try:
-            conn = self.db._get_conn()
-            cursor = conn.cursor()
-            
-            # کل کاربران
-            cursor.execute("SELECT COUNT(*) FROM users")
-            result = cursor.fetchone()
-            total_users = result[0] if result else 0
-            
-            # کاربران امروز
-            cursor.execute("""
-                SELECT COUNT(*) FROM users 
-                WHERE DATE(created_at) = DATE('now')
-            """)
-            result = cursor.fetchone()
-            today_users = result[0] if result else 0
-            
-            # کاربران این هفته
-            cursor.execute("""
-                SELECT COUNT(*) FROM users 
-                WHERE created_at >= DATE('now', '-7 days')
-            """)
-            result = cursor.fetchone()
-            week_users = result[0] if result else 0
+            # از جدول آمار روزانه - بدون اسکن users
+            users = self.db.get_user_summary()
             
             return {
-                'total': total_users,
-                'today': today_users,
-                'this_week': week_users,
+                'total': users['total'],
+                'today': users['today'],
+                'this_week': users['week'],
                 'healthy': True
             }
         except Exception as e:
@@ -208,44 +189,14 @@ class HealthChecker:
     def check_orders(self) -> Dict:
         """بررسی آمار سفارشات - ✅ FIXED"""
         try:
-            conn = self.db._get_conn()
-            cursor = conn.cursor()
-            
-            # کل سفارشات
-            cursor.execute("SELECT COUNT(*) FROM orders")
-            result = cursor.fetchone()
-            total_orders = result[0] if result else 0
-            
-            # سفارشات امروز
-            cursor.execute("""
-                SELECT COUNT(*) FROM orders 
-                WHERE DATE(created_at) = DATE('now')
-            """)
-            result = cursor.fetchone()
-            today_orders = result[0] if result else 0
-            
-            # سفارشات pending
-            cursor.execute("""
-                SELECT COUNT(*) FROM orders 
-                WHERE status = 'pending'
-            """)
-            result = cursor.fetchone()
-            pending_orders = result[0] if result else 0
-            
-            # سفارشات موفق امروز
-            cursor.execute("""
-                SELECT COUNT(*) FROM orders 
-                WHERE status IN ('confirmed', 'payment_confirmed')
-                AND DATE(created_at) = DATE('now')
-            """)
-            result = cursor.fetchone()
-            successful_today = result[0] if result else 0
+            # از جدول آمار روزانه - بدون اسکن orders
+            orders = self.db.get_order_summary()
             
             return {
-                'total': total_orders,
-                'today': today_orders,
-                'pending': pending_orders,
-                'successful_today': successful_today,
+                'total': orders['total'],
+                'today': orders['today'],
+                'pending': orders['pending'],
+                'successful_today': orders['successful_today'],
                 'healthy': True
             }
         except Exception as e:
@@ -331,6 +282,16 @@ class HealthChecker:
         if status.database.get('healthy'):
             report += f"✅ متصل - حجم: {status.database['size_mb']} MB\n"
             report += f"📊 جداول: {status.database['tables']}\n"
+            pool = status.database['pool']
+            report += (
+                f"🔌 Pool: {pool['in_use']} در حال استفاده / {pool['size']} باز (حداکثر {pool['max_size']})\n"
+                f"⏳ انتظار: {pool['waits']} بار (میانگین {pool['avg_wait_ms']}ms) - busy retry: {pool['busy_retries']}\n"
+            )
+            for query in status.database['top_queries']:
+                report += (
+                    f"🐢 `{query['name']}`: {query['count']} بار، "
+                    f"{query['total_ms']:.0f}ms کل (max {query['max_ms']:.1f}ms)\n"
+                )
         else:
             report += f"❌ خطا: {status.database.get('error', 'Unknown')}\n"
         report += "\n"
@@ -21,8 +21,7 @@ def main():
         products = db.get_all_products()
         print(f"📦 تعداد محصولات: {len(products)}")
         
-        users = db.get_all_users()
-        print(f"👥 تعداد کاربران: {len(users)}")
+        print(f"👥 تعداد کاربران: {db.count_users()}")
         
         stats = db.get_statistics()
         print(f"🛒 تعداد سفارشات: {stats.get('total_orders', 0)}")
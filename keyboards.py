@@ -293,15 +293,62 @@ def order_items_removal_keyboard(order_id, items):
     return InlineKeyboardMarkup(keyboard)
 
 
+# گروه‌های مخاطب پیام همگانی (کلید AUDIENCE_SEGMENTS در database.py، عنوان)
+BROADCAST_SEGMENTS = [
+    ('all', "👥 همه کاربران"),
+    ('recent_buyers', "🛍 خرید در ۳۰ روز اخیر"),
+    ('temp_wallet', "💳 اعتبار موقت فعال"),
+    ('cart_not_empty', "🛒 سبد خرید پر"),
+    ('never_ordered', "🆕 بدون سفارش"),
+    ('used_discount', "🎁 استفاده از کد تخفیف..."),
+]
+
+
 def broadcast_confirm_keyboard():
     """تایید ارسال پیام همگانی"""
     keyboard = [
         [InlineKeyboardButton("✅ بله، ارسال شود", callback_data="confirm_broadcast")],
+        [InlineKeyboardButton("🎯 انتخاب گروه مخاطب", callback_data="bcast_segments")],
         [InlineKeyboardButton("❌ لغو", callback_data="cancel_broadcast")],
     ]
     return InlineKeyboardMarkup(keyboard)
 
 
+def broadcast_segments_keyboard():
+    """انتخاب گروه مخاطب پیام همگانی"""
+    keyboard = [
+        [InlineKeyboardButton(label, callback_data=f"bcast_seg:{segment}")]
+        for segment, label in BROADCAST_SEGMENTS
+    ]
+    keyboard.append([InlineKeyboardButton("❌ لغو", callback_data="cancel_broadcast")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def broadcast_discount_segment_keyboard(discounts):
+    """انتخاب کد تخفیف برای گروه «استفاده از کد تخفیف»"""
+    keyboard = [
+        [InlineKeyboardButton(f"🎁 {discount[1]}", callback_data=f"bcast_seg:used_discount:{discount[0]}")]
+        for discount in discounts
+    ]
+    keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="bcast_segments")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def broadcast_job_keyboard(job_id: int, status: str):
+    """کنترل job پیام همگانی (توقف، ادامه، لغو)"""
+    keyboard = []
+    
+    if status in ('pending', 'running'):
+        keyboard.append([InlineKeyboardButton("⏸ توقف", callback_data=f"bcast:pause:{job_id}")])
+    elif status == 'paused':
+        keyboard.append([InlineKeyboardButton("▶️ ادامه", callback_data=f"bcast:resume:{job_id}")])
+    
+    if status in ('pending', 'running', 'paused'):
+        keyboard.append([InlineKeyboardButton("🛑 لغو ارسال", callback_data=f"bcast:cancel:{job_id}")])
+    
+    return InlineKeyboardMarkup(keyboard) if keyboard else None
+
+
 def analytics_menu_keyboard():
     """منوی گزارش‌های تحلیلی"""
     keyboard = [
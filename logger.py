@@ -118,6 +118,34 @@ def setup_logger(
     return logger
 
 
+# ==================== Logger کوئری‌های کند ====================
+
+def setup_slow_query_logger(name: str = "slow_queries") -> logging.Logger:
+    """
+    logger جداگانه برای کوئری‌های کند دیتابیس (logs/slow_queries.log)
+    این لاگ‌ها به لاگ اصلی نمیرن تا bot_all.log شلوغ نشه
+    """
+    setup_log_folder()
+
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    if logger.handlers:
+        return logger
+
+    handler = RotatingFileHandler(
+        os.path.join(LOG_FOLDER, "slow_queries.log"),
+        maxBytes=MAX_LOG_SIZE,
+        backupCount=BACKUP_COUNT,
+        encoding='utf-8'
+    )
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s', datefmt=DATE_FORMAT))
+    logger.addHandler(handler)
+
+    return logger
+
+
 # ==================== Logger سراسری ====================
 
 bot_logger = setup_logger("bot")
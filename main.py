@@ -20,8 +20,18 @@ from telegram.ext import (
 )
 
 # ایمپورت ماژول‌های پروژه
-from config import BOT_TOKEN, ADMIN_ID
+from config import (
+    BOT_TOKEN, ADMIN_ID, DB_READER_THREADS,
+    DB_GROUP_COMMIT, DB_GROUP_COMMIT_WINDOW_MS,
+    CACHE_MAX_ENTRIES, CACHE_MAX_MB, CACHE_STALE_SECONDS,
+    CHART_WORKERS, CHART_CACHE_SIZE,
+    WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+    WEBHOOK_SECRET_TOKEN, WEBHOOK_MAX_CONNECTIONS
+)
 from database import Database
+from async_database import AsyncDatabase
+from chart_renderer import ChartRenderer
+from analytics_engine import AnalyticsEngine
 from telegram.ext import ContextTypes
 from logger import (
     bot_logger, 
@@ -31,7 +41,7 @@ from logger import (
     log_error
 )
 
-from rate_limiter import rate_limiter
+from rate_limiter import rate_limiter, GENERAL_ACTION
 from states import *
 
 # 🆕 ایمپورت ماژول‌های جدید
@@ -194,8 +204,8 @@ async def manual_cleanup(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("🧹 در حال پاکسازی دیتابیس...")
     
     try:
-        db = context.bot_data['db']
-        report = db.cleanup_old_orders(days_old=7)
+        db = context.bot_data['adb']
+        report = await db.cleanup_old_orders(days_old=7)
         
         if report['success']:
             message = (
@@ -215,13 +225,41 @@ async def manual_cleanup(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ خطا رخ داد: {str(e)}")
 
 
+async def rebuild_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    🆕 بازسازی جداول آمار روزانه از روی سفارشات و کاربران (/rebuild_stats)
+    آمار محصولات هم در جدول سایه از نو ساخته و atomic جایگزین میشه
+    """
+    if not update.effective_user or update.effective_user.id != ADMIN_ID:
+        return
+    
+    await update.message.reply_text("🔄 در حال بازسازی آمار روزانه و آمار محصولات...")
+    
+    try:
+        db = context.bot_data['adb']
+        report = await db.rebuild_rollups()
+        product_report = await db.rebuild_product_stats()
+        
+        await update.message.reply_text(
+            "✅ **آمار روزانه بازسازی شد!**\n\n"
+            f"📦 ردیف‌های سفارش: {report['order_rows']}\n"
+            f"👥 ردیف‌های کاربر: {report['user_rows']}\n"
+            f"🏆 محصولات: {product_report['products']}",
+            parse_mode='Markdown'
+        )
+        
+    except Exception as e:
+        logger.error(f"❌ خطا در بازسازی آمار: {e}")
+        await update.message.reply_text(f"❌ خطا رخ داد: {str(e)}")
+
+
 async def scheduled_cleanup(context: ContextTypes.DEFAULT_TYPE):
     """🆕 پاکسازی زمان‌بندی شده (خودکار)"""
     try:
         logger.info("🧹 شروع پاکسازی خودکار...")
         
-        db = context.bot_data['db']
-        report = db.cleanup_old_orders(days_old=7)
+        db = context.bot_data['adb']
+        report = await db.cleanup_old_orders(days_old=7)
         
         if report['success'] and report['deleted_count'] > 0:
             # ارسال گزارش به ادمین
@@ -297,11 +335,13 @@ async def global_rate_limit_check(update: Update, context: ContextTypes.DEFAULT_
     if user_id == ADMIN_ID:
         return
     
+    max_requests, window_seconds = rate_limiter.get_limit(GENERAL_ACTION, 20, 60)
+    
     # ✅ FIX: حالا 3 تا مقدار برمیگردونه
     allowed, remaining_time, show_alert = rate_limiter.check_rate_limit(
         user_id,
-        max_requests=20,
-        window_seconds=60
+        max_requests=max_requests,
+        window_seconds=window_seconds
     )
     
     if not allowed:
@@ -322,7 +362,7 @@ async def global_rate_limit_check(update: Update, context: ContextTypes.DEFAULT_
                 await update.message.reply_text(
                     f"🛑 **محدودیت درخواست!**\n\n"
                     f"⏰ لطفاً {wait_msg} صبر کنید.\n\n"
-                    f"💡 محدودیت: 20 درخواست در دقیقه",
+                    f"💡 محدودیت: {max_requests} درخواست در {window_seconds} ثانیه",
                     parse_mode='Markdown'
                 )
             elif update.callback_query:
@@ -336,19 +376,42 @@ async def global_rate_limit_check(update: Update, context: ContextTypes.DEFAULT_
         return
 
 
-def setup_signal_handlers(application, db):
-    """تنظیم signal handlers برای Graceful Shutdown"""
+async def close_resources(application, db, adb=None):
+    """
+    بستن منابع بعد از توقف Application (post_shutdown)
+    
+    اول نوشتن‌های صف group commit ثبت میشن (aclose)، بعد رسم نمودار و دیتابیس بسته میشن.
+    """
+    try:
+        if adb:
+            await adb.aclose()
+    except Exception as e:
+        logger.error(f"❌ Error closing async database: {e}")
+    
+    try:
+        chart_renderer = application.bot_data.get('chart_renderer')
+        if chart_renderer:
+            chart_renderer.close()
+    except Exception as e:
+        logger.error(f"❌ Error closing chart renderer: {e}")
+    
+    try:
+        if db:
+            db.close()
+            logger.info("✅ Database closed successfully")
+    except Exception as e:
+        logger.error(f"❌ Error closing database: {e}")
+
+
+def setup_signal_handlers(application, db, adb=None):
+    """
+    تنظیم signal handlers برای Graceful Shutdown
+    
+    handler فقط SystemExit میده؛ run_polling بعدش آپدیت‌ها و job ها رو تخلیه
+    میکنه و منابع در post_shutdown (close_resources) بسته میشن.
+    """
     def signal_handler(sig, frame):
         logger.info(f"🛑 Received signal {sig}, shutting down gracefully...")
-        
-        try:
-            if db:
-                db.close()
-                logger.info("✅ Database closed successfully")
-        except Exception as e:
-            logger.error(f"❌ Error closing database: {e}")
-        
-        log_shutdown()
         sys.exit(0)
     
     signal.signal(signal.SIGINT, signal_handler)
@@ -431,15 +494,30 @@ def main():
     
     from handlers.broadcast import (
         broadcast_start, broadcast_message_received, 
-        confirm_broadcast, cancel_broadcast
+        confirm_broadcast, cancel_broadcast,
+        broadcast_job_control, resume_broadcast_jobs, probe_blocked_users,
+        broadcast_choose_segment, broadcast_segment_selected
     )
     
     from handlers.analytics import handle_analytics_report, scheduled_stats_update
     
-    # ایجاد دیتابیس
-    db = Database()
+    # ظرفیت کش
+    cache_manager.configure(
+        max_entries=CACHE_MAX_ENTRIES or None,
+        max_bytes=int(CACHE_MAX_MB * 1024 * 1024) or None
+    )
+    
+    # ایجاد دیتابیس (نوشتن‌ها کش مرتبط رو دقیق invalidate میکنن)
+    db = Database(cache_manager=cache_manager)
+    db_cache = DatabaseCache(db, cache_manager, stale_ttl=CACHE_STALE_SECONDS)
+    adb = AsyncDatabase(
+        db,
+        readers=DB_READER_THREADS,
+        group_commit=DB_GROUP_COMMIT,
+        batch_window_ms=DB_GROUP_COMMIT_WINDOW_MS,
+        cache=db_cache
+    )
     
-    db_cache = DatabaseCache(db, cache_manager)
     health_checker = HealthChecker(db, start_time)
     enhanced_error_handler = EnhancedErrorHandler(health_checker)
     
@@ -458,12 +536,26 @@ def main():
     
     # ذخیره در bot_data
     application.bot_data['db'] = db
+    application.bot_data['adb'] = adb
     application.bot_data['db_cache'] = db_cache
     application.bot_data['cache_manager'] = cache_manager
     application.bot_data['health_checker'] = health_checker
     application.bot_data['error_handler'] = enhanced_error_handler
+    application.bot_data['chart_renderer'] = ChartRenderer(CHART_WORKERS, CHART_CACHE_SIZE)
+    application.bot_data['analytics_engine'] = AnalyticsEngine()
+    
+    # در هر دو حالت (polling/webhook) بعد از تخلیه‌ی صف آپدیت‌ها و job ها
+    # منابع بسته میشن؛ نوشتن‌های صف group commit قبلش ثبت میشن
+    async def shutdown_resources(app):
+        logger.info("✅ Updates drained, closing resources")
+        await close_resources(app, db, adb)
+        log_shutdown()
+    
+    application.post_shutdown = shutdown_resources
     
-    setup_signal_handlers(application, db)
+    if not WEBHOOK_URL:
+        # در webhook حالت SIGINT/SIGTERM رو خود run_webhook میگیره
+        setup_signal_handlers(application, db, adb)
     
     # اضافه کردن Global Rate Limiter
     application.add_handler(
@@ -514,6 +606,22 @@ def main():
     except Exception as e:
         logger.warning(f"⚠️ خطا در راه‌اندازی به‌روزرسانی آمار: {e}")
     
+    # 📢 ادامه‌ی پیام‌های همگانی نیمه‌کاره بعد از restart
+    try:
+        if hasattr(application, 'job_queue') and application.job_queue is not None:
+            application.job_queue.run_once(resume_broadcast_jobs, when=5, name="resume_broadcasts")
+            # بررسی دوباره‌ی کاربران بلاک‌شده (روزی یک بار، هر بار تعداد محدود)
+            application.job_queue.run_repeating(
+                probe_blocked_users,
+                interval=86400,
+                first=1800,
+                name="probe_blocked_users"
+            )
+        else:
+            logger.warning("⚠️ JobQueue در دسترس نیست - ادامه‌ی پیام همگانی غیرفعال است")
+    except Exception as e:
+        logger.warning(f"⚠️ خطا در راه‌اندازی ادامه‌ی پیام همگانی: {e}")
+    
     # ==================== ConversationHandler ها ====================
     
     add_product_conv = ConversationHandler(
@@ -741,6 +849,7 @@ def main():
     
     # اضافه کردن handler ها
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("rebuild_stats", rebuild_stats))
     application.add_handler(add_product_conv)
     application.add_handler(add_pack_conv)
     application.add_handler(product_search_conv)
@@ -822,6 +931,9 @@ def main():
     
     application.add_handler(CallbackQueryHandler(confirm_broadcast, pattern="^confirm_broadcast$"))
     application.add_handler(CallbackQueryHandler(cancel_broadcast, pattern="^cancel_broadcast$"))
+    application.add_handler(CallbackQueryHandler(broadcast_choose_segment, pattern="^bcast_segments$"))
+    application.add_handler(CallbackQueryHandler(broadcast_segment_selected, pattern="^bcast_seg:"))
+    application.add_handler(CallbackQueryHandler(broadcast_job_control, pattern=r"^bcast:(pause|resume|cancel):\d+$"))
     
     application.add_handler(CallbackQueryHandler(handle_analytics_report, pattern="^analytics:"))
     
@@ -909,7 +1021,18 @@ def main():
     logger.info("✅ سیستم فاکتورزنی با تمام قابلیت‌ها فعال")
     
     # اجرای ربات
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WEBHOOK_URL:
+        from webhook import run_webhook, webhook_options
+        run_webhook(application, webhook_options(
+            WEBHOOK_URL,
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            path=WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET_TOKEN,
+            max_connections=WEBHOOK_MAX_CONNECTIONS
+        ))
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,796 @@
+"""
+رجیستری کوئری‌های SQL
+
+همه‌ی کوئری‌های ثابت (کاتالوگ، کاربر، سبد، سفارش، تخفیف، آمار، مخاطب‌ها و
+پیام همگانی، کیف پول) و کوئری‌هایی که قبلاً داخل هندلرها نوشته شده بودن
+اینجا با یک نام ثابت تعریف میشن و
+Database فقط با نام اجراشون میکنه (Database._execute / _fetchone / _fetchall):
+- متن هر کوئری همیشه همون رشته‌ست، پس statement cache هر connection
+  (cached_statements به اندازه‌ی همین رجیستری) یک بار parse میکنه
+- زمان اجرای هر کوئری با نامش در QueryStats ثبت میشه (histogram)
+
+DDL و migration ها و کوئری‌هایی که متنشون پویا ساخته میشه در database.py موندن.
+
+برای دیدن همه‌ی SQL ها (نه فقط رجیستری) لایه‌ی اختیاری QueryInstrumentation
+هست (DB_QUERY_STATS): هر statement نرمال‌شده با تعداد، p50/p95/p99 و تعداد ردیف
+ثبت میشه و کوئری‌های کندتر از DB_SLOW_QUERY_MS با EXPLAIN QUERY PLAN در
+logs/slow_queries.log نوشته میشن.
+"""
+import logging
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+# ستون‌های اصلی users - خروجی get_user/get_all_users/page_users همیشه همین ۹ ستونه
+# (ستون‌های بعدی مثل blocked_at به unpack های موجود در هندلرها آسیب نمیزنن)
+USER_COLUMNS = "user_id, username, first_name, full_name, phone, landline_phone, address, shop_name, created_at"
+
+# ستون‌های سفارش به ترتیبی که هندلرها unpack میکنن
+ORDER_COLUMNS = """id, user_id, items, total_price, discount_amount, final_price,
+                   discount_code, status, receipt_photo, shipping_method, created_at, expires_at"""
+
+
+QUERIES: Dict[str, str] = {
+    # ==================== محصولات ====================
+    'products.insert': "INSERT INTO products (name, description, photo_id) VALUES (?, ?, ?)",
+    'products.by_id': "SELECT * FROM products WHERE id = ?",
+    'products.all': "SELECT * FROM products ORDER BY created_at DESC",
+    'products.set_name': "UPDATE products SET name = ? WHERE id = ?",
+    'products.set_description': "UPDATE products SET description = ? WHERE id = ?",
+    'products.set_photo': "UPDATE products SET photo_id = ? WHERE id = ?",
+    'products.set_channel_message': "UPDATE products SET channel_message_id = ? WHERE id = ?",
+    'products.channel_message': "SELECT channel_message_id FROM products WHERE id = ?",
+    'products.delete': "DELETE FROM products WHERE id = ?",
+    'packs.delete_by_product': "DELETE FROM packs WHERE product_id = ?",
+    'cart.delete_by_product': "DELETE FROM cart WHERE product_id = ?",
+
+    # ==================== پک‌ها ====================
+    'packs.insert': "INSERT INTO packs (product_id, name, quantity, price) VALUES (?, ?, ?, ?)",
+    'packs.by_product': "SELECT * FROM packs WHERE product_id = ?",
+    'packs.by_id': "SELECT * FROM packs WHERE id = ?",
+    'packs.update': "UPDATE packs SET name = ?, quantity = ?, price = ? WHERE id = ?",
+    'packs.delete': "DELETE FROM packs WHERE id = ?",
+    'cart.delete_by_pack': "DELETE FROM cart WHERE pack_id = ?",
+
+    # ==================== کاربران ====================
+    'users.insert': "INSERT OR IGNORE INTO users (user_id, username, first_name) VALUES (?, ?, ?)",
+    'users.unblock_on_start': """
+        UPDATE users SET blocked_at = NULL, block_reason = NULL, block_checked_at = NULL
+        WHERE user_id = ? AND blocked_at IS NOT NULL
+    """,
+    'users.by_id': f"SELECT {USER_COLUMNS} FROM users WHERE user_id = ?",
+    'users.all': f"SELECT {USER_COLUMNS} FROM users",
+    'users.count': "SELECT COUNT(*) FROM users",
+    'users.count_reachable': "SELECT COUNT(*) FROM users WHERE blocked_at IS NULL",
+    'users.ids_after': "SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+    'users.page_after': f"SELECT {USER_COLUMNS} FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+    'users.page_before': f"SELECT {USER_COLUMNS} FROM users WHERE user_id < ? ORDER BY user_id DESC LIMIT ?",
+    'users.recent': """
+        SELECT user_id, username, first_name, created_at
+        FROM users
+        ORDER BY created_at DESC
+        LIMIT ?
+    """,
+    'users.mark_blocked': """
+        UPDATE users
+        SET blocked_at = COALESCE(blocked_at, datetime('now')),
+            block_reason = ?,
+            block_checked_at = datetime('now')
+        WHERE user_id = ?
+    """,
+    'users.mark_reachable': """
+        UPDATE users SET blocked_at = NULL, block_reason = NULL, block_checked_at = NULL
+        WHERE user_id = ?
+    """,
+    'users.to_probe': """
+        SELECT user_id FROM users
+        WHERE blocked_at IS NOT NULL AND block_checked_at <= datetime('now', ?)
+        ORDER BY block_checked_at
+        LIMIT ?
+    """,
+
+    # ==================== سبد خرید ====================
+    'cart.upsert': """
+        INSERT INTO cart (user_id, product_id, pack_id, quantity)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id, pack_id) DO UPDATE
+        SET quantity = quantity + excluded.quantity
+    """,
+    'cart.by_user': """
+        SELECT c.id, p.name, pk.name, pk.quantity, pk.price, c.quantity
+        FROM cart c
+        JOIN products p ON c.product_id = p.id
+        JOIN packs pk ON c.pack_id = pk.id
+        WHERE c.user_id = ?
+    """,
+    'cart.item_owner': "SELECT user_id FROM cart WHERE id = ?",
+    'cart.item_detail': """
+        SELECT c.quantity, pk.quantity, pk.name, p.name
+        FROM cart c
+        JOIN packs pk ON c.pack_id = pk.id
+        JOIN products p ON c.product_id = p.id
+        WHERE c.id = ? AND c.user_id = ?
+    """,
+    'cart.set_quantity': "UPDATE cart SET quantity = ? WHERE id = ?",
+    'cart.delete_item': "DELETE FROM cart WHERE id = ?",
+    'cart.clear': "DELETE FROM cart WHERE user_id = ?",
+    'cart.delete_invalid': """
+        DELETE FROM cart
+        WHERE user_id = ?
+        AND (
+            product_id NOT IN (SELECT id FROM products)
+            OR pack_id NOT IN (SELECT id FROM packs)
+        )
+    """,
+
+    # ==================== سفارشات ====================
+    'orders.insert_checkout': """
+        INSERT INTO orders
+        (user_id, items, total_price, discount_amount, final_price, discount_code, expires_at)
+        VALUES (?, ?, ?, ?, ?, ?, datetime('now', '+1 day'))
+    """,
+    'orders.by_id': f"SELECT {ORDER_COLUMNS} FROM orders WHERE id = ?",
+    'orders.set_status': "UPDATE orders SET status = ? WHERE id = ?",
+    'orders.set_receipt': "UPDATE orders SET receipt_photo = ?, status = 'receipt_sent' WHERE id = ?",
+    'orders.set_shipping': "UPDATE orders SET shipping_method = ? WHERE id = ?",
+    'orders.mark_shipped': "UPDATE orders SET shipping_method = 'shipped', receipt_photo = ? WHERE id = ?",
+    'orders.pending': f"""
+        SELECT {ORDER_COLUMNS}
+        FROM orders
+        WHERE status = 'pending'
+        ORDER BY created_at DESC
+    """,
+    'orders.pending_active': f"""
+        SELECT {ORDER_COLUMNS}
+        FROM orders
+        WHERE status = 'pending'
+        AND (expires_at IS NULL OR expires_at > datetime('now'))
+        ORDER BY created_at DESC
+    """,
+    'orders.waiting_payment': f"""
+        SELECT {ORDER_COLUMNS}
+        FROM orders
+        WHERE status = 'waiting_payment'
+        ORDER BY created_at DESC
+    """,
+    'orders.receipt_sent': """
+        SELECT * FROM orders
+        WHERE status = 'receipt_sent'
+        ORDER BY created_at DESC
+    """,
+    'orders.not_shipped': """
+        SELECT * FROM orders
+        WHERE status IN ('payment_confirmed', 'confirmed')
+        AND (shipping_method IS NULL OR shipping_method != 'shipped')
+        ORDER BY created_at DESC
+    """,
+    'orders.shipped': """
+        SELECT * FROM orders
+        WHERE shipping_method = 'shipped'
+        ORDER BY created_at DESC
+    """,
+    'orders.by_user': f"""
+        SELECT {ORDER_COLUMNS}
+        FROM orders
+        WHERE user_id = ?
+        AND status != 'rejected'
+        AND (
+            status IN ('payment_confirmed', 'confirmed')
+            OR expires_at > datetime('now')
+        )
+        ORDER BY created_at DESC
+    """,
+    'orders.count_customers': "SELECT COUNT(DISTINCT user_id) FROM orders",
+    'orders.peak_hours': """
+        SELECT strftime('%H', created_at) as hour, COUNT(*) as count
+        FROM orders
+        WHERE created_at >= DATE('now', ?)
+        GROUP BY hour
+        ORDER BY count DESC
+        LIMIT ?
+    """,
+    'orders.count_rejected_before': """
+        SELECT COUNT(*) FROM orders
+        WHERE status = 'rejected'
+        AND created_at < ?
+    """,
+    'orders.count_expired_before': """
+        SELECT COUNT(*) FROM orders
+        WHERE expires_at < datetime('now')
+        AND status NOT IN ('payment_confirmed', 'confirmed', 'rejected')
+        AND created_at < ?
+    """,
+    'orders.count_completed': """
+        SELECT COUNT(*) FROM orders
+        WHERE status IN ('payment_confirmed', 'confirmed')
+    """,
+    'orders.campaign_totals': """
+        SELECT user_id, SUM(final_price) as total_amount
+        FROM orders
+        WHERE created_at >= ? AND created_at <= ?
+        AND status = 'confirmed'
+        AND final_price >= ?
+        AND (? IS NULL OR final_price <= ?)
+        GROUP BY user_id
+    """,
+    'order_items.delete': "DELETE FROM order_items WHERE order_id = ?",
+    'order_items.resolve_product': """
+        SELECT p.id, pk.id
+        FROM products p
+        LEFT JOIN packs pk ON pk.product_id = p.id AND pk.name = ?
+        WHERE p.name = ?
+        ORDER BY pk.id IS NULL, p.id DESC
+        LIMIT 1
+    """,
+    'order_items.insert': """
+        INSERT INTO order_items
+        (order_id, product_id, pack_id, product_name, pack_name, quantity, unit_price, line_total)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    'orders.insert': """
+        INSERT INTO orders
+        (user_id, items, total_price, discount_amount, final_price, discount_code, expires_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """,
+    'orders.update_items_with_code': """
+        UPDATE orders
+        SET items = ?, total_price = ?, discount_amount = ?, final_price = ?, discount_code = ?
+        WHERE id = ?
+    """,
+    'orders.update_items': """
+        UPDATE orders
+        SET items = ?, total_price = ?, discount_amount = ?, final_price = ?
+        WHERE id = ?
+    """,
+    'orders.delete': "DELETE FROM orders WHERE id = ?",
+    'orders.count_stale': """
+        SELECT COUNT(*) FROM orders
+        WHERE (
+            status = 'rejected'
+            OR (expires_at < datetime('now') AND status NOT IN ('payment_confirmed', 'confirmed'))
+        )
+        AND created_at < ?
+    """,
+    'orders.delete_stale': """
+        DELETE FROM orders
+        WHERE (
+            status = 'rejected'
+            OR (expires_at < datetime('now') AND status NOT IN ('payment_confirmed', 'confirmed'))
+        )
+        AND created_at < ?
+    """,
+
+    # ==================== تخفیف ====================
+    'discounts.active_by_code': "SELECT * FROM discount_codes WHERE code = ? AND is_active = 1",
+    'discounts.by_id': "SELECT * FROM discount_codes WHERE id = ?",
+    'discounts.all': "SELECT * FROM discount_codes ORDER BY created_at DESC",
+    'discounts.user_usage': """
+        SELECT COUNT(*)
+        FROM discount_usage
+        WHERE user_id = ? AND discount_code = ?
+    """,
+    'discounts.insert_usage': "INSERT INTO discount_usage (user_id, discount_code, order_id) VALUES (?, ?, ?)",
+    'discounts.increment_used': "UPDATE discount_codes SET used_count = used_count + 1 WHERE code = ?",
+    'discounts.toggle': "UPDATE discount_codes SET is_active = 1 - is_active WHERE id = ?",
+    'temp_discounts.upsert': """
+        INSERT INTO temp_discount_codes (user_id, discount_code, discount_amount, expires_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            discount_code = excluded.discount_code,
+            discount_amount = excluded.discount_amount,
+            applied_at = CURRENT_TIMESTAMP,
+            expires_at = excluded.expires_at
+    """,
+    'temp_discounts.active_by_user': """
+        SELECT discount_code, discount_amount, expires_at
+        FROM temp_discount_codes
+        WHERE user_id = ? AND expires_at > datetime('now')
+    """,
+    'temp_discounts.clear': "DELETE FROM temp_discount_codes WHERE user_id = ?",
+    'discounts.insert': """
+        INSERT INTO discount_codes
+        (code, type, value, min_purchase, max_discount, usage_limit, per_user_limit, start_date, end_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    'discounts.delete': "DELETE FROM discount_codes WHERE id = ?",
+    'temp_discounts.delete_expired': """
+        DELETE FROM temp_discount_codes
+        WHERE expires_at < datetime('now')
+    """,
+
+    # ==================== آمار و گزارش ====================
+    'watermarks.get': "SELECT last_id FROM stats_watermarks WHERE name = ?",
+    'watermarks.set': """
+        INSERT INTO stats_watermarks (name, last_id) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id
+    """,
+    'stats.product_count': "SELECT COUNT(*) FROM products",
+    'stats.top_product': """
+        SELECT oi.product_name, SUM(oi.quantity) as total_quantity
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id
+        WHERE o.status IN ('confirmed', 'payment_confirmed')
+        GROUP BY oi.product_name
+        ORDER BY total_quantity DESC
+        LIMIT 1
+    """,
+    'stats.order_summary': """
+        SELECT
+            COALESCE(SUM(order_count), 0),
+            COALESCE(SUM(CASE WHEN day >= date('now') THEN order_count END), 0),
+            COALESCE(SUM(CASE WHEN day >= date('now', '-7 days') THEN order_count END), 0),
+            COALESCE(SUM(CASE WHEN status = 'pending' THEN order_count END), 0),
+            COALESCE(SUM(CASE WHEN status IN (?, ?) THEN revenue END), 0),
+            COALESCE(SUM(CASE WHEN status IN (?, ?) AND day >= date('now') THEN revenue END), 0),
+            COALESCE(SUM(CASE WHEN status IN (?, ?) AND day >= date('now', '-7 days') THEN revenue END), 0),
+            COALESCE(SUM(CASE WHEN status IN (?, ?) AND day >= date('now') THEN order_count END), 0)
+        FROM daily_order_stats
+    """,
+    'stats.user_summary': """
+        SELECT
+            COALESCE(SUM(new_users), 0),
+            COALESCE(SUM(CASE WHEN day >= date('now') THEN new_users END), 0),
+            COALESCE(SUM(CASE WHEN day >= date('now', '-7 days') THEN new_users END), 0)
+        FROM daily_user_stats
+    """,
+    'stats.blocked_users': "SELECT COUNT(*) FROM users WHERE blocked_at IS NOT NULL",
+    'stats.daily_sales': """
+        SELECT day, SUM(order_count), SUM(gross_amount), SUM(discount_amount), SUM(revenue)
+        FROM daily_order_stats
+        WHERE day >= date('now', ?)
+        AND status IN (?, ?)
+        GROUP BY day
+        HAVING SUM(order_count) > 0
+        ORDER BY day DESC
+    """,
+    'product_stats.max_delta_id': "SELECT COALESCE(MAX(id), 0) FROM product_stats_deltas",
+    'product_stats.apply_deltas': """
+        INSERT INTO product_stats
+        (product_name, total_sold, total_revenue, last_order_date, last_updated)
+        SELECT COALESCE(product_name, ''), SUM(quantity), SUM(revenue),
+               MAX(CASE WHEN quantity > 0 THEN order_date END), CURRENT_TIMESTAMP
+        FROM product_stats_deltas
+        WHERE id > ? AND id <= ?
+        GROUP BY 1
+        ON CONFLICT(product_name) DO UPDATE SET
+            total_sold = total_sold + excluded.total_sold,
+            total_revenue = total_revenue + excluded.total_revenue,
+            last_order_date = NULLIF(MAX(COALESCE(last_order_date, ''), COALESCE(excluded.last_order_date, '')), ''),
+            last_updated = excluded.last_updated
+    """,
+    'product_stats.count_deltas': "SELECT COUNT(*) FROM product_stats_deltas WHERE id > ? AND id <= ?",
+    'product_stats.delete_deltas': "DELETE FROM product_stats_deltas WHERE id <= ?",
+
+    # ==================== مخاطب‌ها و پیام همگانی ====================
+    'audiences.insert': """
+        INSERT INTO audiences (segment, param) VALUES (?, ?)
+        ON CONFLICT(segment, param) DO NOTHING
+    """,
+    'audiences.id': "SELECT id FROM audiences WHERE segment = ? AND param = ?",
+    'audiences.clear_members': "DELETE FROM audience_members WHERE audience_id = ?",
+    'audiences.set_size': "UPDATE audiences SET size = ?, built_at = datetime('now') WHERE id = ?",
+    'audiences.fresh': """
+        SELECT id, size FROM audiences
+        WHERE segment = ? AND param = ? AND built_at >= datetime('now', ?)
+    """,
+    'broadcast.insert_job': """
+        INSERT INTO broadcast_jobs (message_type, content, caption, created_by)
+        VALUES (?, ?, ?, ?)
+    """,
+    'broadcast.enqueue_audience': """
+        INSERT INTO broadcast_deliveries (job_id, user_id)
+        SELECT ?, user_id FROM audience_members WHERE audience_id = ?
+    """,
+    'broadcast.enqueue_all': """
+        INSERT INTO broadcast_deliveries (job_id, user_id)
+        SELECT ?, user_id FROM users
+    """,
+    'broadcast.enqueue_reachable': """
+        INSERT INTO broadcast_deliveries (job_id, user_id)
+        SELECT ?, user_id FROM users WHERE blocked_at IS NULL
+    """,
+    'broadcast.set_total': "UPDATE broadcast_jobs SET total = ? WHERE id = ?",
+    'broadcast.job_by_id': "SELECT * FROM broadcast_jobs WHERE id = ?",
+    'broadcast.set_progress_message': "UPDATE broadcast_jobs SET progress_chat_id = ?, progress_message_id = ? WHERE id = ?",
+    'broadcast.pending': """
+        SELECT user_id FROM broadcast_deliveries
+        WHERE job_id = ? AND status = 'pending' AND user_id > ?
+        ORDER BY user_id
+        LIMIT ?
+    """,
+    'broadcast.record_delivery': """
+        UPDATE broadcast_deliveries
+        SET status = ?, message_id = ?, error = ?, updated_at = datetime('now')
+        WHERE job_id = ? AND user_id = ?
+    """,
+    'broadcast.stats': """
+        SELECT status, COUNT(*) FROM broadcast_deliveries
+        WHERE job_id = ?
+        GROUP BY status
+    """,
+
+    # ==================== کیف پول ====================
+    'wallet.permanent_balance': """
+        SELECT balance
+        FROM wallet_permanent
+        WHERE user_id = ?
+    """,
+    'wallet.active_temp': """
+        SELECT id, balance, expires_at, description
+        FROM wallet_temp
+        WHERE user_id = ?
+        AND balance > 0
+        AND expires_at > datetime('now')
+        ORDER BY expires_at ASC
+    """,
+    'wallet.permanent_row': "SELECT id, balance FROM wallet_permanent WHERE user_id = ?",
+    'wallet.set_permanent_balance': """
+        UPDATE wallet_permanent
+        SET balance = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE user_id = ?
+    """,
+    'wallet.insert_permanent': """
+        INSERT INTO wallet_permanent (user_id, balance)
+        VALUES (?, ?)
+    """,
+    'wallet.log_permanent_credit': """
+        INSERT INTO wallet_transactions
+        (user_id, amount, transaction_type, wallet_type, description, admin_id)
+        VALUES (?, ?, 'credit', 'permanent', ?, ?)
+    """,
+    'wallet.insert_temp': """
+        INSERT INTO wallet_temp (user_id, balance, expires_at, description)
+        VALUES (?, ?, ?, ?)
+    """,
+    'wallet.log_temp_credit': """
+        INSERT INTO wallet_transactions
+        (user_id, amount, transaction_type, wallet_type, description, admin_id)
+        VALUES (?, ?, 'credit', 'temp', ?, ?)
+    """,
+    'wallet.log_permanent_debit': """
+        INSERT INTO wallet_transactions
+        (user_id, amount, transaction_type, wallet_type, description, order_id)
+        VALUES (?, ?, 'debit', 'permanent', ?, ?)
+    """,
+    'wallet.temp_balance': """
+        SELECT balance
+        FROM wallet_temp
+        WHERE id = ? AND user_id = ?
+    """,
+    'wallet.set_temp_balance': """
+        UPDATE wallet_temp
+        SET balance = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    """,
+    'wallet.log_temp_debit': """
+        INSERT INTO wallet_transactions
+        (user_id, amount, transaction_type, wallet_type, description, order_id)
+        VALUES (?, ?, 'debit', 'temp', ?, ?)
+    """,
+    'wallet.active_temp_for_deduct': """
+        SELECT id, balance, expires_at
+        FROM wallet_temp
+        WHERE user_id = ? AND balance > 0 AND expires_at > datetime('now')
+        ORDER BY expires_at ASC
+    """,
+    'wallet.transactions': """
+        SELECT id, amount, transaction_type, wallet_type, description, created_at
+        FROM wallet_transactions
+        WHERE user_id = ?
+        ORDER BY created_at DESC
+        LIMIT ?
+    """,
+    'orders.set_wallet_payment': """
+        UPDATE orders
+        SET wallet_used = ?,
+            final_price = ?
+        WHERE id = ?
+    """,
+    'wallet.delete_expired_temp': """
+        DELETE FROM wallet_temp
+        WHERE balance <= 0
+        OR expires_at <= datetime('now')
+    """,
+    'wallet.permanent_totals': """
+        SELECT COUNT(*), COALESCE(SUM(balance), 0), COALESCE(AVG(balance), 0)
+        FROM wallet_permanent
+        WHERE balance > 0
+    """,
+    'wallet.temp_totals': """
+        SELECT
+            COUNT(DISTINCT user_id),
+            COUNT(*),
+            COALESCE(SUM(balance), 0)
+        FROM wallet_temp
+        WHERE balance > 0
+        AND expires_at > datetime('now')
+    """,
+    'wallet.expired_temp_count': """
+        SELECT COUNT(*)
+        FROM wallet_temp
+        WHERE expires_at <= datetime('now')
+        OR balance <= 0
+    """,
+    'wallet.today_transactions': """
+        SELECT COUNT(*)
+        FROM wallet_transactions
+        WHERE created_at >= date('now')
+    """,
+    'wallet.today_credit': """
+        SELECT COALESCE(SUM(amount), 0)
+        FROM wallet_transactions
+        WHERE created_at >= date('now')
+        AND transaction_type = 'credit'
+    """,
+    'wallet.today_debit': """
+        SELECT COALESCE(SUM(ABS(amount)), 0)
+        FROM wallet_transactions
+        WHERE created_at >= date('now')
+        AND transaction_type = 'debit'
+    """,
+}
+
+
+# مرزهای histogram زمان اجرا (میلی‌ثانیه)
+TIMING_BUCKETS = (1, 5, 20, 100, 500)
+BUCKET_LABELS = tuple(f"<{edge}ms" for edge in TIMING_BUCKETS) + (f">={TIMING_BUCKETS[-1]}ms",)
+
+
+class QueryStats:
+    """
+    histogram و صدک‌های زمان اجرای کوئری‌ها به تفکیک نام (thread-safe)
+
+    صدک‌ها از آخرین SAMPLE_SIZE اجرای هر کوئری حساب میشن.
+
+    استفاده:
+        stats.record('products.by_id', 0.0004)
+        stats.add_rows('products.by_id', 1)
+        stats.snapshot(limit=5)  # پرهزینه‌ترین کوئری‌ها بر اساس زمان کل
+    """
+
+    SAMPLE_SIZE = 512
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _entry(self, name: str) -> dict:
+        """رکورد آمار name (قفل باید گرفته شده باشه)"""
+        entry = self._stats.get(name)
+        if entry is None:
+            entry = self._stats[name] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0,
+                                         'buckets': [0] * len(BUCKET_LABELS),
+                                         'samples': deque(maxlen=self.SAMPLE_SIZE)}
+        return entry
+
+    def record(self, name: str, seconds: float):
+        """ثبت یک اجرا"""
+        ms = seconds * 1000
+        bucket = len(TIMING_BUCKETS)
+        for index, edge in enumerate(TIMING_BUCKETS):
+            if ms < edge:
+                bucket = index
+                break
+
+        with self._lock:
+            entry = self._entry(name)
+            entry['count'] += 1
+            entry['total_ms'] += ms
+            entry['max_ms'] = max(entry['max_ms'], ms)
+            entry['buckets'][bucket] += 1
+            entry['samples'].append(ms)
+
+    def add_rows(self, name: str, rows: int):
+        """ثبت تعداد ردیف‌های برگشتی"""
+        with self._lock:
+            self._entry(name)['rows'] += rows
+
+    @staticmethod
+    def _percentile(ordered: list, fraction: float) -> float:
+        """صدک به روش nearest-rank روی لیست مرتب"""
+        if not ordered:
+            return 0.0
+        index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+        return round(ordered[index], 3)
+
+    def snapshot(self, limit: Optional[int] = None) -> List[dict]:
+        """
+        آمار کوئری‌ها به ترتیب زمان کل (نزولی)
+
+        Returns:
+            لیست {'name', 'count', 'total_ms', 'avg_ms', 'max_ms',
+                  'p50_ms', 'p95_ms', 'p99_ms', 'rows', 'histogram'}
+        """
+        with self._lock:
+            entries = [(name, dict(entry, samples=sorted(entry['samples'])))
+                       for name, entry in self._stats.items() if entry['count']]
+
+        rows = [
+            {
+                'name': name,
+                'count': entry['count'],
+                'total_ms': round(entry['total_ms'], 2),
+                'avg_ms': round(entry['total_ms'] / entry['count'], 3),
+                'max_ms': round(entry['max_ms'], 2),
+                'p50_ms': self._percentile(entry['samples'], 0.50),
+                'p95_ms': self._percentile(entry['samples'], 0.95),
+                'p99_ms': self._percentile(entry['samples'], 0.99),
+                'rows': entry['rows'],
+                'histogram': dict(zip(BUCKET_LABELS, entry['buckets'])),
+            }
+            for name, entry in entries
+        ]
+
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+# ==================== Instrumentation همه‌ی SQL ها ====================
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(sql: str) -> str:
+    """
+    کلید ثابت برای یک statement: فاصله‌ها یکی، literal ها ? و لیست‌های
+    IN (?, ?, ...) با هر طولی یکی میشن تا کوئری‌های پویا یک ردیف آمار بشن
+    """
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _WHITESPACE.sub(' ', sql).strip().rstrip(';')
+    return _PLACEHOLDER_LIST.sub('(?, ...)', sql)
+
+
+class QueryInstrumentation:
+    """
+    آمار همه‌ی statement های اجرا شده روی connection های pool + لاگ کوئری‌های کند
+
+    connection ها با factory=InstrumentedConnection ساخته میشن و هر
+    execute/executemany اینجا گزارش میشه. زمان ثبت شده زمان execute است
+    (برای SELECT های مرتب‌سازی/تجمیعی همون زمان اصلی اجراست) و ردیف‌ها
+    موقع fetch شمرده میشن.
+    """
+
+    # تعداد کوئری‌های کند اخیر که برای داشبورد نگه داشته میشه
+    RECENT_SLOW = 20
+
+    def __init__(self, slow_ms: float = 200, slow_logger: Optional[logging.Logger] = None):
+        self.slow_ms = slow_ms
+        self.stats = QueryStats()
+        self.slow_count = 0
+        self.recent_slow = deque(maxlen=self.RECENT_SLOW)
+        self._slow_logger = slow_logger
+        self._lock = threading.Lock()
+
+    @property
+    def slow_logger(self) -> logging.Logger:
+        if self._slow_logger is None:
+            from logger import setup_slow_query_logger
+            self._slow_logger = setup_slow_query_logger()
+        return self._slow_logger
+
+    def observe(self, conn: sqlite3.Connection, key: str, sql: str, params, seconds: float):
+        """ثبت یک اجرا؛ اگه کند بود همراه با plan لاگ میشه"""
+        self.stats.record(key, seconds)
+        ms = seconds * 1000
+        if self.slow_ms and ms >= self.slow_ms:
+            self._log_slow(conn, key, sql, params, ms)
+
+    def _log_slow(self, conn: sqlite3.Connection, key: str, sql: str, params, ms: float):
+        plan = explain_query_plan(conn, sql, params)
+        with self._lock:
+            self.slow_count += 1
+            self.recent_slow.append({'sql': key, 'ms': round(ms, 2), 'plan': plan,
+                                     'at': time.strftime('%Y-%m-%d %H:%M:%S')})
+
+        self.slow_logger.warning(
+            f"🐢 {ms:.1f}ms | {key}\n" + "\n".join(f"    {line}" for line in plan)
+        )
+
+    def snapshot(self, limit: Optional[int] = None) -> dict:
+        with self._lock:
+            recent = list(self.recent_slow)
+            slow_count = self.slow_count
+        return {
+            'slow_ms': self.slow_ms,
+            'slow_count': slow_count,
+            'statements': self.stats.snapshot(limit),
+            'recent_slow': recent[::-1],
+        }
+
+    def reset(self):
+        self.stats.reset()
+        with self._lock:
+            self.slow_count = 0
+            self.recent_slow.clear()
+
+
+def explain_query_plan(conn: sqlite3.Connection, sql: str, params=None) -> List[str]:
+    """خروجی EXPLAIN QUERY PLAN به صورت سطرهای متنی (اگه ممکن نباشه لیست خالی)"""
+    if params is None:
+        params = ()
+    try:
+        # متد کلاس پایه: خود EXPLAIN دوباره instrument نشه
+        rows = sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    except (sqlite3.Error, ValueError):
+        return []
+    return [row[3] for row in rows]
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor ای که زمان execute و تعداد ردیف‌های fetch شده رو گزارش میکنه"""
+
+    _key = None
+
+    def execute(self, sql, parameters=()):
+        instrumentation = self.connection.instrumentation
+        self._key = key = normalize_sql(sql)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            instrumentation.observe(self.connection, key, sql, parameters,
+                                    time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        instrumentation = self.connection.instrumentation
+        self._key = key = normalize_sql(sql)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            # پارامترها مصرف شدن - plan بدون پارامتر گرفته میشه
+            instrumentation.observe(self.connection, key, sql, None,
+                                    time.perf_counter() - started)
+
+    def _count(self, rows: int):
+        if rows and self._key is not None:
+            self.connection.instrumentation.stats.add_rows(self._key, rows)
+
+    def fetchone(self):
+        row = super().fetchone()
+        self._count(row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._count(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._count(len(rows))
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        self._count(1)
+        return row
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection ای که همه‌ی cursor هاش InstrumentedCursor هستن"""
+
+    instrumentation: QueryInstrumentation = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -3,57 +3,175 @@
 ✅ FIX: Smart Alert - فقط یه بار alert میده، بعد silent
 ✅ FIX: Admin Bypass خودکار
 ✅ FIX: حذف bypass_rate_limit_for_admin (deprecated)
+✅ الگوریتم GCRA: برای هر کلید فقط یک عدد (TAT) نگه داشته میشه
+✅ کلیدهای بیکار و alert های قدیمی به صورت دوره‌ای حذف میشن (حافظه با کاربرهای فعال رشد میکنه، نه با کل کاربرها)
 🛡️ محدودیت‌ها:
 - 20 پیام در دقیقه (سراسری)
 - 3 سفارش در ساعت
 - 5 امتحان کد تخفیف در دقیقه
+
+محدودیت هر عملیات با RATE_LIMITS در .env قابل تغییره، مثلاً:
+    RATE_LIMITS=general=20/60,order=3/3600,discount=5/60
+
+GCRA (Generic Cell Rate Algorithm):
+هر درخواست زمان "ورود نظری" (TAT) رو به اندازه‌ی window/max جلو میبره؛
+درخواست وقتی رد میشه که TAT بیشتر از یک window جلوتر از الان باشه.
+یعنی تا max درخواست پشت سر هم مجازه و بعد ظرفیت با نرخ ثابت پر میشه.
+وقتی TAT به گذشته برسه کلید هیچ اطلاعاتی نداره و حذفش بی‌خطره.
 """
+import math
 import time
 import logging
 from functools import wraps
 from logger import log_rate_limit
-from collections import defaultdict, deque
-from typing import Callable, Dict, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 from telegram import Update
 from telegram.ext import ContextTypes
-from config import ADMIN_ID
+from config import ADMIN_ID, RATE_LIMITS
 
 logger = logging.getLogger(__name__)
 
+# نام عملیات برای محدودیت سراسری
+GENERAL_ACTION = 'general'
 
-class RateLimiter:
-    """کلاس مدیریت Rate Limiting با Smart Alert"""
+
+def parse_limits(spec: str) -> Dict[str, Tuple[int, int]]:
+    """
+    تبدیل رشته‌ی RATE_LIMITS به دیکشنری
+    
+    مثال:
+        "order=3/3600,discount=5/60" -> {'order': (3, 3600), 'discount': (5, 60)}
+    """
+    limits = {}
     
-    def __init__(self):
-        # ذخیره زمان‌های درخواست هر کاربر
-        self._user_requests: Dict[int, deque] = defaultdict(lambda: deque(maxlen=100))
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
         
-        # شمارنده برای عملیات خاص
-        self._action_requests: Dict[Tuple[int, str], deque] = defaultdict(lambda: deque(maxlen=50))
+        try:
+            action, rule = item.split('=', 1)
+            max_requests, window_seconds = rule.split('/', 1)
+            limits[action.strip()] = (int(max_requests), int(window_seconds))
+        except ValueError:
+            logger.warning(f"⚠️ Invalid RATE_LIMITS entry ignored: {item!r}")
+    
+    return limits
+
+
+class RateLimiter:
+    """کلاس مدیریت Rate Limiting با Smart Alert (GCRA)"""
+    
+    def __init__(self, shards: int = 16, sweep_interval: float = 60,
+                 limits: Optional[Dict[str, Tuple[int, int]]] = None):
+        """
+        Args:
+            shards: تعداد بخش‌های جدول؛ پاکسازی هر بار یک بخش رو بررسی میکنه
+            sweep_interval: فاصله‌ی پاکسازی کامل کلیدهای بیکار (ثانیه)
+            limits: محدودیت‌های جایگزین {action: (max_requests, window_seconds)}
+        """
+        # {(user_id, action): (TAT, interval)} - TAT بر حسب time.monotonic()؛
+        # interval فاصله‌ی GCRA همین کلیده (برای تبدیل TAT به تعداد در get_stats)
+        self._shards: List[Dict[Tuple[int, str], Tuple[float, float]]] = [{} for _ in range(max(1, shards))]
         
         # ✅ FIX: ذخیره آخرین باری که alert داده شده
-        # {user_id: last_alert_time}
-        self._last_alert: Dict[int, float] = {}
+        # {user_id: last_alert_time} - هم‌بخش با TAT ها تا همراه اون‌ها پاکسازی بشه
+        self._alert_shards: List[Dict[int, float]] = [{} for _ in self._shards]
         
         # ✅ FIX: حداقل فاصله بین alertها (ثانیه)
         self.ALERT_COOLDOWN = 10
-    
-    def _cleanup_old_requests(self, user_id: int, window_seconds: int):
-        """حذف درخواست‌های قدیمی خارج از بازه زمانی"""
-        current_time = time.time()
-        cutoff_time = current_time - window_seconds
         
-        while self._user_requests[user_id] and self._user_requests[user_id][0] < cutoff_time:
-            self._user_requests[user_id].popleft()
+        self.limits: Dict[str, Tuple[int, int]] = dict(limits or {})
+        
+        # هر بار یک shard پاکسازی میشه تا کل جدول در sweep_interval بررسی بشه
+        self._sweep_step = sweep_interval / len(self._shards)
+        self._next_sweep = time.monotonic() + self._sweep_step
+        self._sweep_cursor = 0
     
-    def _cleanup_action_requests(self, user_id: int, action: str, window_seconds: int):
-        """حذف درخواست‌های قدیمی برای یک عملیات خاص"""
-        current_time = time.time()
-        cutoff_time = current_time - window_seconds
+    def _shard_index(self, user_id: int) -> int:
+        return hash(user_id) % len(self._shards)
+    
+    def _shard(self, user_id: int) -> Dict[Tuple[int, str], Tuple[float, float]]:
+        return self._shards[self._shard_index(user_id)]
+    
+    def _alerts(self, user_id: int) -> Dict[int, float]:
+        return self._alert_shards[self._shard_index(user_id)]
+    
+    def configure_limit(self, action: str, max_requests: int, window_seconds: int):
+        """تنظیم محدودیت یک عملیات (بر مقادیر دکوریتورها اولویت داره)"""
+        self.limits[action] = (max_requests, window_seconds)
+    
+    def get_limit(self, action: str, max_requests: int, window_seconds: int) -> Tuple[int, int]:
+        """محدودیت نهایی یک عملیات (تنظیمات یا مقدار پیش‌فرض فراخوان)"""
+        return self.limits.get(action, (max_requests, window_seconds))
+    
+    def _consume(self, user_id: int, action: str, max_requests: int,
+                 window_seconds: int) -> Tuple[bool, int]:
+        """
+        یک قدم GCRA
+        
+        Returns:
+            (allowed, remaining_time)
+        """
+        now = time.monotonic()
+        self._maybe_sweep(now)
+        
+        max_requests = max(1, max_requests)
+        interval = window_seconds / max_requests
+        shard = self._shard(user_id)
         key = (user_id, action)
         
-        while self._action_requests[key] and self._action_requests[key][0] < cutoff_time:
-            self._action_requests[key].popleft()
+        tat = max(shard.get(key, (now, interval))[0], now)
+        new_tat = tat + interval
+        
+        # چند ثانیه زودتر از زمان مجاز اومده (حاشیه‌ی کوچک برای خطای ممیز شناور)
+        wait = new_tat - window_seconds - now
+        if wait > 1e-6:
+            return False, int(wait) + 1
+        
+        shard[key] = (new_tat, interval)
+        return True, 0
+    
+    def _maybe_sweep(self, now: float):
+        """پاکسازی تدریجی: هر sweep_step ثانیه یک shard"""
+        if now < self._next_sweep:
+            return
+        
+        self._next_sweep = now + self._sweep_step
+        self._sweep_shard(self._sweep_cursor, now)
+        self._sweep_cursor = (self._sweep_cursor + 1) % len(self._shards)
+    
+    def _sweep_shard(self, index: int, now: float) -> int:
+        """حذف کلیدهای بیکار و alert های قدیمی یک shard"""
+        shard = self._shards[index]
+        idle = [key for key, (tat, _) in shard.items() if tat <= now]
+        for key in idle:
+            del shard[key]
+        
+        alerts = self._alert_shards[index]
+        cutoff = time.time() - self.ALERT_COOLDOWN
+        for user_id in [uid for uid, at in alerts.items() if at < cutoff]:
+            del alerts[user_id]
+        
+        return len(idle)
+    
+    def sweep(self) -> int:
+        """
+        حذف همه‌ی کلیدهای بیکار و alert های قدیمی
+        
+        Returns:
+            تعداد کلیدهای حذف شده
+        """
+        now = time.monotonic()
+        removed = sum(self._sweep_shard(i, now) for i in range(len(self._shards)))
+        
+        if removed:
+            logger.debug(f"🧹 Rate limiter swept {removed} idle keys")
+        return removed
+    
+    def tracked_keys(self) -> int:
+        """تعداد کلیدهای در حال پیگیری"""
+        return sum(len(shard) for shard in self._shards)
     
     def _should_show_alert(self, user_id: int) -> bool:
         """
@@ -64,11 +182,12 @@ class RateLimiter:
             False: نشون نده (silent)
         """
         current_time = time.time()
-        last_alert = self._last_alert.get(user_id, 0)
+        alerts = self._alerts(user_id)
+        last_alert = alerts.get(user_id, 0)
         
         # اگه cooldown گذشته یا اولین باره
         if current_time - last_alert >= self.ALERT_COOLDOWN:
-            self._last_alert[user_id] = current_time
+            alerts[user_id] = current_time
             return True
         
         return False
@@ -87,24 +206,18 @@ class RateLimiter:
         Returns:
             (allowed, remaining_time, show_alert)
         """
-        self._cleanup_old_requests(user_id, window_seconds)
-        
-        request_count = len(self._user_requests[user_id])
+        max_requests, window_seconds = self.get_limit(GENERAL_ACTION, max_requests, window_seconds)
+        allowed, remaining_time = self._consume(user_id, GENERAL_ACTION, max_requests, window_seconds)
         
-        if request_count >= max_requests:
-            oldest_request = self._user_requests[user_id][0]
-            remaining_time = int(window_seconds - (time.time() - oldest_request)) + 1
-            
+        if not allowed:
             # لاگ محدودیت
-            log_rate_limit(user_id, "general", remaining_time)
+            log_rate_limit(user_id, GENERAL_ACTION, remaining_time)
             
             # ✅ FIX: چک کن باید alert بده یا نه
             show_alert = self._should_show_alert(user_id)
             
             return False, remaining_time, show_alert
         
-        # ثبت درخواست جدید
-        self._user_requests[user_id].append(time.time())
         return True, 0, False
     
     def check_action_limit(self, user_id: int, action: str, 
@@ -122,61 +235,67 @@ class RateLimiter:
         Returns:
             (allowed, remaining_time, show_alert)
         """
-        self._cleanup_action_requests(user_id, action, window_seconds)
-        key = (user_id, action)
+        max_requests, window_seconds = self.get_limit(action, max_requests, window_seconds)
+        allowed, remaining_time = self._consume(user_id, action, max_requests, window_seconds)
         
-        request_count = len(self._action_requests[key])
-        
-        if request_count >= max_requests:
-            oldest_request = self._action_requests[key][0]
-            remaining_time = int(window_seconds - (time.time() - oldest_request)) + 1
-            
+        if not allowed:
             log_rate_limit(user_id, action, remaining_time)
-            logger.warning(f"⚠️ Action limit exceeded for user {user_id}, action '{action}': {request_count}/{max_requests}")
+            logger.warning(f"⚠️ Action limit exceeded for user {user_id}, action '{action}': {max_requests}/{window_seconds}s")
             
             # ✅ FIX: چک کن باید alert بده یا نه
             show_alert = self._should_show_alert(user_id)
             
             return False, remaining_time, show_alert
         
-        # ثبت درخواست جدید
-        self._action_requests[key].append(time.time())
         return True, 0, False
     
     def reset_user(self, user_id: int):
         """ریست کردن محدودیت‌های یک کاربر (برای ادمین)"""
-        if user_id in self._user_requests:
-            del self._user_requests[user_id]
+        shard = self._shard(user_id)
         
-        # حذف تمام action های این کاربر
-        keys_to_delete = [key for key in self._action_requests if key[0] == user_id]
+        # حذف محدودیت سراسری و تمام action های این کاربر
+        keys_to_delete = [key for key in shard if key[0] == user_id]
         for key in keys_to_delete:
-            del self._action_requests[key]
+            del shard[key]
         
         # ✅ پاک کردن alert cooldown
-        if user_id in self._last_alert:
-            del self._last_alert[user_id]
+        self._alerts(user_id).pop(user_id, None)
         
         logger.info(f"✅ Rate limits reset for user {user_id}")
     
     def get_stats(self, user_id: int) -> dict:
-        """دریافت آمار محدودیت‌های یک کاربر"""
+        """
+        دریافت آمار محدودیت‌های یک کاربر
+        
+        تعداد درخواست‌ها از روی TAT تخمین زده میشه (ظرفیت مصرف شده).
+        """
+        now = time.monotonic()
+        shard = self._shard(user_id)
+        
         stats = {
             'user_id': user_id,
-            'general_requests': len(self._user_requests.get(user_id, [])),
+            'general_requests': 0,
             'actions': {},
-            'last_alert': self._last_alert.get(user_id, 0)
+            'last_alert': self._alerts(user_id).get(user_id, 0)
         }
         
-        for (uid, action), requests in self._action_requests.items():
-            if uid == user_id:
-                stats['actions'][action] = len(requests)
+        for (uid, action), (tat, interval) in shard.items():
+            if uid != user_id or tat <= now:
+                continue
+            
+            # هر درخواست TAT رو یک interval (فاصله‌ی همین کلید) جلو میبره
+            count = math.ceil((tat - now) / interval) if interval else 0
+            
+            if action == GENERAL_ACTION:
+                stats['general_requests'] = count
+            else:
+                stats['actions'][action] = count
         
         return stats
 
 
 # نمونه سراسری
-rate_limiter = RateLimiter()
+rate_limiter = RateLimiter(limits=parse_limits(RATE_LIMITS))
 
 
 # ==================== Helper Functions ====================
@@ -212,9 +331,12 @@ def rate_limit(max_requests: int = 10, window_seconds: int = 10):
                 logger.debug(f"✅ Admin {user_id} bypassed rate limit")
                 return await func(update, context, *args, **kwargs)
             
+            # محدودیت تنظیم شده در RATE_LIMITS بر مقدار دکوریتور اولویت داره
+            limit, window = rate_limiter.get_limit(GENERAL_ACTION, max_requests, window_seconds)
+            
             # ✅ FIX: دریافت show_alert
             allowed, remaining_time, show_alert = rate_limiter.check_rate_limit(
-                user_id, max_requests, window_seconds
+                user_id, limit, window
             )
             
             if not allowed:
@@ -223,7 +345,7 @@ def rate_limit(max_requests: int = 10, window_seconds: int = 10):
                     warning_msg = (
                         f"⚠️ **شما خیلی سریع درخواست می‌فرستید!**\n\n"
                         f"لطفاً {remaining_time} ثانیه صبر کنید.\n\n"
-                        f"📌 محدودیت: {max_requests} درخواست در {window_seconds} ثانیه"
+                        f"📌 محدودیت: {limit} درخواست در {window} ثانیه"
                     )
                     
                     try:
@@ -272,9 +394,12 @@ def action_limit(action: str, max_requests: int, window_seconds: int):
                 logger.debug(f"✅ Admin {user_id} bypassed action limit for '{action}'")
                 return await func(update, context, *args, **kwargs)
             
+            # محدودیت تنظیم شده در RATE_LIMITS بر مقدار دکوریتور اولویت داره
+            limit, window = rate_limiter.get_limit(action, max_requests, window_seconds)
+            
             # ✅ FIX: دریافت show_alert
             allowed, remaining_time, show_alert = rate_limiter.check_action_limit(
-                user_id, action, max_requests, window_seconds
+                user_id, action, limit, window
             )
             
             if not allowed:
@@ -303,15 +428,15 @@ def action_limit(action: str, max_requests: int, window_seconds: int):
                         f"⚠️ **محدودیت {action_display}**\n\n"
                         f"شما به حداکثر تعداد مجاز رسیده‌اید.\n\n"
                         f"⏰ لطفاً {time_str} صبر کنید.\n\n"
-                        f"📌 محدودیت: {max_requests} بار در هر "
+                        f"📌 محدودیت: {limit} بار در هر "
                     )
                     
-                    if window_seconds >= 3600:
-                        warning_msg += f"{window_seconds // 3600} ساعت"
-                    elif window_seconds >= 60:
-                        warning_msg += f"{window_seconds // 60} دقیقه"
+                    if window >= 3600:
+                        warning_msg += f"{window // 3600} ساعت"
+                    elif window >= 60:
+                        warning_msg += f"{window // 60} دقیقه"
                     else:
-                        warning_msg += f"{window_seconds} ثانیه"
+                        warning_msg += f"{window} ثانیه"
                     
                     try:
                         if update.message:
@@ -8,6 +8,7 @@ import pytest
 import sqlite3
 import tempfile
 import os
+import time
 from datetime import datetime, timedelta
 from unittest.mock import Mock, AsyncMock, patch, MagicMock
 import asyncio
@@ -566,6 +567,82 @@ class TestRateLimiter:
         
         assert stats['user_id'] == 12345
         assert 'general_requests' in stats
+    
+    def test_capacity_refills_at_steady_rate(self):
+        """تست پر شدن ظرفیت با نرخ ثابت (GCRA)"""
+        from rate_limiter import RateLimiter
+        
+        limiter = RateLimiter()
+        now = time.monotonic()
+        
+        with patch('rate_limiter.time.monotonic', return_value=now):
+            results = [limiter.check_action_limit(12345, 'order', 3, 3600)[0] for _ in range(4)]
+        
+        assert results == [True, True, True, False]
+        
+        # بعد از یک سوم ساعت یک سفارش دیگه مجازه
+        with patch('rate_limiter.time.monotonic', return_value=now + 1200):
+            assert limiter.check_action_limit(12345, 'order', 3, 3600)[0] is True
+            assert limiter.check_action_limit(12345, 'order', 3, 3600)[0] is False
+    
+    def test_idle_users_are_swept(self):
+        """تست حذف کاربرهای بیکار از حافظه"""
+        from rate_limiter import RateLimiter
+        
+        limiter = RateLimiter()
+        for user_id in range(1000):
+            limiter.check_rate_limit(user_id, 20, 60)
+            limiter.check_action_limit(user_id, 'discount', 5, 60)
+        
+        assert limiter.tracked_keys() == 2000
+        
+        with patch('rate_limiter.time.monotonic', return_value=time.monotonic() + 61):
+            assert limiter.sweep() == 2000
+        
+        assert limiter.tracked_keys() == 0
+    
+    def test_incremental_sweep_prunes_alerts(self):
+        """تست حذف alert های قدیمی در پاکسازی تدریجی (بدون sweep دستی)"""
+        from rate_limiter import RateLimiter
+        
+        limiter = RateLimiter(shards=1, sweep_interval=1)
+        for user_id in range(100):
+            limiter.check_action_limit(user_id, 'order', 1, 3600)
+            assert limiter.check_action_limit(user_id, 'order', 1, 3600)[2] is True
+        
+        assert len(limiter._alert_shards[0]) == 100
+        
+        later = time.time() + limiter.ALERT_COOLDOWN + 1
+        with patch('rate_limiter.time.time', return_value=later), \
+                patch('rate_limiter.time.monotonic', return_value=time.monotonic() + 2):
+            limiter.check_rate_limit(999, 20, 60)
+        
+        assert len(limiter._alert_shards[0]) == 0
+    
+    def test_stats_use_interval_of_each_key(self):
+        """تست تبدیل TAT به تعداد با فاصله‌ی خود کلید، نه آخرین محدودیت استفاده شده"""
+        from rate_limiter import RateLimiter
+        
+        limiter = RateLimiter()
+        now = time.monotonic()
+        with patch('rate_limiter.time.monotonic', return_value=now):
+            for _ in range(4):
+                limiter.check_rate_limit(1, 20, 60)
+            limiter.check_rate_limit(2, 10, 10)
+            stats = limiter.get_stats(1)
+        
+        assert stats['general_requests'] == 4
+    
+    def test_configured_limits_override_defaults(self):
+        """تست محدودیت‌های تنظیم شده در RATE_LIMITS"""
+        from rate_limiter import RateLimiter, parse_limits
+        
+        limits = parse_limits("order=1/3600, discount=10/60, broken")
+        assert limits == {'order': (1, 3600), 'discount': (10, 60)}
+        
+        limiter = RateLimiter(limits=limits)
+        assert limiter.check_action_limit(12345, 'order', 3, 3600)[0] is True
+        assert limiter.check_action_limit(12345, 'order', 3, 3600)[0] is False
 
 
 # ==================== Tests: Edge Cases ====================
@@ -1008,6 +1085,1680 @@ class TestDataIntegrity:
 
 # ==================== Tests: Stress Testing ====================
 
+class TestAsyncDatabase:
+    """تست لایه‌ی async دیتابیس"""
+
+    def test_awaitable_methods(self, db):
+        """تست فراخوانی متدهای دیتابیس به صورت await"""
+        from async_database import AsyncDatabase
+
+        adb = AsyncDatabase(db, readers=2)
+
+        async def scenario():
+            product_id = await adb.add_product("محصول", "توضیحات", "photo")
+            pack_id = await adb.add_pack(product_id, "پک 6 تایی", 6, 300000)
+            await adb.add_user(12345, "test", "Test")
+            await adb.add_to_cart(12345, product_id, pack_id, 1)
+            return await adb.get_product(product_id), await adb.get_cart(12345)
+
+        try:
+            product, cart = asyncio.run(scenario())
+        finally:
+            adb.close()
+
+        assert product[1] == "محصول"
+        assert len(cart) == 1
+
+    def test_reads_and_writes_use_separate_threads(self, db):
+        """تست اجرای خواندن روی thread خواننده و نوشتن روی thread نویسنده"""
+        import threading
+        from async_database import AsyncDatabase
+
+        adb = AsyncDatabase(db, readers=2)
+        current = lambda: threading.current_thread().name
+
+        async def scenario():
+            return await adb.run_read(current), await adb.run_write(current)
+
+        try:
+            reader_name, writer_name = asyncio.run(scenario())
+        finally:
+            adb.close()
+
+        assert reader_name.startswith("db-reader")
+        assert writer_name.startswith("db-writer")
+
+    def test_read_not_blocked_by_pending_write(self, db):
+        """تست اینکه یک نوشتن کند، خواندن‌ها رو متوقف نمیکنه"""
+        import time
+        from async_database import AsyncDatabase
+
+        adb = AsyncDatabase(db, readers=2)
+        product_id = db.add_product("محصول", "توضیحات", "photo")
+
+        async def scenario():
+            slow_write = asyncio.create_task(adb.run_write(time.sleep, 0.5))
+            await asyncio.sleep(0.01)
+
+            start = time.time()
+            product = await adb.get_product(product_id)
+            read_duration = time.time() - start
+
+            await slow_write
+            return product, read_duration
+
+        try:
+            product, read_duration = asyncio.run(scenario())
+        finally:
+            adb.close()
+
+        assert product is not None
+        assert read_duration < 0.25
+
+    def test_private_methods_not_exposed(self, db):
+        """تست عدم دسترسی به متدهای خصوصی"""
+        from async_database import AsyncDatabase
+
+        adb = AsyncDatabase(db, readers=1)
+        try:
+            with pytest.raises(AttributeError):
+                adb._get_conn
+        finally:
+            adb.close()
+
+    def test_group_commit_batches_writes(self, db):
+        """تست commit یکجای نوشتن‌های همزمان"""
+        from async_database import AsyncDatabase
+
+        adb = AsyncDatabase(db, readers=1, group_commit=True, batch_window_ms=20)
+        product_id = db.add_product("محصول", "توضیحات", "photo")
+        pack_id = db.add_pack(product_id, "پک 6 تایی", 6, 300000)
+
+        async def scenario():
+            await asyncio.gather(*(adb.add_user(1000 + i, None, "Test") for i in range(20)))
+            await asyncio.gather(*(adb.add_to_cart(1000 + i, product_id, pack_id, 1) for i in range(20)))
+
+        try:
+            asyncio.run(scenario())
+        finally:
+            adb.close()
+
+        assert adb.batch_stats['operations'] == 40
+        assert adb.batch_stats['batches'] < 40
+        assert all(len(db.get_cart(1000 + i)) == 1 for i in range(20))
+
+    def test_close_drains_or_fails_queued_writes(self, db):
+        """تست اینکه aclose صف نوشتن رو تخلیه میکنه و close نوشتن‌های صف رو با خطا تموم میکنه"""
+        from async_database import AsyncDatabase
+
+        async def scenario(adb, drain):
+            writes = [asyncio.ensure_future(adb.add_user(user_id, None, "Test")) for user_id in range(1, 11)]
+            await asyncio.sleep(0)
+            if drain:
+                await adb.aclose()
+            else:
+                adb.close()
+            return await asyncio.gather(*writes, return_exceptions=True)
+
+        drained = AsyncDatabase(db, readers=1, group_commit=True, batch_window_ms=20)
+        results = asyncio.run(scenario(drained, True))
+        assert not any(isinstance(r, Exception) for r in results)
+        assert all(db.get_user(user_id) for user_id in range(1, 11))
+
+        dropped = AsyncDatabase(db, readers=1, group_commit=True, batch_window_ms=20)
+        results = asyncio.run(scenario(dropped, False))
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    def test_run_batch_isolates_failures(self, db):
+        """تست اینکه خطای یک عملیات بقیه‌ی دسته رو برنمی‌گردونه"""
+        def failing_operation():
+            with db.transaction() as cursor:
+                cursor.execute("INSERT INTO users (user_id, first_name) VALUES (1, 'a')")
+                raise ValueError("boom")
+
+        results = db.run_batch([
+            (db.add_user, (1, None, "First"), {}),
+            (failing_operation, (), {}),
+            (db.add_user, (2, None, "Second"), {}),
+        ])
+
+        assert results[0][0] is True
+        assert results[1][0] is False
+        assert results[2][0] is True
+        assert db.get_user(1)[2] == "First"
+        assert db.get_user(2) is not None
+
+    def test_change_cart_item_quantity(self, db):
+        """تست تغییر تعداد آیتم سبد و حذف در صفر"""
+        db.add_user(12345, "test", "Test")
+        product_id = db.add_product("محصول", "توضیحات", "photo")
+        pack_id = db.add_pack(product_id, "پک 6 تایی", 6, 300000)
+        db.add_to_cart(12345, product_id, pack_id, 1)
+        cart_id = db.get_cart(12345)[0][0]
+
+        result = db.change_cart_item_quantity(cart_id, 12345, 1)
+        assert result['new_quantity'] == 12
+
+        # کاربر دیگه نمیتونه سبد این کاربر رو تغییر بده
+        assert db.change_cart_item_quantity(cart_id, 99999, 1) is None
+
+        db.change_cart_item_quantity(cart_id, 12345, -2)
+        assert db.get_cart(12345) == []
+
+    def test_checkout_cart(self, db):
+        """تست ثبت سفارش از سبد در یک تراکنش"""
+        db.add_user(12345, "test", "Test")
+        product_id = db.add_product("محصول", "توضیحات", "photo")
+        pack_id = db.add_pack(product_id, "پک 6 تایی", 6, 300000)
+        db.add_to_cart(12345, product_id, pack_id, 1)
+        db.create_discount("CHECKOUT10", "fixed", 10000)
+
+        items = [{'product': 'محصول', 'pack': 'پک 6 تایی', 'pack_quantity': 6,
+                  'unit_price': 50000, 'quantity': 6, 'price': 300000, 'pack_price': 300000}]
+        order_id = db.checkout_cart(12345, items, 300000, 10000, 290000, discount_code="CHECKOUT10")
+
+        order = db.get_order(order_id)
+        assert order[5] == 290000
+        assert db.get_cart(12345) == []
+        assert db.get_user_discount_usage_count(12345, "CHECKOUT10") == 1
+
+
+class TestTimestamps:
+    """تست ذخیره‌ی زمان به صورت UTC و استفاده‌ی کوئری‌ها از index"""
+
+    def _plan(self, db, sql, params=()):
+        cursor = db._get_conn().cursor()
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return " ".join(row[-1] for row in cursor.fetchall())
+
+    def test_db_timestamp_roundtrip(self):
+        """تست تبدیل زمان تهران به UTC و برعکس"""
+        from database import to_db_timestamp, from_db_timestamp, TEHRAN_TZ
+
+        tehran = TEHRAN_TZ.localize(datetime(2024, 1, 1, 12, 0, 0))
+        stored = to_db_timestamp(tehran)
+
+        assert stored == "2024-01-01 08:30:00"
+        assert from_db_timestamp(stored) == tehran
+        assert from_db_timestamp(None) is None
+
+    def test_create_order_stores_utc(self, db):
+        """تست ذخیره‌ی expires_at با همان فرمت CURRENT_TIMESTAMP"""
+        db.add_user(12345, "test", "Test")
+        order_id = db.create_order(12345, [{'product': 'x', 'quantity': 1, 'price': 1000}], 1000)
+
+        cursor = db._get_conn().cursor()
+        cursor.execute("SELECT expires_at, datetime(expires_at), created_at FROM orders WHERE id = ?", (order_id,))
+        expires_at, normalized, created_at = cursor.fetchone()
+
+        assert expires_at == normalized
+        assert expires_at > created_at
+        assert not db.is_order_expired(order_id)
+
+    def test_migration_normalizes_legacy_values(self, temp_db):
+        """تست تبدیل مقادیر قدیمی با timezone به UTC"""
+        from database import Database
+
+        with patch('database.DATABASE_NAME', temp_db):
+            db = Database()
+            db.add_user(12345, "test", "Test")
+            order_id = db.create_order(12345, [{'product': 'x', 'quantity': 1, 'price': 1000}], 1000)
+
+            conn = db._get_conn()
+            conn.execute("UPDATE orders SET expires_at = '2024-01-01T12:00:00+03:30' WHERE id = ?", (order_id,))
+            conn.execute("PRAGMA user_version = 0")
+            conn.commit()
+            db.close()
+
+            db = Database()
+            cursor = db._get_conn().cursor()
+            cursor.execute("SELECT expires_at FROM orders WHERE id = ?", (order_id,))
+            assert cursor.fetchone()[0] == "2024-01-01 08:30:00"
+            assert db.is_order_expired(order_id)
+            db.close()
+
+    def test_time_filters_use_indexes(self, db):
+        """تست اینکه فیلترهای زمانی sargable هستن"""
+        plan = self._plan(db, "SELECT COUNT(*) FROM orders WHERE created_at >= date('now')")
+        assert "idx_orders_created_at" in plan or "idx_orders_status_created" in plan
+
+        plan = self._plan(db, "SELECT id FROM orders WHERE expires_at < datetime('now')")
+        assert "idx_orders_expires_at" in plan
+
+        plan = self._plan(db, """
+            SELECT id, balance, expires_at, description FROM wallet_temp
+            WHERE user_id = ? AND balance > 0 AND expires_at > datetime('now')
+            ORDER BY expires_at ASC
+        """, (12345,))
+        assert "idx_wallet_temp_active" in plan and "expires_at>?" in plan
+
+        plan = self._plan(db, "SELECT COUNT(*) FROM wallet_transactions WHERE created_at >= date('now')")
+        assert "idx_wallet_trans_created" in plan
+
+        plan = self._plan(db, "SELECT COUNT(*) FROM users WHERE created_at >= date('now', '-7 days')")
+        assert "idx_users_created_at" in plan
+
+
+class TestOrderItems:
+    """تست جدول نرمال order_items"""
+
+    def _setup_order(self, db):
+        db.add_user(12345, "test", "Test")
+        product_id = db.add_product("مانتو", "توضیحات", "photo")
+        pack_id = db.add_pack(product_id, "پک 6 تایی", 6, 300000)
+        items = [{'product': 'مانتو', 'pack': 'پک 6 تایی', 'pack_quantity': 6,
+                  'unit_price': 50000, 'quantity': 6, 'price': 300000, 'pack_price': 300000}]
+        order_id = db.create_order(12345, items, 300000)
+        return order_id, product_id, pack_id, items
+
+    def _rows(self, db, order_id):
+        cursor = db._get_conn().cursor()
+        cursor.execute("""
+            SELECT product_id, pack_id, product_name, quantity, unit_price, line_total
+            FROM order_items WHERE order_id = ?
+        """, (order_id,))
+        return [tuple(row) for row in cursor.fetchall()]
+
+    def test_create_order_writes_items(self, db):
+        """تست نوشتن order_items همراه با سفارش"""
+        order_id, product_id, pack_id, _ = self._setup_order(db)
+
+        assert self._rows(db, order_id) == [(product_id, pack_id, "مانتو", 6, 50000, 300000)]
+
+    def test_update_order_items_rewrites_rows(self, db):
+        """تست بازنویسی order_items بعد از ویرایش ادمین"""
+        order_id, product_id, pack_id, items = self._setup_order(db)
+
+        items[0]['quantity'] = 12
+        db.update_order_items(order_id, items, 600000, 0, 600000)
+
+        assert self._rows(db, order_id) == [(product_id, pack_id, "مانتو", 12, 50000, 600000)]
+
+        db.delete_order(order_id)
+        assert self._rows(db, order_id) == []
+
+    def test_most_popular_from_order_items(self, db):
+        """تست محاسبه‌ی محبوب‌ترین محصول از order_items"""
+        order_id, _, _, _ = self._setup_order(db)
+        db.update_order_status(order_id, 'confirmed')
+
+        assert db.get_statistics()['most_popular'] == "مانتو"
+
+    def test_backfill_from_json(self, temp_db):
+        """تست پر شدن order_items از سفارشات قدیمی"""
+        from database import Database
+
+        with patch('database.DATABASE_NAME', temp_db):
+            db = Database()
+            order_id, product_id, _, _ = self._setup_order(db)
+
+            conn = db._get_conn()
+            conn.execute("DELETE FROM order_items")
+            conn.execute("PRAGMA user_version = 1")
+            conn.commit()
+            db.close()
+
+            db = Database()
+            rows = self._rows(db, order_id)
+            db.close()
+
+        assert len(rows) == 1
+        assert rows[0][0] == product_id
+        assert rows[0][3] == 6
+
+
+class TestRollups:
+    """تست جداول آمار روزانه"""
+
+    def _base_counts(self, db):
+        cursor = db._get_conn().cursor()
+        cursor.execute("""
+            SELECT COUNT(*),
+                   COALESCE(SUM(CASE WHEN status IN ('confirmed', 'payment_confirmed') THEN final_price END), 0),
+                   COALESCE(SUM(CASE WHEN status = 'pending' THEN 1 END), 0)
+            FROM orders
+        """)
+        return tuple(cursor.fetchone())
+
+    def _rollup_counts(self, db):
+        summary = db.get_order_summary()
+        return summary['total'], summary['total_income'], summary['pending']
+
+    def test_triggers_follow_order_lifecycle(self, db):
+        """تست بروزرسانی آمار با ثبت، تغییر وضعیت و حذف سفارش"""
+        db.add_user(12345, "test", "Test")
+        items = [{'product': 'x', 'quantity': 1, 'price': 1000}]
+        first = db.create_order(12345, items, 1000)
+        second = db.create_order(12345, items, 2000, discount_amount=500)
+
+        assert self._rollup_counts(db) == (2, 0, 2)
+
+        db.update_order_status(second, 'confirmed')
+        assert self._rollup_counts(db) == (2, 1500, 1)
+
+        db.delete_order(first)
+        assert self._rollup_counts(db) == self._base_counts(db) == (1, 1500, 0)
+
+        sales = db.get_daily_sales(days=7)
+        assert len(sales) == 1
+        assert sales[0][1:] == (1, 2000, 500, 1500)
+
+    def test_statistics_read_rollups(self, db):
+        """تست یکسان بودن get_statistics با جداول اصلی"""
+        db.add_user(1, "a", "A")
+        db.add_user(2, "b", "B")
+        order_id = db.create_order(1, [{'product': 'x', 'quantity': 1, 'price': 1000}], 1000)
+        db.update_order_status(order_id, 'payment_confirmed')
+
+        stats = db.get_statistics()
+        assert stats['total_users'] == 2
+        assert stats['week_new_users'] == 2
+        assert stats['total_orders'] == stats['today_orders'] == 1
+        assert stats['total_income'] == stats['today_income'] == 1000
+        assert stats['pending_orders'] == 0
+
+    def test_rebuild_reconciles(self, db):
+        """تست همگام‌سازی دوباره بعد از تغییر داده‌ها خارج از trigger"""
+        db.add_user(12345, "test", "Test")
+        db.create_order(12345, [{'product': 'x', 'quantity': 1, 'price': 1000}], 1000)
+
+        conn = db._get_conn()
+        conn.execute("DELETE FROM daily_order_stats")
+        conn.execute("DELETE FROM daily_user_stats")
+        conn.commit()
+        assert self._rollup_counts(db) == (0, 0, 0)
+
+        db.rebuild_rollups()
+        assert self._rollup_counts(db) == self._base_counts(db)
+        assert db.get_user_summary()['total'] == 1
+
+
+class TestCacheManager:
+    """تست کش با ظرفیت محدود"""
+
+    def test_lru_eviction_by_count(self):
+        """تست حذف کم‌استفاده‌ترین رکورد وقتی تعداد از سقف بیشتر بشه"""
+        from cache_manager import CacheManager
+
+        cache = CacheManager(max_entries=2, max_bytes=None)
+        cache.set("user:1", "a")
+        cache.set("user:2", "b")
+        cache.get("user:1")
+        cache.set("user:3", "c")
+
+        assert cache.get("user:2") is None
+        assert cache.get("user:1") == "a"
+        assert cache.get("user:3") == "c"
+        assert cache.get_stats()['evictions'] == 1
+
+    def test_eviction_by_bytes(self):
+        """تست محدود ماندن حجم تقریبی کش"""
+        from cache_manager import CacheManager
+
+        cache = CacheManager(max_entries=None, max_bytes=20000)
+        for i in range(50):
+            cache.set(f"cart:{i}", [(i, "محصول " * 20, 300000)] * 5)
+
+        stats = cache.get_stats()
+        assert stats['memory_bytes'] <= 20000
+        assert stats['evictions'] > 0
+        assert cache.get("cart:49") is not None
+
+        # رکوردی بزرگ‌تر از کل ظرفیت ذخیره نمیشه
+        cache.set("huge", "x" * 50000)
+        assert cache.get("huge") is None
+
+    def test_bytes_accounting(self):
+        """تست بروز ماندن حجم با invalidate و clear"""
+        from cache_manager import CacheManager
+
+        cache = CacheManager()
+        cache.set("product:1", ("a", "b"))
+        cache.set("product:2", ("c", "d"))
+        assert cache.get_stats()['memory_bytes'] > 0
+
+        cache.invalidate_pattern("product:")
+        assert cache.get_stats()['memory_bytes'] == 0
+
+        cache.set("stats:main", {'total': 1})
+        cache.clear()
+        assert cache.get_stats()['memory_bytes'] == 0
+
+    def test_invalidate_is_exact(self):
+        """تست اینکه invalidate کلید cart:1 به cart:10 دست نمیزنه"""
+        from cache_manager import CacheManager
+
+        cache = CacheManager()
+        for user_id in (1, 10, 11):
+            cache.set(f"cart:{user_id}", [user_id])
+
+        cache.invalidate("cart:1")
+        assert cache.get("cart:1") is None
+        assert cache.get("cart:10") == [10]
+        assert cache.get("cart:11") == [11]
+
+    def test_namespace_and_tag_invalidation(self):
+        """تست حذف namespace و tag با index"""
+        from cache_manager import CacheManager, make_key
+
+        cache = CacheManager()
+        cache.set(make_key("stats", "main"), {'total': 1})
+        cache.set(make_key("stats", "wallet"), {'total': 2})
+        cache.set(make_key("product", 5), "p5")
+        cache.set(make_key("packs", 5), ["pack"], tags=(make_key("product", 5),))
+        cache.set(make_key("packs", 6), ["pack"], tags=(make_key("product", 6),))
+
+        assert cache.invalidate_namespace("stats") == 2
+        assert cache.get("stats:main") is None
+
+        assert cache.invalidate_tag("product:5") == 2
+        assert cache.get("product:5") is None
+        assert cache.get("packs:5") is None
+        assert cache.get("packs:6") == ["pack"]
+
+        # index ها بعد از حذف خالی میشن
+        assert "stats" not in cache._namespaces
+        assert "product:5" not in cache._tags
+
+
+class TestReadThroughCache:
+    """تست کش read-through در AsyncDatabase"""
+
+    def _setup(self, db):
+        from cache_manager import CacheManager, DatabaseCache
+        from async_database import AsyncDatabase
+
+        cache = CacheManager()
+        db.cache_manager = cache
+        adb = AsyncDatabase(db, readers=2, cache=DatabaseCache(db, cache))
+        return cache, adb
+
+    def test_repeated_reads_hit_cache(self, db):
+        """تست اینکه کلیک‌های پشت سر هم به SQLite نمیرسن"""
+        product_id = db.add_product("محصول", "توضیحات", "photo")
+        pack_id = db.add_pack(product_id, "پک 6 تایی", 6, 300000)
+        cache, adb = self._setup(db)
+
+        calls = []
+        original = db.get_pack
+        db.get_pack = lambda *args: calls.append(args) or original(*args)
+
+        async def scenario():
+            for _ in range(50):
+                pack = await adb.get_pack(pack_id)
+            return pack
+
+        try:
+            pack = asyncio.run(scenario())
+        finally:
+            adb.close()
+
+        assert pack[2] == "پک 6 تایی"
+        assert len(calls) == 1
+        assert cache.get_namespace_stats()['pack']['hits'] == 49
+
+    def test_writers_invalidate_precisely(self, db):
+        """تست invalidate شدن کش بعد از تغییر پک و تخفیف"""
+        product_id = db.add_product("محصول", "توضیحات", "photo")
+        pack_id = db.add_pack(product_id, "پک 6 تایی", 6, 300000)
+        db.create_discount("CACHE10", "percentage", 10)
+        db.add_user(12345, "test", "Test")
+        cache, adb = self._setup(db)
+
+        async def scenario():
+            await adb.get_pack(pack_id)
+            await adb.get_discount("CACHE10")
+            await adb.get_user(12345)
+
+            await adb.update_pack(pack_id, "پک جدید", 6, 250000)
+            await adb.toggle_discount(1)
+
+            return (await adb.get_pack(pack_id), await adb.get_discount("CACHE10"),
+                    cache.get("user:12345"))
+
+        try:
+            pack, discount, user = asyncio.run(scenario())
+        finally:
+            adb.close()
+
+        assert pack[2] == "پک جدید"
+        assert discount is None
+        assert user is not None
+
+    def test_block_state_writers_invalidate_user(self, db):
+        """تست invalidate کش کاربر بعد از بلاک، رفع بلاک و /start دوباره"""
+        db.add_user(1, "test", "Test")
+        cache, adb = self._setup(db)
+
+        async def cached_after(write):
+            await adb.get_user(1)
+            assert cache.get("user:1") is not None
+            write()
+            return cache.get("user:1")
+
+        try:
+            assert asyncio.run(cached_after(lambda: db.mark_users_blocked([(1, 'blocked')]))) is None
+            assert asyncio.run(cached_after(lambda: db.add_user(1, "test", "Test"))) is None
+            db.mark_users_blocked([(1, 'blocked')])
+            assert asyncio.run(cached_after(lambda: db.mark_users_reachable([1]))) is None
+            # /start کاربر غیر بلاک ردیف رو عوض نمیکنه و کش میمونه
+            assert asyncio.run(cached_after(lambda: db.add_user(1, "test", "Test"))) is not None
+        finally:
+            adb.close()
+
+    def test_load_does_not_cache_stale_value(self, db):
+        """تست اینکه invalidate وسط بارگذاری باعث کش شدن داده‌ی قدیمی نمیشه"""
+        from cache_manager import CacheManager, DatabaseCache
+
+        cache = CacheManager()
+        db_cache = DatabaseCache(db, cache)
+        product_id = db.add_product("محصول", "توضیحات", "photo")
+
+        original = db.get_product
+
+        def slow_get_product(pid):
+            value = original(pid)
+            # نوشتن همزمان بین خواندن و ذخیره در کش
+            cache.invalidate(f"product:{pid}")
+            return value
+
+        db.get_product = slow_get_product
+        db_cache.get_product(product_id)
+
+        assert cache.get(f"product:{product_id}") is None
+
+
+class TestSingleFlight:
+    """تست یکی شدن miss های همزمان و stale-while-revalidate"""
+
+    def test_concurrent_async_misses_share_one_load(self, db):
+        """تست اینکه ۵۰ درخواست همزمان یک محصول فقط یک کوئری میزنن"""
+        import time
+        from cache_manager import CacheManager, DatabaseCache
+        from async_database import AsyncDatabase
+
+        product_id = db.add_product("محصول", "توضیحات", "photo")
+        cache = CacheManager()
+        adb = AsyncDatabase(db, readers=4, cache=DatabaseCache(db, cache))
+
+        calls = []
+        original = db.get_product
+
+        def slow_get_product(pid):
+            calls.append(pid)
+            time.sleep(0.05)
+            return original(pid)
+
+        db.get_product = slow_get_product
+
+        async def scenario():
+            return await asyncio.gather(*(adb.get_product(product_id) for _ in range(50)))
+
+        try:
+            results = asyncio.run(scenario())
+        finally:
+            adb.close()
+
+        assert len(calls) == 1
+        assert all(row[1] == "محصول" for row in results)
+        assert cache.get_stats()['coalesced'] == 49
+
+    def test_concurrent_thread_misses_share_one_load(self, db):
+        """تست single-flight بین thread ها (DatabaseCache.get_statistics)"""
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from cache_manager import CacheManager, DatabaseCache
+
+        cache = CacheManager()
+        db_cache = DatabaseCache(db, cache)
+
+        calls = []
+        original = db.get_statistics
+
+        def slow_statistics():
+            calls.append(1)
+            time.sleep(0.1)
+            return original()
+
+        db.get_statistics = slow_statistics
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: db_cache.get_statistics(), range(8)))
+
+        assert len(calls) == 1
+        assert all(result == results[0] for result in results)
+
+    def test_stale_value_served_while_refreshing(self, db):
+        """تست اینکه رکورد منقضی در پنجره‌ی stale فوراً برگردونده و بروز میشه"""
+        from cache_manager import CacheManager, DatabaseCache
+        from async_database import AsyncDatabase
+
+        product_id = db.add_product("قدیمی", "توضیحات", "photo")
+        cache = CacheManager()
+        adb = AsyncDatabase(db, readers=2, cache=DatabaseCache(db, cache, stale_ttl=60))
+
+        async def scenario():
+            await adb.get_product(product_id)
+
+            # منقضی کردن رکورد و تغییر مستقیم دیتابیس (بدون invalidate)
+            entry = cache._cache[f"product:{product_id}"]
+            entry.created_at -= entry.ttl + 30
+            conn = db._get_conn()
+            conn.execute("UPDATE products SET name = 'جدید' WHERE id = ?", (product_id,))
+            conn.commit()
+
+            stale = await adb.get_product(product_id)
+            await asyncio.gather(*adb._inflight.values())
+            fresh = await adb.get_product(product_id)
+            return stale, fresh
+
+        try:
+            stale, fresh = asyncio.run(scenario())
+        finally:
+            adb.close()
+
+        assert stale[1] == "قدیمی"
+        assert fresh[1] == "جدید"
+        assert cache.get_stats()['stale_served'] == 1
+
+
+class TestBroadcastEngine:
+    """تست موتور ارسال پیام همگانی"""
+
+    def test_paces_to_rate_and_classifies_results(self):
+        """تست سرعت ارسال و دسته‌بندی نتیجه‌ها"""
+        from telegram.error import Forbidden, TimedOut
+        from broadcast_engine import BroadcastEngine
+
+        sent = []
+        flaky = {7}
+
+        async def send(user_id):
+            if user_id == 3:
+                raise Forbidden("blocked")
+            if user_id in flaky:
+                flaky.discard(user_id)
+                raise TimedOut()
+            sent.append(user_id)
+            return user_id
+
+        async def scenario():
+            engine = BroadcastEngine(send, rate=200, workers=8)
+            engine.bucket._tokens = 0  # بدون burst اولیه
+            start = time.monotonic()
+            stats = await engine.run(range(100))
+            return stats, time.monotonic() - start
+
+        stats, duration = asyncio.run(scenario())
+
+        assert stats['total'] == 100
+        assert stats['success'] == 99
+        assert stats['blocked'] == 1
+        assert stats['retries'] == 1
+        assert sorted(sent) == [i for i in range(100) if i != 3]
+        # ۱۰۱ ارسال با ۲۰۰ در ثانیه + یک ثانیه back-off شبکه
+        assert duration >= 0.5
+
+    def test_retry_after_pauses_all_workers(self):
+        """تست back-off سراسری بعد از RetryAfter"""
+        from telegram.error import RetryAfter
+        from broadcast_engine import BroadcastEngine
+
+        calls = []
+        limited = {0}
+
+        async def send(user_id):
+            calls.append((user_id, time.monotonic()))
+            if user_id in limited:
+                limited.discard(user_id)
+                raise RetryAfter(1)
+            return user_id
+
+        async def scenario():
+            engine = BroadcastEngine(send, rate=1000, workers=4)
+            return await engine.run(range(10))
+
+        stats = asyncio.run(scenario())
+
+        assert stats['success'] == 10
+        assert stats['backoffs'] == 1
+        first = calls[0][1]
+        # بعد از RetryAfter هیچ worker دیگه‌ای زودتر از یک ثانیه ارسال نکرده
+        late = [at for user_id, at in calls[1:] if at - first > 0.9]
+        assert len(late) >= len(calls) - 4
+
+    def test_progress_updates_are_throttled(self):
+        """تست محدود بودن تعداد به‌روزرسانی پیشرفت"""
+        from broadcast_engine import BroadcastEngine
+
+        updates = []
+
+        async def send(user_id):
+            return user_id
+
+        async def progress(stats):
+            updates.append(stats['processed'])
+
+        async def scenario():
+            engine = BroadcastEngine(send, rate=10000, workers=16,
+                                     progress_interval=60, on_progress=progress)
+            return await engine.run(range(500))
+
+        asyncio.run(scenario())
+
+        # اولین گزارش + گزارش نهایی
+        assert len(updates) == 2
+        assert updates[-1] == 500
+
+
+class TestBroadcastJobs:
+    """تست job های ماندگار پیام همگانی"""
+
+    def _users(self, db, count):
+        for user_id in range(1, count + 1):
+            db.add_user(user_id, f"user{user_id}", "Test")
+
+    def test_job_snapshot_and_status_transitions(self, db):
+        """تست ساخت job، صفحه‌بندی گیرنده‌ها و تغییر وضعیت مجاز"""
+        self._users(db, 5)
+        job_id = db.create_broadcast_job('text', 'سلام', None, 999)
+
+        assert db.get_broadcast_job(job_id)['total'] == 5
+        assert db.get_pending_deliveries(job_id, 0, 3) == [1, 2, 3]
+        assert db.get_pending_deliveries(job_id, 3, 3) == [4, 5]
+
+        db.record_broadcast_deliveries(job_id, [(1, 'success', 77, None), (2, 'blocked', None, 'Forbidden')])
+        stats = db.get_broadcast_stats(job_id)
+        assert (stats['success'], stats['blocked'], stats['pending'], stats['processed']) == (1, 1, 3, 2)
+
+        assert db.set_broadcast_job_status(job_id, 'completed') is False
+        assert db.set_broadcast_job_status(job_id, 'running') is True
+        assert db.set_broadcast_job_status(job_id, 'paused') is True
+        assert db.set_broadcast_job_status(job_id, 'cancelled') is True
+        assert db.set_broadcast_job_status(job_id, 'running') is False
+        assert db.get_broadcast_job(job_id)['finished_at'] is not None
+
+    def test_resumed_job_skips_delivered_users(self, db):
+        """تست اینکه ادامه‌ی job بعد از restart به کسی دو بار پیام نمیده"""
+        from async_database import AsyncDatabase
+        from handlers.broadcast import run_broadcast_job
+
+        self._users(db, 20)
+        job_id = db.create_broadcast_job('text', 'سلام', None, 999)
+        db.set_broadcast_job_status(job_id, 'running')
+        # ۸ نفر اول قبل از crash پیام گرفتن
+        db.record_broadcast_deliveries(job_id, [(uid, 'success', uid, None) for uid in range(1, 9)])
+
+        adb = AsyncDatabase(db, readers=2)
+        sent = []
+
+        async def send_message(user_id, text, parse_mode=None):
+            sent.append(user_id)
+            return Mock(message_id=1000 + user_id)
+
+        context = Mock()
+        context.job.data = job_id
+        context.bot_data = {'adb': adb}
+        context.bot.send_message = send_message
+        context.bot.edit_message_text = AsyncMock()
+
+        try:
+            asyncio.run(run_broadcast_job(context))
+        finally:
+            adb.close()
+
+        assert sorted(sent) == list(range(9, 21))
+        assert db.get_broadcast_stats(job_id)['success'] == 20
+        assert db.get_broadcast_job(job_id)['status'] == 'completed'
+
+        conn = db._get_conn()
+        message_id = conn.execute(
+            "SELECT message_id FROM broadcast_deliveries WHERE job_id = ? AND user_id = 15", (job_id,)
+        ).fetchone()[0]
+        assert message_id == 1015
+
+
+class TestUserPaging:
+    """تست دسترسی تکه‌تکه و keyset به کاربران"""
+
+    def test_iter_and_count_users(self, db):
+        """تست شمارش و پیمایش تکه‌تکه‌ی شناسه‌ها"""
+        for user_id in range(1, 26):
+            db.add_user(user_id, f"user{user_id}", "Test")
+
+        chunks = list(db.iter_user_ids(chunk_size=10))
+
+        assert db.count_users() == 25
+        assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+        assert [uid for chunk in chunks for uid in chunk] == list(range(1, 26))
+
+    def test_page_users_forward_and_back(self, db):
+        """تست صفحه‌ی بعد و قبل"""
+        for user_id in range(1, 13):
+            db.add_user(user_id, f"user{user_id}", "Test")
+
+        first = db.page_users(0, 5)
+        second = db.page_users(first[-1][0], 5)
+        back = db.page_users(limit=5, before_id=second[0][0])
+
+        assert [row[0] for row in first] == [1, 2, 3, 4, 5]
+        assert [row[0] for row in second] == [6, 7, 8, 9, 10]
+        assert [row[0] for row in back] == [1, 2, 3, 4, 5]
+        assert len(first[0]) == 9
+
+    def test_async_iter_user_ids(self, db):
+        """تست نسخه‌ی async پیمایش شناسه‌ها"""
+        from async_database import AsyncDatabase
+
+        for user_id in range(1, 8):
+            db.add_user(user_id, f"user{user_id}", "Test")
+
+        adb = AsyncDatabase(db, readers=2)
+
+        async def scenario():
+            return [chunk async for chunk in adb.iter_user_ids(chunk_size=3)]
+
+        try:
+            chunks = asyncio.run(scenario())
+        finally:
+            adb.close()
+
+        assert chunks == [[1, 2, 3], [4, 5, 6], [7]]
+
+
+class TestBlockedUsers:
+    """تست حذف کاربران بلاک‌کننده از پیام همگانی"""
+
+    def _users(self, db, count):
+        for user_id in range(1, count + 1):
+            db.add_user(user_id, f"user{user_id}", "Test")
+
+    def test_blocked_users_are_excluded(self, db):
+        """تست حذف از گیرنده‌ها و آمار قابل دسترس"""
+        self._users(db, 5)
+        db.mark_users_blocked([(2, 'blocked'), (4, 'deactivated')])
+
+        job_id = db.create_broadcast_job('text', 'سلام')
+
+        assert db.get_pending_deliveries(job_id) == [1, 3, 5]
+        assert db.count_users(reachable_only=True) == 3
+        assert db.get_user_summary()['reachable'] == 3
+        assert len(db.get_user(2)) == 9
+
+        # کاربری که دوباره /start بزنه از لیست بلاک خارج میشه
+        db.add_user(2, "user2", "Test")
+        assert db.count_users(reachable_only=True) == 4
+
+    def test_reachable_query_uses_partial_index(self, db):
+        """تست استفاده از index جزئی برای گیرنده‌های قابل دسترس"""
+        conn = db._get_conn()
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT user_id FROM users WHERE blocked_at IS NULL"
+        ).fetchall()
+
+        assert any('idx_users_reachable' in row[-1] for row in plan)
+
+    def test_probe_unblocks_reachable_users(self, db):
+        """تست بررسی دوباره: کاربر قابل دسترس آزاد و بلاک‌شده ثبت میشه"""
+        from telegram.error import Forbidden
+        from async_database import AsyncDatabase
+        from handlers.broadcast import probe_blocked_users
+
+        self._users(db, 3)
+        db.mark_users_blocked([(1, 'blocked'), (2, 'blocked'), (3, 'blocked')])
+        conn = db._get_conn()
+        conn.execute("UPDATE users SET block_checked_at = datetime('now', '-40 days') WHERE user_id IN (1, 2)")
+        conn.commit()
+
+        adb = AsyncDatabase(db, readers=2)
+
+        async def send_chat_action(user_id, action):
+            if user_id == 2:
+                raise Forbidden("Forbidden: user is deactivated")
+            return True
+
+        context = Mock()
+        context.bot_data = {'adb': adb}
+        context.bot.send_chat_action = send_chat_action
+
+        try:
+            asyncio.run(probe_blocked_users(context))
+        finally:
+            adb.close()
+
+        reasons = dict(conn.execute("SELECT user_id, block_reason FROM users").fetchall())
+        assert reasons == {1: None, 2: 'deactivated', 3: 'blocked'}
+        assert db.get_users_to_probe() == []
+
+
+class TestAudiences:
+    """تست گروه‌های مخاطب پیام همگانی"""
+
+    def test_segments_membership(self, db):
+        """تست اعضای هر گروه"""
+        product_id = db.add_product("محصول", "توضیحات", "photo")
+        pack_id = db.add_pack(product_id, "پک", 6, 300000)
+        for user_id in range(1, 6):
+            db.add_user(user_id, f"user{user_id}", "Test")
+
+        db.create_order(1, [{'product': 'محصول', 'quantity': 6, 'price': 300000}], 300000)
+        db.create_order(2, [{'product': 'محصول', 'quantity': 6, 'price': 300000}], 300000)
+        db.add_to_cart(3, product_id, pack_id, 1)
+        db.create_discount("SEG10", "percentage", 10)
+        db.use_discount(2, "SEG10", 1)
+        db.mark_users_blocked([(5, 'blocked')])
+
+        def members(segment, param=''):
+            audience = db.build_audience(segment, param)
+            conn = db._get_conn()
+            rows = conn.execute(
+                "SELECT user_id FROM audience_members WHERE audience_id = ? ORDER BY user_id", (audience['id'],)
+            ).fetchall()
+            assert audience['size'] == len(rows)
+            return [row[0] for row in rows]
+
+        assert members('all') == [1, 2, 3, 4]
+        assert members('recent_buyers') == [1, 2]
+        assert members('cart_not_empty') == [3]
+        assert members('never_ordered') == [3, 4]
+        assert members('used_discount', 'SEG10') == [2]
+
+    def test_job_targets_audience(self, db):
+        """تست ساخت job فقط برای اعضای گروه و استفاده‌ی دوباره از گروه ساخته شده"""
+        for user_id in range(1, 6):
+            db.add_user(user_id, f"user{user_id}", "Test")
+        db.create_order(4, [{'product': 'x', 'quantity': 1, 'price': 1000}], 1000)
+
+        audience = db.get_audience('recent_buyers')
+        job_id = db.create_broadcast_job('text', 'سلام', audience_id=audience['id'])
+
+        assert db.get_pending_deliveries(job_id) == [4]
+        # دفعه‌ی دوم از جدول خونده میشه و دوباره ساخته نمیشه
+        db.create_order(5, [{'product': 'x', 'quantity': 1, 'price': 1000}], 1000)
+        assert db.get_audience('recent_buyers') == audience
+
+    def test_segment_callback_requires_admin(self, mock_update, mock_context):
+        """تست رد callback گروه مخاطب برای غیرادمین و شناسه‌ی تخفیف نامعتبر"""
+        from config import ADMIN_ID
+        from handlers.broadcast import broadcast_segment_selected
+
+        adb = Mock()
+        adb.get_audience = AsyncMock()
+        adb.get_discount_by_id = AsyncMock()
+        mock_context.bot_data = {'adb': adb}
+        mock_update.callback_query = AsyncMock()
+        mock_update.callback_query.data = "bcast_seg:all"
+
+        mock_update.effective_user.id = ADMIN_ID + 1
+        asyncio.run(broadcast_segment_selected(mock_update, mock_context))
+        adb.get_audience.assert_not_called()
+
+        mock_update.effective_user.id = ADMIN_ID
+        mock_update.callback_query.data = "bcast_seg:used_discount:x1"
+        asyncio.run(broadcast_segment_selected(mock_update, mock_context))
+        adb.get_discount_by_id.assert_not_called()
+        mock_update.callback_query.answer.assert_called_with("❌ کد تخفیف نامعتبر!", show_alert=True)
+
+
+class TestBackup:
+    """تست بکاپ آنلاین دیتابیس"""
+
+    def test_backup_is_consistent_and_compressed(self, db, temp_db, tmp_path):
+        """تست اینکه بکاپ تغییرات WAL رو داره، سالمه و فشرده است"""
+        import gzip
+        import shutil
+        from backup_scheduler import backup_database
+
+        db.add_user(12345, "test", "Test")
+        db.add_product("محصول", "توضیحات", "photo")
+
+        report = backup_database(temp_db, str(tmp_path))
+
+        assert report['filename'].endswith('.db.gz')
+        assert report['size'] > 0 and report['db_size'] > 0
+        assert not os.path.exists(report['path'][:-3])
+
+        restored = tmp_path / "restored.db"
+        with gzip.open(report['path'], 'rb') as src, open(restored, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+
+        conn = sqlite3.connect(restored)
+        try:
+            assert conn.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+            assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 1
+            assert conn.execute("SELECT name FROM products").fetchone()[0] == "محصول"
+        finally:
+            conn.close()
+
+    def test_corrupt_backup_is_rejected(self, tmp_path):
+        """تست رد شدن فایل خراب"""
+        from backup_scheduler import verify_backup
+
+        broken = tmp_path / "broken.db"
+        broken.write_bytes(b"not a database" * 100)
+
+        with pytest.raises(Exception):
+            verify_backup(str(broken))
+
+    def test_incremental_chain_restores_point_in_time(self, db, temp_db, tmp_path):
+        """تست بکاپ افزایشی و بازیابی در یک لحظه‌ی مشخص"""
+        from backup_scheduler import incremental_backup, restore_backup
+
+        archive = str(tmp_path / "archive")
+        db.add_user(1, "first", "First")
+        full = incremental_backup(temp_db, archive)
+        checkpoint = datetime.now()
+
+        db.add_user(2, "second", "Second")
+        delta = incremental_backup(temp_db, archive)
+        unchanged = incremental_backup(temp_db, archive)
+
+        assert full['kind'] == 'full'
+        assert delta['kind'] == 'incremental'
+        assert 0 < delta['pages'] < full['pages']
+        assert unchanged['kind'] == 'unchanged'
+
+        def user_ids(path):
+            conn = sqlite3.connect(path)
+            try:
+                return [row[0] for row in conn.execute("SELECT user_id FROM users ORDER BY user_id")]
+            finally:
+                conn.close()
+
+        before = restore_backup(str(tmp_path / "before.db"), checkpoint, archive)
+        latest = restore_backup(str(tmp_path / "latest.db"), None, archive)
+
+        assert before['entries'] == 1
+        assert latest['entries'] == 2
+        assert user_ids(tmp_path / "before.db") == [1]
+        assert user_ids(tmp_path / "latest.db") == [1, 2]
+
+    def test_retention_removes_whole_chains(self, db, temp_db, tmp_path):
+        """تست اینکه پاکسازی زنجیره‌ها رو کامل حذف میکنه"""
+        from backup_scheduler import incremental_backup, load_manifest, prune_chains
+
+        archive = str(tmp_path / "archive")
+        for user_id in range(1, 7):
+            db.add_user(user_id, f"user{user_id}", "User")
+            # chain_length=1: هر زنجیره یک full و یک incremental
+            incremental_backup(temp_db, archive, chain_length=1)
+
+        assert len(load_manifest(archive)['chains']) == 3
+
+        prune_chains(1, archive)
+
+        chains = load_manifest(archive)['chains']
+        assert len(chains) == 1
+        kept = {entry['file'] for entry in chains[0]['entries']} | {chains[0]['hashes'], 'manifest.json'}
+        assert set(os.listdir(archive)) == kept
+
+    def test_chain_holds_chain_length_incrementals(self, db, temp_db, tmp_path):
+        """تست اینکه هر زنجیره یک full و دقیقاً chain_length بکاپ افزایشی داره"""
+        from backup_scheduler import incremental_backup, load_manifest
+
+        archive = str(tmp_path / "archive")
+        for user_id in range(1, 8):
+            db.add_user(user_id, f"user{user_id}", "User")
+            incremental_backup(temp_db, archive, chain_length=2)
+
+        chains = load_manifest(archive)['chains']
+        assert [len(chain['entries']) for chain in chains] == [3, 3, 1]
+
+
+class TestQueryRegistry:
+    """تست رجیستری کوئری‌ها و آمار زمان اجرا"""
+
+    def test_all_registered_queries_prepare(self, db):
+        """تست اینکه همه‌ی کوئری‌های رجیستری روی schema فعلی معتبرن"""
+        from queries import QUERIES
+
+        conn = db._get_conn()
+        for name, sql in QUERIES.items():
+            params = (None,) * sql.count('?')
+            # EXPLAIN بدون اجرای واقعی کوئری رو compile میکنه
+            conn.execute(f"EXPLAIN {sql}", params)
+
+    def test_query_timings_recorded(self, db):
+        """تست ثبت histogram زمان اجرا به تفکیک نام کوئری"""
+        from queries import BUCKET_LABELS
+
+        db.add_user(12345, "test", "Test")
+        for _ in range(3):
+            db.get_user(12345)
+
+        stats = {row['name']: row for row in db.get_query_stats()}
+        assert stats['users.by_id']['count'] == 3
+        assert sum(stats['users.by_id']['histogram'].values()) == 3
+        assert set(stats['users.by_id']['histogram']) == set(BUCKET_LABELS)
+        assert stats['users.insert']['count'] == 1
+
+    def test_moved_handler_queries(self, db):
+        """تست متدهایی که جای SQL داخل هندلرها رو گرفتن"""
+        items = [{'product': 'محصول', 'pack': 'پک', 'quantity': 1, 'price': 1000}]
+        db.add_user(1, "a", "A")
+        db.add_user(2, "b", "B")
+
+        active_id = db.create_order(1, items, 1000, 0, 1000)
+        expired_id = db.create_order(2, items, 5000, 0, 5000)
+        conn = db._get_conn()
+        conn.execute("UPDATE orders SET expires_at = datetime('now', '-1 hour') WHERE id = ?", (expired_id,))
+        conn.execute("UPDATE orders SET status = 'confirmed'")
+        conn.execute("UPDATE orders SET status = 'pending' WHERE id IN (?, ?)", (active_id, expired_id))
+        conn.commit()
+
+        assert len(db.get_pending_orders()) == 2
+        assert [row[0] for row in db.get_pending_orders(active_only=True)] == [active_id]
+        assert db.count_customers() == 2
+        assert [row[0] for row in db.get_recent_users(1)] in ([1], [2])
+
+        conn.execute("UPDATE orders SET status = 'confirmed'")
+        conn.commit()
+        start, end = '2000-01-01 00:00:00', '2999-01-01 00:00:00'
+        assert sorted(tuple(row) for row in db.get_campaign_totals(start, end, 0)) == [(1, 1000), (2, 5000)]
+        assert [tuple(row) for row in db.get_campaign_totals(start, end, 0, 2000)] == [(1, 1000)]
+
+
+class TestQueryInstrumentation:
+    """تست آمار تک‌تک SQL ها و لاگ کوئری‌های کند"""
+
+    def test_percentiles_and_normalization(self):
+        """تست صدک‌ها و یکی شدن statement های پویا"""
+        from queries import QueryStats, normalize_sql
+
+        stats = QueryStats()
+        for ms in range(1, 101):
+            stats.record('q', ms / 1000)
+        stats.add_rows('q', 7)
+        row = stats.snapshot()[0]
+        assert (row['p50_ms'], row['p95_ms'], row['p99_ms']) == (50, 95, 99)
+        assert row['rows'] == 7
+
+        assert normalize_sql("SELECT *  FROM t\n WHERE id IN (?, ?, ?) AND name = 'x' AND n > 5") == \
+            normalize_sql("SELECT * FROM t WHERE id IN (?,?) AND name = 'y' AND n > 10") == \
+            "SELECT * FROM t WHERE id IN (?, ...) AND name = ? AND n > ?"
+
+    def test_database_statements_recorded(self, temp_db):
+        """تست ثبت همه‌ی SQL ها (حتی خارج از رجیستری) با تعداد ردیف"""
+        from database import Database
+
+        with patch('database.DATABASE_NAME', temp_db), \
+                patch('database.DB_QUERY_STATS', True), \
+                patch('database.DB_SLOW_QUERY_MS', 0):
+            db = Database()
+            try:
+                db.add_user(1, "a", "A")
+                db.add_user(2, "b", "B")
+                assert len(db.get_all_users()) == 2
+                db._get_conn().execute("SELECT user_id FROM users WHERE user_id > 0").fetchall()
+
+                stats = db.get_statement_stats()
+                by_sql = {row['name']: row for row in stats['statements']}
+            finally:
+                db.close()
+
+        assert stats['enabled'] and stats['slow_count'] == 0
+        from queries import QUERIES, normalize_sql
+        insert = by_sql[normalize_sql(QUERIES['users.insert'])]
+        assert insert['count'] == 2
+        assert by_sql[normalize_sql(QUERIES['users.all'])]['rows'] == 2
+        assert by_sql["SELECT user_id FROM users WHERE user_id > ?"]['rows'] == 2
+
+    def test_slow_query_logged_with_plan(self, temp_db):
+        """تست لاگ کوئری کند همراه با EXPLAIN QUERY PLAN"""
+        import logging
+        from database import DatabaseConnectionPool
+        from queries import QueryInstrumentation
+
+        records = []
+        slow_logger = logging.getLogger('test_slow_queries')
+        slow_logger.propagate = False
+        handler = logging.Handler()
+        handler.emit = records.append
+        slow_logger.addHandler(handler)
+
+        instrumentation = QueryInstrumentation(slow_ms=1e-6, slow_logger=slow_logger)
+        pool = DatabaseConnectionPool(temp_db, max_size=1, instrumentation=instrumentation)
+        try:
+            conn = pool.get_connection()
+            conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+            conn.executemany("INSERT INTO t (v) VALUES (?)", [('a',), ('b',)])
+            instrumentation.reset()
+            rows = list(conn.execute("SELECT * FROM t WHERE v = ?", ('a',)))
+        finally:
+            pool.cleanup_all()
+            slow_logger.removeHandler(handler)
+
+        assert len(rows) == 1
+        snapshot = instrumentation.snapshot()
+        assert snapshot['slow_count'] == 1
+        assert snapshot['statements'][0]['rows'] == 1
+        assert any('SCAN' in line for line in snapshot['recent_slow'][0]['plan'])
+        assert 'SCAN' in records[-1].getMessage()
+
+    def test_dashboard_plan_inside_code_span(self, mock_update, mock_context):
+        """تست اینکه plan با نام‌های دارای _ داخل `code` نمایش داده میشه (Markdown معتبر) - فقط برای ادمین"""
+        from config import ADMIN_ID
+        from admin_dashboard import show_query_stats
+
+        plan = ['SEARCH order_items USING INDEX idx_order_items_order_id (order_id=?)']
+        adb = Mock()
+        adb.get_statement_stats = AsyncMock(return_value={
+            'enabled': True, 'slow_ms': 200, 'slow_count': 1, 'statements': [],
+            'recent_slow': [{'at': '12:00:00', 'ms': 250.0, 'sql': 'SELECT 1', 'plan': plan}],
+        })
+        mock_context.bot_data = {'adb': adb}
+        mock_update.callback_query = AsyncMock()
+
+        mock_update.effective_user.id = ADMIN_ID + 1
+        asyncio.run(show_query_stats(mock_update, mock_context))
+        adb.get_statement_stats.assert_not_called()
+
+        mock_update.effective_user.id = ADMIN_ID
+        asyncio.run(show_query_stats(mock_update, mock_context))
+
+        text = mock_update.callback_query.edit_message_text.call_args[0][0]
+        assert f"`{plan[0]}`" in text
+
+
+class TestProductStats:
+    """تست نگهداری افزایشی product_stats"""
+
+    ITEMS = [{'product': 'الف', 'pack': 'پک', 'quantity': 2, 'price': 1000},
+             {'product': 'ب', 'pack': 'پک', 'quantity': 1, 'price': 4000}]
+
+    @staticmethod
+    def stats(db):
+        rows = db._get_conn().execute(
+            "SELECT product_name, total_sold, total_revenue FROM product_stats ORDER BY product_name"
+        ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def test_deltas_follow_paid_transitions(self, db):
+        """تست delta ها برای ورود/خروج از وضعیت پرداخت شده و حذف سفارش"""
+        db.add_user(1, "a", "A")
+        first = db.create_order(1, self.ITEMS, 6000, 0, 6000)
+        second = db.create_order(1, self.ITEMS[:1], 2000, 0, 2000)
+
+        db.update_order_status(first, 'confirmed')
+        db.update_order_status(second, 'payment_confirmed')
+        report = db.apply_product_stats_deltas()
+        assert report['deltas'] == 3
+        assert self.stats(db) == [('الف', 4, 4000.0), ('ب', 1, 4000.0)]
+
+        # بدون تغییر جدید کاری انجام نمیشه و high-water mark ثابت میمونه
+        assert db.apply_product_stats_deltas() == {'deltas': 0, 'products': 0, 'watermark': report['watermark']}
+
+        db.update_order_status(first, 'rejected')
+        conn = db._get_conn()
+        conn.execute("DELETE FROM orders WHERE id = ?", (second,))
+        conn.commit()
+        db.apply_product_stats_deltas()
+        assert self.stats(db) == [('الف', 0, 0.0), ('ب', 0, 0.0)]
+        assert conn.execute("SELECT COUNT(*) FROM product_stats_deltas").fetchone()[0] == 0
+
+    def test_rebuild_is_atomic_swap(self, db, temp_db):
+        """تست بازسازی کامل در جدول سایه بدون دیدن جدول خالی"""
+        db.add_user(1, "a", "A")
+        order_id = db.create_order(1, self.ITEMS, 6000, 0, 6000)
+        db.update_order_status(order_id, 'confirmed')
+        db.apply_product_stats_deltas()
+        before = self.stats(db)
+
+        conn = db._get_conn()
+        conn.execute("UPDATE product_stats SET total_sold = 99")
+        conn.commit()
+        db.update_order_status(db.create_order(1, self.ITEMS[:1], 2000, 0, 2000), 'confirmed')
+
+        reader = sqlite3.connect(temp_db)
+        try:
+            with db.transaction() as cursor:
+                db._rebuild_product_stats(cursor)
+                # تا commit خواننده‌ها جدول قبلی رو میبینن
+                assert reader.execute("SELECT COUNT(*), MIN(total_sold) FROM product_stats").fetchone() == (2, 99)
+        finally:
+            reader.close()
+
+        assert self.stats(db) == [('الف', 4, 4000.0), before[1]]
+        assert db.apply_product_stats_deltas()['deltas'] == 0
+
+
+class TestAnalyticsEngine:
+    """تست موتور تحلیل برداری (NumPy)"""
+
+    ITEMS_A = [{'product': 'الف', 'pack': 'پک', 'quantity': 3, 'price': 1000}]
+    ITEMS_B = [{'product': 'ب', 'pack': 'پک', 'quantity': 1, 'price': 5000}]
+
+    def test_incremental_refresh(self, db):
+        """تست بارگذاری افزایشی، تغییر وضعیت سفارش باز و بازسازی بعد از حذف"""
+        from analytics_engine import AnalyticsEngine
+
+        db.add_user(1, "a", "A")
+        db.add_user(2, "b", "B")
+        first = db.create_order(1, self.ITEMS_A, 3000, 0, 3000)
+        db.update_order_status(first, 'confirmed')
+
+        engine = AnalyticsEngine()
+        assert engine.refresh(db) == 1
+        assert engine.conversion(2)['buyers'] == 1
+
+        second = db.create_order(2, self.ITEMS_B, 5000, 0, 5000)
+        assert engine.refresh(db) == 1
+        assert engine.top_products() == [('الف', 3)]
+
+        db.update_order_status(second, 'confirmed')
+        assert engine.refresh(db) == 0
+        assert engine.conversion(2)['buyers'] == 2
+        assert engine.top_products() == [('الف', 3), ('ب', 1)]
+        assert engine.stats['full_loads'] == 1
+
+        conn = db._get_conn()
+        conn.execute("DELETE FROM orders WHERE id = ?", (first,))
+        conn.commit()
+        engine.refresh(db)
+        assert engine.stats['full_loads'] == 2
+        assert engine.top_products() == [('ب', 1)]
+
+    def test_edited_open_order_items_refreshed(self, db):
+        """تست اینکه ویرایش آیتم‌های سفارش باز و بعد تایید در snapshot دیده میشه"""
+        from analytics_engine import AnalyticsEngine
+
+        db.add_user(1, "a", "A")
+        items = [{'product': 'Shirt', 'pack': 'پک', 'quantity': 1, 'price': 1000}]
+        order_id = db.create_order(1, items, 1000, 0, 1000)
+
+        engine = AnalyticsEngine()
+        engine.refresh(db)
+
+        items[0]['quantity'] = 5
+        db.update_order_items(order_id, items, 5000, 0, 5000)
+        db.update_order_status(order_id, 'confirmed')
+        engine.refresh(db)
+
+        assert engine.stats['full_loads'] == 1
+        assert engine.top_products() == [('Shirt', 5)]
+        assert engine.series(1)['net'].tolist() == [5000.0]
+
+    def test_vectorized_reports_match_sql(self, db):
+        """تست برابری گزارش‌های برداری با کوئری‌های SQL قبلی"""
+        import numpy as np
+        from analytics_engine import AnalyticsEngine, moving_average
+        from handlers.analytics import Analytics
+
+        db.add_user(1, "a", "A")
+        conn = db._get_conn()
+        for days_ago, items, price in [(0, self.ITEMS_A, 3000), (0, self.ITEMS_B, 5000),
+                                       (3, self.ITEMS_A, 3000), (40, self.ITEMS_B, 5000)]:
+            order_id = db.create_order(1, items, price, 500, price - 500)
+            conn.execute("""
+                UPDATE orders SET status = 'confirmed', created_at = datetime('now', ?)
+                WHERE id = ?
+            """, (f'-{days_ago} days', order_id))
+            conn.commit()
+
+        engine = AnalyticsEngine()
+        engine.refresh(db)
+        analytics = Analytics(db)
+
+        for days in (30, 90):
+            daily = engine.series(days)
+            expected = analytics.get_sales_data(days)
+            assert [str(day) for day in daily['start']] == [row[0] for row in expected]
+            assert list(daily['orders']) == [row[1] for row in expected]
+            assert list(daily['net']) == [row[2] for row in expected]
+
+        assert engine.series(90, 'week')['net'].sum() == engine.series(90, 'month')['net'].sum() == 14000
+        assert str(engine.series(90, 'month')['start'][0]).endswith('-01')
+        assert len(engine.series(7, dense=True)['start']) == 8
+
+        hourly = engine.hourly_histogram(30)
+        for hour, count in analytics.get_hourly_orders():
+            assert hourly[int(hour)] == count
+        assert engine.top_products(10) == [tuple(row) for row in analytics.get_popular_products_fast(10)]
+
+        assert np.allclose(moving_average([2, 4, 6, 8], 2), [2, 3, 5, 7])
+
+
+class TestChartRenderer:
+    """تست رسم نمودارها خارج از event loop و کش PNG"""
+
+    @staticmethod
+    def sales(days=2):
+        import numpy as np
+        dates = np.datetime64('2024-01-01') + np.arange(days)
+        sales = np.linspace(1.5, 2.5, days)
+        return {'dates': dates, 'orders': np.arange(1, days + 1), 'sales': sales,
+                'ma_dates': dates, 'ma': sales, 'ma_window': 7}
+
+    def test_all_charts_render_png(self):
+        """تست رسم همه‌ی نمودارها با Figure API"""
+        import numpy as np
+        from chart_renderer import render_chart
+
+        conversion = {'total_users': 10, 'buyers': 4, 'non_buyers': 6,
+                      'conversion_rate': 40.0, 'total_orders': 7, 'repeat_rate': 1.75}
+        hourly = np.zeros(24, dtype=np.int64)
+        hourly[[9, 18]] = [2, 5]
+        charts = [
+            ('sales', 'daily', self.sales()),
+            ('popular', None, [('محصول بلند با نام خیلی طولانی', 12), ('دوم', 4)]),
+            ('hourly', None, hourly),
+            ('revenue', 'monthly', {'dates': np.array(['2024-01-01'], dtype='datetime64[D]'),
+                                    'gross': np.array([2.0]), 'net': np.array([1.5])}),
+            ('conversion', None, conversion),
+        ]
+        for report, period, data in charts:
+            assert render_chart(report, period, data).startswith(b'\x89PNG')
+
+    def test_cache_keyed_on_data(self):
+        """تست کش: داده‌ی یکسان رسم نمیشه، داده‌ی جدید نسخه‌ی قبلی رو جایگزین میکنه"""
+        from chart_renderer import ChartRenderer
+
+        async def scenario():
+            renderer = ChartRenderer(workers=0)
+            first, second = await asyncio.gather(
+                renderer.render('sales', 'weekly', self.sales()),
+                renderer.render('sales', 'weekly', self.sales()),
+            )
+            again = await renderer.render('sales', 'weekly', self.sales())
+            updated = await renderer.render('sales', 'weekly', self.sales(3))
+            empty = await renderer.render('hourly', None, [])
+            return renderer.get_stats(), first, second, again, updated, empty
+
+        stats, first, second, again, updated, empty = asyncio.run(scenario())
+        assert first is second is again
+        assert updated != first and empty is None
+        assert (stats['renders'], stats['coalesced'], stats['hits']) == (2, 1, 1)
+        assert stats['cached'] == 1
+
+    def test_process_pool_and_data_loading(self, db):
+        """تست رسم در process جدا با داده‌ی واقعی دیتابیس"""
+        from analytics_engine import AnalyticsEngine
+        from chart_renderer import ChartRenderer
+        from handlers.analytics import load_chart_data
+
+        db.add_user(1, "a", "A")
+        items = [{'product': 'محصول', 'pack': 'پک', 'quantity': 1, 'price': 1000}]
+        order_id = db.create_order(1, items, 1000, 0, 1000)
+        db.update_order_status(order_id, 'confirmed')
+
+        engine = AnalyticsEngine()
+        hourly = load_chart_data(engine, db, 'hourly')
+        assert hourly.sum() == 1 and len(hourly) == 24
+        assert load_chart_data(engine, db, 'conversion')['buyers'] == 1
+        sales = load_chart_data(engine, db, 'sales', 'weekly')
+        assert list(sales['orders']) == [1] and list(sales['sales']) == [0.001]
+
+        async def scenario():
+            renderer = ChartRenderer(workers=1)
+            try:
+                return await renderer.render('hourly', None, hourly)
+            finally:
+                renderer.close()
+
+        assert asyncio.run(scenario()).startswith(b'\x89PNG')
+
+
+class TestWebhook:
+    """تست تنظیمات webhook"""
+
+    def test_secret_token_validated_or_generated(self):
+        """تست اعتبارسنجی secret token و ساخت مقدار تصادفی برای مقدار خالی"""
+        from webhook import resolve_secret_token, SECRET_TOKEN_PATTERN
+
+        assert resolve_secret_token("abc_DEF-123") == "abc_DEF-123"
+        generated = resolve_secret_token("")
+        assert SECRET_TOKEN_PATTERN.match(generated)
+        assert generated != resolve_secret_token(None)
+
+        for bad in ("has space", "a" * 257, "توکن"):
+            with pytest.raises(ValueError):
+                resolve_secret_token(bad)
+
+    def test_webhook_options(self):
+        """تست ساخت آدرس webhook و محدود کردن max_connections"""
+        from webhook import webhook_options
+
+        options = webhook_options("https://bot.example.com/", port="9000", path="/hook/",
+                                  secret_token="s3cret", max_connections=500)
+        assert options['webhook_url'] == "https://bot.example.com/hook"
+        assert options['url_path'] == "hook"
+        assert options['port'] == 9000
+        assert options['secret_token'] == "s3cret"
+        assert options['max_connections'] == 100
+        assert webhook_options("https://x", max_connections=0, secret_token="t")['max_connections'] == 1
+
+
+class TestReadSnapshot:
+    """تست connection فقط‌خواندنی گزارش‌ها"""
+
+    def test_read_only_connection_rejects_writes(self, db):
+        """تست اینکه connection گزارش‌ها (mode=ro و query_only) نمیتونه بنویسه"""
+        db.add_user(1, "a", "A")
+        with db.read_snapshot() as conn:
+            assert conn.execute("PRAGMA query_only").fetchone()[0] == 1
+            assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 1
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("DELETE FROM users")
+        assert db.get_user(1) is not None
+
+    def test_snapshot_is_stable_while_orders_are_written(self, db):
+        """تست اینکه نوشتن سفارش با snapshot باز block نمیشه و snapshot ثابت میمونه"""
+        from concurrent.futures import ThreadPoolExecutor
+        from handlers.analytics import Analytics
+
+        db.add_user(1, "a", "A")
+        items = [{'product': 'الف', 'pack': 'پک', 'quantity': 1, 'price': 1000}]
+        db.create_order(1, items, 1000, 0, 1000)
+
+        with db.read_snapshot() as conn:
+            count = lambda: conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+            assert count() == 1
+
+            # نوشتن از thread دیگه (مثل thread نویسنده‌ی AsyncDatabase)
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                assert pool.submit(db.create_order, 1, items, 1000, 0, 1000).result(timeout=5)
+
+            assert count() == 1
+            # استفاده‌ی تو در تو همون snapshot رو میبینه
+            assert Analytics(db)._fetchone("SELECT COUNT(*) FROM orders")[0] == 1
+
+        assert Analytics(db)._fetchone("SELECT COUNT(*) FROM orders")[0] == 2
+        assert db.read_pool.get_stats()['in_use'] == 0
+
+
+class TestConnectionPool:
+    """تست connection pool"""
+
+    def test_pragma_profile_applied(self, temp_db):
+        """تست اعمال پروفایل PRAGMA و نادیده گرفتن مقدار نامعتبر"""
+        from database import DatabaseConnectionPool, parse_pragmas
+
+        pragmas = parse_pragmas("cache_size=-2000, temp_store=MEMORY, mmap_size=1;DROP")
+        assert pragmas['cache_size'] == '-2000'
+        assert pragmas['mmap_size'] == '134217728'
+
+        pool = DatabaseConnectionPool(temp_db, max_size=2, pragmas=pragmas)
+        try:
+            conn = pool.get_connection()
+            assert conn.execute("PRAGMA cache_size").fetchone()[0] == -2000
+            assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+            assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        finally:
+            pool.cleanup_all()
+
+    def test_connections_reused_across_threads(self, temp_db):
+        """تست اینکه pool محدوده و connection آزاد شده به thread دیگه میرسه"""
+        import threading
+        from database import DatabaseConnectionPool
+
+        pool = DatabaseConnectionPool(temp_db, max_size=1, timeout=5)
+        holding = threading.Event()
+        used = []
+
+        def hold():
+            used.append(pool.get_connection())
+            holding.set()
+            time.sleep(0.2)
+            pool.release_connection()
+
+        def borrow():
+            holding.wait()
+            used.append(pool.get_connection())
+            pool.release_connection()
+
+        try:
+            threads = [threading.Thread(target=hold), threading.Thread(target=borrow)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            stats = pool.get_stats()
+            assert used[0] is used[1]
+            assert stats['created'] == 1
+            assert stats['waits'] == 1
+            assert stats['max_wait_ms'] > 0
+            assert stats['in_use'] == 0
+        finally:
+            pool.cleanup_all()
+
+    def test_dead_thread_connection_reclaimed(self, temp_db):
+        """تست پس گرفتن connection از thread تموم شده‌ای که release نکرده"""
+        import threading
+        from database import DatabaseConnectionPool
+
+        pool = DatabaseConnectionPool(temp_db, max_size=1, timeout=5)
+        try:
+            thread = threading.Thread(target=pool.get_connection)
+            thread.start()
+            thread.join()
+
+            conn = pool.get_connection()
+            assert conn.execute("SELECT 1").fetchone()[0] == 1
+            assert pool.get_stats()['created'] == 1
+        finally:
+            pool.cleanup_all()
+
+    def test_release_rolls_back_open_transaction(self, temp_db):
+        """تست اینکه نوشتن commit نشده با برگشت connection به pool ثبت نمیشه"""
+        from database import DatabaseConnectionPool
+
+        pool = DatabaseConnectionPool(temp_db, max_size=1, timeout=5)
+        try:
+            conn = pool.get_connection()
+            conn.execute("CREATE TABLE IF NOT EXISTS t (x INTEGER)")
+            conn.commit()
+            conn.execute("INSERT INTO t VALUES (1)")
+            pool.release_connection()
+
+            conn = pool.get_connection()
+            assert not conn.in_transaction
+            assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+        finally:
+            pool.cleanup_all()
+
+
 class TestStress:
     """تست استرس و حجم بالا"""
     
@@ -0,0 +1,81 @@
+"""
+دریافت آپدیت‌ها با webhook به جای long polling
+
+سرور HTTP همون سرور داخلی python-telegram-bot هست (tornado، نصب با
+python-telegram-bot[webhooks]). Telegram آپدیت‌ها رو با چند connection
+همزمان (WEBHOOK_MAX_CONNECTIONS) POST میکنه و هر درخواست بدون هدر
+X-Telegram-Bot-Api-Secret-Token درست با 403 رد میشه.
+
+خاموش شدن (SIGINT/SIGTERM): اول سرور دیگه درخواست جدید قبول نمیکنه و
+درخواست‌های باز تموم میشن، بعد آپدیت‌های صف و job ها پردازش میشن و در
+آخر post_shutdown منابع (دیتابیس، رسم نمودار) رو میبنده.
+"""
+import logging
+import re
+import secrets
+from typing import Optional
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# فرمت مجاز secret_token در setWebhook
+SECRET_TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,256}$')
+
+# محدوده‌ی مجاز max_connections در setWebhook
+MIN_CONNECTIONS = 1
+MAX_CONNECTIONS = 100
+
+
+def resolve_secret_token(token: Optional[str]) -> str:
+    """
+    اعتبارسنجی secret token یا ساخت یک مقدار تصادفی
+
+    اگر خالی باشه برای همین اجرا یک token ساخته میشه (با setWebhook به
+    Telegram داده میشه، پس فقط برای load test بیرونی باید ثابت باشه).
+
+    Raises:
+        ValueError: اگر token کاراکتر غیرمجاز داشته باشه یا خیلی بلند باشه
+    """
+    if not token:
+        logger.warning("⚠️ WEBHOOK_SECRET_TOKEN تنظیم نشده، یک token تصادفی ساخته شد")
+        return secrets.token_urlsafe(32)
+
+    if not SECRET_TOKEN_PATTERN.match(token):
+        raise ValueError("WEBHOOK_SECRET_TOKEN فقط A-Z و a-z و 0-9 و _ و - (حداکثر 256 کاراکتر)")
+    return token
+
+
+def webhook_options(url: str, listen: str = '0.0.0.0', port: int = 8443,
+                    path: str = 'webhook', secret_token: Optional[str] = None,
+                    max_connections: int = 40) -> dict:
+    """
+    پارامترهای Application.run_webhook از تنظیمات
+
+    Args:
+        url: آدرس عمومی https ربات (بدون مسیر)، مثال: https://bot.example.com
+        path: مسیر webhook روی سرور محلی و آدرس عمومی
+    """
+    path = path.strip('/')
+    clamped = min(max(int(max_connections), MIN_CONNECTIONS), MAX_CONNECTIONS)
+    if clamped != max_connections:
+        logger.warning(f"⚠️ WEBHOOK_MAX_CONNECTIONS={max_connections} خارج از 1..100، {clamped} استفاده میشه")
+
+    return {
+        'listen': listen,
+        'port': int(port),
+        'url_path': path,
+        'webhook_url': f"{url.rstrip('/')}/{path}",
+        'secret_token': resolve_secret_token(secret_token),
+        'max_connections': clamped,
+        'allowed_updates': Update.ALL_TYPES,
+    }
+
+
+def run_webhook(application, options: dict):
+    """اجرای ربات با webhook (تا رسیدن SIGINT/SIGTERM بلاک میشه)"""
+    logger.info(
+        f"🌐 Webhook mode: {options['listen']}:{options['port']}/{options['url_path']} "
+        f"(max_connections={options['max_connections']})"
+    )
+    application.run_webhook(**options)